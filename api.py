@@ -0,0 +1,66 @@
+"""
+Ready to Study - JSON API サーバー
+Streamlit以外のクライアント向けのエントリーポイント
+
+使用例:
+    python scripts/manage_api_tokens.py issue 1   # 利用者ごとのトークンを発行
+    python api.py --port 8600 --workers 8
+    python api.py --port 8600 --processes 4   # CPUコアごとにプロセスを起動
+    python api.py --insecure                  # 認証なし（開発用、ループバックのみで使用）
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+import tornado.netutil
+import tornado.process
+from tornado.httpserver import HTTPServer
+
+from src.api.server import make_app
+from src.controllers.api_tokens import has_tokens
+from src.controllers.database import DatabaseController
+from src.controllers.memory import start_memory_monitor
+
+def main():
+    """APIサーバーを起動"""
+    parser = argparse.ArgumentParser(description="Ready to Study JSON API")
+    parser.add_argument("--address", default=os.environ.get("API_ADDRESS", "127.0.0.1"), help="待ち受けアドレス")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("API_PORT", "8600")), help="待ち受けポート")
+    parser.add_argument("--workers", type=int, default=8, help="DB処理用スレッド数（プロセスごと）")
+    parser.add_argument("--max-pending", type=int, default=256, help="DB処理の待ち行列の上限")
+    parser.add_argument("--processes", type=int, default=1, help="プロセス数（0でCPUコア数）")
+    parser.add_argument("--insecure", action="store_true", help="利用者の認証を行わない（開発用）")
+    args = parser.parse_args()
+    
+    # トークンは既定のシャードに保存される（フォーク前に開いた接続は閉じておく）
+    primary = DatabaseController(os.environ.get("READY_TO_STUDY_DB", "data/study_app.db"))
+    issued = has_tokens(primary)
+    primary.writer.close()
+    primary.analytics.close()
+    if not args.insecure and not issued:
+        print("❌ APIトークンが発行されていません。scripts/manage_api_tokens.py issue <user_id> で発行するか、"
+              "開発用に --insecure を指定してください。", file=sys.stderr)
+        sys.exit(1)
+    
+    sockets = tornado.netutil.bind_sockets(args.port, args.address)
+    if args.processes != 1:
+        tornado.process.fork_processes(args.processes)
+    
+    async def serve():
+        start_memory_monitor()
+        server = HTTPServer(make_app(max_workers=args.workers, max_pending=args.max_pending,
+                                     insecure=args.insecure), xheaders=True)
+        server.add_sockets(sockets)
+        await asyncio.Event().wait()
+    
+    asyncio.run(serve())
+
+if __name__ == "__main__":
+    main()
@@ -16,7 +16,13 @@ from src.views.subjects import show_subjects
 from src.views.schedule import show_schedule
 from src.views.progress import show_progress
 from src.views.settings import show_settings
+from src.views.admin import is_admin, show_admin
 from src.controllers.database import init_database
+from src.controllers.sidecar import start_sidecar
+from src.controllers.memory import start_memory_monitor
+from src.controllers.snapshots import start_snapshot_scheduler
+from src.controllers.events import start_event_pump
+from src.controllers.profiler import profile_rerun, tag_rerun
 from src.models.user import User
 
 # ページ設定
@@ -55,11 +61,22 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 def main():
-    """メインアプリケーション"""
+    """メインアプリケーション（再実行ごとに処理時間を計測）"""
+    with profile_rerun():
+        render_app()
+
+def render_app():
+    """画面の描画"""
     
     # データベース初期化
     init_database()
     
+    # 監視用エンドポイント（/metrics）・メモリ計測（有効な場合のみ）・ダッシュボードの事前集計・イベントストアの起動
+    start_sidecar()
+    start_memory_monitor()
+    start_snapshot_scheduler()
+    start_event_pump()
+    
     # サイドバー
     with st.sidebar:
         st.markdown('<div class="sidebar-content">', unsafe_allow_html=True)
@@ -67,11 +84,15 @@ def main():
         st.markdown("---")
         
         # ナビゲーション
+        pages = ["ダッシュボード", "教科学習", "スケジュール", "進捗管理", "設定"]
+        if is_admin():
+            pages.append("管理")
         page = st.selectbox(
             "ページを選択",
-            ["ダッシュボード", "教科学習", "スケジュール", "進捗管理", "設定"],
+            pages,
             index=0
         )
+        tag_rerun(page)
         
         st.markdown("---")
         
@@ -93,6 +114,8 @@ def main():
         show_progress()
     elif page == "設定":
         show_settings()
+    elif page == "管理":
+        show_admin()
 
 if __name__ == "__main__":
     main()
@@ -5,12 +5,12 @@
 set -e
 
 # 設定
+APP_DIR="/opt/ready-to-study"
 BACKUP_DIR="/var/backups/ready-to-study"
-DB_NAME="ready_to_study_db"
-DB_USER="ready_to_study"
+DB_FILE="$APP_DIR/data/study_app.db"
+PYTHON="$APP_DIR/venv/bin/python"
 RETENTION_DAYS=30
 DATE=$(date +%Y%m%d_%H%M%S)
-BACKUP_FILE="$BACKUP_DIR/ready_to_study_backup_$DATE.sql"
 
 # ログ関数
 log() {
@@ -23,21 +23,13 @@ mkdir -p "$BACKUP_DIR"
 
 log "🗄️ データベースバックアップを開始します..."
 
-# PostgreSQLバックアップ
-export PGPASSWORD="password"
-if pg_dump -h localhost -U "$DB_USER" -d "$DB_NAME" > "$BACKUP_FILE"; then
-    log "✅ バックアップが完了しました: $BACKUP_FILE"
-    
-    # 圧縮
-    gzip "$BACKUP_FILE"
-    log "🗜️ バックアップファイルを圧縮しました: $BACKUP_FILE.gz"
-    
-    # 古いバックアップの削除
-    find "$BACKUP_DIR" -name "ready_to_study_backup_*.sql.gz" -mtime +$RETENTION_DAYS -delete
-    log "🧹 ${RETENTION_DAYS}日以上前のバックアップファイルを削除しました"
+# SQLiteオンラインバックアップ（稼働中でも一貫したスナップショットを作成・検証・圧縮）
+if "$PYTHON" "$APP_DIR/scripts/backup_database.py" --db "$DB_FILE" --backup-dir "$BACKUP_DIR" \
+        backup --retention-days "$RETENTION_DAYS" >> /var/log/ready-to-study/backup.log 2>&1; then
+    log "✅ バックアップが完了しました"
     
     # バックアップファイル一覧
-    BACKUP_COUNT=$(ls -1 "$BACKUP_DIR"/ready_to_study_backup_*.sql.gz | wc -l)
+    BACKUP_COUNT=$(ls -1 "$BACKUP_DIR"/ready_to_study_backup_*.db.gz | wc -l)
     log "📊 現在のバックアップファイル数: $BACKUP_COUNT"
     
 else
@@ -47,10 +39,12 @@ fi
 
 # アプリケーションファイルのバックアップ（任意）
 APP_BACKUP_FILE="$BACKUP_DIR/app_files_$DATE.tar.gz"
-if tar -czf "$APP_BACKUP_FILE" -C /opt ready-to-study --exclude="*.log" --exclude="__pycache__" --exclude=".git"; then
+if tar -czf "$APP_BACKUP_FILE" -C /opt ready-to-study --exclude="*.log" --exclude="__pycache__" --exclude=".git" --exclude="data/*.db*"; then
     log "📦 アプリケーションファイルのバックアップが完了しました: $APP_BACKUP_FILE"
 else
     log "⚠️ アプリケーションファイルのバックアップに失敗しました"
 fi
 
+find "$BACKUP_DIR" -name "app_files_*.tar.gz" -mtime +$RETENTION_DAYS -delete
+
 log "🎉 バックアップ処理が完了しました"
@@ -8,7 +8,9 @@ set -e
 SERVICE_NAME="ready-to-study"
 LOG_FILE="/var/log/ready-to-study/monitor.log"
 EMAIL_ALERT="admin@your-domain.com"  # 必要に応じて変更
-HEALTH_CHECK_URL="http://localhost:8501"
+METRICS_PORTS="${METRICS_PORTS:-9501}"  # ワーカーごとのサイドカー（/readyz・/metrics）のポート（空白区切り）
+METRICS_STATE_FILE="/var/lib/ready-to-study/monitor-slow-queries"
+SLOW_QUERY_ALERT_THRESHOLD=50  # 監視間隔あたりのスロークエリ件数の上限
 
 # ログ関数
 log() {
@@ -37,15 +39,57 @@ check_service() {
     fi
 }
 
-# HTTP ヘルスチェック
+# HTTP ヘルスチェック（各ワーカーのサイドカーの /readyz で、DBの読み取りまで確認）
 check_http() {
-    if curl -f -s -o /dev/null "$HEALTH_CHECK_URL"; then
-        log "✅ HTTPヘルスチェック正常: $HEALTH_CHECK_URL"
-        return 0
-    else
-        log "❌ HTTPヘルスチェック失敗: $HEALTH_CHECK_URL"
+    local port status failed=0
+    
+    for port in $METRICS_PORTS; do
+        if status=$(curl -f -s --max-time 5 "http://localhost:${port}/readyz"); then
+            log "✅ HTTPヘルスチェック正常: localhost:${port} $status"
+        else
+            log "❌ HTTPヘルスチェック失敗: localhost:${port}/readyz ${status}"
+            failed=1
+        fi
+    done
+    return $failed
+}
+
+# メトリクスチェック（各ワーカーの /metrics を取得してスロークエリ件数を確認）
+check_metrics() {
+    local total_slow=0
+    local total_failures=0
+    local port metrics value
+    
+    for port in $METRICS_PORTS; do
+        if ! metrics=$(curl -f -s --max-time 5 "http://localhost:${port}/metrics"); then
+            log "❌ メトリクス取得失敗: http://localhost:${port}/metrics"
+            return 1
+        fi
+        value=$(echo "$metrics" | awk '$1 == "rts_db_slow_queries_total" {print $2}')
+        total_slow=$((total_slow + ${value:-0}))
+        value=$(echo "$metrics" | awk '$1 == "rts_db_write_failures_total" {print $2}')
+        total_failures=$((total_failures + ${value:-0}))
+    done
+    
+    # 前回からの増分を計算（ワーカー再起動でカウンターが戻った場合は現在値を使う）
+    local previous=0
+    if [[ -f "$METRICS_STATE_FILE" ]]; then
+        previous=$(cat "$METRICS_STATE_FILE")
+    fi
+    mkdir -p "$(dirname "$METRICS_STATE_FILE")"
+    echo "$total_slow" > "$METRICS_STATE_FILE"
+    local increase=$((total_slow - previous))
+    if [[ $increase -lt 0 ]]; then
+        increase=$total_slow
+    fi
+    
+    if [[ $increase -gt $SLOW_QUERY_ALERT_THRESHOLD ]]; then
+        log "⚠️ スロークエリ増加: 前回から${increase}件（書き込み失敗 累計${total_failures}件）"
+        send_alert "Ready to Study - スロークエリ警告" "前回の監視から${increase}件のスロークエリが記録されました。/opt/ready-to-study/data/logs/slow_queries.log を確認してください。"
         return 1
     fi
+    log "✅ メトリクス正常: スロークエリ 前回から${increase}件、書き込み失敗 累計${total_failures}件"
+    return 0
 }
 
 # データベース接続チェック
@@ -116,6 +160,7 @@ main() {
     # 各チェック実行
     check_service || ((errors++))
     check_http || ((errors++))
+    check_metrics || ((errors++))
     check_database || ((errors++))
     check_disk_usage || ((errors++))
     check_memory_usage || ((errors++))
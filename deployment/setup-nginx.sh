@@ -26,6 +26,11 @@ mkdir -p /etc/nginx/sites-enabled
 echo "📄 Nginx設定ファイルをコピーしています..."
 cp /opt/ready-to-study/deployment/nginx-ready-to-study.conf /etc/nginx/sites-available/ready-to-study
 
+# ワーカー構成に合わせた upstream 設定の生成
+echo "🔀 upstream設定を生成しています..."
+/opt/ready-to-study/venv/bin/python /opt/ready-to-study/scripts/supervisor.py nginx-upstream \
+    --workers "${STREAMLIT_WORKERS:-4}" > /etc/nginx/ready-to-study-upstream.conf
+
 # シンボリックリンクの作成
 ln -sf /etc/nginx/sites-available/ready-to-study /etc/nginx/sites-enabled/
 
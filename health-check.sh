@@ -93,7 +93,8 @@ else
 fi
 
 if command -v curl &>/dev/null; then
-    check_item "ローカルホストでHTTPアクセス可能" "timeout 10 curl -s http://localhost:8501 >/dev/null"
+    check_item "ローカルホストでHTTPアクセス可能" "timeout 10 curl -fs http://localhost:8501/_stcore/health >/dev/null"
+    check_item "データベース読み取り可能 (/readyz)" "timeout 10 curl -fs http://localhost:9501/readyz >/dev/null"
 else
     log_warn "⚠️  curlコマンドが見つかりません"
 fi
@@ -0,0 +1,67 @@
+"""
+データベースバックアップ・リストアスクリプト
+
+使用例:
+    python scripts/backup_database.py backup --backup-dir /var/backups/ready-to-study
+    python scripts/backup_database.py list --backup-dir /var/backups/ready-to-study
+    python scripts/backup_database.py restore /var/backups/ready-to-study/ready_to_study_backup_20260101_030000.db.gz
+"""
+
+import argparse
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.backup import create_backup, apply_retention, list_backups, restore_backup
+
+def main():
+    """バックアップ・リストアを実行"""
+    parser = argparse.ArgumentParser(description="SQLiteデータベースのオンラインバックアップ")
+    parser.add_argument("--db", default="data/study_app.db", help="データベースファイル")
+    parser.add_argument("--backup-dir", default=os.environ.get("BACKUP_DIR", "backups"), help="バックアップの保存先")
+    parser.add_argument("--pages", type=int, default=256, help="1ステップでコピーするページ数")
+    parser.add_argument("--sleep", type=float, default=0.01, help="ステップ間の待ち時間（秒）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    backup_parser = subparsers.add_parser("backup", help="バックアップを作成")
+    backup_parser.add_argument("--retention-days", type=int,
+                               default=int(os.environ.get("BACKUP_RETENTION_DAYS", "30")),
+                               help="バックアップの保存日数")
+    backup_parser.add_argument("--keep-min", type=int, default=3, help="常に残す最新バックアップ数")
+    
+    subparsers.add_parser("list", help="バックアップ一覧を表示")
+    
+    restore_parser = subparsers.add_parser("restore", help="バックアップから復元")
+    restore_parser.add_argument("backup_file", help="復元するバックアップファイル (.db.gz)")
+    restore_parser.add_argument("--no-safety-backup", action="store_true",
+                                help="復元前に現在のデータベースをバックアップしない")
+    args = parser.parse_args()
+    
+    if args.command == "backup":
+        print("🗄️ データベースバックアップを開始します...")
+        path = create_backup(args.db, args.backup_dir, args.pages, args.sleep)
+        print(f"✅ バックアップが完了しました: {path}")
+        
+        removed = apply_retention(args.backup_dir, args.retention_days, args.keep_min)
+        print(f"🧹 {args.retention_days}日以上前のバックアップを {len(removed)} 件削除しました")
+        print(f"📊 現在のバックアップファイル数: {len(list_backups(args.backup_dir))}")
+    
+    elif args.command == "list":
+        for path in list_backups(args.backup_dir):
+            print(f"  - {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+    
+    elif args.command == "restore":
+        if not args.no_safety_backup and os.path.exists(args.db):
+            path = create_backup(args.db, args.backup_dir, args.pages, args.sleep, label="pre_restore")
+            print(f"💾 復元前のデータベースを保存しました: {path}")
+        
+        print(f"♻️ {args.backup_file} から復元しています...")
+        try:
+            restore_backup(args.backup_file, args.db, args.pages, args.sleep)
+        except RuntimeError as e:
+            print(f"❌ 復元に失敗しました: {e}")
+            sys.exit(1)
+        print("✅ 復元と整合性チェックが完了しました")
+
+if __name__ == "__main__":
+    main()
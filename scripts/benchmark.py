@@ -0,0 +1,373 @@
+"""
+クエリ・書き込みのマイクロベンチマーク
+
+各ページを AppTest で実際に描画して実行されたSQLと引数を記録し、
+それぞれのSQLを繰り返し実行して時間を計測する（ビューにクエリを追加・変更しても
+ベンチマーク側の修正は不要）。書き込み処理は write_transaction 経由で計測する。
+結果は実行ごとにJSONで保存し、バックエンド・インデックス・キャッシュの違いを比較できる。
+
+使用例:
+    python scripts/seed_database.py --db data/bench.db
+    python scripts/benchmark.py run --db data/bench.db --label baseline
+    python scripts/benchmark.py run --db data/bench.db --label with-index
+    python scripts/benchmark.py compare data/benchmarks/20260101_120000_baseline.json data/benchmarks/20260101_130000_with-index.json
+    python scripts/benchmark.py list
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+from scripts.load_test import APP_PATH, install_apptest_compat, navigate, percentile, _widget
+
+RESULTS_DIR = os.path.join("data", "benchmarks")
+
+# ページを描画し、実行されたSQLと描画時間をセッション状態に残す
+CAPTURE_TEMPLATE = """
+import runpy
+import time
+import streamlit as st
+from src.controllers.database import capture_queries
+
+started = time.perf_counter()
+with capture_queries() as statements:
+    runpy.run_path({app_path!r}, run_name="__main__")
+st.session_state["_benchmark_run"] = {{
+    "statements": statements,
+    "seconds": time.perf_counter() - started,
+}}
+"""
+
+
+def _select(label: str, value: str) -> Callable:
+    def interact(at):
+        _widget(at.selectbox, label).select(value)
+    return interact
+
+
+# (ページ名, 追加操作) ページの既定表示に加えて、集計範囲の広い表示も計測する
+PAGE_VIEWS: List[Tuple[str, str, Callable]] = [
+    ("dashboard", "ダッシュボード", None),
+    ("subjects", "教科学習", None),
+    ("schedule", "スケジュール", None),
+    ("schedule/all", "スケジュール", _select("期間", "すべて")),
+    ("progress", "進捗管理", None),
+    ("progress/all", "進捗管理", _select("分析期間", "全期間")),
+    ("settings", "設定", None),
+]
+
+
+def normalize_sql(sql: str) -> str:
+    """空白を詰めたSQL（集計のキー）"""
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def capture_pages(user_ids: List[int]) -> Tuple[Dict[str, Dict], Dict[str, Dict[str, List[float]]]]:
+    """各利用者で全ページを描画し、SQLごとの引数とページごとの描画時間を記録
+
+    描画時間は1回目（キャッシュなし）と2回目（同じデータで再描画）を分けて記録する。
+    """
+    from streamlit.testing.v1 import AppTest
+
+    statements: Dict[str, Dict] = {}
+    pages: Dict[str, Dict[str, List[float]]] = {}
+    for user_id in user_ids:
+        at = AppTest.from_string(CAPTURE_TEMPLATE.format(app_path=APP_PATH), default_timeout=120)
+        at.session_state["current_user_id"] = user_id
+        at.run()
+        for name, page, interact in PAGE_VIEWS:
+            for attempt in ("cold", "warm"):
+                navigate(at, page)
+                if interact is not None and attempt == "cold":
+                    at.run()
+                    interact(at)
+                at.run()
+                if at.exception:
+                    raise RuntimeError(f"{name}: {at.exception[0].message}")
+                # 操作がある場合は操作後の描画だけが記録される
+                run = at.session_state["_benchmark_run"]
+                pages.setdefault(name, {"cold": [], "warm": []})[attempt].append(run["seconds"] * 1000)
+                for sql, params in run["statements"]:
+                    key = normalize_sql(sql)
+                    entry = statements.setdefault(key, {"pages": set(), "params": []})
+                    entry["pages"].add(name)
+                    if params not in entry["params"]:
+                        entry["params"].append(params)
+    return statements, pages
+
+
+def time_statements(db, statements: Dict[str, Dict], repeat: int, samples: int) -> List[Dict]:
+    """記録したSQLを引数ごとに repeat 回ずつ実行して計測"""
+    results = []
+    with db.get_connection() as conn:
+        for sql, entry in statements.items():
+            if not sql.upper().startswith(("SELECT", "WITH")):
+                continue
+            timings = []
+            rows = 0
+            for params in entry["params"][:samples]:
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    rows = len(conn.execute(sql, params).fetchall())
+                    timings.append((time.perf_counter() - started) * 1000)
+            plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", entry["params"][0])]
+            results.append({
+                "sql": sql,
+                "pages": sorted(entry["pages"]),
+                "executions": len(timings),
+                "rows": rows,
+                "min_ms": min(timings),
+                "p50_ms": percentile(timings, 50),
+                "p95_ms": percentile(timings, 95),
+                "mean_ms": sum(timings) / len(timings),
+                "plan": plan,
+            })
+    return sorted(results, key=lambda r: -r["p50_ms"])
+
+
+def time_writes(db, user_ids: List[int], iterations: int) -> List[Dict]:
+    """書き込み処理を write_transaction 経由で計測（投入した行は最後に削除する）"""
+    from src.controllers import queries
+    from src.controllers.recurrence import create_rule, delete_rule, set_occurrence_state
+
+    rng = random.Random(0)
+    with db.get_connection() as conn:
+        quiz_ids = [row[0] for row in conn.execute("SELECT id FROM quizzes LIMIT 200")]
+        subject_ids = [row[0] for row in conn.execute("SELECT id FROM subjects")]
+    created: Dict[str, List[int]] = {"study_sessions": [], "quiz_results": [], "schedules": []}
+    now = datetime.now().replace(microsecond=0)
+
+    with db.write_transaction() as conn:
+        rule_id = create_rule(conn, user_ids[0], "ベンチマーク", None, "review",
+                              "FREQ=DAILY", now.replace(hour=19, minute=0, second=0))
+
+    def record_session(conn, user_id):
+        created["study_sessions"].append(queries.insert_study_session(
+            conn, user_id, rng.choice(subject_ids), 30, "ベンチマーク", 3))
+
+    def record_quiz(conn, user_id):
+        created["quiz_results"].append(queries.insert_quiz_result(
+            conn, user_id, rng.choice(quiz_ids), "A", rng.random() < 0.6, 30))
+
+    def add_schedule(conn, user_id):
+        created["schedules"].append(queries.insert_schedule(
+            conn, user_id, "ベンチマーク", None, now + timedelta(days=1), "review"))
+
+    def toggle_schedule(conn, user_id):
+        if created["schedules"]:
+            queries.set_schedule_completed(conn, user_ids[0], created["schedules"][0], rng.random() < 0.5)
+
+    def toggle_occurrence(conn, user_id):
+        occurrence = now.replace(hour=19, minute=0, second=0) + timedelta(days=rng.randint(0, 30))
+        set_occurrence_state(conn, rule_id, occurrence, is_completed=rng.random() < 0.5)
+
+    paths = [
+        ("insert_study_session", record_session),
+        ("insert_quiz_result", record_quiz),
+        ("insert_schedule", add_schedule),
+        ("set_schedule_completed", toggle_schedule),
+        ("set_occurrence_state", toggle_occurrence),
+    ]
+
+    results = []
+    try:
+        for name, fn in paths:
+            timings = []
+            for _ in range(iterations):
+                user_id = rng.choice(user_ids)
+                started = time.perf_counter()
+                with db.write_transaction() as conn:
+                    fn(conn, user_id)
+                timings.append((time.perf_counter() - started) * 1000)
+            results.append({
+                "name": name,
+                "executions": len(timings),
+                "min_ms": min(timings),
+                "p50_ms": percentile(timings, 50),
+                "p95_ms": percentile(timings, 95),
+                "mean_ms": sum(timings) / len(timings),
+            })
+    finally:
+        with db.write_transaction() as conn:
+            for table, ids in created.items():
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    conn.execute(f"DELETE FROM {table} WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            delete_rule(conn, rule_id)
+    return results
+
+
+def database_profile(db) -> Dict:
+    """比較のためのデータベースの状態（件数・インデックス・設定）"""
+    with db.get_connection() as conn:
+        counts = {
+            table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("users", "study_sessions", "quizzes", "quiz_results", "schedules")
+        }
+        indexes = [row[0] for row in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL ORDER BY name"
+        )]
+        return {
+            "path": db.db_path,
+            "size_mb": os.path.getsize(db.db_path) / 1024 / 1024,
+            "counts": counts,
+            "indexes": indexes,
+            "journal_mode": conn.execute("PRAGMA journal_mode").fetchone()[0],
+            "page_size": conn.execute("PRAGMA page_size").fetchone()[0],
+        }
+
+
+def command_run(args):
+    """ベンチマークを実行して結果を保存"""
+    os.environ["READY_TO_STUDY_DB"] = args.db
+    # 計測用プロセスでは監視用サイドカーを起動しない
+    os.environ.setdefault("METRICS_PORT", "off")
+    from src.controllers.database import init_database
+    db = init_database()
+
+    with db.get_connection() as conn:
+        all_users = [row[0] for row in conn.execute("SELECT id FROM users")]
+    if not all_users:
+        print("❌ 利用者がいません。先に scripts/seed_database.py でデータを投入してください")
+        sys.exit(1)
+    user_ids = random.Random(args.seed).sample(all_users, min(args.users, len(all_users)))
+
+    install_apptest_compat()
+    print(f"🔍 {len(user_ids)}人分のページを描画してクエリを記録しています...")
+    statements, pages = capture_pages(user_ids)
+
+    print(f"⏱️ {len(statements)}種類のクエリを計測しています...")
+    query_results = time_statements(db, statements, args.repeat, args.samples)
+
+    print(f"✏️ 書き込み処理を各{args.write_iterations}回計測しています...")
+    write_results = time_writes(db, user_ids, args.write_iterations)
+
+    result = {
+        "label": args.label,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "database": database_profile(db),
+        "pages": {
+            name: {attempt: percentile(values, 50) for attempt, values in timings.items()}
+            for name, timings in pages.items()
+        },
+        "queries": query_results,
+        "writes": write_results,
+    }
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    path = os.path.join(args.results_dir, f"{datetime.now():%Y%m%d_%H%M%S}_{args.label}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    print_result(result)
+    print(f"\n📁 結果を保存しました: {path}")
+
+
+def print_result(result: Dict):
+    """結果を表示"""
+    print("\nページ描画（p50, ms）:")
+    for name, timings in result["pages"].items():
+        print(f"  {name:<16} 初回 {timings['cold']:>8.1f}  再描画 {timings['warm']:>8.1f}")
+    print("\nクエリ（遅い順）:")
+    for query in result["queries"]:
+        print(f"  p50 {query['p50_ms']:>8.2f}ms  p95 {query['p95_ms']:>8.2f}ms  {','.join(query['pages'])}")
+        print(f"      {query['sql'][:110]}")
+    print("\n書き込み:")
+    for write in result["writes"]:
+        print(f"  {write['name']:<24} p50 {write['p50_ms']:>7.2f}ms  p95 {write['p95_ms']:>7.2f}ms")
+
+
+def command_compare(args):
+    """2つの結果を比較"""
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.target, encoding="utf-8") as f:
+        target = json.load(f)
+    print(f"比較: {base['label']} ({base['created_at']}) → {target['label']} ({target['created_at']})")
+
+    def ratio(before: float, after: float) -> str:
+        return f"x{after / before:.2f}" if before else "-"
+
+    print("\nページ描画（初回 p50, ms）:")
+    for name, timings in base["pages"].items():
+        if name in target["pages"]:
+            after = target["pages"][name]["cold"]
+            print(f"  {name:<16} {timings['cold']:>8.1f} → {after:>8.1f}  {ratio(timings['cold'], after)}")
+
+    print("\nクエリ（p50, ms）:")
+    target_queries = {q["sql"]: q for q in target["queries"]}
+    for query in base["queries"]:
+        other = target_queries.get(query["sql"])
+        if other is None:
+            continue
+        print(f"  {query['p50_ms']:>8.2f} → {other['p50_ms']:>8.2f}  {ratio(query['p50_ms'], other['p50_ms']):>7}"
+              f"  {query['sql'][:90]}")
+
+    print("\n書き込み（p50, ms）:")
+    target_writes = {w["name"]: w for w in target["writes"]}
+    for write in base["writes"]:
+        other = target_writes.get(write["name"])
+        if other is not None:
+            print(f"  {write['name']:<24} {write['p50_ms']:>7.2f} → {other['p50_ms']:>7.2f}"
+                  f"  {ratio(write['p50_ms'], other['p50_ms'])}")
+
+
+def command_list(args):
+    """保存済みの結果を一覧表示"""
+    for path in sorted(glob.glob(os.path.join(args.results_dir, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            result = json.load(f)
+        counts = result["database"]["counts"]
+        print(f"  {path}  [{result['label']}]  sessions={counts['study_sessions']:,}"
+              f"  indexes={len(result['database']['indexes'])}")
+
+
+def main():
+    """ベンチマークを実行"""
+    parser = argparse.ArgumentParser(description="ビューのクエリと書き込み処理のベンチマーク")
+    parser.add_argument("--results-dir", default=RESULTS_DIR, help="結果の保存先")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="ベンチマークを実行")
+    run_parser.add_argument("--db", default="data/bench.db", help="計測するデータベース（seed_database.py で作成）")
+    run_parser.add_argument("--label", default="run", help="結果に付ける名前（例: baseline, with-index）")
+    run_parser.add_argument("--users", type=int, default=10, help="ページを描画する利用者数")
+    run_parser.add_argument("--repeat", type=int, default=3, help="引数ごとの実行回数")
+    run_parser.add_argument("--samples", type=int, default=10, help="クエリごとに使う引数の組数")
+    run_parser.add_argument("--write-iterations", type=int, default=200, help="書き込み処理ごとの実行回数")
+    run_parser.add_argument("--seed", type=int, default=0, help="利用者を選ぶ乱数シード")
+
+    compare_parser = subparsers.add_parser("compare", help="2つの結果を比較")
+    compare_parser.add_argument("base", help="基準の結果ファイル")
+    compare_parser.add_argument("target", help="比較する結果ファイル")
+
+    subparsers.add_parser("list", help="保存済みの結果を一覧表示")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        command_run(args)
+    elif args.command == "compare":
+        command_compare(args)
+    elif args.command == "list":
+        command_list(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+列指向エクスポートスクリプト
+
+学習記録・クイズ結果の終わった月を Parquet（または Arrow IPC）の月別パーティションに
+書き出す。2回目以降は新しい月と内容が変わった月だけを書き出すため、cron などから
+毎日実行できる。シャーディング時はシャードごとに --db を指定して同じ保存先へ書き出す。
+
+使用例:
+    python scripts/export_columnar.py
+    python scripts/export_columnar.py --format arrow --table study_sessions
+    python scripts/export_columnar.py --rebuild
+
+読み込み例（pandas）:
+    pd.read_parquet("data/columnar/study_sessions", filters=[("user_id", "=", 1)])
+"""
+
+import argparse
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import DatabaseController
+from src.controllers.columnar import (
+    ColumnarExporter, DEFAULT_ROW_GROUP_SIZE, EXPORT_TABLES, FORMATS
+)
+
+def main():
+    """終わった月を列指向形式で書き出す"""
+    parser = argparse.ArgumentParser(description="分析用の列指向エクスポート")
+    parser.add_argument("--db", default=os.environ.get("READY_TO_STUDY_DB", "data/study_app.db"),
+                        help="データベースファイル")
+    parser.add_argument("--directory", default=None, help="保存先（既定はDBと同じ場所の columnar/）")
+    parser.add_argument("--format", default="parquet", choices=list(FORMATS), help="書き出し形式")
+    parser.add_argument("--table", dest="tables", action="append", choices=list(EXPORT_TABLES),
+                        help="対象テーブル（複数指定可、省略時はすべて）")
+    parser.add_argument("--row-group-size", type=int, default=DEFAULT_ROW_GROUP_SIZE,
+                        help="1つの行グループの行数")
+    parser.add_argument("--rebuild", action="store_true", help="書き出し済みの月もすべて書き直す")
+    args = parser.parse_args()
+
+    db = DatabaseController(args.db)
+    exporter = ColumnarExporter(db, args.directory, args.format, args.row_group_size)
+    try:
+        print(f"📦 {exporter.directory} へ書き出しています...")
+        for table in args.tables or EXPORT_TABLES:
+            result = exporter.export(table, rebuild=args.rebuild)
+            months = ", ".join(result["months"]) or "なし"
+            print(f"  - {table}: {result['rows']:,} 行 (書き出した月: {months})")
+        print("✅ エクスポートが完了しました")
+    finally:
+        db.writer.close()
+        db.analytics.close()
+
+if __name__ == "__main__":
+    main()
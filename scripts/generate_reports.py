@@ -0,0 +1,59 @@
+"""
+学習レポート一括作成スクリプト
+
+全ユーザーの週次・月次の学習レポートを印刷用の HTML と PDF で作成する。
+ユーザーをプロセスプールで並列に処理し、中断しても同じ期間で再実行すると
+作成済みのレポートを飛ばして続きから作成する。シャーディング時はシャードごとに
+--db を指定して同じ保存先へ作成する。
+
+使用例:
+    python scripts/generate_reports.py weekly              # 先週のレポート
+    python scripts/generate_reports.py monthly --date 2026-03-01 --format pdf
+    python scripts/generate_reports.py weekly --workers 8
+"""
+
+import argparse
+import sys
+import os
+from datetime import date
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import DatabaseController
+from src.controllers.reports import REPORT_FORMATS, REPORT_KINDS, ReportBatch, previous_period
+
+def main():
+    """全ユーザーの学習レポートを作成"""
+    parser = argparse.ArgumentParser(description="学習レポートの一括作成")
+    parser.add_argument("kind", choices=list(REPORT_KINDS), help="レポートの種類")
+    parser.add_argument("--db", default=os.environ.get("READY_TO_STUDY_DB", "data/study_app.db"),
+                        help="データベースファイル")
+    parser.add_argument("--date", type=date.fromisoformat, default=None,
+                        help="この日を含む期間のレポート（省略時は直前の終わった期間）")
+    parser.add_argument("--output-dir", default="data/reports", help="保存先")
+    parser.add_argument("--format", dest="formats", action="append", choices=REPORT_FORMATS,
+                        help="出力形式（複数指定可、省略時は html と pdf）")
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数（既定はCPU数）")
+    parser.add_argument("--chunk-size", type=int, default=50, help="1つのプロセスにまとめて渡す人数")
+    args = parser.parse_args()
+
+    db = DatabaseController(args.db)
+    start = args.date or previous_period(args.kind)[0]
+    batch = ReportBatch(db, args.kind, start, args.output_dir, tuple(args.formats or REPORT_FORMATS),
+                        args.workers, args.chunk_size)
+
+    def progress(done: int, total: int):
+        print(f"\r  {done:,} / {total:,} 人", end="", flush=True)
+
+    try:
+        print(f"📝 {batch.title()}を {batch.directory} に作成しています...")
+        result = batch.run(progress)
+        if result["generated"]:
+            print()
+        print(f"✅ {result['generated']:,} 人分を作成、{result['skipped']:,} 人分は作成済み "
+              f"({result['seconds']:.1f} 秒)")
+    finally:
+        db.writer.close()
+        db.analytics.close()
+
+if __name__ == "__main__":
+    main()
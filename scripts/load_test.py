@@ -0,0 +1,432 @@
+"""
+負荷試験スクリプト
+
+Streamlitの AppTest で app.py をヘッドレスに実行し、N人の同時利用者が
+ページ遷移・学習記録・クイズ回答・予定追加などの操作を繰り返す状況を再現する。
+1回の操作（再実行）ごとの応答時間・DB時間・クエリ数と、プロセスのRSSの推移を集計する。
+応答時間はスクリプトの実行時間で、AppTest の完了待ち（0.1秒単位）を含む値は wall_ms に記録する。
+利用者ごとにスレッドを1つ使うため、1つのワーカープロセスに N セッションが
+集中した状態を計測することになる。
+
+使用例:
+    python scripts/load_test.py --users 20 --duration 60
+    python scripts/load_test.py --users 50 --duration 300 --db data/loadtest.db --output loadtest.json
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+APP_PATH = os.path.join(PROJECT_ROOT, "app.py")
+
+# 実際の app.py を実行し、再実行スレッドの実行時間・クエリ数・DB時間をセッション状態に残す
+# （st.rerun() による再実行は同じスレッドで続けて行われるため、スレッド単位で合計する）
+SCRIPT_TEMPLATE = """
+import runpy
+import threading
+import time
+import streamlit as st
+from src.controllers.database import get_query_counters
+
+started = time.perf_counter()
+try:
+    runpy.run_path({app_path!r}, run_name="__main__")
+finally:
+    thread = threading.current_thread()
+    thread.load_test_seconds = getattr(thread, "load_test_seconds", 0.0) + time.perf_counter() - started
+    st.session_state["_load_test_run"] = dict(get_query_counters(), script_seconds=thread.load_test_seconds)
+"""
+
+def install_apptest_compat():
+    """Streamlit 1.28 の AppTest を複数スレッドから使うための調整
+
+    - st.container はブロックの種類を持たないため、要素ツリーの構築で assert に失敗する
+    - 実行ごとに Runtime._instance を設定・解除するため、並行実行中に他のスレッドから
+      "Runtime hasn't been created!" になる（共有のモックを代わりに返す）
+    - スクリプトスレッドの終了前に結果を読むため、SHUTDOWN イベントを取りこぼすことがある
+    """
+    from unittest.mock import MagicMock
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.testing.v1 import element_tree
+    from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+    def block_init(self, proto, root):
+        self.children = {}
+        self.proto = proto
+        self.type = (proto.WhichOneof("type") if proto else None) or "unknown"
+        self.root = root
+    element_tree.Block.__init__ = block_init
+
+    shared_runtime = MagicMock(spec=Runtime)
+    shared_runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared_runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: cls._instance or shared_runtime)
+    Runtime.exists = classmethod(lambda cls: True)
+
+    original_run = LocalScriptRunner.run
+    def run_and_join(self, *args, **kwargs):
+        tree = original_run(self, *args, **kwargs)
+        self.join()
+        return tree
+    LocalScriptRunner.run = run_and_join
+
+
+def rss_mb() -> float:
+    """現在のプロセスのRSS（MB）"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        # /proc が無い環境では最大RSSで代用する
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近傍順位法によるパーセンタイル"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+@dataclass
+class StepResult:
+    """1回の操作（再実行）の計測結果"""
+    user_id: int
+    page: str
+    action: str
+    started: float
+    latency_ms: float
+    wall_ms: float
+    db_ms: float
+    queries: int
+    error: Optional[str] = None
+
+
+# ---- 操作シナリオ ----
+
+def _widget(widgets, label: str):
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    return None
+
+
+def navigate(at, page: str):
+    at.sidebar.selectbox[0].select(page)
+
+
+def action_view_dashboard(at, rng):
+    navigate(at, "ダッシュボード")
+
+
+def action_record_study(at, rng):
+    content = _widget(at.text_area, "学習内容")
+    if content is None:
+        return False
+    content.input(f"負荷試験 {rng.randint(1, 1000)}")
+    _widget(at.number_input, "学習時間（分）").set_value(rng.choice([15, 30, 45, 60, 90]))
+    _widget(at.button, "記録する").click()
+
+
+def action_answer_quiz(at, rng):
+    radio = _widget(at.radio, "答えを選択してください:")
+    if radio is not None and radio.options:
+        radio.set_value(rng.choice(radio.options))
+    else:
+        text = _widget(at.text_input, "答えを入力してください:")
+        if text is None:
+            return False
+        text.input("負荷試験")
+    _widget(at.button, "回答する").click()
+
+
+def action_view_subjects(at, rng):
+    navigate(at, "教科学習")
+
+
+def action_select_subject(at, rng):
+    subject = _widget(at.selectbox, "科目選択")
+    if subject is None or not subject.options:
+        return False
+    subject.select(rng.choice(subject.options))
+
+
+def action_view_schedule(at, rng):
+    navigate(at, "スケジュール")
+
+
+def action_filter_schedule(at, rng):
+    _widget(at.selectbox, "期間").select(rng.choice(["今週", "今月", "3ヶ月", "すべて"]))
+
+
+def action_toggle_schedule(at, rng):
+    checkboxes = [c for c in at.main.checkbox if c.label == ""]
+    if not checkboxes:
+        return False
+    checkbox = rng.choice(checkboxes)
+    checkbox.set_value(not checkbox.value)
+
+
+def action_add_schedule(at, rng):
+    _widget(at.text_input, "タイトル").input(f"負荷試験の予定 {rng.randint(1, 1000)}")
+    _widget(at.button, "予定を追加").click()
+
+
+def action_view_progress(at, rng):
+    navigate(at, "進捗管理")
+
+
+def action_analyze_progress(at, rng):
+    _widget(at.selectbox, "分析期間").select(rng.choice(["過去1週間", "過去1ヶ月", "過去3ヶ月", "全期間"]))
+
+
+def action_view_settings(at, rng):
+    navigate(at, "設定")
+
+
+# (重み, ページ, [(操作名, 関数), ...]) 先頭の操作でページに移動する
+SCENARIOS: List[Tuple[int, str, List[Tuple[str, Callable]]]] = [
+    (4, "ダッシュボード", [("view", action_view_dashboard)]),
+    (3, "教科学習", [("view", action_view_subjects), ("select_subject", action_select_subject),
+                    ("record_study", action_record_study)]),
+    (3, "教科学習", [("view", action_view_subjects), ("answer_quiz", action_answer_quiz),
+                    ("answer_quiz", action_answer_quiz)]),
+    (2, "スケジュール", [("view", action_view_schedule), ("filter", action_filter_schedule),
+                      ("toggle", action_toggle_schedule)]),
+    (1, "スケジュール", [("view", action_view_schedule), ("add", action_add_schedule)]),
+    (2, "進捗管理", [("view", action_view_progress), ("analyze", action_analyze_progress)]),
+    (1, "設定", [("view", action_view_settings)]),
+]
+
+
+class SimulatedUser:
+    """1人の利用者（1セッション）"""
+
+    def __init__(self, user_id: int, results: List[StepResult], lock: threading.Lock,
+                 think_time: Tuple[float, float], seed: int, timeout: float):
+        self.user_id = user_id
+        self.results = results
+        self.lock = lock
+        self.think_time = think_time
+        self.rng = random.Random(seed)
+        self.timeout = timeout
+        self.at = None
+
+    def new_session(self):
+        """新しいセッションを開始"""
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_string(SCRIPT_TEMPLATE.format(app_path=APP_PATH), default_timeout=self.timeout)
+        self.at.session_state["current_user_id"] = self.user_id
+
+    def step(self, page: str, action: str, fn: Optional[Callable]):
+        """操作を1つ実行して計測"""
+        started = time.time()
+        try:
+            if fn is not None and fn(self.at, self.rng) is False:
+                return
+            t0 = time.perf_counter()
+            self.at.run()
+            wall = time.perf_counter() - t0
+            run = self.at.session_state["_load_test_run"] if "_load_test_run" in self.at.session_state else {}
+            error = "; ".join(e.message.splitlines()[0] for e in self.at.exception) or None
+            result = StepResult(self.user_id, page, action, started, run.get("script_seconds", wall) * 1000,
+                                wall * 1000, run.get("seconds", 0.0) * 1000, run.get("queries", 0), error)
+        except Exception as e:
+            result = StepResult(self.user_id, page, action, started, 0.0, 0.0, 0.0, 0, f"{type(e).__name__}: {e}")
+            # セッションが壊れた場合は作り直す
+            self.new_session()
+        with self.lock:
+            self.results.append(result)
+
+    def run(self, deadline: float):
+        """期限まで操作を繰り返す"""
+        self.new_session()
+        self.step("ダッシュボード", "open", None)
+        weights = [weight for weight, _, _ in SCENARIOS]
+        while time.time() < deadline:
+            _, page, actions = self.rng.choices(SCENARIOS, weights)[0]
+            for action, fn in actions:
+                if time.time() >= deadline:
+                    break
+                time.sleep(self.rng.uniform(*self.think_time))
+                self.step(page, action, fn)
+
+
+def seed_users(db, users: int, sessions_per_user: int = 60, seed: int = 0):
+    """負荷試験用の利用者・学習記録・クイズ・予定を投入（不足分のみ）"""
+    rng = random.Random(seed)
+    with db.get_connection() as conn:
+        existing = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        subject_ids = [row[0] for row in conn.execute("SELECT id FROM subjects")]
+        quiz_count = conn.execute("SELECT COUNT(*) FROM quizzes").fetchone()[0]
+
+    now = datetime.now()
+    with db.write_transaction() as conn:
+        if quiz_count == 0:
+            conn.executemany("""
+                INSERT INTO quizzes (subject_id, title, question, options, correct_answer, explanation, difficulty)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (subject_id, f"確認問題{n}", f"問題文{n}", json.dumps(["A", "B", "C", "D"]), "A", None, rng.randint(1, 5))
+                for subject_id in subject_ids for n in range(5)
+            ])
+
+        for user_id in range(existing + 1, users + 1):
+            conn.execute(
+                "INSERT INTO users (id, name, email, grade) VALUES (?, ?, ?, ?)",
+                (user_id, f"負荷試験{user_id}", f"load{user_id}@example.com", rng.randint(1, 3))
+            )
+            conn.executemany("""
+                INSERT INTO study_sessions
+                (user_id, subject_id, duration_minutes, content, satisfaction_score, study_date)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [
+                (user_id, rng.choice(subject_ids), rng.choice([15, 30, 45, 60, 90]), "負荷試験",
+                 rng.randint(1, 5), now - timedelta(days=rng.randint(0, 90), minutes=rng.randint(0, 600)))
+                for _ in range(sessions_per_user)
+            ])
+            conn.executemany("""
+                INSERT INTO schedules (user_id, title, scheduled_date, event_type)
+                VALUES (?, ?, ?, ?)
+            """, [
+                (user_id, f"予定{n}", now + timedelta(days=rng.randint(0, 30)), "homework")
+                for n in range(5)
+            ])
+
+
+def summarize(results: List[StepResult], rss_samples: List[Tuple[float, float]],
+              elapsed: float) -> Dict:
+    """計測結果を集計"""
+    ok = [r for r in results if r.error is None]
+    latencies = [r.latency_ms for r in ok]
+    by_action: Dict[str, List[float]] = {}
+    for r in ok:
+        by_action.setdefault(f"{r.page}/{r.action}", []).append(r.latency_ms)
+
+    return {
+        "reruns": len(results),
+        "errors": len(results) - len(ok),
+        "elapsed_seconds": elapsed,
+        "reruns_per_second": len(results) / elapsed if elapsed else 0.0,
+        "latency_ms": {f"p{p}": percentile(latencies, p) for p in (50, 95, 99)},
+        "db_ms": {f"p{p}": percentile([r.db_ms for r in ok], p) for p in (50, 95, 99)},
+        "queries_per_rerun": {
+            "mean": sum(r.queries for r in ok) / len(ok) if ok else 0.0,
+            "p95": percentile([r.queries for r in ok], 95),
+        },
+        "by_action": {
+            name: {"count": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95)}
+            for name, values in sorted(by_action.items())
+        },
+        "rss_mb": {
+            "start": rss_samples[0][1] if rss_samples else 0.0,
+            "peak": max(mb for _, mb in rss_samples) if rss_samples else 0.0,
+            "end": rss_samples[-1][1] if rss_samples else 0.0,
+            "samples": rss_samples,
+        },
+        "error_messages": sorted({r.error for r in results if r.error})[:20],
+    }
+
+
+def print_report(summary: Dict):
+    """集計結果を表示"""
+    print(f"\n📊 再実行 {summary['reruns']} 回（エラー {summary['errors']} 回）"
+          f" / {summary['elapsed_seconds']:.0f}秒 = {summary['reruns_per_second']:.1f} 回/秒")
+    latency, db_ms = summary["latency_ms"], summary["db_ms"]
+    print(f"⏱️ 応答時間 p50 {latency['p50']:.0f}ms / p95 {latency['p95']:.0f}ms / p99 {latency['p99']:.0f}ms")
+    print(f"🗄️ DB時間   p50 {db_ms['p50']:.1f}ms / p95 {db_ms['p95']:.1f}ms / p99 {db_ms['p99']:.1f}ms")
+    print(f"🔍 クエリ数 平均 {summary['queries_per_rerun']['mean']:.1f} / p95 {summary['queries_per_rerun']['p95']}")
+    rss = summary["rss_mb"]
+    print(f"💾 RSS 開始 {rss['start']:.0f}MB / 最大 {rss['peak']:.0f}MB / 終了 {rss['end']:.0f}MB")
+    print("\n操作別の応答時間:")
+    for name, stats in summary["by_action"].items():
+        print(f"  {name:<30} {stats['count']:>5}回  p50 {stats['p50']:>6.0f}ms  p95 {stats['p95']:>6.0f}ms")
+    for message in summary["error_messages"]:
+        print(f"⚠️ {message}")
+
+
+def main():
+    """負荷試験を実行"""
+    parser = argparse.ArgumentParser(description="Streamlitページのヘッドレス負荷試験")
+    parser.add_argument("--db", default="data/loadtest.db", help="負荷試験用データベースファイル")
+    parser.add_argument("--users", type=int, default=10, help="同時利用者数")
+    parser.add_argument("--duration", type=float, default=60, help="試験時間（秒）")
+    parser.add_argument("--ramp-up", type=float, default=5, help="全利用者が開始するまでの時間（秒）")
+    parser.add_argument("--think-min", type=float, default=0.5, help="操作間の待ち時間の最小値（秒）")
+    parser.add_argument("--think-max", type=float, default=2.0, help="操作間の待ち時間の最大値（秒）")
+    parser.add_argument("--timeout", type=float, default=60, help="1回の再実行のタイムアウト（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    parser.add_argument("--no-seed-data", action="store_true", help="テストデータを投入しない")
+    parser.add_argument("--output", help="集計結果と全計測値を保存するJSONファイル")
+    args = parser.parse_args()
+
+    os.environ["READY_TO_STUDY_DB"] = args.db
+    # 計測用プロセスでは監視用サイドカーを起動しない
+    os.environ.setdefault("METRICS_PORT", "off")
+    from src.controllers.database import init_database
+    db = init_database()
+    if not args.no_seed_data:
+        print(f"🌱 {args.db} にテストデータを投入しています...")
+        seed_users(db, args.users, seed=args.seed)
+
+    install_apptest_compat()
+
+    results: List[StepResult] = []
+    lock = threading.Lock()
+    rss_samples: List[Tuple[float, float]] = []
+    stop = threading.Event()
+    started = time.time()
+
+    def sample_rss():
+        while not stop.is_set():
+            rss_samples.append((round(time.time() - started, 1), rss_mb()))
+            stop.wait(1.0)
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+
+    print(f"🚀 {args.users}人で {args.duration:.0f}秒間の負荷試験を開始します...")
+    deadline = started + args.duration
+    threads = []
+    for i in range(args.users):
+        user = SimulatedUser(i + 1, results, lock, (args.think_min, args.think_max),
+                             args.seed * 100003 + i, args.timeout)
+        thread = threading.Thread(target=user.run, args=(deadline,), daemon=True)
+        thread.start()
+        threads.append(thread)
+        time.sleep(args.ramp_up / max(args.users, 1))
+
+    for thread in threads:
+        thread.join()
+    stop.set()
+    sampler.join()
+
+    summary = summarize(results, rss_samples, time.time() - started)
+    print_report(summary)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "summary": summary,
+                       "steps": [asdict(r) for r in results]}, f, ensure_ascii=False, indent=2)
+        print(f"\n📁 結果を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+JSON API のトークン管理スクリプト
+
+利用者ごとのアクセストークンを発行・無効化する。トークンの平文は発行時にだけ表示される。
+
+使用例:
+    python scripts/manage_api_tokens.py issue 1 --label "スマートフォン"
+    python scripts/manage_api_tokens.py revoke 1
+    python scripts/manage_api_tokens.py list
+"""
+
+import argparse
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.api_tokens import issue_token, list_tokens, revoke_tokens
+from src.controllers.database import DatabaseController
+
+def main():
+    """APIトークンを管理"""
+    parser = argparse.ArgumentParser(description="JSON API のトークン管理")
+    parser.add_argument("--db", default=os.environ.get("READY_TO_STUDY_DB", "data/study_app.db"),
+                        help="データベースファイル（シャーディング時は既定のシャード）")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    issue = commands.add_parser("issue", help="利用者のトークンを発行")
+    issue.add_argument("user_id", type=int)
+    issue.add_argument("--label", help="端末などの識別用の名前")
+
+    revoke = commands.add_parser("revoke", help="利用者のトークンをすべて無効化")
+    revoke.add_argument("user_id", type=int)
+
+    commands.add_parser("list", help="発行済みのトークンの一覧")
+    args = parser.parse_args()
+
+    db = DatabaseController(args.db)
+    try:
+        if args.command == "issue":
+            token = issue_token(db, args.user_id, args.label)
+            print(f"✅ ユーザー {args.user_id} のトークンを発行しました（この表示の後は確認できません）")
+            print(token)
+        elif args.command == "revoke":
+            print(f"✅ {revoke_tokens(db, args.user_id)} 件のトークンを無効にしました")
+        else:
+            for token in list_tokens(db):
+                print(f"{token['user_id']}\t{token['hash']}…\t{token['created_at']}\t{token['label'] or ''}")
+    finally:
+        db.writer.close()
+        db.analytics.close()
+
+if __name__ == "__main__":
+    main()
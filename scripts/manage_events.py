@@ -0,0 +1,72 @@
+"""
+イベントストア管理スクリプト
+
+送信待ちの学習イベントのセグメントへの追記、射影（集計）の圧縮、
+ユーザーの状態の再構築（スナップショット + 以降のイベントの再生）と状況の確認を行う。
+Streamlitのワーカー番号 0 が定期的に実行するが、API だけを運用する場合は cron などから実行する。
+
+使用例:
+    python scripts/manage_events.py flush
+    python scripts/manage_events.py compact
+    python scripts/manage_events.py replay study_rollup 1
+    python scripts/manage_events.py replay quiz_boxes 1 --until "2026-04-01 00:00:00"
+    python scripts/manage_events.py status
+"""
+
+import argparse
+import json
+import sys
+import os
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import DatabaseController
+from src.controllers.events import PROJECTIONS, EventStore, StudyRollup
+
+def main():
+    """イベントストアを管理"""
+    parser = argparse.ArgumentParser(description="学習イベントストアの管理")
+    parser.add_argument("--db", default=os.environ.get("READY_TO_STUDY_DB", "data/study_app.db"),
+                        help="データベースファイル")
+    parser.add_argument("--directory", default=None, help="セグメントの保存先（既定はDBと同じ場所の events/）")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("flush", help="送信待ちのイベントをセグメントに追記")
+
+    compact = commands.add_parser("compact", help="射影のスナップショットを更新")
+    compact.add_argument("--projection", dest="projections", action="append", choices=list(PROJECTIONS),
+                         help="対象の射影（複数指定可、省略時はすべて）")
+
+    replay = commands.add_parser("replay", help="ユーザーの状態を再構築して表示")
+    replay.add_argument("projection", choices=list(PROJECTIONS))
+    replay.add_argument("user_id", type=int)
+    replay.add_argument("--until", type=datetime.fromisoformat, help="この時点（UTC）の状態を最初から再生")
+
+    commands.add_parser("status", help="セグメントと送信待ちの状況")
+    args = parser.parse_args()
+
+    db = DatabaseController(args.db)
+    store = EventStore(db, args.directory)
+    try:
+        if args.command == "flush":
+            print(f"✅ {store.flush()} 件のイベントを追記しました")
+        elif args.command == "compact":
+            for name in args.projections or PROJECTIONS:
+                result = store.compact(PROJECTIONS[name])
+                print(f"✅ {name}: {result['events']} 件のイベントで {result['users']} 人のスナップショットを更新 (seq {result['seq']})")
+        elif args.command == "replay":
+            projection = PROJECTIONS[args.projection]
+            state = store.replay(projection, args.user_id, args.until)
+            if isinstance(projection, StudyRollup):
+                state = dict(state, streaks=StudyRollup.streaks(state))
+            print(json.dumps(state, ensure_ascii=False, indent=2))
+        elif args.command == "status":
+            stats = store.stats()
+            print(f"{store.directory}: セグメント {stats['segments']} 個 ({stats['bytes'] / 1024 / 1024:.1f} MB)")
+            print(f"  最終 seq {stats['last_seq']:,} / 送信待ち {stats['pending']:,} 件")
+    finally:
+        db.writer.close()
+        db.analytics.close()
+
+if __name__ == "__main__":
+    main()
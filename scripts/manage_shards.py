@@ -0,0 +1,103 @@
+"""
+シャード管理スクリプト
+
+ディレクトリDBへのシャード・テナントの登録、ユーザーの割り当て、
+テナントのシャード間の移動（再配置）と、全シャードの状況の確認を行う。
+アプリは環境変数 READY_TO_STUDY_DIRECTORY に同じディレクトリDBを指定して起動する。
+
+既存のユーザーを新しいシャードへ移すときは、データのあるシャードにテナントを登録して
+ユーザーを割り当ててから move で移動する（割り当てだけではデータは移動しない）。
+
+使用例:
+    python scripts/manage_shards.py add-shard shard2 data/shards/shard2.db
+    python scripts/manage_shards.py add-tenant school-a --shard primary
+    python scripts/manage_shards.py assign school-a 101 102 103
+    python scripts/manage_shards.py move school-a shard2
+    python scripts/manage_shards.py add-tenant range-1 --shard shard2 --users 1000001-2000000
+    python scripts/manage_shards.py status
+"""
+
+import argparse
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.sharding import create_router
+
+def parse_range(value: str):
+    """"開始-終了" 形式の user_id の範囲"""
+    first, _, last = value.partition("-")
+    try:
+        return int(first), int(last)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"範囲は 開始-終了 の形式で指定してください: {value}")
+
+def main():
+    """シャードとテナントを管理"""
+    parser = argparse.ArgumentParser(description="テナント単位のシャードの管理")
+    parser.add_argument("--directory", default=os.environ.get("READY_TO_STUDY_DIRECTORY", "data/directory.db"),
+                        help="ディレクトリDB")
+    parser.add_argument("--db", default=os.environ.get("READY_TO_STUDY_DB", "data/study_app.db"),
+                        help="既定のシャード（ディレクトリが空の場合に登録）")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add_shard = commands.add_parser("add-shard", help="シャードを作成して登録")
+    add_shard.add_argument("name")
+    add_shard.add_argument("path")
+
+    add_tenant = commands.add_parser("add-tenant", help="テナントを登録")
+    add_tenant.add_argument("tenant")
+    add_tenant.add_argument("--shard", required=True, help="テナントを置くシャード")
+    add_tenant.add_argument("--users", type=parse_range, help="テナントに属する user_id の範囲（開始-終了）")
+
+    assign = commands.add_parser("assign", help="ユーザーをテナントに割り当てる")
+    assign.add_argument("tenant")
+    assign.add_argument("user_ids", type=int, nargs="+")
+
+    move = commands.add_parser("move", help="テナントを別のシャードへ移動")
+    move.add_argument("tenant")
+    move.add_argument("shard", help="移動先のシャード")
+    move.add_argument("--grace", type=float, default=None,
+                      help="ルーティングの切り替えを各プロセスに行き渡らせる待ち時間（秒）")
+
+    commands.add_parser("status", help="全シャードの件数と書き込み状況")
+    args = parser.parse_args()
+
+    router = create_router(args.directory, args.db)
+    directory = router.directory
+    try:
+        if args.command == "add-shard":
+            shard = router.create_shard(args.name, args.path)
+            print(f"✅ シャード {shard.name} (id={shard.id}) を作成しました: {shard.path}")
+        elif args.command == "add-tenant":
+            first, last = args.users if args.users else (None, None)
+            directory.add_tenant(args.tenant, args.shard, first, last)
+            print(f"✅ テナント {args.tenant} を {args.shard} に登録しました")
+        elif args.command == "assign":
+            directory.assign_users(args.tenant, args.user_ids)
+            print(f"✅ {len(args.user_ids)} 人を {args.tenant} に割り当てました")
+            print("   データは移動しないため、テナントのシャードと異なる場合は move で移動してください")
+        elif args.command == "move":
+            print(f"🚚 テナント {args.tenant} を {args.shard} へ移動しています（移動中は書き込みできません）...")
+            moved = router.move_tenant(args.tenant, args.shard, args.grace)
+            if not moved:
+                print("テナントはすでに移動先のシャードにあります")
+            for table, count in moved.items():
+                print(f"  - {table}: {count} 件")
+            print("✅ 移動が完了しました")
+        elif args.command == "status":
+            routes = router.routes()
+            for row in router.overview():
+                print(f"{row['shard']}: {row['path']} ({row['size_mb']} MB)")
+                print(f"  テナント: {', '.join(row['tenants']) or '-'}")
+                print(f"  users {row['users']:,} / study_sessions {row['study_sessions']:,} / "
+                      f"quiz_results {row['quiz_results']:,} / schedules {row['schedules']:,}")
+            print(f"割り当て済みユーザー: {len(routes.members):,} 人 (epoch {routes.epoch})")
+    except (KeyError, ValueError, LookupError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        router.close()
+
+if __name__ == "__main__":
+    main()
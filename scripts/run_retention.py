@@ -0,0 +1,70 @@
+"""
+保存期間管理スクリプト
+
+保存期間を過ぎた学習記録・クイズ結果をアーカイブへ移動し、同期用の変更履歴のうち
+新しい変更のある古い履歴と古い冪等キーを削除してから、空き領域を回収する。
+cron などから定期的に実行することを想定している。
+
+使用例:
+    python scripts/run_retention.py --months 12
+    python scripts/run_retention.py --enable-incremental-vacuum  # 既存DBで一度だけ実行
+"""
+
+import argparse
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import DatabaseController
+from src.controllers.retention import (
+    RetentionEngine, retention_cutoff, retention_months_from_env, ARCHIVE_TABLES
+)
+from src.controllers.sync import compact_change_log
+
+def main():
+    """保存期間を過ぎたデータをアーカイブ"""
+    parser = argparse.ArgumentParser(description="古いデータのアーカイブとバキューム")
+    parser.add_argument("--db", default="data/study_app.db", help="データベースファイル")
+    parser.add_argument("--archive-dir", help="アーカイブの保存先（既定は環境変数 ARCHIVE_DIR またはDBと同じ場所の archive/）")
+    parser.add_argument("--months", type=int, help="保存期間（月、既定は環境変数 RETENTION_MONTHS または12）")
+    parser.add_argument("--batch-size", type=int, default=500, help="1トランザクションで移動する行数")
+    parser.add_argument("--upload-key-days", type=int, default=30, help="同期の冪等キーを保存する日数")
+    parser.add_argument("--pause", type=float, default=0.05, help="バッチ間の待ち時間（秒）")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="auto_vacuum を INCREMENTAL に切り替える（全体のVACUUMを1回実行）")
+    args = parser.parse_args()
+    if args.months is None:
+        try:
+            args.months = retention_months_from_env()
+        except ValueError as e:
+            parser.error(str(e))
+    
+    db = DatabaseController(args.db)
+    engine = RetentionEngine(db, args.archive_dir, args.batch_size, args.pause)
+    
+    if args.enable_incremental_vacuum:
+        print("auto_vacuum を INCREMENTAL に切り替えています（VACUUM実行中）...")
+        engine.enable_incremental_vacuum()
+        print("✅ 切り替えが完了しました")
+        return
+    
+    cutoff = retention_cutoff(args.months)
+    print(f"🗄️ {cutoff:%Y-%m-%d} より前のデータをアーカイブしています...")
+    for table in ARCHIVE_TABLES:
+        moved = engine.archive(table, cutoff)
+        print(f"  - {table}: {moved} 件")
+    
+    removed = compact_change_log(db, args.upload_key_days, args.batch_size)
+    print(f"🔁 同期用の変更履歴 {removed['change_log']} 件・冪等キー {removed['sync_uploads']} 件を削除しました")
+    
+    if engine.auto_vacuum_mode() != 2:
+        print("⚠️ auto_vacuum が INCREMENTAL ではないため空き領域は回収されません")
+        print("   --enable-incremental-vacuum をメンテナンス時間帯に一度実行してください")
+    else:
+        pages = engine.incremental_vacuum()
+        print(f"🧹 {pages} ページの空き領域を回収しました")
+    
+    print("✅ 保存期間管理が完了しました")
+
+if __name__ == "__main__":
+    main()
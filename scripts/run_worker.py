@@ -0,0 +1,41 @@
+"""
+Streamlitワーカー起動スクリプト
+
+app.py はブラウザのセッションが接続するまで実行されないため、先にデータベースと
+監視用サイドカー（/healthz・/readyz・/metrics）を起動してから `streamlit run app.py` を実行する。
+起動直後から死活監視・メトリクス取得に応答できる。ダッシュボードの事前集計
+（ワーカー番号 0 のみ、DASHBOARD_PRECOMPUTE で変更可）とイベントストアへの追記
+（ワーカー番号 0 のみ）もここで開始する。
+引数はそのまま streamlit run に渡す。
+
+使用例:
+    python scripts/run_worker.py --server.port 8501 --server.headless true
+    METRICS_PORT=9501 python scripts/run_worker.py --server.address 0.0.0.0
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streamlit.web import cli
+
+from src.controllers.database import init_database
+from src.controllers.sidecar import start_sidecar
+from src.controllers.memory import start_memory_monitor
+from src.controllers.snapshots import start_snapshot_scheduler
+from src.controllers.events import start_event_pump
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+def main():
+    """サイドカーを起動してからStreamlitを実行"""
+    init_database()
+    start_sidecar()
+    start_memory_monitor()
+    start_snapshot_scheduler()
+    start_event_pump()
+    sys.argv = ["streamlit", "run", APP_PATH, *sys.argv[1:]]
+    sys.exit(cli.main())
+
+if __name__ == "__main__":
+    main()
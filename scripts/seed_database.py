@@ -0,0 +1,59 @@
+"""
+テストデータ投入スクリプト
+
+負荷試験・ベンチマーク用に、実際の利用に近い分布の大規模データを一括投入する。
+本番のデータベースには実行しないこと。
+
+使用例:
+    python scripts/seed_database.py --db data/bench.db
+    python scripts/seed_database.py --db data/bench_small.db --users 1000 --sessions 500000 --quiz-results 100000
+"""
+
+import argparse
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import DatabaseController
+from src.controllers.seeding import SeedConfig, seed_database
+
+def main():
+    """テストデータを投入"""
+    defaults = SeedConfig()
+    parser = argparse.ArgumentParser(description="大規模テストデータの一括投入")
+    parser.add_argument("--db", default="data/bench.db", help="投入先のデータベースファイル")
+    parser.add_argument("--users", type=int, default=defaults.users, help="利用者数")
+    parser.add_argument("--sessions", type=int, default=defaults.study_sessions, help="学習記録の件数")
+    parser.add_argument("--quiz-results", type=int, default=defaults.quiz_results, help="クイズ結果の件数")
+    parser.add_argument("--quizzes-per-subject", type=int, default=defaults.quizzes_per_subject, help="科目ごとのクイズ数")
+    parser.add_argument("--schedules-per-user", type=int, default=defaults.schedules_per_user, help="利用者ごとの予定数")
+    parser.add_argument("--days", type=int, default=defaults.days, help="学習記録を生成する日数（今日から遡る）")
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="乱数シード")
+    args = parser.parse_args()
+    
+    if os.path.abspath(args.db) == os.path.abspath("data/study_app.db"):
+        print("❌ 本番のデータベースには投入できません。--db で別のファイルを指定してください")
+        sys.exit(1)
+    
+    config = SeedConfig(
+        users=args.users,
+        study_sessions=args.sessions,
+        quiz_results=args.quiz_results,
+        quizzes_per_subject=args.quizzes_per_subject,
+        schedules_per_user=args.schedules_per_user,
+        days=args.days,
+        seed=args.seed,
+    )
+    
+    def progress(table, done, total):
+        print(f"\r  {table}: {done:,} / {total:,}", end="" if done < total else "\n", flush=True)
+    
+    print(f"🌱 {args.db} にテストデータを投入しています...")
+    db = DatabaseController(args.db)
+    result = seed_database(db, config, progress)
+    
+    print(f"✅ 投入が完了しました（{result['seconds']:.0f}秒）")
+    print(f"📁 ファイルサイズ: {os.path.getsize(args.db) / 1024 / 1024:.0f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+マルチプロセス配信スクリプト
+
+Streamlitワーカーを連続したポートで複数起動して監視する。
+nginx の upstream 設定もワーカー構成に合わせて生成できる。
+
+使用例:
+    python scripts/supervisor.py run --workers 4
+    python scripts/supervisor.py nginx-upstream --workers 4 > /etc/nginx/ready-to-study-upstream.conf
+"""
+
+import argparse
+import logging
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.supervisor import SupervisorConfig, WorkerSupervisor, render_nginx_upstream
+
+def main():
+    """ワーカーの起動・監視、またはnginx設定の生成"""
+    parser = argparse.ArgumentParser(description="Streamlitワーカーの監視")
+    parser.add_argument("command", choices=["run", "nginx-upstream"], help="実行するコマンド")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("STREAMLIT_WORKERS", os.cpu_count() or 2)),
+                        help="ワーカー数")
+    parser.add_argument("--base-port", type=int, default=int(os.environ.get("SERVER_PORT", "8501")),
+                        help="最初のワーカーのポート（以降連番）")
+    parser.add_argument("--metrics-base-port", type=int, default=int(os.environ.get("METRICS_BASE_PORT", "9501")),
+                        help="最初のワーカーの /metrics ポート（以降連番）")
+    parser.add_argument("--address", default="127.0.0.1", help="ワーカーの待ち受けアドレス")
+    parser.add_argument("--check-interval", type=float, default=10.0, help="ヘルスチェック間隔（秒）")
+    args = parser.parse_args()
+    
+    config = SupervisorConfig(
+        workers=args.workers,
+        base_port=args.base_port,
+        metrics_base_port=args.metrics_base_port,
+        address=args.address,
+        check_interval=args.check_interval,
+    )
+    
+    if args.command == "nginx-upstream":
+        print(render_nginx_upstream(config))
+        return
+    
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    WorkerSupervisor(config).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,487 @@
+"""
+JSON API サーバー
+
+Streamlit以外のクライアント（モバイルアプリ・学校のLMS連携など）向けに、
+ビューと同じクエリ層を asyncio (tornado) 上の HTTP API として公開する。
+ブロッキングなDB処理は上限付きのスレッドプールで実行し、GETには
+ユーザーごとのデータバージョンから作る ETag で条件付きリクエストに応答する。
+/users/<id>/... は利用者ごとのトークン（api_tokens）で認証し、トークンの利用者と
+パスの利用者IDが一致しない場合は 403 を返す。
+"""
+
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import tornado.web
+from tornado.ioloop import IOLoop
+
+from src.controllers import database, queries
+from src.controllers.api_tokens import find_token_user
+from src.controllers.database import get_database, user_scope
+from src.controllers.recurrence import iter_schedule_items, set_occurrence_state
+from src.controllers.sharding import TenantMovingError
+from src.controllers.sidecar import PROMETHEUS_CONTENT_TYPE, health_status, readiness_status, render_metrics
+from src.controllers.sync import MAX_SYNC_BATCH, find_upload, pull_changes, record_upload
+
+API_PREFIX = "/api/v1"
+MAX_PAGE_SIZE = 200
+MAX_BATCH_OPERATIONS = 500
+MAX_IDEMPOTENCY_KEY_LENGTH = 128
+
+
+def get_version(conn, scope: str) -> int:
+    """スコープのデータバージョンを取得"""
+    row = conn.execute("SELECT version FROM data_versions WHERE scope = ?", (scope,)).fetchone()
+    return row[0] if row else 0
+
+
+class DatabaseExecutor:
+    """ブロッキングなDB処理を実行する上限付きスレッドプール
+
+    スレッドごとに接続を（シャーディング有効時はシャードごとに）保持して再利用する。
+    待ち行列が max_pending を超えた場合は 503 を返し、イベントループ側に
+    リクエストが溜まり続けないようにする。
+    """
+
+    def __init__(self, db, max_workers: int = 8, max_pending: int = 256):
+        self.db = db
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="api-db")
+        self._local = threading.local()
+
+    def database(self, user_id: Optional[int] = None):
+        """ユーザーのデータを持つデータベース（シャーディング無効時は常に self.db）"""
+        if user_id is not None and database.shard_router is not None:
+            return get_database(user_id)
+        return self.db
+
+    def _connection(self, db):
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        conn = connections.get(db.db_path)
+        if conn is None:
+            conn = connections[db.db_path] = db.get_connection()
+        return conn
+
+    def _call(self, fn: Callable, args: Tuple, user_id: Optional[int]):
+        return fn(self._connection(self.database(user_id)), *args)
+
+    def _write(self, fn: Callable, args: Tuple, user_id: Optional[int]):
+        try:
+            with self.database(user_id).write_transaction() as conn:
+                return fn(conn, *args)
+        except TenantMovingError as e:
+            raise tornado.web.HTTPError(503, reason=str(e))
+
+    async def _submit(self, target: Callable, fn: Callable, args: Tuple, user_id: Optional[int]) -> Any:
+        if self.pending >= self.max_pending:
+            raise tornado.web.HTTPError(503, reason="Too many pending requests")
+        self.pending += 1
+        try:
+            return await IOLoop.current().run_in_executor(self._executor, target, fn, args, user_id)
+        finally:
+            self.pending -= 1
+
+    async def run(self, fn: Callable, *args, user_id: Optional[int] = None) -> Any:
+        """fn(conn, *args) を読み取り用接続でスレッドプールで実行"""
+        return await self._submit(self._call, fn, args, user_id)
+
+    async def run_write(self, fn: Callable, *args, user_id: Optional[int] = None) -> Any:
+        """fn(conn, *args) を書き込みトランザクション内で実行"""
+        return await self._submit(self._write, fn, args, user_id)
+
+
+class ResponseCache:
+    """ETagごとのレスポンス本文のLRUキャッシュ"""
+
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+
+    def get(self, etag: str) -> Optional[bytes]:
+        body = self._entries.get(etag)
+        if body is not None:
+            self._entries.move_to_end(etag)
+        return body
+
+    def put(self, etag: str, body: bytes):
+        self._entries[etag] = body
+        self._entries.move_to_end(etag)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    raise TypeError(f"JSONに変換できない値です: {value!r}")
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    if value in (None, ""):
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise tornado.web.HTTPError(400, reason=f"Invalid datetime: {value}")
+
+
+class APIHandler(tornado.web.RequestHandler):
+    """API共通ハンドラー"""
+
+    def initialize(self, executor: DatabaseExecutor, responses: ResponseCache):
+        self.executor = executor
+        self.responses = responses
+
+    # パスの最初の引数が利用者IDのハンドラー（トークンの利用者と一致する必要がある）
+    user_route = True
+    # --insecure でもトークンを必須にするハンドラー
+    always_authenticate = False
+
+    async def prepare(self):
+        """Bearer トークンから利用者を引き、パスの利用者IDと照合（--insecure 時は照合しない）"""
+        self.token_user_id = None
+        if self.settings.get("insecure") and not self.always_authenticate:
+            return
+        scheme, _, token = self.request.headers.get("Authorization", "").partition(" ")
+        if scheme != "Bearer" or not token:
+            raise tornado.web.HTTPError(401, reason="Bearer token required")
+        self.token_user_id = await self.executor.run(find_token_user, token)
+        if self.token_user_id is None:
+            raise tornado.web.HTTPError(401, reason="Invalid token")
+        if self.user_route and int(self.path_args[0]) != self.token_user_id:
+            raise tornado.web.HTTPError(403, reason="Token is not valid for this user")
+
+    def write_json(self, data: Any, status: int = 200):
+        """JSONレスポンスを書き込む"""
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.finish(json.dumps(data, ensure_ascii=False, default=_json_default))
+
+    def write_error(self, status_code: int, **kwargs):
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.finish(json.dumps({"error": self._reason}, ensure_ascii=False))
+
+    def json_body(self) -> Dict:
+        """リクエスト本文のJSONを取得"""
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="Invalid JSON body")
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, reason="JSON body must be an object")
+        return body
+
+    def int_argument(self, name: str, default: Optional[int] = None,
+                     maximum: Optional[int] = None) -> Optional[int]:
+        """整数のクエリパラメータを取得"""
+        value = self.get_query_argument(name, None)
+        if value is None:
+            return default
+        try:
+            number = int(value)
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason=f"Invalid integer: {name}")
+        return min(number, maximum) if maximum is not None else number
+
+    async def write_versioned(self, scope: str, loader: Callable, *args, user_id: Optional[int] = None):
+        """データバージョンに基づく ETag 付きでGETに応答
+
+        バージョンの取得だけを先に行い、If-None-Match が一致すれば 304、
+        同じ ETag の本文がキャッシュにあればそれを返し、重いクエリは実行しない。
+        時刻に依存する集計があるため ETag には日付も含める。
+        """
+        version = await self.executor.run(get_version, scope, user_id=user_id)
+        uri_hash = zlib.crc32(self.request.uri.encode("utf-8"))
+        etag = f'W/"{scope}-{version}-{datetime.now():%Y%m%d}-{uri_hash:08x}"'
+        self.set_header("Etag", etag)
+        self.set_header("Cache-Control", "private, no-cache")
+
+        if etag in self.request.headers.get("If-None-Match", ""):
+            self.set_status(304)
+            self.finish()
+            return
+
+        body = self.responses.get(etag)
+        if body is None:
+            data = await self.executor.run(loader, *args, user_id=user_id)
+            body = json.dumps(data, ensure_ascii=False, default=_json_default).encode("utf-8")
+            self.responses.put(etag, body)
+
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.finish(body)
+
+    async def run_write(self, fn: Callable, user_id: int, *args) -> Any:
+        """ユーザーのデータへの書き込みをトランザクション内で実行してコミット"""
+        return await self.executor.run_write(fn, user_id, *args, user_id=user_id)
+
+
+class MetricsHandler(APIHandler):
+    """概要メトリクス"""
+
+    async def get(self, user_id: str):
+        await self.write_versioned(user_scope(int(user_id)), queries.get_overview_metrics, int(user_id),
+                                   user_id=int(user_id))
+
+
+class SessionsHandler(APIHandler):
+    """学習セッション"""
+
+    async def get(self, user_id: str):
+        limit = self.int_argument("limit", 50, MAX_PAGE_SIZE)
+        before_id = self.int_argument("before_id")
+        subject_id = self.int_argument("subject_id")
+        await self.write_versioned(
+            user_scope(int(user_id)), queries.list_study_sessions,
+            int(user_id), limit, before_id, subject_id, user_id=int(user_id)
+        )
+
+    async def post(self, user_id: str):
+        operation = dict(self.json_body(), op="create_session")
+        result = await self.run_write(apply_operations, int(user_id), [operation])
+        self.write_json(result[0], status=201)
+
+
+class QuizzesHandler(APIHandler):
+    """科目のクイズ（有効なトークンであれば利用者を問わない）"""
+
+    user_route = False
+
+    async def get(self, subject_id: str):
+        limit = self.int_argument("limit", 50, MAX_PAGE_SIZE)
+        offset = self.int_argument("offset", 0)
+        await self.write_versioned("quizzes", queries.list_quizzes, int(subject_id), limit, offset)
+
+
+class QuizResultsHandler(APIHandler):
+    """クイズ結果"""
+
+    async def post(self, user_id: str):
+        operation = dict(self.json_body(), op="create_quiz_result")
+        result = await self.run_write(apply_operations, int(user_id), [operation])
+        self.write_json(result[0], status=201)
+
+
+class SchedulesHandler(APIHandler):
+    """予定（繰り返し予定は期間内の分を展開）"""
+
+    async def get(self, user_id: str):
+        start = _parse_datetime(self.get_query_argument("start", None)) or datetime.now()
+        end = _parse_datetime(self.get_query_argument("end", None)) or datetime(start.year + 1, 1, 1)
+        event_type = self.get_query_argument("event_type", None)
+        limit = self.int_argument("limit", 100, MAX_PAGE_SIZE)
+        await self.write_versioned(
+            user_scope(int(user_id)), list_schedules, int(user_id), start, end, event_type, limit,
+            user_id=int(user_id)
+        )
+
+
+class BatchHandler(APIHandler):
+    """複数の書き込みを1トランザクションで適用"""
+
+    async def post(self, user_id: str):
+        operations = self.json_body().get("operations")
+        if not isinstance(operations, list) or not operations:
+            raise tornado.web.HTTPError(400, reason="operations must be a non-empty list")
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            raise tornado.web.HTTPError(413, reason=f"At most {MAX_BATCH_OPERATIONS} operations per batch")
+        results = await self.run_write(apply_operations, int(user_id), operations)
+        self.write_json({"results": results})
+
+
+class SyncHandler(APIHandler):
+    """オフライン端末との差分同期
+
+    GET はカーソル（前回受け取った cursor）以降の変更を返す。変更が無ければ
+    ETag により 304 になる。POST は冪等キー（key）付きの操作を1トランザクションで適用する。
+    端末は学校のネットワークなどループバック以外から接続するため、--insecure でも
+    トークンを必須とし、変更履歴・冪等キーはトークンの利用者の分だけを扱う。
+    """
+
+    always_authenticate = True
+
+    async def get(self, user_id: str):
+        user_id = self.token_user_id
+        cursor = self.int_argument("cursor", 0)
+        limit = self.int_argument("limit", MAX_SYNC_BATCH, MAX_SYNC_BATCH)
+        await self.write_versioned(
+            user_scope(user_id), pull_changes, user_id, cursor, limit, user_id=user_id
+        )
+
+    async def post(self, user_id: str):
+        user_id = self.token_user_id
+        operations = self.json_body().get("operations")
+        if not isinstance(operations, list) or not operations:
+            raise tornado.web.HTTPError(400, reason="operations must be a non-empty list")
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            raise tornado.web.HTTPError(413, reason=f"At most {MAX_BATCH_OPERATIONS} operations per batch")
+        results = await self.run_write(apply_uploads, user_id, operations)
+        self.write_json({"results": results})
+
+
+class PrometheusHandler(tornado.web.RequestHandler):
+    """プロセスのメトリクス（Prometheus形式、API_TOKEN を設定した場合は監視用のトークンが必要）
+
+    --processes で複数プロセスを起動した場合は、応答したプロセスの値のみを返す。
+    """
+
+    def prepare(self):
+        token = self.settings.get("api_token")
+        if token and self.request.headers.get("Authorization") != f"Bearer {token}":
+            raise tornado.web.HTTPError(401)
+
+    def get(self):
+        self.set_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.finish(render_metrics())
+
+
+class HealthHandler(tornado.web.RequestHandler):
+    """プロセスの生存確認（認証不要・DBに触れない）"""
+
+    def get(self):
+        self.finish(health_status())
+
+
+class ReadinessHandler(tornado.web.RequestHandler):
+    """DBの読み取り可否と負荷の状況（認証不要）"""
+
+    def initialize(self, executor: DatabaseExecutor):
+        self.executor = executor
+
+    def get(self):
+        ready, status = readiness_status(self.executor.db)
+        status["pending"] = self.executor.pending
+        self.set_status(200 if ready else 503)
+        self.finish(status)
+
+
+def list_schedules(conn, user_id: int, start: datetime, end: datetime,
+                   event_type: Optional[str], limit: int) -> List[Dict]:
+    """期間内の予定を取得"""
+    items = islice(iter_schedule_items(conn, user_id, start, end, event_type), limit)
+    return [
+        {
+            "key": item.key,
+            "title": item.title,
+            "description": item.description,
+            "scheduled_date": item.scheduled_date,
+            "event_type": item.event_type,
+            "is_completed": item.is_completed,
+            "schedule_id": item.schedule_id,
+            "rule_id": item.rule_id,
+        }
+        for item in items
+    ]
+
+
+def apply_operations(conn, user_id: int, operations: List[Dict]) -> List[Dict]:
+    """書き込み操作を順に適用（コミットは呼び出し側）"""
+    return [apply_operation(conn, user_id, operation, index) for index, operation in enumerate(operations)]
+
+
+def apply_operation(conn, user_id: int, operation: Dict, index: int = 0) -> Dict:
+    """書き込み操作を1件適用（index はエラーメッセージ用）"""
+    if not isinstance(operation, dict):
+        raise tornado.web.HTTPError(400, reason=f"operations[{index}] must be an object")
+    op = operation.get("op")
+    try:
+        if op == "create_session":
+            row_id = queries.insert_study_session(
+                conn, user_id,
+                int(operation["subject_id"]),
+                int(operation["duration_minutes"]),
+                operation.get("content"),
+                operation.get("satisfaction_score"),
+                _parse_datetime(operation.get("study_date"))
+            )
+            return {"op": op, "id": row_id}
+        elif op == "create_quiz_result":
+            row_id = queries.insert_quiz_result(
+                conn, user_id,
+                int(operation["quiz_id"]),
+                operation.get("user_answer"),
+                bool(operation["is_correct"]),
+                operation.get("time_taken_seconds"),
+                _parse_datetime(operation.get("attempted_at"))
+            )
+            return {"op": op, "id": row_id}
+        elif op == "create_schedule":
+            row_id = queries.insert_schedule(
+                conn, user_id,
+                operation["title"],
+                operation.get("description"),
+                _parse_datetime(operation["scheduled_date"]),
+                operation.get("event_type", "other")
+            )
+            return {"op": op, "id": row_id}
+        elif op == "set_schedule_completed":
+            completed = bool(operation["is_completed"])
+            if "rule_id" in operation:
+                owner = conn.execute(
+                    "SELECT 1 FROM schedule_rules WHERE id = ? AND user_id = ?",
+                    (int(operation["rule_id"]), user_id)
+                ).fetchone()
+                if owner is None:
+                    raise tornado.web.HTTPError(404, reason=f"operations[{index}]: schedule rule not found")
+                set_occurrence_state(
+                    conn, int(operation["rule_id"]),
+                    _parse_datetime(operation["occurrence_date"]),
+                    is_completed=completed
+                )
+            elif not queries.set_schedule_completed(conn, user_id, int(operation["schedule_id"]), completed):
+                raise tornado.web.HTTPError(404, reason=f"operations[{index}]: schedule not found")
+            return {"op": op}
+        else:
+            raise tornado.web.HTTPError(400, reason=f"operations[{index}]: unknown op {op!r}")
+    except (KeyError, TypeError, ValueError) as e:
+        raise tornado.web.HTTPError(400, reason=f"operations[{index}]: invalid field {e}")
+
+
+def apply_uploads(conn, user_id: int, operations: List[Dict]) -> List[Dict]:
+    """冪等キー付きの書き込み操作を適用（再送された操作は保存済みの結果を返す）"""
+    results = []
+    for index, operation in enumerate(operations):
+        key = operation.get("key") if isinstance(operation, dict) else None
+        if not isinstance(key, str) or not key or len(key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            raise tornado.web.HTTPError(400, reason=f"operations[{index}]: key is required")
+        result = find_upload(conn, user_id, key)
+        if result is None:
+            result = apply_operation(conn, user_id, operation, index)
+            record_upload(conn, user_id, key, result)
+        else:
+            result = dict(result, replayed=True)
+        results.append(dict(result, key=key))
+    return results
+
+
+def make_app(db=None, max_workers: int = 8, max_pending: int = 256,
+             api_token: Optional[str] = None, insecure: bool = False) -> tornado.web.Application:
+    """APIアプリケーションを作成
+
+    api_token は /metrics 用の監視トークン。insecure では利用者の認証を行わない（開発用）。
+    """
+    options = {
+        "executor": DatabaseExecutor(db or get_database(), max_workers, max_pending),
+        "responses": ResponseCache(),
+    }
+    return tornado.web.Application([
+        (rf"{API_PREFIX}/users/(\d+)/metrics", MetricsHandler, options),
+        (rf"{API_PREFIX}/users/(\d+)/sessions", SessionsHandler, options),
+        (rf"{API_PREFIX}/users/(\d+)/quiz-results", QuizResultsHandler, options),
+        (rf"{API_PREFIX}/users/(\d+)/schedules", SchedulesHandler, options),
+        (rf"{API_PREFIX}/users/(\d+)/batch", BatchHandler, options),
+        (rf"{API_PREFIX}/users/(\d+)/sync", SyncHandler, options),
+        (rf"{API_PREFIX}/subjects/(\d+)/quizzes", QuizzesHandler, options),
+        (r"/metrics", PrometheusHandler),
+        (r"/healthz", HealthHandler),
+        (r"/readyz", ReadinessHandler, {"executor": options["executor"]}),
+    ], api_token=api_token or os.environ.get("API_TOKEN"), insecure=insecure, compress_response=True)
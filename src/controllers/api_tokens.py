@@ -0,0 +1,55 @@
+"""
+JSON API の利用者ごとのアクセストークン
+
+トークンは発行時にだけ平文で返し、データベース（既定のシャード）には SHA-256 の
+ハッシュと利用者IDだけを保存する。API は Authorization: Bearer <トークン> から
+利用者を引き、パスの利用者IDと一致しない場合は 403 を返す。
+"""
+
+import hashlib
+import secrets
+from typing import Dict, List, Optional
+
+
+def hash_token(token: str) -> str:
+    """保存・照合用のトークンのハッシュ"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def issue_token(db, user_id: int, label: Optional[str] = None) -> str:
+    """利用者のトークンを発行（平文はこの戻り値でしか得られない）"""
+    token = secrets.token_urlsafe(32)
+    with db.write_transaction() as conn:
+        conn.execute(
+            "INSERT INTO api_tokens (token_hash, user_id, label) VALUES (?, ?, ?)",
+            (hash_token(token), user_id, label)
+        )
+    return token
+
+
+def revoke_tokens(db, user_id: int) -> int:
+    """利用者のトークンをすべて無効にし、無効にした件数を返す"""
+    with db.write_transaction() as conn:
+        return conn.execute("DELETE FROM api_tokens WHERE user_id = ?", (user_id,)).rowcount
+
+
+def find_token_user(conn, token: str) -> Optional[int]:
+    """トークンの利用者ID（無効なトークンは None）"""
+    row = conn.execute("SELECT user_id FROM api_tokens WHERE token_hash = ?", (hash_token(token),)).fetchone()
+    return row[0] if row else None
+
+
+def list_tokens(db) -> List[Dict]:
+    """発行済みのトークンの一覧（ハッシュの先頭のみ）"""
+    with db.get_connection() as conn:
+        rows = conn.execute(
+            "SELECT user_id, label, created_at, substr(token_hash, 1, 12) FROM api_tokens ORDER BY user_id, created_at"
+        ).fetchall()
+    return [{"user_id": user_id, "label": label, "created_at": created_at, "hash": prefix}
+            for user_id, label, created_at, prefix in rows]
+
+
+def has_tokens(db) -> bool:
+    """トークンが1件以上発行されているか"""
+    with db.get_connection() as conn:
+        return conn.execute("SELECT 1 FROM api_tokens LIMIT 1").fetchone() is not None
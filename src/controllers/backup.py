@@ -0,0 +1,153 @@
+"""
+データベースのオンラインバックアップ・リストア
+
+sqlite3.Connection.backup でページ単位に少しずつコピーし、ステップ間で待機することで
+書き込み中のアプリを止めずに一貫したスナップショットを作成する。
+スナップショットは整合性チェック後に gzip 圧縮し、SHA-256 のチェックサムを添えて保存する。
+"""
+
+import glob
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+BACKUP_PREFIX = "ready_to_study_backup_"
+BACKUP_SUFFIX = ".db.gz"
+
+
+def _sha256(path: str) -> str:
+    """ファイルのSHA-256を計算"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_integrity(db_path: str) -> str:
+    """PRAGMA integrity_check の結果を取得（正常なら "ok"）"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return "\n".join(row[0] for row in conn.execute("PRAGMA integrity_check"))
+    finally:
+        conn.close()
+
+
+def snapshot(db_path: str, target_path: str, pages_per_step: int = 256,
+             sleep_seconds: float = 0.01):
+    """オンラインバックアップAPIでスナップショットを作成
+
+    1ステップで pages_per_step ページだけコピーし、ステップ間で sleep_seconds 待機する。
+    コピー中に他の接続から書き込みがあった場合は SQLite がコピーをやり直すため、
+    完成したファイルはある時点の一貫した状態になる。
+    """
+    def progress(status, remaining, total):
+        if remaining:
+            time.sleep(sleep_seconds)
+
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(target_path)
+    try:
+        with target:
+            source.backup(target, pages=pages_per_step, progress=progress)
+    finally:
+        target.close()
+        source.close()
+
+
+def create_backup(db_path: str, backup_dir: str, pages_per_step: int = 256,
+                  sleep_seconds: float = 0.01, label: Optional[str] = None) -> str:
+    """スナップショットを作成・検証・圧縮し、バックアップファイルのパスを返す"""
+    os.makedirs(backup_dir, exist_ok=True)
+    name = f"{BACKUP_PREFIX}{label + '_' if label else ''}{datetime.now():%Y%m%d_%H%M%S}"
+    raw_path = os.path.join(backup_dir, f"{name}.db")
+    backup_path = os.path.join(backup_dir, f"{name}{BACKUP_SUFFIX}")
+
+    try:
+        snapshot(db_path, raw_path, pages_per_step, sleep_seconds)
+
+        result = check_integrity(raw_path)
+        if result != "ok":
+            raise RuntimeError(f"スナップショットの整合性チェックに失敗しました: {result}")
+
+        raw_digest = _sha256(raw_path)
+        with open(raw_path, "rb") as src, gzip.open(backup_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+
+        # 圧縮ファイルを展開して元のスナップショットと一致するか確認
+        digest = hashlib.sha256()
+        with gzip.open(backup_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        if digest.hexdigest() != raw_digest:
+            os.unlink(backup_path)
+            raise RuntimeError("圧縮したバックアップの検証に失敗しました")
+
+        with open(f"{backup_path}.sha256", "w") as f:
+            f.write(f"{raw_digest}  {name}.db\n")
+    finally:
+        if os.path.exists(raw_path):
+            os.unlink(raw_path)
+
+    return backup_path
+
+
+def list_backups(backup_dir: str) -> List[str]:
+    """バックアップファイルを古い順に取得"""
+    return sorted(
+        glob.glob(os.path.join(backup_dir, f"{BACKUP_PREFIX}*{BACKUP_SUFFIX}")),
+        key=os.path.getmtime
+    )
+
+
+def apply_retention(backup_dir: str, retention_days: int = 30, keep_min: int = 3) -> List[str]:
+    """保存期間を過ぎたバックアップを削除（最新 keep_min 個は常に残す）"""
+    backups = list_backups(backup_dir)
+    threshold = time.time() - timedelta(days=retention_days).total_seconds()
+
+    removed = []
+    for path in backups[:max(len(backups) - keep_min, 0)]:
+        if os.path.getmtime(path) < threshold:
+            os.unlink(path)
+            if os.path.exists(f"{path}.sha256"):
+                os.unlink(f"{path}.sha256")
+            removed.append(path)
+    return removed
+
+
+def restore_backup(backup_path: str, db_path: str, pages_per_step: int = 256,
+                   sleep_seconds: float = 0.01):
+    """バックアップを検証してからデータベースへ復元
+
+    展開したファイルのチェックサムと整合性を確認したうえで、バックアップAPIで
+    稼働中のデータベースへ書き戻す（ファイルの置き換えは行わない）。
+    """
+    raw_path = f"{db_path}.restore-{os.getpid()}"
+    try:
+        with gzip.open(backup_path, "rb") as src, open(raw_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+
+        checksum_path = f"{backup_path}.sha256"
+        if os.path.exists(checksum_path):
+            with open(checksum_path) as f:
+                expected = f.read().split()[0]
+            if _sha256(raw_path) != expected:
+                raise RuntimeError("バックアップのチェックサムが一致しません")
+
+        result = check_integrity(raw_path)
+        if result != "ok":
+            raise RuntimeError(f"バックアップの整合性チェックに失敗しました: {result}")
+
+        snapshot(raw_path, db_path, pages_per_step, sleep_seconds)
+
+        result = check_integrity(db_path)
+        if result != "ok":
+            raise RuntimeError(f"復元後の整合性チェックに失敗しました: {result}")
+    finally:
+        if os.path.exists(raw_path):
+            os.unlink(raw_path)
@@ -0,0 +1,79 @@
+"""
+データバージョンで無効化されるプロセス内キャッシュ
+
+各エントリは読み込み時点のスコープのバージョン（data_versions テーブル）を保持し、
+取得時にバージョンが進んでいれば読み込み直す。バージョンはトリガーで更新されるため、
+複数のワーカープロセス間でもデータベースを介してキャッシュの無効化が共有される。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+from src.controllers.database import database_for_scope
+
+
+class VersionedCache:
+    """データバージョン付きLRUキャッシュ"""
+
+    def __init__(self, ttl_seconds: float = 300, max_entries: int = 10000, db=None):
+        self.db = db
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[int, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, scope: str, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """キャッシュから取得し、無い・古い場合は loader で読み込む"""
+        version = (self.db or database_for_scope(scope)).get_data_version(scope)
+        cache_key = (scope, key)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry and entry[0] == version and now - entry[1] < self.ttl_seconds:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        value = loader()
+
+        with self._lock:
+            self._entries[cache_key] = (version, now, value)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def items(self) -> List[Tuple[Tuple[str, Hashable], Any]]:
+        """((スコープ, キー), 値) の一覧を取得"""
+        with self._lock:
+            return [(cache_key, entry[2]) for cache_key, entry in self._entries.items()]
+
+    def clear(self):
+        """すべてのエントリを削除"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """ヒット率などの統計を取得"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+# グローバルインスタンス
+cache = VersionedCache()
+
+def get_cache() -> VersionedCache:
+    """プロセス共通のキャッシュを取得"""
+    return cache
@@ -0,0 +1,131 @@
+"""
+教科カタログ
+
+subjects テーブルは参照用の固定データのため、プロセスごとに1度だけ読み込んだ
+不変のカタログを全セッションで共有する。subjects スコープのデータバージョンが
+進んだときだけ読み込み直す（バージョンの確認は refresh_interval 秒に1回まで）。
+ビューは学習記録などを subject_id で集計し、教科名はカタログから付与する。
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+import pandas as pd
+
+from src.controllers.database import get_database
+
+SUBJECTS_SCOPE = "subjects"
+
+
+@dataclass(frozen=True)
+class Subject:
+    """教科"""
+    id: int
+    name: str
+    category: str
+    description: Optional[str]
+    grade_level: int
+
+
+class SubjectCatalog:
+    """教科の不変カタログ"""
+
+    def __init__(self, subjects: Iterable[Subject], version: int = 0):
+        self.version = version
+        ordered = sorted(subjects, key=lambda s: (s.category, s.grade_level, s.name))
+        self.by_id: Mapping[int, Subject] = MappingProxyType({s.id: s for s in ordered})
+
+        by_category: Dict[str, List[Subject]] = {}
+        for subject in ordered:
+            by_category.setdefault(subject.category, []).append(subject)
+        self.by_category: Mapping[str, Tuple[Subject, ...]] = MappingProxyType(
+            {category: tuple(items) for category, items in by_category.items()}
+        )
+        self.categories: Tuple[str, ...] = tuple(by_category)
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def get(self, subject_id: int) -> Optional[Subject]:
+        """IDから教科を取得"""
+        return self.by_id.get(subject_id)
+
+    def name(self, subject_id: int, default: str = "不明な教科") -> str:
+        """IDから教科名を取得"""
+        subject = self.by_id.get(subject_id)
+        return subject.name if subject else default
+
+    def in_category(self, category: str) -> Tuple[Subject, ...]:
+        """カテゴリの教科（学年・名前順）"""
+        return self.by_category.get(category, ())
+
+    def for_grade(self, grade: int, category: Optional[str] = None) -> Tuple[Subject, ...]:
+        """指定した学年までに履修する教科（カテゴリで絞り込み可）"""
+        subjects = self.in_category(category) if category else self.by_id.values()
+        return tuple(s for s in subjects if s.grade_level <= grade)
+
+    def attach(self, df: pd.DataFrame, id_column: str = "subject_id",
+               columns: Tuple[str, ...] = ("name",)) -> pd.DataFrame:
+        """subject_id 列をもとに教科名などの列を追加した DataFrame を返す"""
+        df = df.copy()
+        ids = df[id_column]
+        for column in columns:
+            values = {subject_id: getattr(subject, column) for subject_id, subject in self.by_id.items()}
+            df[column] = ids.map(values)
+        return df
+
+
+def load_catalog(conn, version: int = 0) -> SubjectCatalog:
+    """subjects テーブルからカタログを作成"""
+    rows = conn.execute(
+        "SELECT id, name, category, description, grade_level FROM subjects"
+    ).fetchall()
+    return SubjectCatalog((Subject(*row) for row in rows), version)
+
+
+class CatalogProvider:
+    """データバージョンが進んだときだけカタログを読み込み直す"""
+
+    def __init__(self, db=None, refresh_interval: float = 5.0):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self._catalog: Optional[SubjectCatalog] = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def get(self) -> SubjectCatalog:
+        """現在のカタログを取得"""
+        catalog = self._catalog
+        if catalog is not None and time.monotonic() - self._checked_at < self.refresh_interval:
+            return catalog
+
+        with self._lock:
+            if self._catalog is not None and time.monotonic() - self._checked_at < self.refresh_interval:
+                return self._catalog
+            db = self.db or get_database()
+            with db.get_connection() as conn:
+                row = conn.execute(
+                    "SELECT version FROM data_versions WHERE scope = ?", (SUBJECTS_SCOPE,)
+                ).fetchone()
+                version = row[0] if row else 0
+                if self._catalog is None or self._catalog.version != version:
+                    self._catalog = load_catalog(conn, version)
+                    self.loads += 1
+            self._checked_at = time.monotonic()
+            return self._catalog
+
+    def invalidate(self):
+        """次回の取得でバージョンを確認させる"""
+        self._checked_at = float("-inf")
+
+
+# グローバルインスタンス
+catalog_provider = CatalogProvider()
+
+def get_subject_catalog() -> SubjectCatalog:
+    """プロセス共通の教科カタログを取得"""
+    return catalog_provider.get()
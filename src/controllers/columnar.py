@@ -0,0 +1,351 @@
+"""
+分析用の列指向エクスポート
+
+学習記録・クイズ結果を月ごとのパーティション（Parquet または Arrow IPC）に書き出す。
+行は読み取り専用スナップショットから row_group_size 行ずつ取り出して行グループとして
+書き込むため、テーブル全体をメモリに載せない。型は列ごとに固定し（教科ID・クイズIDは
+辞書エンコード、日時は秒単位の整数タイムスタンプ）、月内はユーザー順に並べるので
+ユーザーで絞り込む読み取りは行グループの統計で不要な部分を読み飛ばせる。
+
+書き出すのは終わった月だけで、2回目以降は新しい月と、行数・最大IDが変わった月
+（オフライン端末からの後日のアップロードやテナントの移動）だけを書き直す。
+ファイル名にDBファイル名を含めるため、シャードごとに同じ保存先へ書き出せる。
+
+    <保存先>/<テーブル>/month=YYYY-MM/part-<DB名>.parquet
+    <保存先>/<テーブル>/_manifest-<DB名>.json
+
+pyarrow がインストールされていない場合、エクスポートは RuntimeError になり、
+進捗画面の読み取り（load_study_sessions）はデータベースへのクエリに戻る。
+"""
+
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# 書き出し形式と拡張子
+FORMATS = {"parquet": "parquet", "arrow": "arrow"}
+
+# 1つの行グループ（Arrow IPC ではレコードバッチ）の行数
+DEFAULT_ROW_GROUP_SIZE = 65536
+
+# 列の型の版（変えた場合は書き出し済みの月もすべて書き直す）
+SCHEMA_VERSION = 2
+
+
+def _schemas() -> Dict[str, Any]:
+    """テーブルごとの列の型（利用者IDは2つ目以降のシャードの採番範囲が 32 ビットを超えるため int64）"""
+    reference = pa.dictionary(pa.int32(), pa.int32())
+    return {
+        "study_sessions": pa.schema([
+            ("id", pa.int64()),
+            ("user_id", pa.int64()),
+            ("subject_id", reference),
+            ("duration_minutes", pa.int32()),
+            ("content", pa.string()),
+            ("satisfaction_score", pa.int8()),
+            ("study_date", pa.timestamp("s")),
+        ]),
+        "quiz_results": pa.schema([
+            ("id", pa.int64()),
+            ("user_id", pa.int64()),
+            ("quiz_id", reference),
+            ("user_answer", pa.string()),
+            ("is_correct", pa.bool_()),
+            ("time_taken_seconds", pa.int32()),
+            ("attempted_at", pa.timestamp("s")),
+        ]),
+    }
+
+
+# 辞書エンコードする列
+DICTIONARY_COLUMNS = ["subject_id", "quiz_id"]
+
+# エクスポート対象テーブルと基準日時カラム
+EXPORT_TABLES = {
+    "study_sessions": "study_date",
+    "quiz_results": "attempted_at",
+}
+
+
+def require_pyarrow():
+    """pyarrow が使えない場合はエラー"""
+    if pa is None:
+        raise RuntimeError("列指向エクスポートには pyarrow が必要です（pip install pyarrow）")
+
+
+def month_start(month: str) -> str:
+    """YYYY-MM の月初（テキストの日時と比較できる形式）"""
+    return f"{month}-01"
+
+
+def next_month(month: str) -> str:
+    """YYYY-MM の翌月"""
+    year, number = map(int, month.split("-"))
+    return f"{year + number // 12:04d}-{number % 12 + 1:02d}"
+
+
+def default_export_directory(db_path: str) -> str:
+    """エクスポートの保存先（環境変数 COLUMNAR_EXPORT_DIR、既定はDBと同じ場所の columnar/）"""
+    return os.environ.get("COLUMNAR_EXPORT_DIR") or os.path.join(os.path.dirname(db_path), "columnar")
+
+
+class ColumnarExporter:
+    """1つのデータベース（シャード）の月別パーティションの書き出し"""
+
+    def __init__(self, db, directory: Optional[str] = None, fmt: str = "parquet",
+                 row_group_size: int = DEFAULT_ROW_GROUP_SIZE):
+        if fmt not in FORMATS:
+            raise ValueError(f"未対応の形式です: {fmt}")
+        self.db = db
+        self.directory = directory or default_export_directory(db.db_path)
+        self.format = fmt
+        self.row_group_size = row_group_size
+        self.name = os.path.splitext(os.path.basename(db.db_path))[0]
+
+    def path(self, table: str, month: str) -> str:
+        """パーティションのファイルパス"""
+        return os.path.join(self.directory, table, f"month={month}", f"part-{self.name}.{FORMATS[self.format]}")
+
+    def manifest_path(self, table: str) -> str:
+        """書き出し済みの月を記録するファイルのパス"""
+        return os.path.join(self.directory, table, f"_manifest-{self.name}.json")
+
+    def load_manifest(self, table: str) -> Dict[str, Any]:
+        """書き出し済みの月の記録を読み込む"""
+        return load_manifest(self.manifest_path(table))
+
+    def _save_manifest(self, table: str, manifest: Dict[str, Any]):
+        path = self.manifest_path(table)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def month_counts(self, conn, table: str, until: str) -> Dict[str, List[int]]:
+        """until より前の月ごとの [行数, 最大ID]"""
+        date_column = EXPORT_TABLES[table]
+        rows = conn.execute(f"""
+            SELECT substr({date_column}, 1, 7) AS month, COUNT(*), MAX(id)
+            FROM {table}
+            WHERE {date_column} < ?
+            GROUP BY month
+        """, (until,)).fetchall()
+        return {month: [count, max_id] for month, count, max_id in rows}
+
+    def export(self, table: str, now: Optional[datetime] = None, rebuild: bool = False) -> Dict[str, Any]:
+        """終わった月のうち未出力・変更ありの月を書き出す
+
+        書き出しは1つの読み取り専用スナップショットで行い、その時点の変更履歴の version を
+        記録する。進捗画面はこれより後に出力済みの月の行が変更されたかどうかで、
+        エクスポートを使えるかを判断する。
+        """
+        require_pyarrow()
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"エクスポート対象外のテーブルです: {table}")
+        now = now or datetime.now()
+        until = now.strftime("%Y-%m")
+        manifest = self.load_manifest(table)
+        if manifest.get("format", self.format) != self.format or manifest.get("schema", 1) != SCHEMA_VERSION:
+            rebuild = True
+        months = {} if rebuild else manifest.get("months", {})
+
+        written = []
+        rows = 0
+        with self.db.analytics_snapshot() as conn:
+            cursor_version = conn.execute("SELECT COALESCE(MAX(version), 0) FROM change_log").fetchone()[0]
+            counts = self.month_counts(conn, table, month_start(until))
+            for month, (count, max_id) in sorted(counts.items()):
+                entry = months.get(month)
+                if entry and [entry["rows"], entry["max_id"]] == [count, max_id]:
+                    continue
+                rows += self._write_month(conn, table, month)
+                months[month] = {"rows": count, "max_id": max_id, "exported_at": now.isoformat(timespec="seconds")}
+                written.append(month)
+
+        # 行がなくなった月（アーカイブ・テナントの移動）のファイルは削除する
+        for month in [month for month in months if month not in counts]:
+            if os.path.exists(self.path(table, month)):
+                os.remove(self.path(table, month))
+            del months[month]
+
+        self._save_manifest(table, {
+            "format": self.format,
+            "schema": SCHEMA_VERSION,
+            "until": until,
+            "cursor": cursor_version,
+            "months": dict(sorted(months.items())),
+        })
+        return {"months": written, "rows": rows}
+
+    def _write_month(self, conn, table: str, month: str) -> int:
+        """1か月分の行を行グループごとに書き出し、書き出した行数を返す"""
+        schema = _schemas()[table]
+        date_column = EXPORT_TABLES[table]
+        columns = [
+            f"CAST(strftime('%s', {name}) AS INTEGER)" if name == date_column else name
+            for name in schema.names
+        ]
+        cursor = conn.execute(f"""
+            SELECT {', '.join(columns)}
+            FROM {table}
+            WHERE {date_column} >= ? AND {date_column} < ?
+            ORDER BY user_id, id
+        """, (month_start(month), month_start(next_month(month))))
+
+        path = self.path(table, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        if self.format == "parquet":
+            writer = pq.ParquetWriter(temp_path, schema, compression="zstd")
+        else:
+            writer = ipc.new_file(temp_path, schema)
+        rows = 0
+        try:
+            while True:
+                chunk = cursor.fetchmany(self.row_group_size)
+                if not chunk:
+                    break
+                writer.write_batch(_record_batch(schema, chunk))
+                rows += len(chunk)
+        finally:
+            writer.close()
+        os.replace(temp_path, path)
+        return rows
+
+
+def _record_batch(schema, chunk: List[tuple]):
+    """行のリストを列の型どおりのレコードバッチに変換"""
+    arrays = []
+    for index, field in enumerate(schema):
+        values = [row[index] for row in chunk]
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(values, field.type.value_type).dictionary_encode())
+        elif pa.types.is_boolean(field.type):
+            arrays.append(pa.array([None if value is None else bool(value) for value in values], field.type))
+        else:
+            arrays.append(pa.array(values, field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    """マニフェストを読み込む（未出力の場合は空）"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_partitions(paths: List[str], user_id: Optional[int] = None,
+                    columns: Optional[List[str]] = None):
+    """パーティションをメモリマップで読み、Arrow のテーブルとして返す"""
+    require_pyarrow()
+    tables = []
+    for path in paths:
+        if path.endswith(".parquet"):
+            filters = [("user_id", "=", user_id)] if user_id is not None else None
+            table = pq.read_table(path, columns=columns, filters=filters, memory_map=True)
+            # Parquet は整数列の辞書エンコードを型として保存しないため、読み取り後に戻す
+            for name in DICTIONARY_COLUMNS:
+                if name in table.column_names:
+                    index = table.column_names.index(name)
+                    table = table.set_column(index, name, pc.dictionary_encode(table[name]))
+            tables.append(table)
+            continue
+        table = ipc.open_file(pa.memory_map(path)).read_all()
+        if user_id is not None:
+            table = table.filter(pc.equal(table["user_id"], user_id))
+        tables.append(table.select(columns) if columns else table)
+    if not tables:
+        return None
+    return pa.concat_tables(tables)
+
+
+def read_export(directory: str, table: str, user_id: Optional[int] = None,
+                columns: Optional[List[str]] = None, start: Optional[str] = None) -> pd.DataFrame:
+    """保存先の全パーティション（全シャード）を DataFrame として読む
+
+    start（YYYY-MM）を指定するとその月以降のパーティションだけを読む。
+    """
+    root = os.path.join(directory, table)
+    paths = []
+    if os.path.isdir(root):
+        for partition in sorted(os.listdir(root)):
+            if not partition.startswith("month=") or (start and partition[6:] < start):
+                continue
+            for name in sorted(os.listdir(os.path.join(root, partition))):
+                if name.startswith("part-") and not name.endswith(".tmp"):
+                    paths.append(os.path.join(root, partition, name))
+    result = read_partitions(paths, user_id, columns)
+    if result is None:
+        return pd.DataFrame(columns=columns or _schemas()[table].names)
+    return result.to_pandas()
+
+
+def load_study_sessions(db, user_id: int, start: datetime) -> pd.DataFrame:
+    """進捗画面用にユーザーの学習記録（study_date, subject_id, duration_minutes）を取得
+
+    書き出し済みの月はエクスポートからメモリマップで読み、それ以降の行だけを
+    データベースから読む。エクスポート後に書き出し済みの月の行が追加・変更・削除
+    されていた場合（件数か変更履歴で判定）は、すべてデータベースから読む。
+    呼び出し側の読み取り専用スナップショットの中で使う。
+    """
+    columns = ["study_date", "subject_id", "duration_minutes"]
+    exporter = None
+    if pa is not None:
+        exporter = ColumnarExporter(db)
+        manifest = exporter.load_manifest("study_sessions")
+
+    with db.analytics_snapshot() as conn:
+        if exporter is not None and manifest.get("months") and manifest["until"] > start.strftime("%Y-%m"):
+            until = month_start(manifest["until"])
+            paths = [
+                exporter.path("study_sessions", month) for month in manifest["months"]
+                if month >= start.strftime("%Y-%m")
+            ]
+            exported = read_partitions(paths, user_id, columns)
+            exported_rows = exported.num_rows if exported is not None else 0
+            # 最初の月は start 以降の行だけを数える
+            current_rows = conn.execute(
+                "SELECT COUNT(*) FROM study_sessions WHERE user_id = ? AND study_date >= ? AND study_date < ?",
+                (user_id, month_start(start.strftime("%Y-%m")), until)
+            ).fetchone()[0]
+            changed = conn.execute("""
+                SELECT 1 FROM change_log AS c
+                LEFT JOIN study_sessions AS s ON s.id = c.row_id
+                WHERE c.user_id = ? AND c.table_name = 'study_sessions' AND c.version > ?
+                  AND (s.id IS NULL OR s.study_date < ?)
+                LIMIT 1
+            """, (user_id, manifest["cursor"], until)).fetchone()
+            if current_rows == exported_rows and changed is None:
+                recent = pd.read_sql_query(
+                    "SELECT study_date, subject_id, duration_minutes FROM study_sessions "
+                    "WHERE user_id = ? AND study_date >= ?",
+                    conn, params=(user_id, until)
+                )
+                recent["study_date"] = pd.to_datetime(recent["study_date"], format="mixed")
+                frames = [recent]
+                if exported is not None:
+                    frame = exported.to_pandas()
+                    frame["subject_id"] = frame["subject_id"].astype("int64")
+                    frame["study_date"] = frame["study_date"].astype("datetime64[ns]")
+                    frames.insert(0, frame[frame["study_date"] >= pd.Timestamp(start)])
+                return pd.concat(frames, ignore_index=True)
+
+        frame = pd.read_sql_query(
+            "SELECT study_date, subject_id, duration_minutes FROM study_sessions "
+            "WHERE user_id = ? AND study_date >= ?",
+            conn, params=(user_id, start)
+        )
+    frame["study_date"] = pd.to_datetime(frame["study_date"], format="mixed")
+    return frame
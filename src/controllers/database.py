@@ -4,8 +4,418 @@
 
 import sqlite3
 import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Any, Iterator, List, Dict, Optional, Tuple
+
+from src.controllers.metrics import find_caller, get_query_metrics
+
+# バージョン管理対象のテーブルと、変更時に上げるスコープ（SQL式）
+# 学習記録は利用者全体のスコープに加え、学習記録だけを読むキャッシュ用のスコープも上げる
+VERSIONED_TABLES = {
+    "users": ("'user:' || {row}.id",),
+    "study_sessions": ("'user:' || {row}.user_id", "'study_sessions:' || {row}.user_id"),
+    "quiz_results": ("'user:' || {row}.user_id",),
+    "schedules": ("'user:' || {row}.user_id",),
+    "schedule_rules": ("'user:' || {row}.user_id",),
+    "schedule_exceptions": ("'user:' || (SELECT user_id FROM schedule_rules WHERE id = {row}.rule_id)",),
+    "subjects": ("'subjects'",),
+    "quizzes": ("'quizzes'",),
+}
+
+# 変更履歴（オフライン同期用）に記録するテーブルと、(記録するテーブル名, ユーザー, 行ID) の式
+# 繰り返し予定の例外は親の繰り返し予定の更新として記録する
+CHANGE_LOG_TABLES = {
+    "users": ("users", "{row}.id", "{row}.id"),
+    "study_sessions": ("study_sessions", "{row}.user_id", "{row}.id"),
+    "quiz_results": ("quiz_results", "{row}.user_id", "{row}.id"),
+    "schedules": ("schedules", "{row}.user_id", "{row}.id"),
+    "schedule_rules": ("schedule_rules", "{row}.user_id", "{row}.id"),
+    "schedule_exceptions": ("schedule_rules", "(SELECT user_id FROM schedule_rules WHERE id = {row}.rule_id)",
+                            "{row}.rule_id"),
+}
+
+# 学習イベント（追記専用のイベントストア用）として記録するテーブルと、(ユーザー, 記録する列)
+EVENT_TABLES = {
+    "study_sessions": ("{row}.user_id",
+                       ("id", "subject_id", "duration_minutes", "content", "satisfaction_score", "study_date")),
+    "quiz_results": ("{row}.user_id",
+                     ("id", "quiz_id", "user_answer", "is_correct", "time_taken_seconds", "attempted_at")),
+    "schedules": ("{row}.user_id", ("id", "title", "scheduled_date", "event_type", "is_completed")),
+    "schedule_exceptions": ("(SELECT user_id FROM schedule_rules WHERE id = {row}.rule_id)",
+                            ("rule_id", "occurrence_date", "is_completed", "is_cancelled")),
+}
+
+# 既存の行をイベントとして登録するときの発生日時の列（行自身の日時を使う）
+EVENT_OCCURRED_AT = {
+    "study_sessions": "study_date",
+    "quiz_results": "attempted_at",
+    "schedules": "created_at",
+    "schedule_exceptions": "occurrence_date",
+}
+
+# 保存期間管理のアーカイブ中でないときだけ実行するトリガーの条件（retention_archiving を参照）
+NOT_ARCHIVING = "WHEN NOT EXISTS (SELECT 1 FROM retention_archiving)"
+
+def user_scope(user_id: int) -> str:
+    """ユーザーデータのバージョンスコープ名を取得"""
+    return f"user:{user_id}"
+
+def study_sessions_scope(user_id: int) -> str:
+    """ユーザーの学習記録だけのバージョンスコープ名を取得（学習記録の変更でのみ上がる）"""
+    return f"study_sessions:{user_id}"
+
+# スレッドごとのクエリ数・DB時間（Streamlitでは1回の再実行が1スレッドで実行される）
+_query_counters = threading.local()
+
+def reset_query_counters():
+    """現在のスレッドのクエリ数・DB時間をリセット"""
+    _query_counters.queries = 0
+    _query_counters.seconds = 0.0
+
+def get_query_counters() -> Dict[str, float]:
+    """現在のスレッドのクエリ数・DB時間を取得"""
+    return {
+        "queries": getattr(_query_counters, "queries", 0),
+        "seconds": getattr(_query_counters, "seconds", 0.0),
+    }
+
+@contextmanager
+def capture_queries() -> Iterator[List[Tuple[str, Any]]]:
+    """現在のスレッドで実行されたSQLと引数を記録（ベンチマーク用）"""
+    statements: List[Tuple[str, Any]] = []
+    _query_counters.capture = statements
+    try:
+        yield statements
+    finally:
+        _query_counters.capture = None
+
+def _record_query(seconds: float, statement: bool):
+    if not hasattr(_query_counters, "queries"):
+        reset_query_counters()
+    if statement:
+        _query_counters.queries += 1
+    _query_counters.seconds += seconds
+
+class TimedCursor(sqlite3.Cursor):
+    """実行・取得にかかった時間を記録するカーソル
+
+    文ごとに実行から取得完了（または次の実行・破棄）までの時間と行数を合算し、
+    呼び出し元の関数とともにクエリ計測（metrics）へ記録する。
+    """
+    
+    _statement = None
+    
+    def _start_statement(self, sql, parameters, seconds: float):
+        caller = find_caller(sys._getframe(2))
+        if self.description is None:
+            # 結果行の無い文（書き込み・DDL）はこの時点で完了
+            self._statement = [sql, parameters, caller, seconds, max(self.rowcount, 0)]
+            self._finish_statement()
+        else:
+            self._statement = [sql, parameters, caller, seconds, 0]
+    
+    def _add_fetch(self, seconds: float, rows: int, finished: bool):
+        statement = self._statement
+        if statement is not None:
+            statement[3] += seconds
+            statement[4] += rows
+            if finished:
+                self._finish_statement()
+    
+    def _finish_statement(self):
+        statement, self._statement = self._statement, None
+        if statement is not None:
+            sql, parameters, caller, seconds, rows = statement
+            get_query_metrics().observe(sql, parameters, caller, seconds, rows,
+                                        getattr(self.connection, "database", None))
+    
+    def execute(self, sql, parameters=()):
+        self._finish_statement()
+        capture = getattr(_query_counters, "capture", None)
+        if capture is not None:
+            capture.append((sql, parameters))
+        started = time.perf_counter()
+        try:
+            result = super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            _record_query(elapsed, True)
+        self._start_statement(sql, parameters, elapsed)
+        return result
+    
+    def executemany(self, sql, seq_of_parameters):
+        self._finish_statement()
+        started = time.perf_counter()
+        try:
+            result = super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            _record_query(elapsed, True)
+        self._start_statement(sql, (), elapsed)
+        return result
+    
+    def fetchone(self):
+        started = time.perf_counter()
+        row = None
+        try:
+            row = super().fetchone()
+            return row
+        finally:
+            elapsed = time.perf_counter() - started
+            _record_query(elapsed, False)
+            self._add_fetch(elapsed, 0 if row is None else 1, row is None)
+    
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        started = time.perf_counter()
+        rows = []
+        try:
+            rows = super().fetchmany(size)
+            return rows
+        finally:
+            elapsed = time.perf_counter() - started
+            _record_query(elapsed, False)
+            self._add_fetch(elapsed, len(rows), len(rows) < size)
+    
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = []
+        try:
+            rows = super().fetchall()
+            return rows
+        finally:
+            elapsed = time.perf_counter() - started
+            _record_query(elapsed, False)
+            self._add_fetch(elapsed, len(rows), True)
+    
+    def close(self):
+        self._finish_statement()
+        super().close()
+    
+    def __del__(self):
+        try:
+            self._finish_statement()
+        except Exception:
+            pass
+
+class TimedConnection(sqlite3.Connection):
+    """TimedCursor を使う接続"""
+    
+    def __init__(self, database, *args, **kwargs):
+        super().__init__(database, *args, **kwargs)
+        self.database = os.fsdecode(database)
+    
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def is_lock_error(error: sqlite3.OperationalError) -> bool:
+    """ロック競合によるエラーかどうか"""
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+class WriteCoordinator:
+    """書き込みを1つの接続に直列化するコーディネーター
+
+    プロセス内の書き込みはロックで順番待ちさせ、共有の書き込み接続で
+    BEGIN IMMEDIATE によりトランザクションを開始する。他プロセスが書き込み中で
+    ロックを取れない場合は、ジッター付きの指数バックオフで上限回数まで再試行する。
+    """
+    
+    def __init__(self, db_path: str, max_retries: int = 10, base_delay: float = 0.01,
+                 max_delay: float = 0.5, busy_timeout: float = 0.05):
+        self.db_path = db_path
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.busy_timeout = busy_timeout
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.transactions = 0
+        self.retries = 0
+        self.failures = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+    
+    def _connection(self) -> sqlite3.Connection:
+        """共有の書き込み接続を取得（ロック保持中にのみ呼び出す）"""
+        if self._conn is None:
+            # トランザクションは明示的に制御する
+            self._conn = sqlite3.connect(
+                self.db_path, timeout=self.busy_timeout, isolation_level=None,
+                check_same_thread=False, factory=TimedConnection
+            )
+        return self._conn
+    
+    def _begin(self, conn: sqlite3.Connection):
+        """BEGIN IMMEDIATE を再試行付きで実行"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if not is_lock_error(e) or attempt == self.max_retries:
+                    raise
+                with self._stats_lock:
+                    self.retries += 1
+                delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+                time.sleep(random.uniform(0, delay))
+    
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """書き込みトランザクション（正常終了でコミット、例外でロールバック）"""
+        with self._stats_lock:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        started = time.monotonic()
+        try:
+            with self._lock:
+                conn = self._connection()
+                try:
+                    self._begin(conn)
+                except sqlite3.OperationalError:
+                    with self._stats_lock:
+                        self.failures += 1
+                    raise
+                waited = time.monotonic() - started
+                with self._stats_lock:
+                    self.transactions += 1
+                    self.total_wait_seconds += waited
+                    self.max_wait_seconds = max(self.max_wait_seconds, waited)
+                
+                try:
+                    yield conn
+                    conn.execute("COMMIT")
+                except BaseException:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    raise
+        finally:
+            with self._stats_lock:
+                self.queue_depth -= 1
+    
+    def stats(self) -> Dict[str, float]:
+        """ロック待ち時間などの統計を取得"""
+        with self._stats_lock:
+            return {
+                "transactions": self.transactions,
+                "retries": self.retries,
+                "failures": self.failures,
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "avg_wait_ms": self.total_wait_seconds / self.transactions * 1000 if self.transactions else 0.0,
+                "max_wait_ms": self.max_wait_seconds * 1000,
+            }
+    
+    def close(self):
+        """書き込み接続を閉じる"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class AnalyticsPoolTimeout(RuntimeError):
+    """分析用接続の空き待ちがタイムアウトした"""
+
+class ReadOnlyPool:
+    """分析クエリ用の読み取り専用接続プール
+
+    mode=ro の URI と query_only で開いた接続を最大 max_size 本まで使い回す。
+    上限に達している間は timeout 秒まで空きを待つため、レポートの表示が集中しても
+    書き込みや画面の軽い読み取りの処理時間を奪い合わない。
+    snapshot() は1つの読み取りトランザクションで接続を貸し出し、同じスレッドで
+    入れ子に呼び出した場合は同じ接続（同じWALスナップショット）を返す。
+    """
+    
+    def __init__(self, db_path: str, max_size: int = 4, timeout: float = 10.0):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.in_use = 0
+        self.snapshots = 0
+        self.timeouts = 0
+        self.max_wait_seconds = 0.0
+    
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True,
+                               check_same_thread=False, factory=TimedConnection)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+    
+    @contextmanager
+    def snapshot(self) -> Iterator[sqlite3.Connection]:
+        """一貫したスナップショットを読む接続を貸し出す（with 文で使用）"""
+        current = getattr(self._local, "conn", None)
+        if current is not None:
+            yield current
+            return
+        
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise AnalyticsPoolTimeout(f"分析用の接続が {self.timeout:.0f} 秒以内に空きませんでした")
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+                self.in_use += 1
+                self.snapshots += 1
+                self.max_wait_seconds = max(self.max_wait_seconds, time.monotonic() - started)
+            if conn is None:
+                conn = self._open()
+            conn.execute("BEGIN")
+            self._local.conn = conn
+            try:
+                yield conn
+            finally:
+                self._local.conn = None
+                try:
+                    conn.rollback()
+                except sqlite3.Error:
+                    conn.close()
+                    conn = None
+                with self._lock:
+                    self.in_use -= 1
+                    if conn is not None:
+                        self._idle.append(conn)
+        finally:
+            self._slots.release()
+    
+    def stats(self) -> Dict[str, float]:
+        """貸し出し中の接続数などの統計を取得"""
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "in_use": self.in_use,
+                "idle": len(self._idle),
+                "snapshots": self.snapshots,
+                "timeouts": self.timeouts,
+                "max_wait_ms": self.max_wait_seconds * 1000,
+            }
+    
+    def close(self):
+        """待機中の接続を閉じる"""
+        with self._lock:
+            for conn in self._idle:
+                conn.close()
+            self._idle.clear()
 
 class DatabaseController:
     """データベースコントローラー"""
@@ -13,6 +423,13 @@ class DatabaseController:
     def __init__(self, db_path: str = "data/study_app.db"):
         self.db_path = db_path
         self.ensure_data_directory()
+        self.writer = WriteCoordinator(db_path)
+        # 分析用の読み取り専用接続（環境変数で上限と待ち時間を指定）
+        self.analytics = ReadOnlyPool(
+            db_path,
+            max_size=int(os.environ.get("ANALYTICS_POOL_SIZE", "4")),
+            timeout=float(os.environ.get("ANALYTICS_POOL_TIMEOUT", "10")),
+        )
         self.init_tables()
     
     def ensure_data_directory(self):
@@ -20,14 +437,37 @@ class DatabaseController:
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
     
     def get_connection(self):
-        """データベース接続を取得"""
-        return sqlite3.connect(self.db_path)
+        """データベース接続を取得（読み取り用）
+
+        書き込みは write_transaction を使い、書き込み接続に直列化する。
+        """
+        return sqlite3.connect(self.db_path, factory=TimedConnection)
+    
+    def write_transaction(self):
+        """書き込みトランザクションを開始（with 文で使用）"""
+        return self.writer.transaction()
+    
+    def analytics_snapshot(self):
+        """集計・レポート用の読み取り専用スナップショット接続を取得（with 文で使用）
+
+        ページ全体を with 文で囲むと、内側の呼び出しも同じスナップショットを読む。
+        """
+        return self.analytics.snapshot()
     
     def init_tables(self):
         """テーブルの初期化"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
+            # 新規作成時は空き領域を少しずつ回収できるようにする（既存DBでは無視される）
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            
+            # WALモードでは読み取りが書き込みにブロックされない（設定はファイルに保存される）
+            cursor.execute("PRAGMA journal_mode = WAL")
+            
+            # スキーマ作成は1トランザクションにまとめる
+            cursor.execute("BEGIN")
+            
             # ユーザーテーブル
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS users (
@@ -90,10 +530,15 @@ class DatabaseController:
                     is_correct BOOLEAN NOT NULL,
                     time_taken_seconds INTEGER,
                     attempted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    difficulty INTEGER,
                     FOREIGN KEY (user_id) REFERENCES users (id),
                     FOREIGN KEY (quiz_id) REFERENCES quizzes (id)
                 )
             """)
+            # 回答時点の問題の難易度（導入前の結果は NULL のまま、集計では現在の難易度で数える）
+            quiz_result_columns = [row[1] for row in cursor.execute("PRAGMA table_info(quiz_results)")]
+            if "difficulty" not in quiz_result_columns:
+                cursor.execute("ALTER TABLE quiz_results ADD COLUMN difficulty INTEGER")
             
             # スケジュールテーブル
             cursor.execute("""
@@ -109,13 +554,543 @@ class DatabaseController:
                     FOREIGN KEY (user_id) REFERENCES users (id)
                 )
             """)
-            
+
+            # 繰り返し予定ルールテーブル（range_end は最終回の日時、終了しない場合は番兵値）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schedule_rules (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    title TEXT NOT NULL,
+                    description TEXT,
+                    event_type TEXT NOT NULL,
+                    rrule TEXT NOT NULL,
+                    dtstart TIMESTAMP NOT NULL,
+                    range_end TIMESTAMP NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (id)
+                )
+            """)
+
+            # 繰り返し予定の各回ごとの完了・キャンセル状態（変更された回のみ保存）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schedule_exceptions (
+                    rule_id INTEGER NOT NULL,
+                    occurrence_date TIMESTAMP NOT NULL,
+                    is_completed BOOLEAN DEFAULT FALSE,
+                    is_cancelled BOOLEAN DEFAULT FALSE,
+                    PRIMARY KEY (rule_id, occurrence_date),
+                    FOREIGN KEY (rule_id) REFERENCES schedule_rules (id)
+                ) WITHOUT ROWID
+            """)
+
+            # インデックス
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_schedules_user_date
+                ON schedules (user_id, scheduled_date)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_schedule_rules_user_range
+                ON schedule_rules (user_id, range_end, dtstart)
+            """)
+            # 利用者の期間内の学習記録を表を読まずに集計できるよう、教科と学習時間も含める
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_study_sessions_user_date
+                ON study_sessions (user_id, study_date, subject_id, duration_minutes)
+            """)
+
+            # データバージョンテーブル（プロセス間でのキャッシュ無効化に使用）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS data_versions (
+                    scope TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                ) WITHOUT ROWID
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_data_versions_updated
+                ON data_versions (updated_at)
+            """)
+            self.create_version_triggers(cursor)
+
+            # 変更履歴（version は単調増加で、オフライン端末の同期カーソルに使う）
+            has_change_log = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'change_log'"
+            ).fetchone()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS change_log (
+                    version INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    table_name TEXT NOT NULL,
+                    row_id INTEGER NOT NULL,
+                    op TEXT NOT NULL,
+                    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_change_log_user
+                ON change_log (user_id, version)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_change_log_row
+                ON change_log (table_name, row_id, version)
+            """)
+            self.create_change_log_triggers(cursor)
+            if not has_change_log:
+                self.backfill_change_log(cursor)
+
+            # 同期でアップロードされた操作の結果（冪等キーごと、再送時に同じ結果を返す）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sync_uploads (
+                    user_id INTEGER NOT NULL,
+                    idempotency_key TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, idempotency_key)
+                ) WITHOUT ROWID
+            """)
+
+            # 学習イベントの送信待ち（イベントストアのセグメントへ移したら削除する）
+            has_event_outbox = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'event_outbox'"
+            ).fetchone()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS event_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    type TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    occurred_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            self.create_event_triggers(cursor)
+            if not has_event_outbox:
+                self.backfill_events(cursor)
+
+            # イベントから作る集計（射影）のユーザーごとのスナップショットと、圧縮済みの位置
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS event_snapshots (
+                    projection TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    seq INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    PRIMARY KEY (projection, user_id)
+                ) WITHOUT ROWID
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS event_projections (
+                    name TEXT PRIMARY KEY,
+                    seq INTEGER NOT NULL,
+                    compacted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                ) WITHOUT ROWID
+            """)
+
+            # 保存期間管理がアーカイブの削除を行っている間だけ1行を持つ印
+            # （集計のトリガーはこの間の削除を利用者による削除として数えない）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS retention_archiving (
+                    id INTEGER PRIMARY KEY CHECK (id = 1)
+                )
+            """)
+
+            # 利用者・科目・難易度ごとのクイズの回答数と正解数（回答のたびにトリガーで更新する）
+            has_quiz_accuracy = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'quiz_accuracy'"
+            ).fetchone()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS quiz_accuracy (
+                    user_id INTEGER NOT NULL,
+                    subject_id INTEGER NOT NULL,
+                    difficulty INTEGER NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    correct INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_id, subject_id, difficulty)
+                ) WITHOUT ROWID
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_quizzes_subject_difficulty
+                ON quizzes (subject_id, difficulty)
+            """)
+            self.create_quiz_accuracy_triggers(cursor)
+            if not has_quiz_accuracy:
+                self.backfill_quiz_accuracy(cursor)
+
+            # 問題ごとの回答数・正解数・回答時間と、選択式の選択肢ごとの回答数（問題分析用）
+            has_item_stats = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'quiz_item_stats'"
+            ).fetchone()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS quiz_item_stats (
+                    quiz_id INTEGER PRIMARY KEY,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    correct INTEGER NOT NULL DEFAULT 0,
+                    timed_attempts INTEGER NOT NULL DEFAULT 0,
+                    total_seconds INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS quiz_option_counts (
+                    quiz_id INTEGER NOT NULL,
+                    answer TEXT NOT NULL,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (quiz_id, answer)
+                ) WITHOUT ROWID
+            """)
+            self.create_item_stats_triggers(cursor)
+            if not has_item_stats:
+                self.backfill_item_stats(cursor)
+
+            # JSON API の利用者ごとのアクセストークン（ハッシュのみ保存）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS api_tokens (
+                    token_hash TEXT PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    label TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                ) WITHOUT ROWID
+            """)
+
+            # 進行中の学習タイマー（利用者ごとに1つ、停止で study_sessions に変換する）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS study_timers (
+                    user_id INTEGER PRIMARY KEY,
+                    subject_id INTEGER NOT NULL,
+                    started_at TIMESTAMP NOT NULL,
+                    checkpoint_at TIMESTAMP NOT NULL,
+                    FOREIGN KEY (user_id) REFERENCES users (id),
+                    FOREIGN KEY (subject_id) REFERENCES subjects (id)
+                )
+            """)
+
+            # ダッシュボードの事前集計（圧縮したJSON、集計時点のデータバージョン付き）
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS dashboard_snapshots (
+                    user_id INTEGER PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    computed_at TIMESTAMP NOT NULL,
+                    payload BLOB NOT NULL
+                )
+            """)
+
             conn.commit()
             self.insert_initial_data()
     
+    def create_version_triggers(self, cursor):
+        """データ変更時にスコープのバージョンを上げるトリガーを作成
+
+        どのプロセス・どの経路で書き込まれてもバージョンが上がるため、
+        各ワーカープロセスはバージョンを比較するだけでキャッシュの鮮度を判定できる。
+        """
+        for table, scopes in VERSIONED_TABLES.items():
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                row = "OLD" if event == "DELETE" else "NEW"
+                body = "".join(f"""
+                        INSERT INTO data_versions (scope, version, updated_at)
+                        VALUES ({scope.format(row=row)}, 1, CURRENT_TIMESTAMP)
+                        ON CONFLICT (scope) DO UPDATE SET
+                            version = version + 1,
+                            updated_at = CURRENT_TIMESTAMP;""" for scope in scopes)
+                name = f"trg_{table}_{event.lower()}_version"
+                self.replace_trigger(cursor, name, f"""
+                    CREATE TRIGGER {name}
+                    AFTER {event} ON {table}
+                    BEGIN{body}
+                    END
+                """)
+    
+    def create_change_log_triggers(self, cursor):
+        """データ変更を変更履歴に追記するトリガーを作成
+
+        ビュー・API・スクリプトのどの経路の書き込みも記録され、
+        オフライン端末は同期カーソル以降の変更だけを取得できる。
+        """
+        for table, (logged_table, user, row_id) in CHANGE_LOG_TABLES.items():
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                row = "OLD" if event == "DELETE" else "NEW"
+                op = event.lower() if logged_table == table else "update"
+                user_expr = user.format(row=row)
+                name = f"trg_{table}_{event.lower()}_change"
+                self.replace_trigger(cursor, name, f"""
+                    CREATE TRIGGER {name}
+                    AFTER {event} ON {table}
+                    BEGIN
+                        INSERT INTO change_log (user_id, table_name, row_id, op)
+                        SELECT {user_expr}, '{logged_table}', {row_id.format(row=row)}, '{op}'
+                        WHERE {user_expr} IS NOT NULL;
+                    END
+                """)
+    
+    def create_event_triggers(self, cursor):
+        """学習イベントを送信待ちに追記するトリガーを作成
+
+        イベントの種類は "テーブル.操作"、内容は追加・更新後の行（削除は削除前の行）で、
+        更新では更新前の値を previous に含める。
+        """
+        for table, (user, columns) in EVENT_TABLES.items():
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                row = "OLD" if event == "DELETE" else "NEW"
+                user_expr = user.format(row=row)
+                fields = ", ".join(f"'{column}', {row}.{column}" for column in columns)
+                if event == "UPDATE":
+                    previous = ", ".join(f"'{column}', OLD.{column}" for column in columns)
+                    fields += f", 'previous', json_object({previous})"
+                name = f"trg_{table}_{event.lower()}_event"
+                self.replace_trigger(cursor, name, f"""
+                    CREATE TRIGGER {name}
+                    AFTER {event} ON {table}
+                    BEGIN
+                        INSERT INTO event_outbox (user_id, type, payload)
+                        SELECT {user_expr}, '{table}.{event.lower()}', json_object({fields})
+                        WHERE {user_expr} IS NOT NULL;
+                    END
+                """)
+    
+    def create_quiz_accuracy_triggers(self, cursor):
+        """クイズ結果の追加・更新・削除で quiz_accuracy の回答数・正解数を増減するトリガーを作成
+
+        難易度は結果に保存した回答時点の難易度で数える（保存されていない導入前の結果は
+        問題の現在の難易度）。正答率は利用者・科目・難易度の主キーで引くだけになり、
+        回答数によらず一定の時間で求められる。保存期間管理のアーカイブによる削除では減らさない。
+        """
+        add = """
+            INSERT INTO quiz_accuracy (user_id, subject_id, difficulty, attempts, correct)
+            SELECT NEW.user_id, subject_id, COALESCE(NEW.difficulty, difficulty, 1), 1, NEW.is_correct != 0
+            FROM quizzes WHERE id = NEW.quiz_id
+            ON CONFLICT (user_id, subject_id, difficulty) DO UPDATE SET
+                attempts = attempts + 1,
+                correct = correct + excluded.correct;
+        """
+        remove = """
+            UPDATE quiz_accuracy SET
+                attempts = MAX(attempts - 1, 0),
+                correct = MAX(correct - (OLD.is_correct != 0), 0)
+            WHERE user_id = OLD.user_id
+              AND (subject_id, difficulty) IN (
+                  SELECT subject_id, COALESCE(OLD.difficulty, difficulty, 1) FROM quizzes WHERE id = OLD.quiz_id
+              );
+        """
+        for event, condition, body in (
+            ("INSERT", "", add),
+            ("UPDATE OF user_id, quiz_id, is_correct, difficulty", "", remove + add),
+            ("DELETE", NOT_ARCHIVING, remove),
+        ):
+            name = f"trg_quiz_results_{event.split()[0].lower()}_accuracy"
+            self.replace_trigger(cursor, name, f"""
+                CREATE TRIGGER {name}
+                AFTER {event} ON quiz_results {condition}
+                BEGIN
+                    {body}
+                END
+            """)
+    
+    def backfill_quiz_accuracy(self, cursor, after: Optional[Dict[str, int]] = None):
+        """既存のクイズ結果を quiz_accuracy に加算（導入前に作成されたデータベース用）
+
+        after に {テーブル: ID} を渡すと、そのIDより後の結果だけを加算する（一括投入用）。
+        """
+        cursor.execute("""
+            INSERT INTO quiz_accuracy (user_id, subject_id, difficulty, attempts, correct)
+            SELECT qr.user_id, q.subject_id, COALESCE(qr.difficulty, q.difficulty, 1), COUNT(*),
+                   SUM(qr.is_correct != 0)
+            FROM quiz_results AS qr
+            JOIN quizzes AS q ON q.id = qr.quiz_id
+            WHERE qr.id > ?
+            GROUP BY qr.user_id, q.subject_id, COALESCE(qr.difficulty, q.difficulty, 1)
+            ON CONFLICT (user_id, subject_id, difficulty) DO UPDATE SET
+                attempts = attempts + excluded.attempts,
+                correct = correct + excluded.correct
+        """, ((after or {}).get("quiz_results", 0),))
+    
+    def create_item_stats_triggers(self, cursor):
+        """クイズ結果の追加・更新・削除で問題ごとの集計と選択肢ごとの回答数を増減するトリガーを作成
+
+        結果の書き込みと同じトランザクションで更新されるため、問題分析は回答数によらず
+        問題数に比例した時間で表示できる。選択肢ごとの回答数は選択肢に含まれる回答だけを数える。
+        保存期間管理のアーカイブによる削除では減らさない（集計はアーカイブ済みの結果も含む）。
+        """
+        # 壊れた選択肢の JSON で書き込みが失敗しないよう、json_each には妥当な JSON だけを渡す
+        is_option = """
+            EXISTS (
+                SELECT 1 FROM quizzes, json_each(CASE WHEN json_valid(quizzes.options) THEN quizzes.options ELSE '[]' END)
+                WHERE quizzes.id = {row}.quiz_id AND CAST(json_each.value AS TEXT) = {row}.user_answer
+            )
+        """
+        add = f"""
+            INSERT INTO quiz_item_stats (quiz_id, attempts, correct, timed_attempts, total_seconds)
+            VALUES (NEW.quiz_id, 1, NEW.is_correct != 0, NEW.time_taken_seconds IS NOT NULL,
+                    COALESCE(NEW.time_taken_seconds, 0))
+            ON CONFLICT (quiz_id) DO UPDATE SET
+                attempts = attempts + 1,
+                correct = correct + excluded.correct,
+                timed_attempts = timed_attempts + excluded.timed_attempts,
+                total_seconds = total_seconds + excluded.total_seconds;
+            INSERT INTO quiz_option_counts (quiz_id, answer, count)
+            SELECT NEW.quiz_id, NEW.user_answer, 1
+            WHERE {is_option.format(row="NEW")}
+            ON CONFLICT (quiz_id, answer) DO UPDATE SET count = count + 1;
+        """
+        remove = """
+            UPDATE quiz_item_stats SET
+                attempts = MAX(attempts - 1, 0),
+                correct = MAX(correct - (OLD.is_correct != 0), 0),
+                timed_attempts = MAX(timed_attempts - (OLD.time_taken_seconds IS NOT NULL), 0),
+                total_seconds = MAX(total_seconds - COALESCE(OLD.time_taken_seconds, 0), 0)
+            WHERE quiz_id = OLD.quiz_id;
+            UPDATE quiz_option_counts SET count = MAX(count - 1, 0)
+            WHERE quiz_id = OLD.quiz_id AND answer = OLD.user_answer;
+        """
+        for event, condition, body in (
+            ("INSERT", "", add),
+            ("UPDATE OF quiz_id, user_answer, is_correct, time_taken_seconds", "", remove + add),
+            ("DELETE", NOT_ARCHIVING, remove),
+        ):
+            name = f"trg_quiz_results_{event.split()[0].lower()}_item_stats"
+            self.replace_trigger(cursor, name, f"""
+                CREATE TRIGGER {name}
+                AFTER {event} ON quiz_results {condition}
+                BEGIN
+                    {body}
+                END
+            """)
+    
+    def backfill_item_stats(self, cursor, after: Optional[Dict[str, int]] = None):
+        """既存のクイズ結果を問題ごとの集計に加算（導入前に作成されたデータベース用）
+
+        after に {テーブル: ID} を渡すと、そのIDより後の結果だけを加算する（一括投入用）。
+        """
+        after_id = (after or {}).get("quiz_results", 0)
+        cursor.execute("""
+            INSERT INTO quiz_item_stats (quiz_id, attempts, correct, timed_attempts, total_seconds)
+            SELECT quiz_id, COUNT(*), SUM(is_correct != 0), COUNT(time_taken_seconds),
+                   COALESCE(SUM(time_taken_seconds), 0)
+            FROM quiz_results
+            WHERE id > ?
+            GROUP BY quiz_id
+            ON CONFLICT (quiz_id) DO UPDATE SET
+                attempts = attempts + excluded.attempts,
+                correct = correct + excluded.correct,
+                timed_attempts = timed_attempts + excluded.timed_attempts,
+                total_seconds = total_seconds + excluded.total_seconds
+        """, (after_id,))
+        cursor.execute("""
+            INSERT INTO quiz_option_counts (quiz_id, answer, count)
+            SELECT qr.quiz_id, qr.user_answer, COUNT(*)
+            FROM quiz_results AS qr
+            JOIN quizzes AS q ON q.id = qr.quiz_id
+            WHERE qr.id > ? AND EXISTS (
+                SELECT 1 FROM json_each(CASE WHEN json_valid(q.options) THEN q.options ELSE '[]' END)
+                WHERE CAST(json_each.value AS TEXT) = qr.user_answer
+            )
+            GROUP BY qr.quiz_id, qr.user_answer
+            ON CONFLICT (quiz_id, answer) DO UPDATE SET count = count + excluded.count
+        """, (after_id,))
+    
+    def backfill_events(self, cursor, after: Optional[Dict[str, int]] = None):
+        """既存の行を追加のイベントとして登録（イベントストアの導入前に作成されたデータベース用）
+
+        after に {テーブル: ID} を渡すと、そのテーブルのIDより後の行だけを登録する（一括投入用）。
+        発生日時は登録した時刻ではなく行自身の日時（EVENT_OCCURRED_AT）にする。
+        """
+        for table, (user, columns) in EVENT_TABLES.items():
+            if after is not None and table not in after:
+                continue
+            user_expr = user.format(row=table)
+            fields = ", ".join(f"'{column}', {column}" for column in columns)
+            occurred_at = f"COALESCE(datetime({EVENT_OCCURRED_AT[table]}), CURRENT_TIMESTAMP)"
+            cursor.execute(f"""
+                INSERT INTO event_outbox (user_id, type, payload, occurred_at)
+                SELECT {user_expr}, '{table}.insert', json_object({fields}), {occurred_at}
+                FROM {table} WHERE {user_expr} IS NOT NULL AND {columns[0]} > ?
+                ORDER BY {columns[0]}
+            """, ((after or {}).get(table, 0),))
+    
+    def backfill_change_log(self, cursor, after: Optional[Dict[str, int]] = None):
+        """既存の行を変更履歴に登録（変更履歴の導入前に作成されたデータベース用）
+
+        after に {テーブル: ID} を渡すと、そのテーブルのIDより後の行だけを登録する（一括投入用）。
+        """
+        for table, (logged_table, user, row_id) in CHANGE_LOG_TABLES.items():
+            if logged_table != table or (after is not None and table not in after):
+                continue
+            row_expr = row_id.format(row=table)
+            cursor.execute(f"""
+                INSERT INTO change_log (user_id, table_name, row_id, op)
+                SELECT {user.format(row=table)}, '{table}', {row_expr}, 'insert'
+                FROM {table} WHERE {row_expr} > ? ORDER BY {row_expr}
+            """, ((after or {}).get(table, 0),))
+    
+    def backfill_versions(self, cursor, after: Dict[str, int]):
+        """after（{テーブル: ID}）より後の行があるスコープのバージョンを上げる（一括投入用）"""
+        for table, scopes in VERSIONED_TABLES.items():
+            if table not in after:
+                continue
+            for scope in scopes:
+                cursor.execute(f"""
+                    INSERT INTO data_versions (scope, version, updated_at)
+                    SELECT DISTINCT {scope.format(row=table)}, 1, CURRENT_TIMESTAMP FROM {table} WHERE id > ?
+                    ON CONFLICT (scope) DO UPDATE SET
+                        version = version + 1,
+                        updated_at = CURRENT_TIMESTAMP
+                """, (after[table],))
+    
+    def create_derived_triggers(self, cursor):
+        """派生データ（バージョン・変更履歴・イベント・正答率・問題ごとの集計）を更新するトリガーを作成"""
+        self.create_version_triggers(cursor)
+        self.create_change_log_triggers(cursor)
+        self.create_event_triggers(cursor)
+        self.create_quiz_accuracy_triggers(cursor)
+        self.create_item_stats_triggers(cursor)
+    
+    def backfill_derived(self, cursor, after: Dict[str, int]):
+        """トリガーを外して投入した行（after の {テーブル: ID} より後）を派生データにまとめて反映"""
+        self.backfill_versions(cursor, after)
+        self.backfill_change_log(cursor, after)
+        self.backfill_events(cursor, after)
+        self.backfill_quiz_accuracy(cursor, after)
+        self.backfill_item_stats(cursor, after)
+    
+    def replace_trigger(self, cursor, name: str, sql: str):
+        """トリガーを作成（既存のトリガーと定義が異なる場合は作り直す）
+
+        CREATE TRIGGER IF NOT EXISTS では既存のデータベースのトリガーが更新されないため、
+        定義を変えたトリガーはこれで作成する。
+        """
+        row = cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)
+        ).fetchone()
+        if row is not None:
+            if row[0].split() == sql.split():
+                return
+            cursor.execute(f"DROP TRIGGER {name}")
+        cursor.execute(sql)
+    
+    def drop_derived_triggers(self, cursor):
+        """派生データを更新するトリガーをすべて削除（大量投入時に一時的に外す）"""
+        names = [row[0] for row in cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg\\_%' ESCAPE '\\'"
+        ).fetchall()]
+        for name in names:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+    
+    def get_data_version(self, scope: str) -> int:
+        """スコープのデータバージョンを取得"""
+        with self.get_connection() as conn:
+            row = conn.execute("SELECT version FROM data_versions WHERE scope = ?", (scope,)).fetchone()
+        return row[0] if row else 0
+    
+    def bump_data_version(self, scope: str):
+        """スコープのデータバージョンを上げる（トリガー対象外の変更用）"""
+        with self.write_transaction() as conn:
+            conn.execute("""
+                INSERT INTO data_versions (scope, version, updated_at)
+                VALUES (?, 1, CURRENT_TIMESTAMP)
+                ON CONFLICT (scope) DO UPDATE SET
+                    version = version + 1,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (scope,))
+    
     def insert_initial_data(self):
         """初期データの投入"""
-        with self.get_connection() as conn:
+        with self.write_transaction() as conn:
             cursor = conn.cursor()
             
             # 教科データが存在しない場合のみ投入
@@ -171,16 +1146,59 @@ class DatabaseController:
                     "INSERT INTO subjects (name, category, description, grade_level) VALUES (?, ?, ?, ?)",
                     subjects
                 )
-                conn.commit()
 
 # グローバルインスタンス
-db_controller = DatabaseController()
+db_controller: Optional[DatabaseController] = None
+_init_lock = threading.Lock()
+
+# シャーディングが有効な場合のルーター（環境変数 READY_TO_STUDY_DIRECTORY を指定したとき）
+shard_router = None
 
 def init_database():
-    """データベース初期化（アプリ起動時に呼び出し）"""
-    global db_controller
-    db_controller = DatabaseController()
+    """データベース初期化（アプリ起動時に呼び出し）
 
-def get_database():
-    """データベースコントローラーを取得"""
+    Streamlitは再実行のたびに呼び出すため、書き込み接続を共有できるよう
+    プロセス内で1度だけ初期化する。環境変数 READY_TO_STUDY_DB でファイルを指定できる。
+    READY_TO_STUDY_DIRECTORY を指定するとテナントごとのシャードに振り分け、
+    db_controller は既定のシャードになる。
+    """
+    global db_controller, shard_router
+    with _init_lock:
+        if db_controller is None:
+            db_path = os.environ.get("READY_TO_STUDY_DB", "data/study_app.db")
+            directory_path = os.environ.get("READY_TO_STUDY_DIRECTORY")
+            if directory_path:
+                from src.controllers.sharding import create_router
+                shard_router = create_router(directory_path, db_path)
+                db_controller = shard_router.primary()
+            else:
+                db_controller = DatabaseController(db_path)
     return db_controller
+
+def get_database(user_id: Optional[int] = None):
+    """データベースコントローラーを取得
+
+    シャーディングが有効な場合は user_id のシャードを返す
+    （省略時は教科・クイズなどの参照用データを持つ既定のシャード）。
+    """
+    db = db_controller or init_database()
+    if shard_router is not None and user_id is not None:
+        return shard_router.database_for_user(user_id)
+    return db
+
+def all_databases() -> List["DatabaseController"]:
+    """全データベース（シャーディングが有効な場合は全シャード）"""
+    if shard_router is not None:
+        return [shard_router.database(shard) for shard in shard_router.routes().shards.values()]
+    return [get_database()]
+
+def sync_reference_data():
+    """教科・クイズの変更を他のシャードへ複製（シャーディング無効時は何もしない）"""
+    if shard_router is not None:
+        shard_router.sync_reference_data()
+
+def database_for_scope(scope: str):
+    """データバージョンのスコープに対応するデータベースを取得"""
+    if scope.startswith(("user:", "study_sessions:")):
+        return get_database(int(scope.split(":", 1)[1]))
+    return get_database()
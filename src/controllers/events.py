@@ -0,0 +1,438 @@
+"""
+追記専用の学習イベントストア
+
+学習記録・クイズ結果・予定の変更はトリガーで event_outbox に "テーブル.操作" の
+イベントとして記録される（database.EVENT_TABLES）。EventStore.flush が送信待ちの
+イベントをまとめてセグメントファイル（JSON Lines）の末尾に追記し、セグメントが
+segment_bytes を超えたら次のセグメントに切り替える。書き込みは常にファイル末尾への
+大きな連続書き込みで、一度書いたイベントは変更しない。
+追記と圧縮はストアのディレクトリのロックファイルを排他ロック（flock）してから行うため、
+ワーカーのイベント送出スレッドと cron のスクリプトが同時に動いても同じイベントを
+二重に追記しない。
+
+集計（射影）は Projection として定義し、compact がユーザーごとの状態を
+event_snapshots に保存する。状態の再構築は保存済みのスナップショットと、
+それ以降のイベント（末尾のセグメントのみ）の再生で済む。until を指定すれば
+最初から再生して過去の時点の状態も求められる。保存期間管理によるアーカイブは
+"テーブル.archive" のイベントになり、射影は削除として扱わない。
+"""
+
+import json
+import logging
+import os
+import threading
+from bisect import bisect_right
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from src.controllers.database import all_databases
+from src.controllers.metrics import render_gauges
+from src.controllers.sidecar import register_collector
+
+try:
+    import fcntl
+except ImportError:  # Windows ではプロセス間のロックを行わない
+    fcntl = None
+
+logger = logging.getLogger("ready_to_study.events")
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".jsonl"
+LOCK_FILE = ".lock"
+
+# 既定のセグメントの大きさ（これを超えたら次のセグメントに追記する）
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+
+# 送信待ちから1回に読み出すイベント数
+DEFAULT_FLUSH_BATCH = 5000
+
+
+class Projection:
+    """イベントを畳み込んで作るユーザーごとの状態
+
+    state は JSON に変換できる値とする（スナップショットとして保存するため）。
+    """
+    name = ""
+
+    def initial(self) -> Any:
+        raise NotImplementedError
+
+    def apply(self, state: Any, event: Dict[str, Any]) -> Any:
+        raise NotImplementedError
+
+
+class StudyRollup(Projection):
+    """学習時間の累計（教科別・日別）と連続学習日数"""
+    name = "study_rollup"
+
+    def initial(self) -> Dict[str, Any]:
+        return {"sessions": 0, "minutes": 0, "subjects": {}, "days": {}}
+
+    def _add(self, state: Dict[str, Any], row: Dict[str, Any], sign: int):
+        minutes = (row.get("duration_minutes") or 0) * sign
+        subject = str(row.get("subject_id"))
+        day = str(row.get("study_date") or "")[:10]
+        state["sessions"] += sign
+        state["minutes"] += minutes
+        state["subjects"][subject] = state["subjects"].get(subject, 0) + minutes
+        if not state["subjects"][subject]:
+            del state["subjects"][subject]
+        sessions, total = state["days"].get(day, [0, 0])
+        if sessions + sign:
+            state["days"][day] = [sessions + sign, total + minutes]
+        else:
+            state["days"].pop(day, None)
+
+    def apply(self, state: Dict[str, Any], event: Dict[str, Any]) -> Dict[str, Any]:
+        data = event["data"]
+        if event["type"] == "study_sessions.insert":
+            self._add(state, data, 1)
+        elif event["type"] == "study_sessions.update":
+            self._add(state, data["previous"], -1)
+            self._add(state, data, 1)
+        elif event["type"] == "study_sessions.delete":
+            self._add(state, data, -1)
+        return state
+
+    @staticmethod
+    def streaks(state: Dict[str, Any], today: Optional[date] = None) -> Dict[str, int]:
+        """現在（今日または昨日まで）と最長の連続学習日数"""
+        days = sorted(date.fromisoformat(day) for day in state["days"] if day)
+        longest = current = run = 0
+        previous = None
+        for day in days:
+            run = run + 1 if previous is not None and day - previous == timedelta(days=1) else 1
+            longest = max(longest, run)
+            previous = day
+        today = today or date.today()
+        if previous is not None and today - previous <= timedelta(days=1):
+            current = run
+        return {"current": current, "longest": longest}
+
+
+class QuizBoxes(Projection):
+    """クイズごとの復習間隔（ライトナー方式の箱）
+
+    正解で箱を1つ進め、不正解で最初の箱に戻す。次回の復習日は箱ごとの間隔で決まる。
+    """
+    name = "quiz_boxes"
+    INTERVAL_DAYS = (1, 2, 4, 8, 16)
+
+    def initial(self) -> Dict[str, Any]:
+        return {}
+
+    def apply(self, state: Dict[str, Any], event: Dict[str, Any]) -> Dict[str, Any]:
+        if event["type"] != "quiz_results.insert":
+            return state
+        data = event["data"]
+        quiz = str(data["quiz_id"])
+        box = state.get(quiz, {}).get("box", 0)
+        box = min(box + 1, len(self.INTERVAL_DAYS)) if data.get("is_correct") else 1
+        attempted_at = datetime.fromisoformat(str(data.get("attempted_at") or event["at"]))
+        state[quiz] = {
+            "box": box,
+            "attempts": state.get(quiz, {}).get("attempts", 0) + 1,
+            "due": (attempted_at + timedelta(days=self.INTERVAL_DAYS[box - 1])).date().isoformat(),
+        }
+        return state
+
+
+# 圧縮の対象となる射影
+PROJECTIONS: Dict[str, Projection] = {p.name: p for p in (StudyRollup(), QuizBoxes())}
+
+
+class EventStore:
+    """セグメントファイルへの追記とスナップショットによる再生"""
+
+    def __init__(self, db, directory: Optional[str] = None, segment_bytes: int = DEFAULT_SEGMENT_BYTES):
+        self.db = db
+        self.directory = directory or default_event_directory(db.db_path)
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.last_seq = self._read_last_seq()
+        self.appended = 0
+
+    def segments(self) -> List[str]:
+        """セグメントファイルの一覧（古い順）"""
+        names = [name for name in os.listdir(self.directory)
+                 if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)]
+        return [os.path.join(self.directory, name) for name in sorted(names)]
+
+    @staticmethod
+    def _first_seq(path: str) -> int:
+        return int(os.path.basename(path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+    def _read_last_seq(self) -> int:
+        segments = self.segments()
+        if not segments:
+            return 0
+        with open(segments[-1], "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 65536))
+            lines = [line for line in f.read().splitlines() if line.strip()]
+        for line in reversed(lines):
+            try:
+                return json.loads(line)["seq"]
+            except (ValueError, KeyError):
+                # 書き込み途中で止まった最終行は読み飛ばす
+                continue
+        return self._first_seq(segments[-1]) - 1
+
+    @contextmanager
+    def _exclusive(self):
+        """プロセス内外で排他して追記・圧縮する（他のプロセスが追記した位置を読み直す）"""
+        with self._lock:
+            with open(os.path.join(self.directory, LOCK_FILE), "a+b") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    self.last_seq = self._read_last_seq()
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def flush(self, batch_size: int = DEFAULT_FLUSH_BATCH) -> int:
+        """送信待ちのイベントをセグメントに追記して送信待ちから削除
+
+        追記後・削除前に停止した場合は、次回 last_seq 以下のイベントを追記せずに削除する。
+        """
+        with self._exclusive():
+            return self._flush(batch_size)
+
+    def _flush(self, batch_size: int) -> int:
+        total = 0
+        while True:
+            with self.db.get_connection() as conn:
+                rows = conn.execute("""
+                    SELECT id, user_id, type, payload, occurred_at FROM event_outbox
+                    ORDER BY id LIMIT ?
+                """, (batch_size,)).fetchall()
+            if not rows:
+                break
+            lines = [
+                json.dumps({"seq": seq, "user_id": user_id, "type": type_, "at": occurred_at,
+                            "data": json.loads(payload)}, ensure_ascii=False, separators=(",", ":"))
+                for seq, user_id, type_, payload, occurred_at in rows if seq > self.last_seq
+            ]
+            if lines:
+                self._append(rows[-1][0], lines)
+                total += len(lines)
+            with self.db.write_transaction() as conn:
+                conn.execute("DELETE FROM event_outbox WHERE id <= ?", (rows[-1][0],))
+            if len(rows) < batch_size:
+                break
+        self.appended += total
+        return total
+
+    def _append(self, last_seq: int, lines: List[str]):
+        segments = self.segments()
+        path = segments[-1] if segments else None
+        if path is None or os.path.getsize(path) >= self.segment_bytes:
+            first_seq = json.loads(lines[0])["seq"]
+            path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{first_seq:015d}{SEGMENT_SUFFIX}")
+        with open(path, "a+b") as f:
+            # 書き込み途中で止まった最終行があれば改行で区切る
+            if f.tell() > 0:
+                f.seek(f.tell() - 1)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            f.write(("\n".join(lines) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        self.last_seq = last_seq
+
+    def read(self, after: int = 0, user_id: Optional[int] = None,
+             until: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+        """seq が after より後のイベントを順に読む（after を含まないセグメントは開かない）"""
+        segments = self.segments()
+        starts = [self._first_seq(path) for path in segments]
+        index = max(0, bisect_right(starts, after) - 1)
+        until_text = until.isoformat(sep=" ") if until is not None else None
+        for path in segments[index:]:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue
+                    if event["seq"] <= after or (user_id is not None and event["user_id"] != user_id):
+                        continue
+                    if until_text is not None and event["at"] > until_text:
+                        return
+                    yield event
+
+    def load_snapshot(self, projection: Projection, user_id: int):
+        """保存済みのスナップショット (seq, 状態)"""
+        with self.db.get_connection() as conn:
+            row = conn.execute(
+                "SELECT seq, state FROM event_snapshots WHERE projection = ? AND user_id = ?",
+                (projection.name, user_id)
+            ).fetchone()
+            if row is None:
+                # スナップショットの無いユーザーも圧縮済みの位置までのイベントは持たない
+                watermark = conn.execute(
+                    "SELECT seq FROM event_projections WHERE name = ?", (projection.name,)
+                ).fetchone()
+                return (watermark[0] if watermark else 0), projection.initial()
+        return row[0], json.loads(row[1])
+
+    def replay(self, projection: Projection, user_id: int, until: Optional[datetime] = None) -> Any:
+        """ユーザーの状態を再構築（until（UTC）指定時はその時点の状態を最初から再生）"""
+        if until is None:
+            seq, state = self.load_snapshot(projection, user_id)
+        else:
+            seq, state = 0, projection.initial()
+        for event in self.read(seq, user_id, until):
+            state = projection.apply(state, event)
+        return state
+
+    def compact(self, projection: Projection, batch_users: int = 500) -> Dict[str, int]:
+        """前回の圧縮以降のイベントを畳み込み、ユーザーごとのスナップショットを更新"""
+        with self._exclusive():
+            self._flush(DEFAULT_FLUSH_BATCH)
+            return self._compact(projection, batch_users)
+
+    def _compact(self, projection: Projection, batch_users: int) -> Dict[str, int]:
+        with self.db.get_connection() as conn:
+            row = conn.execute("SELECT seq FROM event_projections WHERE name = ?", (projection.name,)).fetchone()
+        watermark = row[0] if row else 0
+
+        states: Dict[int, Any] = {}
+        last_seq = watermark
+        events = 0
+        for event in self.read(watermark):
+            user_id = event["user_id"]
+            if user_id not in states:
+                states[user_id] = self.load_snapshot(projection, user_id)[1]
+            states[user_id] = projection.apply(states[user_id], event)
+            last_seq = event["seq"]
+            events += 1
+
+        users = list(states.items())
+        for start in range(0, len(users), batch_users):
+            with self.db.write_transaction() as conn:
+                conn.executemany("""
+                    INSERT INTO event_snapshots (projection, user_id, seq, state) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (projection, user_id) DO UPDATE SET seq = excluded.seq, state = excluded.state
+                """, [(projection.name, user_id, last_seq, json.dumps(state, ensure_ascii=False))
+                      for user_id, state in users[start:start + batch_users]])
+        with self.db.write_transaction() as conn:
+            conn.execute("""
+                INSERT INTO event_projections (name, seq, compacted_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (name) DO UPDATE SET seq = excluded.seq, compacted_at = excluded.compacted_at
+            """, (projection.name, last_seq))
+        return {"events": events, "users": len(users), "seq": last_seq}
+
+    def stats(self) -> Dict[str, Any]:
+        """セグメント数・大きさ・送信待ちの件数"""
+        segments = self.segments()
+        with self.db.get_connection() as conn:
+            pending = conn.execute("SELECT COUNT(*) FROM event_outbox").fetchone()[0]
+        return {
+            "segments": len(segments),
+            "bytes": sum(os.path.getsize(path) for path in segments),
+            "last_seq": self.last_seq,
+            "pending": pending,
+            "appended": self.appended,
+        }
+
+
+def default_event_directory(db_path: str) -> str:
+    """データベースごとのイベントストアの保存先（環境変数 EVENT_STORE_DIR の下、既定はDBと同じ場所）"""
+    base = os.environ.get("EVENT_STORE_DIR") or os.path.join(os.path.dirname(db_path), "events")
+    return os.path.join(base, os.path.splitext(os.path.basename(db_path))[0])
+
+
+class EventPump:
+    """送信待ちのイベントを定期的にセグメントへ移し、射影を圧縮するスレッド"""
+
+    def __init__(self, flush_interval: float = 10.0, compact_interval: float = 3600.0,
+                 store_factory: Callable[[Any], EventStore] = EventStore):
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.store_factory = store_factory
+        self.stores: Dict[str, EventStore] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """スレッドを開始"""
+        self._thread = threading.Thread(target=self._run, name="event-pump", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """スレッドを停止（最後に送信待ちを追記する）"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def store(self, db) -> EventStore:
+        """データベースのイベントストア"""
+        store = self.stores.get(db.db_path)
+        if store is None:
+            store = self.stores[db.db_path] = self.store_factory(db)
+        return store
+
+    def _run(self):
+        next_compact = self.compact_interval
+        elapsed = 0.0
+        while not self._stop.wait(self.flush_interval):
+            elapsed += self.flush_interval
+            for db in all_databases():
+                try:
+                    store = self.store(db)
+                    store.flush()
+                    if elapsed >= next_compact:
+                        for projection in PROJECTIONS.values():
+                            store.compact(projection)
+                except Exception:
+                    logger.exception("event store maintenance failed for %s", db.db_path)
+            if elapsed >= next_compact:
+                next_compact = elapsed + self.compact_interval
+        for db in all_databases():
+            self.store(db).flush()
+
+    def render_prometheus(self) -> List[str]:
+        """送信待ち・追記済みのイベント数を Prometheus 形式で出力"""
+        stats = [store.stats() for store in list(self.stores.values())]
+        return render_gauges([
+            ("rts_events_appended_total", "counter", "Learning events appended to segments by this process.",
+             sum(s["appended"] for s in stats)),
+            ("rts_events_pending", "gauge", "Learning events waiting in the outbox.", sum(s["pending"] for s in stats)),
+            ("rts_events_segment_bytes", "gauge", "Total size of event store segments.", sum(s["bytes"] for s in stats)),
+        ])
+
+
+# グローバルインスタンス（start_event_pump で作成）
+event_pump: Optional[EventPump] = None
+_pump_lock = threading.Lock()
+
+def start_event_pump() -> Optional[EventPump]:
+    """イベントの追記・圧縮を開始（プロセス内で1度だけ）
+
+    セグメントへの追記が重ならないよう、ワーカー番号 0 のプロセス（単独起動を含む）
+    だけで実行する。EVENT_STORE=off で無効にできる。
+    """
+    global event_pump
+    if os.environ.get("EVENT_STORE", "").lower() in ("0", "false", "no", "off"):
+        return None
+    if os.environ.get("READY_TO_STUDY_WORKER_INDEX", "0") != "0":
+        return None
+    with _pump_lock:
+        if event_pump is None:
+            event_pump = EventPump(
+                flush_interval=float(os.environ.get("EVENT_FLUSH_INTERVAL", "10")),
+                compact_interval=float(os.environ.get("EVENT_COMPACT_INTERVAL", "3600")),
+            )
+            event_pump.start()
+    return event_pump
+
+
+def _events_collector() -> List[str]:
+    return event_pump.render_prometheus() if event_pump is not None else []
+
+
+register_collector(_events_collector)
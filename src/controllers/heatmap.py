@@ -0,0 +1,120 @@
+"""
+1年間の学習カレンダー（ヒートマップ）
+
+利用者の直近1年分の学習記録を (user_id, study_date) のインデックスの範囲読み取り1回で
+取得し、日付を期間の初日からの日数の NumPy 配列に変換して np.bincount で日ごと・
+教科ごとの学習時間にまとめる。Python のループは行数によらず、描画するマスの数だけになる。
+集計結果は利用者スコープのデータバージョンでキャッシュし、描画は Matplotlib を使わずに
+週を列・曜日を行にした軽量な SVG の文字列を作る。
+"""
+
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from html import escape
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# カレンダーの週数（今週を含む）
+HEATMAP_WEEKS = 53
+
+# 色分けの境界（分）と色（学習なし、境界ごとに濃くなる）
+HEATMAP_LEVELS = (1, 30, 60, 120)
+HEATMAP_COLORS = ("#ebedf0", "#c6e48b", "#7bc96f", "#239a3b", "#196127")
+
+# マスの大きさと間隔（px）、左の曜日・上の月の表示幅
+CELL_SIZE = 11
+CELL_GAP = 2
+LEFT_MARGIN = 24
+TOP_MARGIN = 16
+
+WEEKDAY_LABELS = {1: "月", 3: "水", 5: "金"}
+
+
+@dataclass(frozen=True)
+class StudyHeatmap:
+    """期間の初日からの日ごとの学習時間（分）"""
+    start: date
+    end: date
+    total: np.ndarray
+    by_subject: Dict[int, np.ndarray] = field(default_factory=dict)
+
+    def minutes(self, subject_id: Optional[int] = None) -> np.ndarray:
+        """日ごとの学習時間（subject_id を省略すると全教科）"""
+        if subject_id is None:
+            return self.total
+        return self.by_subject.get(subject_id, np.zeros_like(self.total))
+
+    def subjects(self) -> List[int]:
+        """期間内に学習記録のある教科（学習時間の多い順）"""
+        return sorted(self.by_subject, key=lambda subject_id: -self.by_subject[subject_id].sum())
+
+
+def heatmap_period(today: date, weeks: int = HEATMAP_WEEKS) -> Tuple[date, date]:
+    """カレンダーの期間 [start, end)（start は日曜日、end は today の翌日）"""
+    this_sunday = today - timedelta(days=(today.weekday() + 1) % 7)
+    return this_sunday - timedelta(weeks=weeks - 1), today + timedelta(days=1)
+
+
+def bin_study_days(day_strings: Sequence[str], subject_ids: Sequence[int], minutes: Sequence[int],
+                   start: date, end: date) -> StudyHeatmap:
+    """学習記録の日付・教科・学習時間を日ごと・教科ごとに集計"""
+    days = (end - start).days
+    if not len(day_strings):
+        return StudyHeatmap(start, end, np.zeros(days))
+    day_index = (np.array(day_strings, dtype="datetime64[D]") - np.datetime64(start, "D")).astype(np.int64)
+    weights = np.asarray(minutes, dtype=np.float64)
+    subjects, subject_index = np.unique(np.asarray(subject_ids, dtype=np.int64), return_inverse=True)
+    # 教科ごとの行を並べた1次元の位置に変換して1回の bincount でまとめる
+    grid = np.bincount(subject_index * days + day_index, weights=weights,
+                       minlength=len(subjects) * days).reshape(len(subjects), days)
+    return StudyHeatmap(start, end, grid.sum(axis=0),
+                        {int(subject_id): grid[row] for row, subject_id in enumerate(subjects)})
+
+
+def load_study_heatmap(conn, user_id: int, today: Optional[date] = None,
+                       weeks: int = HEATMAP_WEEKS) -> StudyHeatmap:
+    """利用者の直近 weeks 週の学習カレンダー（学習記録の範囲読み取り1回）"""
+    start, end = heatmap_period(today or date.today(), weeks)
+    rows = conn.execute("""
+        SELECT substr(study_date, 1, 10), subject_id, duration_minutes
+        FROM study_sessions
+        WHERE user_id = ? AND study_date >= ? AND study_date < ?
+    """, (user_id, start.isoformat(), end.isoformat())).fetchall()
+    if not rows:
+        return bin_study_days((), (), (), start, end)
+    day_strings, subject_ids, minutes = zip(*rows)
+    return bin_study_days(day_strings, subject_ids, [value or 0 for value in minutes], start, end)
+
+
+def render_heatmap_svg(heatmap: StudyHeatmap, subject_id: Optional[int] = None) -> str:
+    """週を列・曜日を行にした SVG（各マスに日付と学習時間のツールチップ付き）"""
+    minutes = heatmap.minutes(subject_id)
+    levels = np.digitize(minutes, HEATMAP_LEVELS)
+    step = CELL_SIZE + CELL_GAP
+    weeks = -(-len(minutes) // 7)
+    width = LEFT_MARGIN + weeks * step
+    height = TOP_MARGIN + 7 * step
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" font-size="9" fill="#767676">'
+    ]
+    for row, label in WEEKDAY_LABELS.items():
+        parts.append(f'<text x="0" y="{TOP_MARGIN + row * step + CELL_SIZE - 2}">{label}</text>')
+
+    previous_month = None
+    for index, (value, level) in enumerate(zip(minutes.tolist(), levels.tolist())):
+        day = heatmap.start + timedelta(days=index)
+        week, row = divmod(index, 7)
+        x = LEFT_MARGIN + week * step
+        if row == 0 and day.month != previous_month:
+            # 月が変わった週の上に月を表示
+            parts.append(f'<text x="{x}" y="{TOP_MARGIN - 5}">{day.month}月</text>')
+            previous_month = day.month
+        parts.append(
+            f'<rect x="{x}" y="{TOP_MARGIN + row * step}" width="{CELL_SIZE}" height="{CELL_SIZE}" '
+            f'rx="2" fill="{HEATMAP_COLORS[level]}"><title>{escape(day.isoformat())}: {value:.0f}分</title></rect>'
+        )
+    parts.append("</svg>")
+    return "".join(parts)
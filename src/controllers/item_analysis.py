@@ -0,0 +1,187 @@
+"""
+クイズの問題分析
+
+問題ごとの回答数・正解数・回答時間（quiz_item_stats）と選択肢ごとの回答数
+（quiz_option_counts）はクイズ結果のトリガーで書き込みと同じトランザクションで更新される。
+分析は quiz_results を集計せず、科目の問題（idx_quizzes_subject_difficulty）に
+集計行を主キーで結び付けるだけで表示する。並べ替えと1ページ分の取り出しは SQL で行い、
+選択肢ごとの回答数は表示するページの問題だけを読み込む。
+
+シャーディングが有効な場合、集計は各シャードのクイズ結果から数えられているため、
+全シャードの集計を問題ごとに足し合わせてから並べ替える。
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from src.controllers.quiz_session import parse_options
+
+# 並べ替えの項目と SQL の式（同じ値は問題IDの順）
+ITEM_SORTS = {
+    "正答率": "CAST(s.correct AS REAL) / NULLIF(s.attempts, 0)",
+    "回答数": "COALESCE(s.attempts, 0)",
+    "平均回答時間": "CAST(s.total_seconds AS REAL) / NULLIF(s.timed_attempts, 0)",
+    "難易度": "q.difficulty",
+    "作成順": "q.id",
+}
+
+# シャードの集計を足し合わせた場合の並べ替えの値（ITEM_SORTS と同じ項目）
+ITEM_SORT_KEYS = {
+    "正答率": lambda item: item.accuracy,
+    "回答数": lambda item: item.attempts,
+    "平均回答時間": lambda item: item.mean_seconds,
+    "難易度": lambda item: item.difficulty,
+    "作成順": lambda item: item.quiz_id,
+}
+
+# 1ページに表示する問題数
+DEFAULT_PAGE_SIZE = 20
+
+# 判定に必要な回答数と、難しすぎる・易しすぎる正答率
+MIN_ATTEMPTS = 10
+HARD_ACCURACY = 0.3
+EASY_ACCURACY = 0.95
+
+
+@dataclass(frozen=True)
+class ItemStats:
+    """1問の回答状況"""
+    quiz_id: int
+    title: str
+    difficulty: int
+    options: Optional[Tuple[str, ...]]
+    correct_answer: str
+    attempts: int
+    correct: int
+    timed_attempts: int
+    total_seconds: int
+
+    @property
+    def accuracy(self) -> Optional[float]:
+        """正答率（回答がなければ None）"""
+        return self.correct / self.attempts if self.attempts else None
+
+    @property
+    def mean_seconds(self) -> Optional[float]:
+        """平均回答時間（秒）"""
+        return self.total_seconds / self.timed_attempts if self.timed_attempts else None
+
+
+def item_flag(item: ItemStats, option_counts: Mapping[str, int]) -> Optional[str]:
+    """見直しが必要そうな問題の判定（回答が MIN_ATTEMPTS 問に満たない場合は判定しない）"""
+    if item.attempts < MIN_ATTEMPTS:
+        return None
+    if item.options is not None and item.correct_answer not in item.options:
+        return "正解が選択肢にない"
+    if option_counts:
+        most_chosen = max(option_counts, key=option_counts.get)
+        if most_chosen != item.correct_answer and option_counts[most_chosen] > item.correct:
+            return "誤答が最多（正解の確認）"
+    if item.accuracy < HARD_ACCURACY:
+        return "難しすぎる"
+    if item.accuracy > EASY_ACCURACY:
+        return "易しすぎる"
+    return None
+
+
+def _order_by(sort: str, descending: bool) -> str:
+    direction = "DESC" if descending else "ASC"
+    return f"{ITEM_SORTS[sort]} {direction} NULLS LAST, q.id {direction}"
+
+
+def _item(row) -> ItemStats:
+    quiz_id, title, difficulty, options, correct_answer, attempts, correct, timed_attempts, total_seconds = row
+    return ItemStats(quiz_id, title, difficulty or 1, parse_options(options), correct_answer,
+                     attempts, correct, timed_attempts, total_seconds)
+
+
+def load_item_page(conn, subject_id: int, sort: str = "正答率", descending: bool = False,
+                   page: int = 1, page_size: int = DEFAULT_PAGE_SIZE) -> Tuple[List[ItemStats], int]:
+    """科目の問題を並べ替えて1ページ分の集計と、科目の問題数を取得"""
+    total = conn.execute("SELECT COUNT(*) FROM quizzes WHERE subject_id = ?", (subject_id,)).fetchone()[0]
+    rows = conn.execute(f"""
+        SELECT q.id, q.title, q.difficulty, q.options, q.correct_answer,
+               COALESCE(s.attempts, 0), COALESCE(s.correct, 0),
+               COALESCE(s.timed_attempts, 0), COALESCE(s.total_seconds, 0)
+        FROM quizzes AS q
+        LEFT JOIN quiz_item_stats AS s ON s.quiz_id = q.id
+        WHERE q.subject_id = ?
+        ORDER BY {_order_by(sort, descending)}
+        LIMIT ? OFFSET ?
+    """, (subject_id, page_size, (max(page, 1) - 1) * page_size)).fetchall()
+    return [_item(row) for row in rows], total
+
+
+def load_option_counts(conn, quiz_ids: Sequence[int]) -> Dict[int, Dict[str, int]]:
+    """問題ごとの選択肢別の回答数"""
+    counts: Dict[int, Dict[str, int]] = {quiz_id: {} for quiz_id in quiz_ids}
+    if not quiz_ids:
+        return counts
+    rows = conn.execute(f"""
+        SELECT quiz_id, answer, count FROM quiz_option_counts
+        WHERE quiz_id IN ({', '.join('?' * len(quiz_ids))}) AND count > 0
+    """, list(quiz_ids)).fetchall()
+    for quiz_id, answer, count in rows:
+        counts[quiz_id][answer] = count
+    return counts
+
+
+def _merge(tables: Sequence[Sequence[tuple]]) -> Dict[int, List[int]]:
+    merged: Dict[int, List[int]] = {}
+    for rows in tables:
+        for quiz_id, *values in rows:
+            totals = merged.setdefault(quiz_id, [0] * len(values))
+            for index, value in enumerate(values):
+                totals[index] += value
+    return merged
+
+
+def item_analysis(databases: Sequence, subject_id: int, sort: str = "正答率", descending: bool = False,
+                  page: int = 1, page_size: int = DEFAULT_PAGE_SIZE
+                  ) -> Tuple[List[Tuple[ItemStats, Dict[str, int]]], int]:
+    """問題分析の1ページ分（問題の集計と選択肢別の回答数）と科目の問題数
+
+    databases の先頭は教科・クイズの参照用データを持つデータベースとする。
+    """
+    if sort not in ITEM_SORTS:
+        raise ValueError(f"未対応の並べ替えです: {sort}")
+    if len(databases) == 1:
+        with databases[0].analytics_snapshot() as conn:
+            items, total = load_item_page(conn, subject_id, sort, descending, page, page_size)
+            counts = load_option_counts(conn, [item.quiz_id for item in items])
+        return [(item, counts[item.quiz_id]) for item in items], total
+
+    # 各シャードの集計を足し合わせる（行数は科目の問題数に比例し、回答数にはよらない）
+    stats_tables, count_tables = [], []
+    for db in databases:
+        with db.analytics_snapshot() as conn:
+            stats_tables.append(conn.execute("""
+                SELECT s.quiz_id, s.attempts, s.correct, s.timed_attempts, s.total_seconds
+                FROM quizzes AS q
+                JOIN quiz_item_stats AS s ON s.quiz_id = q.id
+                WHERE q.subject_id = ?
+            """, (subject_id,)).fetchall())
+            count_tables.append(conn.execute("""
+                SELECT c.quiz_id, c.answer, c.count
+                FROM quizzes AS q
+                JOIN quiz_option_counts AS c ON c.quiz_id = q.id
+                WHERE q.subject_id = ? AND c.count > 0
+            """, (subject_id,)).fetchall())
+    with databases[0].analytics_snapshot() as conn:
+        quizzes = conn.execute("""
+            SELECT id, title, difficulty, options, correct_answer FROM quizzes WHERE subject_id = ?
+        """, (subject_id,)).fetchall()
+    stats = _merge(stats_tables)
+    items = [_item((*quiz, *stats.get(quiz[0], (0, 0, 0, 0)))) for quiz in quizzes]
+
+    key = ITEM_SORT_KEYS[sort]
+    # 値のない問題は並べ替えの向きによらず最後に置き、同じ値は問題IDの順にする
+    items.sort(key=lambda item: item.quiz_id, reverse=descending)
+    items.sort(key=lambda item: (key(item) is None, (key(item) or 0) * (-1 if descending else 1)))
+
+    page_items = items[(max(page, 1) - 1) * page_size:max(page, 1) * page_size]
+    counts: Dict[int, Dict[str, int]] = {item.quiz_id: {} for item in page_items}
+    for quiz_id, answer, count in (row for rows in count_tables for row in rows):
+        if quiz_id in counts:
+            counts[quiz_id][answer] = counts[quiz_id].get(answer, 0) + count
+    return [(item, counts[item.quiz_id]) for item in page_items], len(items)
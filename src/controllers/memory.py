@@ -0,0 +1,282 @@
+"""
+メモリ使用量の計測
+
+環境変数 MEMORY_PROFILING=1 のときだけ有効になる。tracemalloc を開始し、
+一定間隔でスナップショットを取得して、割り当ての多い箇所と前回からの増加分、
+セッションごとの st.session_state の推定サイズ、開いたままの matplotlib の図の数、
+キャッシュの推定サイズを記録する。RSS がしきい値を超えたら警告ログを出す。
+結果はサイドカーの /debug/memory（JSON）と /metrics から参照できる。
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from src.controllers.cache import get_cache
+from src.controllers.metrics import render_gauges
+from src.controllers.sidecar import process_rss_bytes, register_collector, register_route
+
+logger = logging.getLogger("ready_to_study.memory")
+
+# スナップショットの集計から除外するファイル（計測自体・インポート処理）
+_IGNORED_TRACES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def estimate_size(obj: Any, max_depth: int = 6) -> int:
+    """オブジェクトの推定サイズ（バイト、参照先を含む）
+
+    DataFrame・ndarray はバッファの大きさを使い、それ以外は sys.getsizeof を
+    コンテナと __dict__ を辿って合計する。同じオブジェクトは1度だけ数える。
+    """
+    seen = set()
+
+    def size(value: Any, depth: int) -> int:
+        if id(value) in seen:
+            return 0
+        seen.add(id(value))
+        memory_usage = getattr(value, "memory_usage", None)
+        if callable(memory_usage) and hasattr(value, "columns"):
+            try:
+                return int(memory_usage(deep=True).sum())
+            except Exception:
+                pass
+        nbytes = getattr(value, "nbytes", None)
+        if isinstance(nbytes, int):
+            return nbytes + sys.getsizeof(value)
+
+        total = sys.getsizeof(value)
+        if depth >= max_depth or isinstance(value, (str, bytes, bytearray, int, float, bool, type(None))):
+            return total
+        if isinstance(value, dict):
+            total += sum(size(k, depth + 1) + size(v, depth + 1) for k, v in value.items())
+        elif isinstance(value, (list, tuple, set, frozenset, deque)):
+            total += sum(size(item, depth + 1) for item in value)
+        elif hasattr(value, "__dict__"):
+            total += size(vars(value), depth + 1)
+        return total
+
+    return size(obj, 0)
+
+
+def open_figure_count() -> int:
+    """pyplot に登録されたまま閉じられていない図の数"""
+    pyplot = sys.modules.get("matplotlib.pyplot")
+    return len(pyplot.get_fignums()) if pyplot is not None else 0
+
+
+def session_state_sizes() -> List[Dict[str, Any]]:
+    """接続中の各セッションの st.session_state の推定サイズ（大きい順）"""
+    try:
+        from streamlit.runtime import Runtime
+        if not Runtime.exists():
+            return []
+        sessions = Runtime.instance()._session_mgr.list_active_sessions()
+    except Exception:
+        return []
+
+    sizes = []
+    for info in sessions:
+        state = info.session.session_state
+        try:
+            values = state.filtered_state
+        except Exception:
+            continue
+        sizes.append({
+            "session": info.session.id,
+            "keys": len(values),
+            "bytes": estimate_size(values),
+            "reruns": info.script_run_count,
+        })
+    return sorted(sizes, key=lambda item: item["bytes"], reverse=True)
+
+
+def cache_sizes() -> Dict[str, Any]:
+    """プロセス内キャッシュの推定サイズ（スコープの種類ごと）"""
+    by_kind: Dict[str, int] = {}
+    entries = get_cache().items()
+    for (scope, key), value in entries:
+        kind = f"{scope.split(':', 1)[0]}:{key}"
+        by_kind[kind] = by_kind.get(kind, 0) + estimate_size(value)
+    return {"entries": len(entries), "bytes": sum(by_kind.values()), "by_kind": by_kind}
+
+
+class MemoryMonitor:
+    """tracemalloc のスナップショットを定期的に取得して比較する"""
+
+    def __init__(self, interval: float = 300.0, alert_mb: float = 512.0,
+                 top_n: int = 15, frames: int = 5, history: int = 48):
+        self.interval = interval
+        self.alert_bytes = int(alert_mb * 1024 * 1024)
+        self.top_n = top_n
+        self.frames = frames
+        self.samples: "deque[Dict[str, Any]]" = deque(maxlen=history)
+        self.alerting = False
+        self._previous: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+        self._sample_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """tracemalloc と計測スレッドを開始"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self._thread = threading.Thread(target=self._run, name="memory-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """計測スレッドと tracemalloc を停止"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        tracemalloc.stop()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.take_sample()
+            except Exception:
+                logger.exception("memory sample failed")
+
+    def _format_stats(self, stats) -> List[Dict[str, Any]]:
+        rows = []
+        for stat in stats[:self.top_n]:
+            frame = stat.traceback[0]
+            rows.append({
+                "location": f"{frame.filename}:{frame.lineno}",
+                "bytes": stat.size,
+                "count": stat.count,
+                **({"growth_bytes": stat.size_diff, "growth_count": stat.count_diff}
+                   if hasattr(stat, "size_diff") else {}),
+            })
+        return rows
+
+    def take_sample(self) -> Dict[str, Any]:
+        """スナップショットを取得して記録（しきい値を超えたら警告）"""
+        with self._sample_lock:
+            return self._take_sample()
+
+    def _take_sample(self) -> Dict[str, Any]:
+        snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED_TRACES) if tracemalloc.is_tracing() else None
+        current, peak = tracemalloc.get_traced_memory() if snapshot is not None else (0, 0)
+        sample: Dict[str, Any] = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "rss_bytes": process_rss_bytes(),
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "open_figures": open_figure_count(),
+            "sessions": session_state_sizes(),
+            "cache": cache_sizes(),
+            "top_allocations": [],
+            "top_growth": [],
+        }
+        if snapshot is not None:
+            sample["top_allocations"] = self._format_stats(snapshot.statistics("lineno"))
+            if self._previous is not None:
+                growth = [stat for stat in snapshot.compare_to(self._previous, "lineno") if stat.size_diff > 0]
+                sample["top_growth"] = self._format_stats(growth)
+            self._previous = snapshot
+
+        with self._lock:
+            self.samples.append(sample)
+            crossed = sample["rss_bytes"] >= self.alert_bytes and not self.alerting
+            self.alerting = sample["rss_bytes"] >= self.alert_bytes
+        if crossed:
+            logger.warning("memory alert: rss %.0f MB >= %.0f MB %s",
+                           sample["rss_bytes"] / 1024 / 1024, self.alert_bytes / 1024 / 1024,
+                           json.dumps(self.summary(sample), ensure_ascii=False))
+        return sample
+
+    def summary(self, sample: Dict[str, Any]) -> Dict[str, Any]:
+        """警告ログ用の要約"""
+        return {
+            "open_figures": sample["open_figures"],
+            "sessions": len(sample["sessions"]),
+            "largest_sessions": sample["sessions"][:3],
+            "cache_bytes": sample["cache"]["bytes"],
+            "top_growth": sample["top_growth"][:5],
+            "top_allocations": sample["top_allocations"][:5],
+        }
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """最新のサンプルを取得"""
+        with self._lock:
+            return self.samples[-1] if self.samples else None
+
+    def history(self) -> List[Dict[str, Any]]:
+        """サンプルの推移（詳細を除いた値のみ）"""
+        with self._lock:
+            return [
+                {
+                    "time": s["time"],
+                    "rss_bytes": s["rss_bytes"],
+                    "traced_bytes": s["traced_bytes"],
+                    "open_figures": s["open_figures"],
+                    "sessions": len(s["sessions"]),
+                    "session_state_bytes": sum(item["bytes"] for item in s["sessions"]),
+                    "cache_bytes": s["cache"]["bytes"],
+                }
+                for s in self.samples
+            ]
+
+    def render_prometheus(self) -> List[str]:
+        """最新のサンプルを Prometheus 形式で出力"""
+        sample = self.latest()
+        if sample is None:
+            return []
+        return render_gauges([
+            ("rts_memory_traced_bytes", "gauge", "Memory traced by tracemalloc at the last sample.", sample["traced_bytes"]),
+            ("rts_memory_open_figures", "gauge", "Matplotlib figures still registered with pyplot.", sample["open_figures"]),
+            ("rts_memory_session_state_bytes", "gauge", "Estimated size of all st.session_state objects.",
+             sum(item["bytes"] for item in sample["sessions"])),
+            ("rts_memory_cache_bytes", "gauge", "Estimated size of the versioned cache.", sample["cache"]["bytes"]),
+            ("rts_memory_alert", "gauge", "1 while RSS is above MEMORY_ALERT_MB.", int(self.alerting)),
+        ])
+
+
+# グローバルインスタンス（MEMORY_PROFILING=1 のときのみ作成）
+memory_monitor: Optional[MemoryMonitor] = None
+_monitor_lock = threading.Lock()
+
+def start_memory_monitor() -> Optional[MemoryMonitor]:
+    """環境変数で有効な場合にメモリ計測を開始（プロセス内で1度だけ）"""
+    global memory_monitor
+    if os.environ.get("MEMORY_PROFILING", "").lower() not in ("1", "true", "yes", "on"):
+        return None
+    with _monitor_lock:
+        if memory_monitor is None:
+            memory_monitor = MemoryMonitor(
+                interval=float(os.environ.get("MEMORY_SNAPSHOT_INTERVAL", "300")),
+                alert_mb=float(os.environ.get("MEMORY_ALERT_MB", "512")),
+                frames=int(os.environ.get("MEMORY_TRACE_FRAMES", "5")),
+            )
+            memory_monitor.start()
+    return memory_monitor
+
+
+def _memory_route():
+    if memory_monitor is None:
+        return 404, "application/json", b'{"error": "MEMORY_PROFILING is not enabled"}'
+    if memory_monitor.latest() is None:
+        memory_monitor.take_sample()
+    body = {"latest": memory_monitor.latest(), "history": memory_monitor.history()}
+    return 200, "application/json; charset=utf-8", json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+
+def _memory_collector() -> List[str]:
+    return memory_monitor.render_prometheus() if memory_monitor is not None else []
+
+
+register_route("/debug/memory", _memory_route)
+register_collector(_memory_collector)
@@ -0,0 +1,297 @@
+"""
+クエリ計測とスロークエリログ
+
+TimedCursor から文ごとの実行時間・取得行数・呼び出し元のビュー関数を受け取り、
+正規化したSQLと呼び出し元の組ごとにヒストグラムとして集計する。
+しきい値を超えた文は EXPLAIN QUERY PLAN 付きでスロークエリログに書き出す。
+集計結果は Prometheus のテキスト形式で出力できる。
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ヒストグラムのバケット境界（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# 呼び出し元として扱わないファイル（DB層・クエリ層そのもの）
+_SKIP_FILES = {
+    os.path.join(PROJECT_ROOT, "src", "controllers", name)
+    for name in ("database.py", "metrics.py", "queries.py")
+}
+_PREFERRED_CALLERS = ("src.views.", "src.api.")
+
+# EXPLAIN QUERY PLAN を取得する文の種類
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\?(\s*,\s*\?)+")
+
+slow_query_logger = logging.getLogger("ready_to_study.slow_queries")
+
+
+def normalize_statement(sql: str) -> str:
+    """SQLを集計用に正規化（空白の統一、IN句などのプレースホルダー列をまとめる）"""
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    return _PLACEHOLDER_LIST.sub("?, ...", sql)
+
+
+def statement_id(normalized_sql: str) -> str:
+    """正規化したSQLの短い識別子"""
+    return f"{zlib.crc32(normalized_sql.encode('utf-8')):08x}"
+
+
+_code_labels: Dict[Any, Optional[str]] = {}
+
+def _code_label(code) -> Optional[str]:
+    """コードオブジェクトを「モジュール:関数」の形式に変換（プロジェクト外は None）"""
+    try:
+        return _code_labels[code]
+    except KeyError:
+        pass
+    filename = os.path.abspath(code.co_filename)
+    label = None
+    if filename.startswith(PROJECT_ROOT + os.sep) and filename not in _SKIP_FILES:
+        module = os.path.splitext(os.path.relpath(filename, PROJECT_ROOT))[0].replace(os.sep, ".")
+        label = f"{module}:{code.co_name}"
+    _code_labels[code] = label
+    return label
+
+
+def find_caller(frame) -> str:
+    """スタックを辿って呼び出し元の関数を取得（ビュー・APIの関数を優先）"""
+    fallback = None
+    while frame is not None:
+        label = _code_label(frame.f_code)
+        if label:
+            if label.startswith(_PREFERRED_CALLERS):
+                return label
+            if fallback is None:
+                fallback = label
+        frame = frame.f_back
+    return fallback or "unknown"
+
+
+def explain_query_plan(db_path: str, sql: str, parameters: Any = ()) -> List[str]:
+    """別の読み取り専用接続で EXPLAIN QUERY PLAN を取得"""
+    if not db_path or db_path == ":memory:" or not _EXPLAINABLE.match(sql):
+        return []
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters or ()).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        return [f"(実行計画を取得できません: {e})"]
+    return [row[3] for row in rows]
+
+
+class _Series:
+    """1つの（文, 呼び出し元）の集計"""
+
+    __slots__ = ("buckets", "count", "total_seconds", "rows")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total_seconds = 0.0
+        self.rows = 0
+
+
+class QueryMetrics:
+    """文ごとのレイテンシヒストグラムとスロークエリログ
+
+    系列数が max_series に達した後の新しい文は "overflow" にまとめ、
+    動的に組み立てたSQLでメトリクスが際限なく増えないようにする。
+    """
+
+    def __init__(self, slow_threshold_ms: Optional[float] = None,
+                 slow_log_path: Optional[str] = None, max_series: int = 2000):
+        if slow_threshold_ms is None:
+            slow_threshold_ms = float(os.environ.get("SLOW_QUERY_MS", "200"))
+        self.slow_threshold_seconds = slow_threshold_ms / 1000
+        # ファイルに書き出すのはパスを指定したとき（引数か環境変数 SLOW_QUERY_LOG）だけ
+        self.slow_log_path = slow_log_path or os.environ.get("SLOW_QUERY_LOG") or None
+        self.max_series = max_series
+        self.slow_queries = 0
+        self._series: Dict[Tuple[str, str], _Series] = {}
+        self._statements: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._log_handler: Optional[logging.Handler] = None
+
+    def observe(self, sql: str, parameters: Any, caller: str, seconds: float, rows: int,
+                db_path: Optional[str] = None):
+        """文の実行結果を記録（しきい値超えはスロークエリログにも書き出す）"""
+        normalized = normalize_statement(sql)
+        sid = statement_id(normalized)
+        index = 0
+        while index < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[index]:
+            index += 1
+
+        with self._lock:
+            key = (sid, caller)
+            series = self._series.get(key)
+            if series is None:
+                if len(self._series) >= self.max_series:
+                    key = ("overflow", "overflow")
+                    series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = _Series()
+                    self._statements.setdefault(key[0], normalized if key[0] == sid else "")
+            series.buckets[index] += 1
+            series.count += 1
+            series.total_seconds += seconds
+            series.rows += max(rows, 0)
+            is_slow = seconds >= self.slow_threshold_seconds
+            if is_slow:
+                self.slow_queries += 1
+
+        if is_slow:
+            self._log_slow(sid, normalized, sql, parameters, caller, seconds, rows, db_path)
+
+    def _log_slow(self, sid: str, normalized: str, sql: str, parameters: Any, caller: str,
+                  seconds: float, rows: int, db_path: Optional[str]):
+        self._ensure_log_handler()
+        record = {
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "pid": os.getpid(),
+            "statement": sid,
+            "caller": caller,
+            "duration_ms": round(seconds * 1000, 2),
+            "rows": rows,
+            "sql": normalized,
+            "parameters": repr(parameters)[:500],
+            "plan": explain_query_plan(db_path, sql, parameters),
+        }
+        slow_query_logger.warning(json.dumps(record, ensure_ascii=False))
+
+    def _ensure_log_handler(self):
+        """スロークエリログのファイル出力を初回に設定（パスの指定がなければファイルには書かない）"""
+        with self._lock:
+            if self._log_handler is not None:
+                return
+            handler: logging.Handler = logging.NullHandler()
+            if self.slow_log_path:
+                try:
+                    os.makedirs(os.path.dirname(self.slow_log_path) or ".", exist_ok=True)
+                    handler = logging.handlers.WatchedFileHandler(self.slow_log_path, encoding="utf-8")
+                except OSError:
+                    pass
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            slow_query_logger.addHandler(handler)
+            slow_query_logger.setLevel(logging.INFO)
+            self._log_handler = handler
+
+    def close(self):
+        """スロークエリログのファイルを閉じる"""
+        with self._lock:
+            if self._log_handler is not None:
+                slow_query_logger.removeHandler(self._log_handler)
+                self._log_handler.close()
+                self._log_handler = None
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """系列ごとの集計を取得（合計時間の降順）"""
+        with self._lock:
+            items = [
+                {
+                    "statement": sid,
+                    "caller": caller,
+                    "sql": self._statements.get(sid, ""),
+                    "count": series.count,
+                    "total_ms": series.total_seconds * 1000,
+                    "rows": series.rows,
+                }
+                for (sid, caller), series in self._series.items()
+            ]
+        return sorted(items, key=lambda item: item["total_ms"], reverse=True)
+
+    def render_prometheus(self) -> List[str]:
+        """Prometheus テキスト形式の行を生成"""
+        with self._lock:
+            series_items = [
+                (sid, caller, list(s.buckets), s.count, s.total_seconds, s.rows)
+                for (sid, caller), s in self._series.items()
+            ]
+            statements = dict(self._statements)
+            slow_queries = self.slow_queries
+
+        lines = [
+            "# HELP rts_db_query_duration_seconds SQL statement latency including row fetches.",
+            "# TYPE rts_db_query_duration_seconds histogram",
+        ]
+        for sid, caller, buckets, count, total, _ in series_items:
+            labels = {"statement": sid, "caller": caller}
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+                cumulative += bucket_count
+                lines.append(format_sample("rts_db_query_duration_seconds_bucket",
+                                           {**labels, "le": _format_value(bound)}, cumulative))
+            lines.append(format_sample("rts_db_query_duration_seconds_bucket", {**labels, "le": "+Inf"}, count))
+            lines.append(format_sample("rts_db_query_duration_seconds_sum", labels, total))
+            lines.append(format_sample("rts_db_query_duration_seconds_count", labels, count))
+
+        lines += [
+            "# HELP rts_db_query_rows_total Rows returned (or affected) by SQL statements.",
+            "# TYPE rts_db_query_rows_total counter",
+        ]
+        for sid, caller, _, _, _, rows in series_items:
+            lines.append(format_sample("rts_db_query_rows_total", {"statement": sid, "caller": caller}, rows))
+
+        lines += [
+            "# HELP rts_db_statement_info Normalized SQL text for each statement id.",
+            "# TYPE rts_db_statement_info gauge",
+        ]
+        for sid, sql in statements.items():
+            lines.append(format_sample("rts_db_statement_info", {"statement": sid, "sql": sql}, 1))
+
+        lines += [
+            "# HELP rts_db_slow_queries_total Statements slower than the slow query threshold.",
+            "# TYPE rts_db_slow_queries_total counter",
+            format_sample("rts_db_slow_queries_total", {}, slow_queries),
+        ]
+        return lines
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+def format_sample(name: str, labels: Dict[str, str], value: float) -> str:
+    """Prometheus のサンプル行を生成"""
+    if labels:
+        label_text = ",".join(f'{key}="{_escape_label(str(val))}"' for key, val in labels.items())
+        return f"{name}{{{label_text}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+def render_gauges(metrics: Iterable[Tuple[str, str, str, float]]) -> List[str]:
+    """(名前, 種類, 説明, 値) の組から Prometheus 形式の行を生成"""
+    lines = []
+    for name, kind, help_text, value in metrics:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", format_sample(name, {}, value)]
+    return lines
+
+
+# グローバルインスタンス
+query_metrics = QueryMetrics()
+
+def get_query_metrics() -> QueryMetrics:
+    """プロセス共通のクエリ計測を取得"""
+    return query_metrics
@@ -0,0 +1,197 @@
+"""
+再実行プロファイラー
+
+app.py の main() の1回の再実行を計測し、処理時間を区間ごとに分解する。
+- db: TimedCursor が記録したDB時間
+- pandas / chart: ビューが profile_phase で囲んだ区間（DB時間などの内側の区間は除く）
+- widgets: Streamlit への要素の送出（DeltaGenerator._enqueue）
+- other: 上記以外（Python処理・Streamlit要素の組み立てなど）
+結果はページ名・セッションIDとともに上限付きのリングバッファに保存し、
+管理パネルとサイドカーの /debug/reruns（JSON）から参照する。
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.controllers.database import get_query_counters
+from src.controllers.sidecar import register_route
+
+PHASES = ("db", "pandas", "chart", "widgets", "other")
+
+_local = threading.local()
+
+
+class _RerunState:
+    """計測中の再実行の状態"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_started = get_query_counters()["seconds"]
+        self.queries_started = get_query_counters()["queries"]
+        self.page: Optional[str] = None
+        self.phases: Dict[str, float] = {}
+        # 区間ごとの [内側の区間の合計時間, 内側の区間中のDB時間]
+        self.stack: List[List[float]] = []
+
+
+@contextmanager
+def profile_phase(name: str) -> Iterator[None]:
+    """再実行中の区間を計測（計測中でなければ何もしない）"""
+    state: Optional[_RerunState] = getattr(_local, "state", None)
+    if state is None:
+        yield
+        return
+    started = time.perf_counter()
+    db_started = get_query_counters()["seconds"]
+    state.stack.append([0.0, 0.0])
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        db = get_query_counters()["seconds"] - db_started
+        children, children_db = state.stack.pop()
+        own = elapsed - children - (db - children_db)
+        state.phases[name] = state.phases.get(name, 0.0) + max(own, 0.0)
+        if state.stack:
+            state.stack[-1][0] += elapsed
+            state.stack[-1][1] += db
+
+
+def tag_rerun(page: str):
+    """計測中の再実行にページ名を設定"""
+    state = getattr(_local, "state", None)
+    if state is not None:
+        state.page = page
+
+
+def _session_id() -> Optional[str]:
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+
+class RerunProfiler:
+    """再実行の計測結果を保持するリングバッファ"""
+
+    def __init__(self, capacity: int = 500):
+        self.capacity = capacity
+        self._records: "deque[Dict[str, Any]]" = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def profile(self, session_id: Optional[str] = None) -> Iterator[None]:
+        """1回の再実行を計測して記録（st.rerun() などの中断も記録する）"""
+        state = _RerunState()
+        _local.state = state
+        interrupted = False
+        try:
+            yield
+        except BaseException:
+            interrupted = True
+            raise
+        finally:
+            _local.state = None
+            self.add(self._build_record(state, session_id or _session_id(), interrupted))
+
+    def _build_record(self, state: _RerunState, session_id: Optional[str],
+                      interrupted: bool) -> Dict[str, Any]:
+        total = time.perf_counter() - state.started
+        counters = get_query_counters()
+        phases = {name: state.phases.get(name, 0.0) for name in PHASES if name not in ("db", "other")}
+        phases["db"] = max(counters["seconds"] - state.db_started, 0.0)
+        phases["other"] = max(total - sum(phases.values()), 0.0)
+        return {
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "session": session_id,
+            "page": state.page,
+            "total_ms": round(total * 1000, 2),
+            "phases_ms": {name: round(phases[name] * 1000, 2) for name in PHASES},
+            "queries": counters["queries"] - state.queries_started,
+            "interrupted": interrupted,
+        }
+
+    def add(self, record: Dict[str, Any]):
+        """計測結果を追加（上限を超えた古いものから捨てる）"""
+        with self._lock:
+            self._records.append(record)
+
+    def records(self) -> List[Dict[str, Any]]:
+        """計測結果を古い順に取得"""
+        with self._lock:
+            return list(self._records)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """ページごとの平均・p95 と区間ごとの平均を取得"""
+        by_page: Dict[str, List[Dict[str, Any]]] = {}
+        for record in self.records():
+            by_page.setdefault(record["page"] or "-", []).append(record)
+
+        rows = []
+        for page, records in sorted(by_page.items()):
+            totals = sorted(r["total_ms"] for r in records)
+            row = {
+                "page": page,
+                "reruns": len(records),
+                "mean_ms": round(sum(totals) / len(totals), 2),
+                "p95_ms": totals[min(len(totals) - 1, int(len(totals) * 0.95))],
+            }
+            for name in PHASES:
+                row[f"{name}_ms"] = round(sum(r["phases_ms"][name] for r in records) / len(records), 2)
+            rows.append(row)
+        return rows
+
+    def clear(self):
+        """計測結果を削除"""
+        with self._lock:
+            self._records.clear()
+
+
+_enqueue_installed = False
+_install_lock = threading.Lock()
+
+def install_widget_timer():
+    """DeltaGenerator._enqueue を包んで要素の送出時間を計測（プロセス内で1度だけ）"""
+    global _enqueue_installed
+    with _install_lock:
+        if _enqueue_installed:
+            return
+        from streamlit.delta_generator import DeltaGenerator
+
+        original = DeltaGenerator._enqueue
+
+        def _timed_enqueue(self, *args, **kwargs):
+            with profile_phase("widgets"):
+                return original(self, *args, **kwargs)
+
+        DeltaGenerator._enqueue = _timed_enqueue
+        _enqueue_installed = True
+
+
+# グローバルインスタンス
+rerun_profiler = RerunProfiler()
+
+def get_rerun_profiler() -> RerunProfiler:
+    """プロセス共通の再実行プロファイラーを取得"""
+    return rerun_profiler
+
+
+def profile_rerun() -> Any:
+    """main() の再実行を計測（with 文で使用）"""
+    install_widget_timer()
+    return rerun_profiler.profile()
+
+
+def _reruns_route():
+    body = {"summary": rerun_profiler.summary(), "reruns": rerun_profiler.records()}
+    return 200, "application/json; charset=utf-8", json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+
+register_route("/debug/reruns", _reruns_route)
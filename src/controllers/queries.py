@@ -0,0 +1,192 @@
+"""
+データ取得・更新クエリ
+
+Streamlitのビューと JSON API で共有するクエリ群。
+すべて呼び出し側から渡された接続を使い、コミットは呼び出し側で行う。
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+def rows_to_dicts(cursor) -> List[Dict]:
+    """カーソルの結果を辞書のリストに変換"""
+    columns = [description[0] for description in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def get_overview_metrics(conn, user_id: int) -> Dict[str, int]:
+    """ダッシュボードの概要メトリクスを取得"""
+    cursor = conn.cursor()
+
+    # 今週の学習時間
+    cursor.execute("""
+        SELECT COALESCE(SUM(duration_minutes), 0) as total_minutes
+        FROM study_sessions
+        WHERE user_id = ? AND study_date >= date('now', '-7 days')
+    """, (user_id,))
+    weekly_minutes = cursor.fetchone()[0]
+
+    # 今月の学習日数
+    cursor.execute("""
+        SELECT COUNT(DISTINCT date(study_date)) as study_days
+        FROM study_sessions
+        WHERE user_id = ? AND study_date >= date('now', 'start of month')
+    """, (user_id,))
+    monthly_days = cursor.fetchone()[0]
+
+    # 完了したクイズ数
+    cursor.execute("""
+        SELECT COUNT(*) as quiz_count
+        FROM quiz_results
+        WHERE user_id = ? AND attempted_at >= date('now', '-30 days')
+    """, (user_id,))
+    quiz_count = cursor.fetchone()[0]
+
+    return {
+        "weekly_minutes": weekly_minutes,
+        "monthly_days": monthly_days,
+        "quiz_count": quiz_count,
+    }
+
+
+def get_daily_minutes(conn, user_id: int, days: int = 14) -> List[Dict]:
+    """過去 days 日間の日別学習時間を取得"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT date(study_date) as study_date,
+               SUM(duration_minutes) as total_minutes
+        FROM study_sessions
+        WHERE user_id = ? AND study_date >= date('now', ?)
+        GROUP BY date(study_date)
+        ORDER BY study_date
+    """, (user_id, f"-{days} days"))
+    return rows_to_dicts(cursor)
+
+
+def get_subject_minutes(conn, user_id: int, days: int = 30, limit: int = 8) -> List[Dict]:
+    """過去 days 日間の教科別学習時間を多い順に取得"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT subject_id, SUM(duration_minutes) as total_minutes
+        FROM study_sessions
+        WHERE user_id = ? AND study_date >= date('now', ?)
+        GROUP BY subject_id
+        ORDER BY total_minutes DESC
+        LIMIT ?
+    """, (user_id, f"-{days} days", limit))
+    return rows_to_dicts(cursor)
+
+
+def get_recent_activities(conn, user_id: int, limit: int = 5) -> List[Dict]:
+    """最近の学習活動を取得"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT subject_id, content, duration_minutes,
+               satisfaction_score, study_date
+        FROM study_sessions
+        WHERE user_id = ?
+        ORDER BY study_date DESC
+        LIMIT ?
+    """, (user_id, limit))
+    return rows_to_dicts(cursor)
+
+
+def list_study_sessions(conn, user_id: int, limit: int = 50,
+                        before_id: Optional[int] = None,
+                        subject_id: Optional[int] = None) -> List[Dict]:
+    """学習セッションを新しい順に取得（before_id より古いものを limit 件）"""
+    query = """
+        SELECT id, subject_id, duration_minutes, content, satisfaction_score, study_date
+        FROM study_sessions
+        WHERE user_id = ?
+    """
+    params: List = [user_id]
+    if before_id is not None:
+        query += " AND id < ?"
+        params.append(before_id)
+    if subject_id is not None:
+        query += " AND subject_id = ?"
+        params.append(subject_id)
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    return rows_to_dicts(cursor)
+
+
+def insert_study_session(conn, user_id: int, subject_id: int, duration_minutes: int,
+                         content: Optional[str], satisfaction_score: Optional[int],
+                         study_date: Optional[datetime] = None) -> int:
+    """学習セッションを記録"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO study_sessions
+        (user_id, subject_id, duration_minutes, content, satisfaction_score, study_date)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (
+        user_id,
+        subject_id,
+        duration_minutes,
+        content,
+        satisfaction_score,
+        study_date or datetime.now()
+    ))
+    return cursor.lastrowid
+
+
+def list_quizzes(conn, subject_id: int, limit: int = 50, offset: int = 0) -> List[Dict]:
+    """科目のクイズを取得"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, subject_id, title, question, options, correct_answer, explanation, difficulty
+        FROM quizzes
+        WHERE subject_id = ?
+        ORDER BY id
+        LIMIT ? OFFSET ?
+    """, (subject_id, limit, offset))
+    return rows_to_dicts(cursor)
+
+
+def insert_quiz_result(conn, user_id: int, quiz_id: int, user_answer: Optional[str],
+                       is_correct: bool, time_taken_seconds: Optional[int] = None,
+                       attempted_at: Optional[datetime] = None) -> int:
+    """クイズ結果を記録（回答時点の問題の難易度も保存する）"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO quiz_results
+        (user_id, quiz_id, user_answer, is_correct, time_taken_seconds, attempted_at, difficulty)
+        VALUES (?, ?, ?, ?, ?, ?, (SELECT difficulty FROM quizzes WHERE id = ?))
+    """, (
+        user_id,
+        quiz_id,
+        user_answer,
+        is_correct,
+        time_taken_seconds,
+        attempted_at or datetime.now(),
+        quiz_id
+    ))
+    return cursor.lastrowid
+
+
+def insert_schedule(conn, user_id: int, title: str, description: Optional[str],
+                    scheduled_date: datetime, event_type: str) -> int:
+    """単発の予定を追加"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO schedules
+        (user_id, title, description, scheduled_date, event_type)
+        VALUES (?, ?, ?, ?, ?)
+    """, (user_id, title, description, scheduled_date, event_type))
+    return cursor.lastrowid
+
+
+def set_schedule_completed(conn, user_id: int, schedule_id: int, is_completed: bool) -> bool:
+    """単発の予定の完了状態を更新（対象が存在すれば True）"""
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE schedules SET is_completed = ? WHERE id = ? AND user_id = ?",
+        (is_completed, schedule_id, user_id)
+    )
+    return cursor.rowcount > 0
@@ -0,0 +1,253 @@
+"""
+クイズの連続出題セッション
+
+問題を batch_size 問ずつまとめて取得し、選択肢の JSON を読み込み済みの不変の
+QuizQuestion としてセッションに保持する。出題・採点はデータベースにアクセスせず、
+表示してから回答するまでの秒数を time_taken_seconds として記録する。
+回答結果はセッションにためておき、flush_every 問ごとと終了時に1つのトランザクションで
+まとめて書き込む。
+
+出題する難易度は設定（DIFFICULTY_PREFERENCES）で選ぶ。「自動」では、トリガーで更新される
+quiz_accuracy（利用者・科目・難易度ごとの回答数・正解数）をセッション開始時に主キーで
+読み込み、回答のたびにメモリ上で更新した正答率から choose_difficulty で次の難易度を決める。
+問題は難易度ごとにまとめて取得するため、出題ごとのクエリは発生しない。
+"""
+
+import json
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from src.controllers.queries import insert_quiz_result
+from src.controllers.sharding import TenantMovingError
+
+# 1回の取得でまとめて読み込む問題数
+DEFAULT_BATCH_SIZE = 10
+
+# 回答結果をまとめて書き込む間隔（問）
+DEFAULT_FLUSH_EVERY = 5
+
+# 難易度の設定と出題する難易度（None はすべての難易度から無作為に出題）
+DIFFICULTY_PREFERENCES = {
+    "自動": (1, 2, 3, 4, 5),
+    "易しい": (1, 2),
+    "標準": (3,),
+    "難しい": (4, 5),
+    "混合": None,
+}
+
+# 自動で選ぶ難易度の目標正答率
+TARGET_ACCURACY = 0.7
+
+# 回答のない難易度の見込み正答率（最も易しい難易度、1段階上がるごとに PRIOR_STEP 下がる）
+BASE_PRIOR = 0.85
+PRIOR_STEP = 0.15
+
+# 見込み正答率を回答何問分として扱うか
+PRIOR_WEIGHT = 4
+
+
+@dataclass(frozen=True)
+class QuizQuestion:
+    """選択肢を読み込み済みの問題"""
+    id: int
+    title: str
+    question: str
+    options: Optional[Tuple[str, ...]]
+    correct_answer: str
+    explanation: Optional[str]
+    difficulty: int
+
+    def is_correct(self, answer: Any) -> bool:
+        """回答を採点（前後の空白・大文字小文字を区別しない）"""
+        return str(answer).strip().lower() == str(self.correct_answer).strip().lower()
+
+
+def parse_options(options_json: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """選択肢の JSON を読み込む（記述式・壊れた値は None）"""
+    if not options_json:
+        return None
+    try:
+        options = json.loads(options_json)
+    except ValueError:
+        return None
+    if not isinstance(options, list) or not options:
+        return None
+    return tuple(str(option) for option in options)
+
+
+def fetch_quiz_batch(conn, subject_id: int, size: int = DEFAULT_BATCH_SIZE,
+                     exclude: Iterable[int] = (), difficulty: Optional[int] = None) -> List[QuizQuestion]:
+    """科目の問題を無作為に size 問取得（exclude の問題は除く、difficulty で難易度を指定）"""
+    exclude = list(exclude)
+    conditions = ["subject_id = ?"]
+    params: List[Any] = [subject_id]
+    if difficulty is not None:
+        conditions.append("difficulty = ?")
+        params.append(difficulty)
+    if exclude:
+        conditions.append(f"id NOT IN ({', '.join('?' * len(exclude))})")
+        params.extend(exclude)
+    rows = conn.execute(f"""
+        SELECT id, title, question, options, correct_answer, explanation, difficulty
+        FROM quizzes
+        WHERE {' AND '.join(conditions)}
+        ORDER BY RANDOM()
+        LIMIT ?
+    """, [*params, size]).fetchall()
+    return [
+        QuizQuestion(quiz_id, title, question, parse_options(options), correct_answer, explanation, difficulty or 1)
+        for quiz_id, title, question, options, correct_answer, explanation, difficulty in rows
+    ]
+
+
+def load_accuracy(conn, user_id: int, subject_id: int) -> Dict[int, List[int]]:
+    """科目の難易度ごとの [回答数, 正解数]"""
+    rows = conn.execute("""
+        SELECT difficulty, attempts, correct FROM quiz_accuracy
+        WHERE user_id = ? AND subject_id = ?
+    """, (user_id, subject_id)).fetchall()
+    return {difficulty: [attempts, correct] for difficulty, attempts, correct in rows}
+
+
+def load_difficulties(conn, subject_id: int) -> Tuple[int, ...]:
+    """科目の問題がある難易度"""
+    rows = conn.execute(
+        "SELECT DISTINCT difficulty FROM quizzes WHERE subject_id = ? AND difficulty IS NOT NULL", (subject_id,)
+    ).fetchall()
+    return tuple(sorted(row[0] for row in rows))
+
+
+def choose_difficulty(accuracy: Mapping[int, Sequence[int]], candidates: Sequence[int]) -> int:
+    """正答率が目標を下回らない最も難しい難易度を選ぶ
+
+    易しい順に、回答数・正解数に見込み正答率を PRIOR_WEIGHT 問分加えて正答率を推定し、
+    目標を下回った難易度の手前で止める。回答のない難易度の見込みは1つ易しい難易度の
+    推定値から PRIOR_STEP を引いた値にするため、易しい難易度で正解を重ねると次の難易度に進む。
+    """
+    ordered = sorted(candidates)
+    chosen = ordered[0]
+    estimate = BASE_PRIOR + PRIOR_STEP
+    for difficulty in ordered:
+        attempts, correct = accuracy.get(difficulty, (0, 0))
+        prior = estimate - PRIOR_STEP
+        estimate = (correct + prior * PRIOR_WEIGHT) / (attempts + PRIOR_WEIGHT)
+        if estimate < TARGET_ACCURACY:
+            break
+        chosen = difficulty
+    return chosen
+
+
+class QuizSession:
+    """1人の利用者の1科目の連続出題（st.session_state に保持する）"""
+
+    def __init__(self, user_id: int, subject_id: int, preference: str = "自動",
+                 batch_size: int = DEFAULT_BATCH_SIZE, flush_every: int = DEFAULT_FLUSH_EVERY):
+        if preference not in DIFFICULTY_PREFERENCES:
+            raise ValueError(f"未対応の難易度設定です: {preference}")
+        self.user_id = user_id
+        self.subject_id = subject_id
+        self.preference = preference
+        self.batch_size = batch_size
+        self.flush_every = flush_every
+        self.accuracy: Optional[Dict[int, List[int]]] = None
+        self.difficulties: Tuple[int, ...] = ()
+        self.pools: Dict[Optional[int], List[QuizQuestion]] = {}
+        self.recent: Deque[int] = deque(maxlen=batch_size)
+        self.question: Optional[QuizQuestion] = None
+        self.presented_at: Optional[float] = None
+        self.last_result: Optional[Dict[str, Any]] = None
+        self.pending: List[Dict[str, Any]] = []
+        self.answered = 0
+        self.correct = 0
+
+    def next_difficulty(self) -> Optional[int]:
+        """次に出題する難易度（None は難易度を問わない）"""
+        allowed = DIFFICULTY_PREFERENCES[self.preference]
+        if allowed is None or not self.difficulties:
+            return None
+        # 設定の範囲に問題がない場合はある難易度から選ぶ
+        candidates = [d for d in self.difficulties if d in allowed] or list(self.difficulties)
+        return choose_difficulty(self.accuracy, candidates)
+
+    def current(self, db) -> Optional[QuizQuestion]:
+        """出題中の問題。表示した時刻から計測を始める
+
+        難易度ごとの手持ちが尽きたときだけ、その難易度の問題をまとめて取得する。
+        """
+        if self.question is None:
+            if self.accuracy is None:
+                with db.get_connection() as conn:
+                    self.accuracy = load_accuracy(conn, self.user_id, self.subject_id)
+                    self.difficulties = load_difficulties(conn, self.subject_id)
+            difficulty = self.next_difficulty()
+            pool = self.pools.setdefault(difficulty, [])
+            if not pool:
+                with db.get_connection() as conn:
+                    pool.extend(fetch_quiz_batch(conn, self.subject_id, self.batch_size, self.recent, difficulty))
+                    if not pool:
+                        # 問題数が少ない科目では直前の問題も出題する
+                        pool.extend(fetch_quiz_batch(conn, self.subject_id, self.batch_size, (), difficulty))
+            if not pool:
+                return None
+            self.question = pool.pop(0)
+        if self.presented_at is None:
+            self.presented_at = time.monotonic()
+        return self.question
+
+    def answer(self, question: QuizQuestion, user_answer: Any,
+               now: Optional[datetime] = None) -> Dict[str, Any]:
+        """回答を採点して記録（同じ問題への2回目以降の回答は最初の結果を返す）"""
+        if self.last_result is not None and self.last_result["quiz_id"] == question.id:
+            return self.last_result
+        elapsed = time.monotonic() - self.presented_at if self.presented_at is not None else None
+        result = {
+            "quiz_id": question.id,
+            "user_answer": str(user_answer),
+            "is_correct": question.is_correct(user_answer),
+            "time_taken_seconds": round(elapsed) if elapsed is not None else None,
+            "attempted_at": now or datetime.now(),
+        }
+        self.pending.append(result)
+        self.last_result = result
+        self.answered += 1
+        self.correct += result["is_correct"]
+        if self.accuracy is not None:
+            # 書き込み前の回答も次の難易度の選択に反映する
+            counts = self.accuracy.setdefault(question.difficulty, [0, 0])
+            counts[0] += 1
+            counts[1] += result["is_correct"]
+        return result
+
+    def advance(self):
+        """次の問題へ進む"""
+        if self.question is not None:
+            self.recent.append(self.question.id)
+        self.question = None
+        self.presented_at = None
+        self.last_result = None
+
+    def should_flush(self) -> bool:
+        """まとめて書き込む時期か"""
+        return len(self.pending) >= self.flush_every
+
+    def flush(self, db) -> bool:
+        """ためた回答結果を1つのトランザクションで書き込む
+
+        テナントの移動中は書き込まずに残し、次の機会に書き込む（False を返す）。
+        """
+        if not self.pending:
+            return True
+        try:
+            with db.write_transaction() as conn:
+                for result in self.pending:
+                    insert_quiz_result(
+                        conn, self.user_id, result["quiz_id"], result["user_answer"], result["is_correct"],
+                        result["time_taken_seconds"], result["attempted_at"]
+                    )
+        except TenantMovingError:
+            return False
+        self.pending = []
+        return True
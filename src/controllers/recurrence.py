@@ -0,0 +1,248 @@
+"""
+繰り返し予定の制御
+
+繰り返しルール（RRULEのサブセット）は schedule_rules に1行だけ保存し、
+各回の予定は要求された期間についてのみジェネレーターで遅延展開する。
+完了・キャンセルなど各回ごとの状態は schedule_exceptions に疎に保存する。
+"""
+
+import heapq
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from dateutil.rrule import rrulestr, DAILY, WEEKLY, MONTHLY
+
+# サポートするRRULEのキーと頻度
+SUPPORTED_KEYS = {"FREQ", "INTERVAL", "BYDAY", "BYMONTHDAY", "COUNT", "UNTIL"}
+SUPPORTED_FREQS = {"DAILY", "WEEKLY", "MONTHLY"}
+
+# 終了しないルールの期間終端（インデックス範囲検索用の番兵値）
+OPEN_ENDED = datetime(9999, 12, 31, 23, 59, 59)
+
+
+@dataclass
+class ScheduleItem:
+    """予定一覧の1項目（単発予定または繰り返し予定の1回分）"""
+    key: str
+    title: str
+    description: Optional[str]
+    scheduled_date: datetime
+    event_type: str
+    is_completed: bool
+    schedule_id: Optional[int] = None
+    rule_id: Optional[int] = None
+
+    @property
+    def is_recurring(self) -> bool:
+        """繰り返し予定の1回分かどうか"""
+        return self.rule_id is not None
+
+
+def parse_rrule(rule_text: str) -> Dict[str, str]:
+    """RRULE文字列を検証して辞書に変換"""
+    parts = {}
+    for part in rule_text.strip().upper().split(";"):
+        if not part:
+            continue
+        if "=" not in part:
+            raise ValueError(f"不正なRRULE要素です: {part}")
+        key, value = part.split("=", 1)
+        if key not in SUPPORTED_KEYS:
+            raise ValueError(f"サポートされていないRRULE要素です: {key}")
+        parts[key] = value
+
+    if parts.get("FREQ") not in SUPPORTED_FREQS:
+        raise ValueError(f"サポートされていない繰り返し頻度です: {parts.get('FREQ')}")
+    if "COUNT" in parts and "UNTIL" in parts:
+        raise ValueError("COUNTとUNTILは同時に指定できません")
+    return parts
+
+
+def build_rrule(rule_text: str, dtstart: datetime):
+    """RRULE文字列から dateutil の rrule を生成"""
+    parse_rrule(rule_text)
+    return rrulestr(rule_text.strip().upper(), dtstart=dtstart)
+
+
+def compute_range_end(rule_text: str, dtstart: datetime) -> datetime:
+    """ルールの最終回の日時を計算（終了しない場合は番兵値）"""
+    parts = parse_rrule(rule_text)
+    if "COUNT" not in parts and "UNTIL" not in parts:
+        return OPEN_ENDED
+
+    last = None
+    for last in build_rrule(rule_text, dtstart):
+        pass
+    return last if last is not None else dtstart
+
+
+def _rebase(rule, window_start: datetime):
+    """ルールの起点を期間の直前まで進める
+
+    起点から期間開始まで1回ずつ展開しないよう、周期の整数倍だけ
+    dtstart をずらしてから展開する。DAILY/WEEKLYは日数、MONTHLYは
+    月数でずらす。COUNT指定のルールは回数が変わってしまうため対象外。
+    """
+    if rule._count is not None:
+        return rule
+    if rule._freq == MONTHLY:
+        return _rebase_monthly(rule, window_start)
+    if rule._freq not in (DAILY, WEEKLY):
+        return rule
+
+    period = timedelta(days=rule._interval * (7 if rule._freq == WEEKLY else 1))
+    elapsed = window_start - rule._dtstart
+    if elapsed <= period:
+        return rule
+
+    steps = elapsed // period - 1
+    return rule.replace(dtstart=rule._dtstart + period * steps)
+
+
+def _rebase_monthly(rule, window_start: datetime):
+    """MONTHLYのルールの起点を期間の直前の周期の月初まで進める
+
+    月の日数が異なるため起点は月初（時刻はそのまま）に置き、BYMONTHDAY・BYDAYの
+    指定が無いルール（毎月起点と同じ日）は起点の日を BYMONTHDAY として引き継ぐ。
+    """
+    dtstart = rule._dtstart
+    elapsed = (window_start.year - dtstart.year) * 12 + window_start.month - dtstart.month
+    steps = elapsed // rule._interval - 1
+    if steps < 1:
+        return rule
+
+    month = dtstart.year * 12 + dtstart.month - 1 + rule._interval * steps
+    kwargs = {"dtstart": dtstart.replace(year=month // 12, month=month % 12 + 1, day=1)}
+    if "bymonthday" in rule._original_rule and rule._original_rule["bymonthday"] is None:
+        kwargs["bymonthday"] = dtstart.day
+    return rule.replace(**kwargs)
+
+
+def iter_occurrences(rule_text: str, dtstart: datetime,
+                     window_start: datetime, window_end: datetime) -> Iterator[datetime]:
+    """期間内の各回の日時を遅延生成"""
+    rule = _rebase(build_rrule(rule_text, dtstart), window_start)
+    for occurrence in rule.xafter(window_start, inc=True):
+        if occurrence > window_end:
+            break
+        yield occurrence
+
+
+def create_rule(conn, user_id: int, title: str, description: Optional[str],
+                event_type: str, rule_text: str, dtstart: datetime) -> int:
+    """繰り返しルールを登録"""
+    range_end = compute_range_end(rule_text, dtstart)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO schedule_rules
+        (user_id, title, description, event_type, rrule, dtstart, range_end)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (user_id, title, description, event_type, rule_text.strip().upper(), dtstart, range_end))
+    return cursor.lastrowid
+
+
+def delete_rule(conn, rule_id: int):
+    """繰り返しルールと各回の例外を削除"""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM schedule_exceptions WHERE rule_id = ?", (rule_id,))
+    cursor.execute("DELETE FROM schedule_rules WHERE id = ?", (rule_id,))
+
+
+def set_occurrence_state(conn, rule_id: int, occurrence_date: datetime,
+                         is_completed: Optional[bool] = None,
+                         is_cancelled: Optional[bool] = None):
+    """繰り返し予定の1回分の状態を保存"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO schedule_exceptions (rule_id, occurrence_date, is_completed, is_cancelled)
+        VALUES (?, ?, COALESCE(?, FALSE), COALESCE(?, FALSE))
+        ON CONFLICT (rule_id, occurrence_date) DO UPDATE SET
+            is_completed = COALESCE(?, is_completed),
+            is_cancelled = COALESCE(?, is_cancelled)
+    """, (rule_id, occurrence_date, is_completed, is_cancelled, is_completed, is_cancelled))
+
+
+def _iter_single_schedules(cursor, user_id: int, start: datetime, end: datetime,
+                           event_type: Optional[str]) -> Iterator[ScheduleItem]:
+    """期間内の単発予定を日付順に生成"""
+    query = """
+        SELECT id, title, description, scheduled_date, event_type, is_completed
+        FROM schedules
+        WHERE user_id = ? AND scheduled_date BETWEEN ? AND ?
+    """
+    params = [user_id, start, end]
+    if event_type:
+        query += " AND event_type = ?"
+        params.append(event_type)
+    query += " ORDER BY scheduled_date"
+
+    for schedule_id, title, description, scheduled_date, type_, is_completed in cursor.execute(query, params):
+        yield ScheduleItem(
+            key=f"schedule_{schedule_id}",
+            title=title,
+            description=description,
+            scheduled_date=datetime.fromisoformat(scheduled_date),
+            event_type=type_,
+            is_completed=bool(is_completed),
+            schedule_id=schedule_id,
+        )
+
+
+def _iter_rule_occurrences(rule_row, exceptions: Dict, start: datetime,
+                           end: datetime) -> Iterator[ScheduleItem]:
+    """1つのルールの期間内の各回を例外を反映して生成"""
+    rule_id, title, description, event_type, rule_text, dtstart = rule_row
+    for occurrence in iter_occurrences(rule_text, datetime.fromisoformat(dtstart), start, end):
+        is_completed, is_cancelled = exceptions.get((rule_id, occurrence), (False, False))
+        if is_cancelled:
+            continue
+        yield ScheduleItem(
+            key=f"rule_{rule_id}_{occurrence:%Y%m%d%H%M%S}",
+            title=title,
+            description=description,
+            scheduled_date=occurrence,
+            event_type=event_type,
+            is_completed=is_completed,
+            rule_id=rule_id,
+        )
+
+
+def iter_schedule_items(conn, user_id: int, start: datetime, end: datetime,
+                        event_type: Optional[str] = None) -> Iterator[ScheduleItem]:
+    """単発予定と繰り返し予定を日付順にマージして生成
+
+    ルールは (user_id, range_end, dtstart) のインデックスで期間と重なるものだけを
+    取得し、例外も主キーの範囲検索で期間内の分だけを読み込む。
+    """
+    cursor = conn.cursor()
+
+    query = """
+        SELECT id, title, description, event_type, rrule, dtstart
+        FROM schedule_rules
+        WHERE user_id = ? AND range_end >= ? AND dtstart <= ?
+    """
+    params = [user_id, start, end]
+    if event_type:
+        query += " AND event_type = ?"
+        params.append(event_type)
+    rules = cursor.execute(query, params).fetchall()
+
+    exceptions = {}
+    if rules:
+        placeholders = ",".join("?" for _ in rules)
+        cursor.execute(f"""
+            SELECT rule_id, occurrence_date, is_completed, is_cancelled
+            FROM schedule_exceptions
+            WHERE rule_id IN ({placeholders}) AND occurrence_date BETWEEN ? AND ?
+        """, [rule[0] for rule in rules] + [start, end])
+        for rule_id, occurrence_date, is_completed, is_cancelled in cursor.fetchall():
+            exceptions[(rule_id, datetime.fromisoformat(occurrence_date))] = (
+                bool(is_completed), bool(is_cancelled)
+            )
+
+    streams: List[Iterator[ScheduleItem]] = [
+        _iter_single_schedules(conn.cursor(), user_id, start, end, event_type)
+    ]
+    streams.extend(_iter_rule_occurrences(rule, exceptions, start, end) for rule in rules)
+    return heapq.merge(*streams, key=lambda item: item.scheduled_date)
@@ -0,0 +1,361 @@
+"""
+学習レポートの一括作成
+
+週次・月次の学習レポートを全ユーザー分、印刷用の HTML と PDF のファイルとして作成する。
+集計は親プロセスが期間全体に対する少数の GROUP BY クエリで1度だけ行い（学年平均などの
+共有の集計もここで求める）、ユーザーを chunk_size 人ずつに分けてプロセスプールへ渡す。
+各プロセスは matplotlib の Figure を pyplot を使わずに描画する（画面を必要としない）。
+
+完了したチャンクごとにマニフェストへユーザーごとのファイルと内容のダイジェストを
+記録するため、中断後に同じ期間で実行し直すと、作成済みで内容の変わらない
+ユーザーは飛ばして続きから作成する。
+"""
+
+import hashlib
+import html
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.controllers.catalog import load_catalog
+
+# レポートの種類と期間の日数の目安（学習アドバイスの基準時間の計算に使う）
+REPORT_KINDS = {"weekly": 7, "monthly": 30}
+
+# 出力形式
+REPORT_FORMATS = ("html", "pdf")
+
+# レポートの様式を変えたときに上げる（作成済みのレポートも作り直す）
+REPORT_TEMPLATE_VERSION = 1
+
+# グラフの日本語フォント（インストールされているものを順に使う）
+REPORT_FONTS = ["Noto Sans CJK JP", "IPAexGothic", "IPAGothic", "TakaoGothic", "DejaVu Sans"]
+
+
+def report_period(kind: str, day: date) -> Tuple[date, date]:
+    """day を含む期間の [開始日, 終了日)（週次は月曜始まり）"""
+    if kind == "weekly":
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=7)
+    if kind == "monthly":
+        start = day.replace(day=1)
+        return start, (start + timedelta(days=32)).replace(day=1)
+    raise ValueError(f"未対応のレポートです: {kind}")
+
+
+def previous_period(kind: str, today: Optional[date] = None) -> Tuple[date, date]:
+    """直前の終わった期間"""
+    start, _ = report_period(kind, today or date.today())
+    return report_period(kind, start - timedelta(days=1))
+
+
+def study_advice(total_hours: float, days: int = 7) -> Tuple[str, str]:
+    """学習時間に応じたアドバイス（レベル, 文言）。基準時間は週15時間・10時間を日数で換算する"""
+    if total_hours >= 15 * days / 7:
+        return "success", "素晴らしい学習量です！この調子で継続しましょう。"
+    if total_hours >= 10 * days / 7:
+        return "info", "良い学習ペースです。もう少し時間を増やせるとより良いですね。"
+    return "warning", "学習時間が少し不足しています。毎日少しずつでも学習を継続しましょう。"
+
+
+def collect_report_data(conn, start: date, end: date) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """期間内の全ユーザーの集計と共有の集計を取得
+
+    学習記録・クイズ結果は期間で絞り込んだ GROUP BY をテーブルごとに数回実行するだけで、
+    ユーザーごとのクエリは行わない。
+    """
+    params = (start.isoformat(), end.isoformat())
+    catalog = load_catalog(conn)
+    users = {
+        user_id: {
+            "user_id": user_id, "name": name, "grade": grade,
+            "total_minutes": 0, "sessions": 0, "avg_satisfaction": None,
+            "subjects": [], "daily": {}, "quiz_attempts": 0, "quiz_correct": 0,
+        }
+        for user_id, name, grade in conn.execute("SELECT id, name, grade FROM users ORDER BY id")
+    }
+
+    for user_id, minutes, sessions, satisfaction in conn.execute("""
+        SELECT user_id, SUM(duration_minutes), COUNT(*), AVG(satisfaction_score)
+        FROM study_sessions
+        WHERE study_date >= ? AND study_date < ?
+        GROUP BY user_id
+    """, params):
+        if user_id in users:
+            users[user_id].update(total_minutes=minutes, sessions=sessions, avg_satisfaction=satisfaction)
+
+    for user_id, subject_id, minutes in conn.execute("""
+        SELECT user_id, subject_id, SUM(duration_minutes) AS minutes
+        FROM study_sessions
+        WHERE study_date >= ? AND study_date < ?
+        GROUP BY user_id, subject_id
+        ORDER BY user_id, minutes DESC
+    """, params):
+        if user_id in users:
+            users[user_id]["subjects"].append([catalog.name(subject_id), minutes])
+
+    for user_id, day, minutes in conn.execute("""
+        SELECT user_id, date(study_date), SUM(duration_minutes)
+        FROM study_sessions
+        WHERE study_date >= ? AND study_date < ?
+        GROUP BY user_id, date(study_date)
+    """, params):
+        if user_id in users:
+            users[user_id]["daily"][day] = minutes
+
+    for user_id, attempts, correct in conn.execute("""
+        SELECT user_id, COUNT(*), SUM(is_correct)
+        FROM quiz_results
+        WHERE attempted_at >= ? AND attempted_at < ?
+        GROUP BY user_id
+    """, params):
+        if user_id in users:
+            users[user_id].update(quiz_attempts=attempts, quiz_correct=correct)
+
+    # 学年ごとの平均学習時間（その期間に学習した生徒の平均）
+    grades: Dict[int, List[int]] = {}
+    for user in users.values():
+        if user["sessions"]:
+            grades.setdefault(user["grade"], []).append(user["total_minutes"])
+    grade_average = {grade: sum(values) / len(values) for grade, values in grades.items()}
+    for user in users.values():
+        user["grade_average_minutes"] = grade_average.get(user["grade"])
+
+    days = [(start + timedelta(days=offset)).isoformat() for offset in range((end - start).days)]
+    return list(users.values()), {"start": start.isoformat(), "end": end.isoformat(), "days": days}
+
+
+def report_digest(user: Dict[str, Any]) -> str:
+    """レポートの内容のダイジェスト（変わっていなければ作り直さない）"""
+    payload = json.dumps([REPORT_TEMPLATE_VERSION, user], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _render_charts(user: Dict[str, Any], shared: Dict[str, Any]):
+    """日別・教科別の学習時間のグラフ（pyplot を使わない Figure）"""
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(8, 3.2))
+    daily_ax, subject_ax = figure.subplots(1, 2, gridspec_kw={"width_ratios": [3, 2]})
+    days = shared["days"]
+    daily_ax.bar(range(len(days)), [user["daily"].get(day, 0) / 60 for day in days], color="#1f77b4")
+    step = max(len(days) // 7, 1)
+    daily_ax.set_xticks(range(0, len(days), step))
+    daily_ax.set_xticklabels([day[5:] for day in days[::step]], fontsize=8)
+    daily_ax.set_title("日別学習時間（時間）", fontsize=10)
+    daily_ax.grid(True, axis="y", alpha=0.3)
+
+    subjects = user["subjects"][:8]
+    if subjects:
+        names = [name for name, _ in reversed(subjects)]
+        subject_ax.barh(names, [minutes / 60 for _, minutes in reversed(subjects)], color="#2ca02c")
+        subject_ax.tick_params(axis="y", labelsize=8)
+    else:
+        subject_ax.text(0.5, 0.5, "記録なし", ha="center", va="center", transform=subject_ax.transAxes)
+        subject_ax.set_xticks([])
+        subject_ax.set_yticks([])
+    subject_ax.set_title("教科別学習時間（時間）", fontsize=10)
+    # tight_layout は描画を1回余分に行うため、余白は固定で指定する
+    figure.subplots_adjust(left=0.06, right=0.97, bottom=0.12, top=0.88, wspace=0.4)
+    return figure
+
+
+def _summary(user: Dict[str, Any], shared: Dict[str, Any]) -> Dict[str, str]:
+    """レポートに載せる数値の表示用の文字列"""
+    total_hours = user["total_minutes"] / 60
+    grade_average = user["grade_average_minutes"]
+    accuracy = user["quiz_correct"] / user["quiz_attempts"] * 100 if user["quiz_attempts"] else None
+    return {
+        "総学習時間": f"{total_hours:.1f}時間",
+        "学習セッション数": f"{user['sessions']}回",
+        "平均満足度": f"{user['avg_satisfaction'] or 0:.1f}/5",
+        "学年平均": f"{grade_average / 60:.1f}時間" if grade_average is not None else "-",
+        "クイズ正答率": f"{accuracy:.0f}%（{user['quiz_attempts']}問）" if accuracy is not None else "-",
+    }
+
+
+def render_html(user: Dict[str, Any], shared: Dict[str, Any], title: str, charts_svg: str) -> str:
+    """印刷用の HTML"""
+    level, advice = study_advice(user["total_minutes"] / 60, len(shared["days"]))
+    summary = "".join(
+        f"<tr><th>{html.escape(label)}</th><td>{html.escape(value)}</td></tr>"
+        for label, value in _summary(user, shared).items()
+    )
+    subjects = "".join(
+        f"<li>{html.escape(name)}: {minutes / 60:.1f}時間</li>" for name, minutes in user["subjects"]
+    ) or "<li>記録なし</li>"
+    return f"""<!DOCTYPE html>
+<html lang="ja">
+<head>
+<meta charset="utf-8">
+<title>{html.escape(title)} - {html.escape(user['name'])}</title>
+<style>
+@page {{ size: A4; margin: 15mm; }}
+body {{ font-family: sans-serif; color: #222; }}
+table {{ border-collapse: collapse; }}
+th, td {{ border: 1px solid #ccc; padding: 4px 12px; text-align: left; }}
+.advice {{ padding: 8px 12px; border-left: 4px solid #888; }}
+.advice.success {{ border-color: #2ca02c; }}
+.advice.info {{ border-color: #1f77b4; }}
+.advice.warning {{ border-color: #ff7f0e; }}
+svg {{ max-width: 100%; height: auto; }}
+</style>
+</head>
+<body>
+<h1>{html.escape(title)}</h1>
+<p>{html.escape(user['name'])}（{user['grade']}年）　{shared['start']} 〜 {shared['days'][-1]}</p>
+<table>{summary}</table>
+<h2>学習時間</h2>
+{charts_svg}
+<h2>教科別学習時間</h2>
+<ul>{subjects}</ul>
+<h2>学習アドバイス</h2>
+<p class="advice {level}">{html.escape(advice)}</p>
+</body>
+</html>
+"""
+
+
+def render_pdf(user: Dict[str, Any], shared: Dict[str, Any], title: str, figure, path: str):
+    """グラフの上に見出し・集計・アドバイスを配置した A4 の PDF"""
+    figure.set_size_inches(8.27, 11.69)
+    figure.subplots_adjust(left=0.1, right=0.95, top=0.7, bottom=0.48, wspace=0.45)
+    figure.text(0.08, 0.95, title, fontsize=18, weight="bold")
+    figure.text(0.08, 0.92, f"{user['name']}（{user['grade']}年）　{shared['start']} 〜 {shared['days'][-1]}",
+                fontsize=10)
+    for index, (label, value) in enumerate(_summary(user, shared).items()):
+        figure.text(0.08, 0.87 - index * 0.025, label, fontsize=10)
+        figure.text(0.35, 0.87 - index * 0.025, value, fontsize=10)
+    _, advice = study_advice(user["total_minutes"] / 60, len(shared["days"]))
+    figure.text(0.08, 0.41, "学習アドバイス", fontsize=12, weight="bold")
+    figure.text(0.08, 0.38, advice, fontsize=10)
+    figure.savefig(path, format="pdf")
+
+
+def render_chunk(users: List[Dict[str, Any]], shared: Dict[str, Any], directory: str,
+                 formats: Tuple[str, ...]) -> List[Tuple[int, str]]:
+    """ユーザーのまとまりのレポートを作成（プロセスプールのワーカーで実行）"""
+    import matplotlib
+    import warnings
+    from matplotlib import font_manager
+
+    installed = {font.name for font in font_manager.fontManager.ttflist}
+    matplotlib.rcParams["font.family"] = [name for name in REPORT_FONTS if name in installed] or ["DejaVu Sans"]
+    matplotlib.rcParams["svg.fonttype"] = "none"
+    # 日本語フォントがない環境では文字が欠けるだけなので、警告は抑止する
+    warnings.filterwarnings("ignore", message=".*missing from current font.*")
+
+    title = shared["title"]
+    done = []
+    for user in users:
+        figure = _render_charts(user, shared)
+        base = os.path.join(directory, f"user_{user['user_id']}")
+        if "html" in formats:
+            buffer = io.StringIO()
+            figure.savefig(buffer, format="svg")
+            svg = buffer.getvalue()
+            svg = svg[svg.index("<svg"):]
+            with open(base + ".html.tmp", "w", encoding="utf-8") as f:
+                f.write(render_html(user, shared, title, svg))
+            os.replace(base + ".html.tmp", base + ".html")
+        if "pdf" in formats:
+            render_pdf(user, shared, title, figure, base + ".pdf.tmp")
+            os.replace(base + ".pdf.tmp", base + ".pdf")
+        done.append((user["user_id"], user["digest"]))
+    return done
+
+
+class ReportBatch:
+    """1つのデータベースの全ユーザーのレポートを1期間分作成"""
+
+    def __init__(self, db, kind: str, start: date, output_dir: str = "data/reports",
+                 formats: Tuple[str, ...] = REPORT_FORMATS, workers: Optional[int] = None,
+                 chunk_size: int = 50):
+        if kind not in REPORT_KINDS:
+            raise ValueError(f"未対応のレポートです: {kind}")
+        self.db = db
+        self.kind = kind
+        self.start, self.end = report_period(kind, start)
+        self.formats = tuple(formats)
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        label = self.start.strftime("%Y-%m") if kind == "monthly" else self.start.isoformat()
+        self.directory = os.path.join(output_dir, f"{kind}-{label}")
+        name = os.path.splitext(os.path.basename(db.db_path))[0]
+        self.manifest_path = os.path.join(self.directory, f"_manifest-{name}.json")
+
+    def title(self) -> str:
+        """レポートの見出し"""
+        if self.kind == "monthly":
+            return f"{self.start.year}年{self.start.month}月の学習レポート"
+        return f"{self.start.month}月{self.start.day}日からの週の学習レポート"
+
+    def load_manifest(self) -> Dict[str, Any]:
+        """作成済みのレポートの記録を読み込む"""
+        if not os.path.exists(self.manifest_path):
+            return {"kind": self.kind, "start": self.start.isoformat(), "end": self.end.isoformat(), "users": {}}
+        with open(self.manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest: Dict[str, Any]):
+        with open(self.manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def run(self, progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """レポートを作成し、{users, generated, skipped, seconds} を返す
+
+        progress(完了数, 対象数) はチャンクが完了するたびに呼ばれる。
+        """
+        started = time.perf_counter()
+        with self.db.analytics_snapshot() as conn:
+            users, shared = collect_report_data(conn, self.start, self.end)
+        shared["title"] = self.title()
+
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = self.load_manifest()
+        pending = []
+        for user in users:
+            user["digest"] = report_digest(user)
+            entry = manifest["users"].get(str(user["user_id"]))
+            if entry and entry["digest"] == user["digest"] and all(
+                os.path.exists(os.path.join(self.directory, file)) for file in entry["files"]
+            ) and set(self.formats) <= {file.rsplit(".", 1)[1] for file in entry["files"]}:
+                continue
+            pending.append(user)
+
+        chunks = [pending[i:i + self.chunk_size] for i in range(0, len(pending), self.chunk_size)]
+        generated = 0
+        if chunks:
+            # 親プロセスのDB接続・スレッドを引き継がないよう spawn で起動する
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(chunks)), mp_context=context) as pool:
+                futures = [
+                    pool.submit(render_chunk, chunk, shared, self.directory, self.formats) for chunk in chunks
+                ]
+                for future in as_completed(futures):
+                    finished_at = datetime.now().isoformat(timespec="seconds")
+                    for user_id, digest in future.result():
+                        manifest["users"][str(user_id)] = {
+                            "digest": digest,
+                            "files": [f"user_{user_id}.{fmt}" for fmt in self.formats],
+                            "generated_at": finished_at,
+                        }
+                        generated += 1
+                    self._save_manifest(manifest)
+                    if progress:
+                        progress(generated, len(pending))
+        else:
+            self._save_manifest(manifest)
+
+        return {
+            "users": len(users),
+            "generated": generated,
+            "skipped": len(users) - len(pending),
+            "seconds": time.perf_counter() - started,
+        }
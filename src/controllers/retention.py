@@ -0,0 +1,234 @@
+"""
+古いデータの保存期間管理
+
+保存期間を過ぎた行をユーザー・月ごとの圧縮アーカイブ（JSON Lines + gzip）へ
+小さなバッチで移動し、インクリメンタルバキュームで空き領域を回収する。
+アーカイブ済みのデータは ArchiveReader から読み取り専用で参照できる。
+"""
+
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# アーカイブ対象テーブルと基準日時カラム
+ARCHIVE_TABLES = {
+    "study_sessions": "study_date",
+    "quiz_results": "attempted_at",
+}
+
+# 既定の保存期間（月、環境変数 RETENTION_MONTHS で変更できる）
+DEFAULT_RETENTION_MONTHS = 12
+
+# 画面で選べる保存期間の上限（月、設定した保存期間がこれより長い場合はその値まで）
+MAX_RETENTION_MONTHS = 60
+
+
+def retention_months_from_env() -> int:
+    """環境変数 RETENTION_MONTHS の保存期間（月、未設定なら DEFAULT_RETENTION_MONTHS）
+
+    使うときに読み込むため、不正な値でもアプリの起動やモジュールの読み込みは失敗しない。
+    1以上の整数でない場合は ValueError。
+    """
+    value = os.environ.get("RETENTION_MONTHS")
+    if value is None or not value.strip():
+        return DEFAULT_RETENTION_MONTHS
+    try:
+        months = int(value)
+    except ValueError:
+        months = 0
+    if months < 1:
+        raise ValueError(f"RETENTION_MONTHS には1以上の整数（月数）を指定してください: {value!r}")
+    return months
+
+
+# PRAGMA auto_vacuum の値
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def retention_cutoff(months: int, now: Optional[datetime] = None) -> datetime:
+    """保存期間の境界日時を計算（その月の1日 0時）"""
+    now = now or datetime.now()
+    month_index = now.year * 12 + (now.month - 1) - months
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+
+def default_archive_directory(db_path: str) -> str:
+    """アーカイブの保存先（環境変数 ARCHIVE_DIR、既定はDBと同じ場所の archive/）"""
+    return os.environ.get("ARCHIVE_DIR") or os.path.join(os.path.dirname(db_path), "archive")
+
+
+class RetentionEngine:
+    """保存期間を過ぎたデータのアーカイブとバキューム"""
+
+    def __init__(self, db, archive_dir: Optional[str] = None,
+                 batch_size: int = 500, pause_seconds: float = 0.05):
+        self.db = db
+        self.archive_dir = archive_dir or default_archive_directory(db.db_path)
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+
+    def archive_path(self, table: str, user_id: int, month: str) -> str:
+        """アーカイブファイルのパスを取得"""
+        return os.path.join(self.archive_dir, table, f"user_{user_id}", f"{month}.jsonl.gz")
+
+    def archive(self, table: str, cutoff: datetime, user_id: Optional[int] = None) -> int:
+        """cutoff より古い行をアーカイブへ移動し、移動した行数を返す
+
+        1バッチごとに「読み取り → アーカイブ追記 → 削除してコミット」を行うため、
+        書き込みロックを保持するのは batch_size 行の DELETE の間だけになる。
+        アーカイブ追記後・削除前に中断した場合は次回同じ行が再度追記されるが、
+        ArchiveReader が id で重複を除去する。
+
+        アーカイブは利用者による削除ではないため、同じトランザクションで移動した行の
+        変更履歴（トリガーが追記した削除を含む）を消し、オフライン端末の同期で
+        アーカイブ済みの記録が削除されないようにする。トリガーが送信待ちに追記した
+        削除イベントも "テーブル.archive" に変え、集計（射影）の累計を減らさない。
+        削除の間は retention_archiving に印を置き、集計表のトリガーが回答数を減らさないようにする。
+        """
+        if table not in ARCHIVE_TABLES:
+            raise ValueError(f"アーカイブ対象外のテーブルです: {table}")
+        date_column = ARCHIVE_TABLES[table]
+
+        query = f"SELECT * FROM {table} WHERE {date_column} < ?"
+        params: List = [cutoff]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        query += " AND id > ? ORDER BY id LIMIT ?"
+
+        moved = 0
+        last_id = 0
+        while True:
+            with self.db.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(query, params + [last_id, self.batch_size])
+                columns = [description[0] for description in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+            if not rows:
+                break
+
+            self._append_to_archive(table, date_column, rows)
+
+            ids = [row["id"] for row in rows]
+            with self.db.write_transaction() as conn:
+                placeholders = ",".join("?" for _ in ids)
+                last_event = conn.execute("SELECT COALESCE(MAX(id), 0) FROM event_outbox").fetchone()[0]
+                conn.execute("INSERT INTO retention_archiving (id) VALUES (1)")
+                conn.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", ids)
+                conn.execute("DELETE FROM retention_archiving")
+                conn.execute(
+                    "UPDATE event_outbox SET type = ? WHERE id > ? AND type = ?",
+                    (f"{table}.archive", last_event, f"{table}.delete")
+                )
+                conn.execute(
+                    f"DELETE FROM change_log WHERE table_name = ? AND row_id IN ({placeholders})", [table] + ids
+                )
+
+            moved += len(rows)
+            last_id = ids[-1]
+            if len(rows) < self.batch_size:
+                break
+            time.sleep(self.pause_seconds)
+
+        return moved
+
+    def _append_to_archive(self, table: str, date_column: str, rows: List[Dict]):
+        """行をユーザー・月ごとのアーカイブファイルに追記"""
+        groups: Dict[Tuple[int, str], List[Dict]] = {}
+        for row in rows:
+            month = str(row[date_column])[:7]
+            groups.setdefault((row["user_id"], month), []).append(row)
+
+        for (user_id, month), group in groups.items():
+            path = self.archive_path(table, user_id, month)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # gzipは複数メンバーの連結を許すため、追記ごとに新しいメンバーを書き込む
+            with open(path, "ab") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb") as archive:
+                    for row in group:
+                        archive.write(json.dumps(row, ensure_ascii=False, default=str).encode("utf-8"))
+                        archive.write(b"\n")
+                raw.flush()
+                os.fsync(raw.fileno())
+
+    def auto_vacuum_mode(self) -> int:
+        """PRAGMA auto_vacuum の現在値を取得"""
+        with self.db.get_connection() as conn:
+            return conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+
+    def incremental_vacuum(self, pages_per_step: int = 256, max_steps: int = 1000) -> int:
+        """空きページを少しずつ回収し、回収したページ数を返す
+
+        auto_vacuum が INCREMENTAL でないデータベースでは何もしない
+        （enable_incremental_vacuum で一度だけ切り替える）。
+        """
+        if self.auto_vacuum_mode() != AUTO_VACUUM_INCREMENTAL:
+            return 0
+
+        reclaimed = 0
+        for _ in range(max_steps):
+            with self.db.write_transaction() as conn:
+                free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if free_pages == 0:
+                    break
+                conn.execute(f"PRAGMA incremental_vacuum({pages_per_step})").fetchall()
+            reclaimed += min(free_pages, pages_per_step)
+            time.sleep(self.pause_seconds)
+        return reclaimed
+
+    def enable_incremental_vacuum(self):
+        """auto_vacuum を INCREMENTAL に切り替える（全体のVACUUMを1回実行する）"""
+        with self.db.get_connection() as conn:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+
+    def run(self, months: Optional[int] = None,
+            user_id: Optional[int] = None) -> Dict[str, int]:
+        """全対象テーブルをアーカイブしてから空き領域を回収（months の既定は RETENTION_MONTHS）"""
+        cutoff = retention_cutoff(months if months is not None else retention_months_from_env())
+        result = {table: self.archive(table, cutoff, user_id) for table in ARCHIVE_TABLES}
+        result["reclaimed_pages"] = self.incremental_vacuum()
+        return result
+
+
+class ArchiveReader:
+    """アーカイブ済みデータの読み取り専用リーダー"""
+
+    def __init__(self, archive_dir: str):
+        self.archive_dir = archive_dir
+
+    def list_months(self, table: str, user_id: int) -> List[str]:
+        """アーカイブが存在する月の一覧を取得"""
+        user_dir = os.path.join(self.archive_dir, table, f"user_{user_id}")
+        if not os.path.isdir(user_dir):
+            return []
+        return sorted(
+            name[:-len(".jsonl.gz")] for name in os.listdir(user_dir) if name.endswith(".jsonl.gz")
+        )
+
+    def iter_rows(self, table: str, user_id: int, start_month: Optional[str] = None,
+                  end_month: Optional[str] = None) -> Iterator[Dict]:
+        """アーカイブ済みの行を月順に生成（同じidの重複は除去）"""
+        for month in self.list_months(table, user_id):
+            if start_month and month < start_month:
+                continue
+            if end_month and month > end_month:
+                continue
+
+            path = os.path.join(self.archive_dir, table, f"user_{user_id}", f"{month}.jsonl.gz")
+            seen = set()
+            with gzip.open(path, "rt", encoding="utf-8") as archive:
+                for line in archive:
+                    row = json.loads(line)
+                    if row["id"] in seen:
+                        continue
+                    seen.add(row["id"])
+                    yield row
+
+    def count_rows(self, table: str, user_id: int) -> int:
+        """アーカイブ済みの行数を取得"""
+        return sum(1 for _ in self.iter_rows(table, user_id))
@@ -0,0 +1,313 @@
+"""
+大規模テストデータの生成
+
+負荷試験・ベンチマーク用に、利用者・学習記録・クイズ・クイズ結果・予定を一括投入する。
+学習時刻は平日の夕方〜夜・休日の日中に多く、教科は数学・英語に偏り、利用者ごとの
+活動量は対数正規分布に従うなど、実際の利用に近い分布で生成する。
+生成は numpy でチャンク単位に行い、同期書き込みと派生データ（バージョン・変更履歴・
+イベント・正答率・問題ごとの集計）のトリガーを一時的に無効にして投入し、最後に
+投入した行をまとめて派生データに反映する。
+"""
+
+import calendar
+import json
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+# 教科カテゴリごとの学習の多さ
+CATEGORY_WEIGHTS = {
+    "数学": 1.6,
+    "英語": 1.5,
+    "国語": 1.0,
+    "理科": 1.1,
+    "社会": 0.9,
+    "情報": 0.5,
+}
+
+# 時刻ごとの学習の多さ（0時〜23時）
+WEEKDAY_HOUR_WEIGHTS = [
+    0.3, 0.1, 0.0, 0.0, 0.0, 0.1, 0.4, 0.8, 0.3, 0.1, 0.1, 0.1,
+    0.4, 0.2, 0.1, 0.2, 0.8, 1.5, 1.6, 2.2, 2.8, 2.6, 1.8, 0.9,
+]
+WEEKEND_HOUR_WEIGHTS = [
+    0.4, 0.2, 0.1, 0.0, 0.0, 0.0, 0.1, 0.3, 0.8, 1.4, 1.8, 1.6,
+    0.9, 1.3, 1.7, 1.6, 1.3, 1.0, 0.8, 1.2, 1.6, 1.5, 1.1, 0.7,
+]
+
+DURATION_CHOICES = [10, 15, 20, 30, 45, 60, 90, 120, 180]
+DURATION_WEIGHTS = [0.04, 0.10, 0.10, 0.24, 0.18, 0.18, 0.10, 0.05, 0.01]
+SATISFACTION_WEIGHTS = [0.05, 0.10, 0.30, 0.35, 0.20]
+# 予定の種類（画面の予定タイプ src/views/schedule.py の EVENT_TYPE_MAP と同じ値）
+EVENT_TYPES = ["test", "homework", "review", "mock_exam", "other"]
+EVENT_TYPE_WEIGHTS = [0.15, 0.35, 0.35, 0.05, 0.10]
+CONTENT_TEMPLATES = ["教科書の復習", "問題集", "授業の予習", "小テスト対策", "ノート整理", None]
+
+# 投入するテーブル
+SEEDED_TABLES = ("users", "quizzes", "study_sessions", "quiz_results", "schedules")
+
+
+@dataclass
+class SeedConfig:
+    """生成するデータの規模"""
+    users: int = 10000
+    study_sessions: int = 5_000_000
+    quiz_results: int = 1_000_000
+    quizzes_per_subject: int = 30
+    schedules_per_user: int = 10
+    days: int = 365
+    chunk_size: int = 50_000
+    seed: int = 0
+
+
+def _normalize(weights) -> np.ndarray:
+    weights = np.asarray(weights, dtype=float)
+    return weights / weights.sum()
+
+
+class DataSeeder:
+    """テストデータの一括投入"""
+
+    def __init__(self, db, config: SeedConfig,
+                 progress: Optional[Callable[[str, int, int], None]] = None):
+        self.db = db
+        self.config = config
+        self.progress = progress or (lambda table, done, total: None)
+        self.rng = np.random.default_rng(config.seed)
+        # タイムゾーンを持たない現地時刻を 'unixepoch' で文字列に戻すため、現地時刻をUTCとして数える
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.today_epoch = calendar.timegm(today.timetuple())
+
+    def run(self) -> Dict[str, int]:
+        """全テーブルを投入し、投入した行数を返す"""
+        conn = sqlite3.connect(self.db.db_path, isolation_level=None)
+        try:
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute("PRAGMA cache_size = -200000")
+            conn.execute("PRAGMA temp_store = MEMORY")
+            cursor = conn.cursor()
+            # 派生データのトリガーを外して投入し、最後に投入した行（投入前の最大IDより後）をまとめて反映する
+            after = {
+                table: cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+                for table in SEEDED_TABLES
+            }
+            self.db.drop_derived_triggers(cursor)
+            try:
+                result = {
+                    "users": self.seed_users(conn),
+                    "quizzes": self.seed_quizzes(conn),
+                }
+                result["study_sessions"] = self.seed_study_sessions(conn)
+                result["quiz_results"] = self.seed_quiz_results(conn)
+                result["schedules"] = self.seed_schedules(conn)
+            finally:
+                cursor.execute("BEGIN")
+                self.db.create_derived_triggers(cursor)
+                self.db.backfill_derived(cursor, after)
+                cursor.execute("COMMIT")
+            conn.execute("ANALYZE")
+            return result
+        finally:
+            conn.close()
+
+    def _insert_chunks(self, conn, table: str, sql: str, total: int,
+                       make_rows: Callable[[int], List[tuple]]) -> int:
+        done = 0
+        while done < total:
+            n = min(self.config.chunk_size, total - done)
+            rows = make_rows(n)
+            conn.execute("BEGIN")
+            conn.executemany(sql, rows)
+            conn.execute("COMMIT")
+            done += n
+            self.progress(table, done, total)
+        return done
+
+    def _load_users(self, conn):
+        """投入済みの利用者と、活動量・正答率の重みを読み込む"""
+        rows = conn.execute("SELECT id, grade FROM users ORDER BY id").fetchall()
+        self.user_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.user_grades = np.array([row[1] for row in rows], dtype=np.int64)
+        # 一部の利用者に活動が集中する
+        self.user_p = _normalize(self.rng.lognormal(0.0, 0.8, len(rows)))
+        self.user_skill = np.clip(self.rng.normal(0.65, 0.12, len(rows)), 0.2, 0.95)
+
+    def _load_subjects(self, conn):
+        """学年ごとに履修できる科目と選ばれやすさを読み込む"""
+        rows = conn.execute("SELECT id, category, grade_level FROM subjects").fetchall()
+        self.subjects_by_grade = {}
+        for grade in (1, 2, 3):
+            ids = [row[0] for row in rows if row[2] <= grade]
+            weights = [CATEGORY_WEIGHTS.get(row[1], 1.0) for row in rows if row[2] <= grade]
+            self.subjects_by_grade[grade] = (np.array(ids, dtype=np.int64), _normalize(weights))
+
+    def _timestamps(self, n: int, future: bool = False) -> np.ndarray:
+        """学習が行われやすい時刻で、過去 days 日（future の場合は前後）の時刻を生成"""
+        if future:
+            day_offsets = self.rng.integers(-30, 61, n)
+        else:
+            day_offsets = -self.rng.integers(0, self.config.days, n)
+        days = self.today_epoch // 86400 + day_offsets
+        # 1970-01-01 は木曜日（月曜日=0 とすると 3）
+        weekend = (days + 3) % 7 >= 5
+        hours = np.where(
+            weekend,
+            self.rng.choice(24, n, p=_normalize(WEEKEND_HOUR_WEIGHTS)),
+            self.rng.choice(24, n, p=_normalize(WEEKDAY_HOUR_WEIGHTS)),
+        )
+        return days * 86400 + hours * 3600 + self.rng.integers(0, 3600, n)
+
+    def _pick_users(self, n: int) -> np.ndarray:
+        return self.rng.choice(len(self.user_ids), n, p=self.user_p)
+
+    def _pick_subjects(self, user_index: np.ndarray) -> np.ndarray:
+        subjects = np.empty(len(user_index), dtype=np.int64)
+        grades = self.user_grades[user_index]
+        for grade, (ids, p) in self.subjects_by_grade.items():
+            mask = grades == grade
+            subjects[mask] = self.rng.choice(ids, int(mask.sum()), p=p)
+        return subjects
+
+    def seed_users(self, conn) -> int:
+        """利用者を投入"""
+        start = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0]) + 1
+        total = self.config.users
+        next_id = [start]
+
+        def make_rows(n):
+            ids = range(next_id[0], next_id[0] + n)
+            next_id[0] += n
+            grades = self.rng.integers(1, 4, n).tolist()
+            created = (self.today_epoch - self.rng.integers(0, self.config.days, n) * 86400).tolist()
+            return [(i, f"生徒{i}", f"student{i}@example.com", g, c) for i, g, c in zip(ids, grades, created)]
+
+        inserted = self._insert_chunks(
+            conn, "users",
+            "INSERT INTO users (id, name, email, grade, created_at) VALUES (?, ?, ?, ?, datetime(?, 'unixepoch'))",
+            total, make_rows
+        )
+        self._load_users(conn)
+        self._load_subjects(conn)
+        return inserted
+
+    def seed_quizzes(self, conn) -> int:
+        """科目ごとのクイズを投入"""
+        subject_ids = [row[0] for row in conn.execute("SELECT id FROM subjects ORDER BY id")]
+        options = json.dumps(["A", "B", "C", "D"])
+        rows = []
+        for subject_id in subject_ids:
+            difficulties = self.rng.choice(5, self.config.quizzes_per_subject, p=[0.2, 0.3, 0.25, 0.15, 0.1]) + 1
+            for n, difficulty in enumerate(difficulties.tolist(), start=1):
+                answer = "ABCD"[int(self.rng.integers(0, 4))]
+                rows.append((subject_id, f"確認問題{n}", f"問題文{n}", options, answer, "解説", difficulty))
+
+        conn.execute("BEGIN")
+        conn.executemany("""
+            INSERT INTO quizzes (subject_id, title, question, options, correct_answer, explanation, difficulty)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.execute("COMMIT")
+        self.progress("quizzes", len(rows), len(rows))
+
+        quiz_rows = conn.execute("SELECT id, subject_id, difficulty, correct_answer FROM quizzes").fetchall()
+        self.quizzes_by_subject: Dict[int, np.ndarray] = {}
+        self.quiz_difficulty: Dict[int, int] = {}
+        self.quiz_answer: Dict[int, str] = {}
+        for quiz_id, subject_id, difficulty, correct_answer in quiz_rows:
+            self.quizzes_by_subject.setdefault(subject_id, []).append(quiz_id)
+            self.quiz_difficulty[quiz_id] = difficulty or 1
+            self.quiz_answer[quiz_id] = correct_answer
+        self.quizzes_by_subject = {k: np.array(v, dtype=np.int64) for k, v in self.quizzes_by_subject.items()}
+        return len(rows)
+
+    def seed_study_sessions(self, conn) -> int:
+        """学習記録を投入"""
+        if not len(self.user_ids):
+            return 0
+
+        def make_rows(n):
+            users = self._pick_users(n)
+            subjects = self._pick_subjects(users)
+            durations = self.rng.choice(DURATION_CHOICES, n, p=_normalize(DURATION_WEIGHTS))
+            satisfaction = self.rng.choice(5, n, p=_normalize(SATISFACTION_WEIGHTS)) + 1
+            contents = self.rng.integers(0, len(CONTENT_TEMPLATES), n)
+            return list(zip(
+                self.user_ids[users].tolist(), subjects.tolist(), durations.tolist(),
+                [CONTENT_TEMPLATES[i] for i in contents.tolist()],
+                satisfaction.tolist(), self._timestamps(n).tolist()
+            ))
+
+        return self._insert_chunks(conn, "study_sessions", """
+            INSERT INTO study_sessions
+            (user_id, subject_id, duration_minutes, content, satisfaction_score, study_date)
+            VALUES (?, ?, ?, ?, ?, datetime(?, 'unixepoch'))
+        """, self.config.study_sessions, make_rows)
+
+    def seed_quiz_results(self, conn) -> int:
+        """クイズ結果を投入（正答率は利用者の実力と難易度で決まる）"""
+        if not len(self.user_ids) or not self.quizzes_by_subject:
+            return 0
+
+        def make_rows(n):
+            users = self._pick_users(n)
+            subjects = self._pick_subjects(users)
+            quizzes = np.empty(n, dtype=np.int64)
+            for subject_id in np.unique(subjects).tolist():
+                mask = subjects == subject_id
+                candidates = self.quizzes_by_subject.get(subject_id)
+                if candidates is None:
+                    candidates = np.array(list(self.quiz_difficulty), dtype=np.int64)
+                quizzes[mask] = self.rng.choice(candidates, int(mask.sum()))
+            difficulty = np.array([self.quiz_difficulty[q] for q in quizzes.tolist()])
+            p_correct = np.clip(self.user_skill[users] - 0.08 * (difficulty - 2), 0.05, 0.98)
+            correct = self.rng.random(n) < p_correct
+            answers = [
+                self.quiz_answer[q] if c else ("誤答" if self.quiz_answer[q] != "誤答" else "-")
+                for q, c in zip(quizzes.tolist(), correct.tolist())
+            ]
+            taken = np.clip(self.rng.gamma(2.0, 20.0, n) * (1 + 0.2 * difficulty), 3, 600).astype(int)
+            return list(zip(
+                self.user_ids[users].tolist(), quizzes.tolist(), answers,
+                correct.tolist(), taken.tolist(), self._timestamps(n).tolist(), difficulty.tolist()
+            ))
+
+        return self._insert_chunks(conn, "quiz_results", """
+            INSERT INTO quiz_results
+            (user_id, quiz_id, user_answer, is_correct, time_taken_seconds, attempted_at, difficulty)
+            VALUES (?, ?, ?, ?, ?, datetime(?, 'unixepoch'), ?)
+        """, self.config.quiz_results, make_rows)
+
+    def seed_schedules(self, conn) -> int:
+        """予定を投入（過去の予定は7割が完了済み）"""
+        total = len(self.user_ids) * self.config.schedules_per_user
+        now_epoch = calendar.timegm(datetime.now().timetuple())
+
+        def make_rows(n):
+            users = self.rng.integers(0, len(self.user_ids), n)
+            dates = self._timestamps(n, future=True)
+            types = self.rng.choice(EVENT_TYPES, n, p=_normalize(EVENT_TYPE_WEIGHTS))
+            completed = (dates < now_epoch) & (self.rng.random(n) < 0.7)
+            return [
+                (u, f"予定{i}", d, t, c)
+                for i, (u, d, t, c) in enumerate(zip(
+                    self.user_ids[users].tolist(), dates.tolist(), types.tolist(), completed.tolist()
+                ))
+            ]
+
+        return self._insert_chunks(conn, "schedules", """
+            INSERT INTO schedules (user_id, title, scheduled_date, event_type, is_completed)
+            VALUES (?, ?, datetime(?, 'unixepoch'), ?, ?)
+        """, total, make_rows)
+
+
+def seed_database(db, config: SeedConfig,
+                  progress: Optional[Callable[[str, int, int], None]] = None) -> Dict[str, float]:
+    """テストデータを投入し、投入件数と所要時間を返す"""
+    started = time.perf_counter()
+    result = DataSeeder(db, config, progress).run()
+    result["seconds"] = time.perf_counter() - started
+    return result
@@ -0,0 +1,536 @@
+"""
+テナント単位のシャーディング
+
+1つのSQLiteファイルでは全校の書き込みが1つのロックを取り合うため、学校（テナント）
+ごとにデータベースファイル（シャード）を分け、シャードごとの書き込みを並行させる。
+どのテナントがどのシャードにあり、どのユーザーがどのテナントに属するかは
+ディレクトリDBに保存する。ユーザーの所属は tenant_users の明示的な割り当て、
+テナントに割り当てた user_id の範囲、既定テナント（default）の順に決まり、
+どれにも当たらない場合は既定のシャード（最初に登録したシャード）に置く。
+
+環境変数 READY_TO_STUDY_DIRECTORY でディレクトリDBを指定すると、
+get_database(user_id) がユーザーのシャードを返すようになる。教科・クイズは
+参照用データとして既定のシャードから各シャードへ複製する。
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from src.controllers.database import (DatabaseController, TimedConnection, WriteCoordinator, study_sessions_scope,
+                                     user_scope)
+
+DEFAULT_TENANT = "default"
+ACTIVE = "active"
+MOVING = "moving"
+
+# シャードごとの採番範囲（シャード間で ID が重複しないため、移動時に ID をそのまま使える）
+SHARD_ID_SPAN = 10 ** 12
+
+# AUTOINCREMENT で採番するテナントのテーブル
+SEQUENCE_TABLES = ("users", "study_sessions", "quiz_results", "schedules", "schedule_rules", "change_log")
+
+# テナントのデータを持つテーブルと、対象ユーザーの条件（削除は逆順に行う）
+TENANT_TABLES = (
+    ("users", "id IN ({ids})"),
+    ("study_sessions", "user_id IN ({ids})"),
+    ("quiz_results", "user_id IN ({ids})"),
+    ("schedules", "user_id IN ({ids})"),
+    ("schedule_rules", "user_id IN ({ids})"),
+    ("schedule_exceptions", "rule_id IN (SELECT id FROM schedule_rules WHERE user_id IN ({ids}))"),
+    ("dashboard_snapshots", "user_id IN ({ids})"),
+    ("sync_uploads", "user_id IN ({ids})"),
+    ("study_timers", "user_id IN ({ids})"),
+)
+
+# 既定のシャードから各シャードへ複製する参照用データ
+REFERENCE_TABLES = ("subjects", "quizzes")
+
+# IN 句に渡すユーザーIDの数（SQLiteの変数の上限より十分小さくする）
+MOVE_CHUNK_SIZE = 500
+
+
+class TenantMovingError(RuntimeError):
+    """シャード間で移動中のテナントへの書き込み"""
+
+
+@dataclass(frozen=True)
+class Shard:
+    """シャード（データベースファイル）"""
+    id: int
+    name: str
+    path: str
+
+
+@dataclass(frozen=True)
+class Tenant:
+    """テナント（学校、または user_id の範囲）"""
+    id: str
+    shard_id: int
+    first_user_id: Optional[int] = None
+    last_user_id: Optional[int] = None
+    state: str = ACTIVE
+
+
+class RoutingTable:
+    """ディレクトリの内容から作る不変のルーティング表"""
+
+    def __init__(self, epoch: int, shards: Sequence[Shard], tenants: Sequence[Tenant],
+                 members: Dict[int, str]):
+        self.epoch = epoch
+        self.shards: Dict[int, Shard] = {shard.id: shard for shard in sorted(shards, key=lambda s: s.id)}
+        self.tenants: Dict[str, Tenant] = {tenant.id: tenant for tenant in tenants}
+        self.members = members
+        self._ranges = sorted((t for t in tenants if t.first_user_id is not None),
+                              key=lambda t: t.first_user_id)
+        self._range_starts = [t.first_user_id for t in self._ranges]
+
+    @property
+    def default_shard(self) -> Shard:
+        """既定のシャード（参照用データの複製元）"""
+        if not self.shards:
+            raise LookupError("シャードが登録されていません")
+        return next(iter(self.shards.values()))
+
+    def tenant_for(self, user_id: int) -> Optional[Tenant]:
+        """ユーザーの所属テナント"""
+        tenant_id = self.members.get(user_id)
+        if tenant_id is not None:
+            return self.tenants[tenant_id]
+        index = bisect_right(self._range_starts, user_id) - 1
+        if index >= 0 and user_id <= self._ranges[index].last_user_id:
+            return self._ranges[index]
+        return self.tenants.get(DEFAULT_TENANT)
+
+    def shard_for(self, user_id: int) -> Shard:
+        """ユーザーのデータを持つシャード"""
+        tenant = self.tenant_for(user_id)
+        return self.shards[tenant.shard_id] if tenant is not None else self.default_shard
+
+
+class ShardDirectory:
+    """シャード・テナント・ユーザーの所属を保存するディレクトリDB
+
+    変更のたびに epoch を上げ、各プロセスは epoch を比較してルーティング表を読み込み直す。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.writer = WriteCoordinator(path)
+        self.init_tables()
+
+    def get_connection(self):
+        """読み取り用の接続を取得"""
+        return sqlite3.connect(self.path, factory=TimedConnection)
+
+    def init_tables(self):
+        """テーブルの初期化"""
+        with self.get_connection() as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+        with self.writer.transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shards (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT UNIQUE NOT NULL,
+                    path TEXT UNIQUE NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tenants (
+                    id TEXT PRIMARY KEY,
+                    shard_id INTEGER NOT NULL,
+                    first_user_id INTEGER,
+                    last_user_id INTEGER,
+                    state TEXT NOT NULL DEFAULT 'active',
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (shard_id) REFERENCES shards (id)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tenant_users (
+                    user_id INTEGER PRIMARY KEY,
+                    tenant_id TEXT NOT NULL,
+                    FOREIGN KEY (tenant_id) REFERENCES tenants (id)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS directory_meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                ) WITHOUT ROWID
+            """)
+            conn.execute("INSERT OR IGNORE INTO directory_meta (key, value) VALUES ('epoch', 0)")
+
+    def _bump_epoch(self, conn):
+        conn.execute("UPDATE directory_meta SET value = value + 1 WHERE key = 'epoch'")
+
+    def epoch(self) -> int:
+        """ディレクトリの変更回数"""
+        with self.get_connection() as conn:
+            return conn.execute("SELECT value FROM directory_meta WHERE key = 'epoch'").fetchone()[0]
+
+    def load(self) -> RoutingTable:
+        """ルーティング表を読み込む"""
+        with self.get_connection() as conn:
+            # 1つの読み取りトランザクションで一貫した内容を読む
+            conn.execute("BEGIN")
+            epoch = conn.execute("SELECT value FROM directory_meta WHERE key = 'epoch'").fetchone()[0]
+            shards = [Shard(*row) for row in conn.execute("SELECT id, name, path FROM shards")]
+            tenants = [Tenant(*row) for row in conn.execute(
+                "SELECT id, shard_id, first_user_id, last_user_id, state FROM tenants"
+            )]
+            members = dict(conn.execute("SELECT user_id, tenant_id FROM tenant_users").fetchall())
+            conn.rollback()
+        return RoutingTable(epoch, shards, tenants, members)
+
+    def shard(self, name: str) -> Shard:
+        """名前からシャードを取得"""
+        with self.get_connection() as conn:
+            row = conn.execute("SELECT id, name, path FROM shards WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(f"シャードが見つかりません: {name}")
+        return Shard(*row)
+
+    def add_shard(self, name: str, path: str) -> Shard:
+        """シャードを登録"""
+        with self.writer.transaction() as conn:
+            cursor = conn.execute("INSERT INTO shards (name, path) VALUES (?, ?)", (name, os.path.abspath(path)))
+            shard = Shard(cursor.lastrowid, name, os.path.abspath(path))
+            self._bump_epoch(conn)
+        return shard
+
+    def add_tenant(self, tenant_id: str, shard_name: str, first_user_id: Optional[int] = None,
+                   last_user_id: Optional[int] = None) -> Tenant:
+        """テナントを登録（user_id の範囲は他のテナントと重ならないこと）"""
+        if (first_user_id is None) != (last_user_id is None):
+            raise ValueError("user_id の範囲は開始と終了の両方を指定してください")
+        if first_user_id is not None and first_user_id > last_user_id:
+            raise ValueError(f"user_id の範囲が不正です: {first_user_id}-{last_user_id}")
+        shard = self.shard(shard_name)
+        with self.writer.transaction() as conn:
+            if first_user_id is not None:
+                overlap = conn.execute("""
+                    SELECT id FROM tenants
+                    WHERE first_user_id IS NOT NULL AND first_user_id <= ? AND last_user_id >= ?
+                """, (last_user_id, first_user_id)).fetchone()
+                if overlap:
+                    raise ValueError(f"user_id の範囲がテナント {overlap[0]} と重なっています")
+            conn.execute(
+                "INSERT INTO tenants (id, shard_id, first_user_id, last_user_id) VALUES (?, ?, ?, ?)",
+                (tenant_id, shard.id, first_user_id, last_user_id)
+            )
+            self._bump_epoch(conn)
+        return Tenant(tenant_id, shard.id, first_user_id, last_user_id)
+
+    def assign_users(self, tenant_id: str, user_ids: Sequence[int]):
+        """ユーザーをテナントに割り当てる（既存の割り当ては置き換える）"""
+        with self.writer.transaction() as conn:
+            if conn.execute("SELECT 1 FROM tenants WHERE id = ?", (tenant_id,)).fetchone() is None:
+                raise KeyError(f"テナントが見つかりません: {tenant_id}")
+            conn.executemany(
+                "INSERT OR REPLACE INTO tenant_users (user_id, tenant_id) VALUES (?, ?)",
+                [(user_id, tenant_id) for user_id in user_ids]
+            )
+            self._bump_epoch(conn)
+
+    def set_tenant(self, tenant_id: str, shard_id: Optional[int] = None, state: Optional[str] = None):
+        """テナントのシャード・状態を更新"""
+        with self.writer.transaction() as conn:
+            cursor = conn.execute("""
+                UPDATE tenants
+                SET shard_id = COALESCE(?, shard_id), state = COALESCE(?, state), updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (shard_id, state, tenant_id))
+            if cursor.rowcount == 0:
+                raise KeyError(f"テナントが見つかりません: {tenant_id}")
+            self._bump_epoch(conn)
+
+    def close(self):
+        """書き込み接続を閉じる"""
+        self.writer.close()
+
+
+def count_rows(conn) -> Dict[str, int]:
+    """シャード内のテナントのデータ件数"""
+    return {
+        table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        for table in ("users", "study_sessions", "quiz_results", "schedules")
+    }
+
+
+class MovingTenantDatabase:
+    """移動中のテナント用のデータベース（読み取りのみ許可）"""
+
+    def __init__(self, db: DatabaseController, tenant_id: str):
+        self._db = db
+        self.tenant_id = tenant_id
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._db, name)
+
+    def write_transaction(self):
+        raise TenantMovingError(f"テナント {self.tenant_id} はシャード間で移動中のため、一時的に書き込めません")
+
+
+class ShardRouter:
+    """ユーザーをシャードのデータベースに振り分ける
+
+    ルーティング表はディレクトリの epoch が進んだときだけ読み込み直す
+    （epoch の確認は refresh_interval 秒に1回まで）。シャードごとに
+    DatabaseController（と書き込みコーディネーター）を1つずつ持つ。
+    """
+
+    def __init__(self, directory: ShardDirectory, refresh_interval: float = 2.0,
+                 max_workers: Optional[int] = None):
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        self.max_workers = max_workers
+        self._routes: Optional[RoutingTable] = None
+        self._checked_at = float("-inf")
+        self._databases: Dict[str, DatabaseController] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def routes(self) -> RoutingTable:
+        """現在のルーティング表を取得"""
+        routes = self._routes
+        if routes is not None and time.monotonic() - self._checked_at < self.refresh_interval:
+            return routes
+
+        with self._lock:
+            if self._routes is None or self.directory.epoch() != self._routes.epoch:
+                self._routes = self.directory.load()
+            self._checked_at = time.monotonic()
+            return self._routes
+
+    def invalidate(self):
+        """次回の取得で epoch を確認させる"""
+        self._checked_at = float("-inf")
+
+    def database(self, shard: Shard) -> DatabaseController:
+        """シャードのデータベースコントローラーを取得"""
+        db = self._databases.get(shard.path)
+        if db is None:
+            with self._lock:
+                db = self._databases.get(shard.path)
+                if db is None:
+                    db = self._databases[shard.path] = DatabaseController(shard.path)
+        return db
+
+    def primary(self) -> DatabaseController:
+        """既定のシャードのデータベース"""
+        return self.database(self.routes().default_shard)
+
+    def database_for_user(self, user_id: int):
+        """ユーザーのシャードのデータベース（移動中のテナントは読み取りのみ）"""
+        routes = self.routes()
+        tenant = routes.tenant_for(user_id)
+        shard = routes.shards[tenant.shard_id] if tenant is not None else routes.default_shard
+        db = self.database(shard)
+        if tenant is not None and tenant.state == MOVING:
+            return MovingTenantDatabase(db, tenant.id)
+        return db
+
+    def fan_out(self, fn: Callable, *args) -> List[Tuple[Shard, Any]]:
+        """fn(conn, *args) を全シャードで並行に実行し、(シャード, 結果) の一覧を返す"""
+        shards = list(self.routes().shards.values())
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers or min(32, len(shards) + 4),
+                                                thread_name_prefix="shard-fan-out")
+            pool = self._pool
+
+        def run(shard: Shard):
+            with self.database(shard).get_connection() as conn:
+                return fn(conn, *args)
+
+        return list(zip(shards, pool.map(run, shards)))
+
+    def fan_out_frame(self, query: str, params: Sequence = ()) -> pd.DataFrame:
+        """全シャードで同じクエリを実行し、shard 列を付けて結合"""
+        results = self.fan_out(lambda conn: pd.read_sql_query(query, conn, params=params))
+        frames = [frame.assign(shard=shard.name) for shard, frame in results]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def overview(self) -> List[Dict[str, Any]]:
+        """シャードごとの件数・ファイルサイズ・書き込み待ちの状況"""
+        routes = self.routes()
+        tenants: Dict[int, List[str]] = {}
+        for tenant in routes.tenants.values():
+            tenants.setdefault(tenant.shard_id, []).append(tenant.id)
+
+        rows = []
+        for shard, counts in self.fan_out(count_rows):
+            writer = self.database(shard).writer.stats()
+            rows.append({
+                "shard": shard.name,
+                "path": shard.path,
+                "tenants": sorted(tenants.get(shard.id, [])),
+                **counts,
+                "size_mb": round(os.path.getsize(shard.path) / 1024 / 1024, 1),
+                "write_transactions": writer["transactions"],
+                "max_write_wait_ms": round(writer["max_wait_ms"], 1),
+            })
+        return rows
+
+    def create_shard(self, name: str, path: str) -> Shard:
+        """シャードを作成して登録（スキーマ・採番範囲・参照用データを用意）"""
+        shard = self.directory.add_shard(name, path)
+        self.invalidate()
+        db = self.database(shard)
+        offset = (shard.id - 1) * SHARD_ID_SPAN
+        with db.write_transaction() as conn:
+            for table in SEQUENCE_TABLES:
+                conn.execute("""
+                    INSERT INTO sqlite_sequence (name, seq)
+                    SELECT ?, 0 WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)
+                """, (table, table))
+                conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (offset, table))
+        self.sync_reference_data()
+        return shard
+
+    def sync_reference_data(self) -> Dict[str, int]:
+        """既定のシャードの教科・クイズを他のシャードへ複製（変更のあった行のみ）"""
+        routes = self.routes()
+        with self.primary().get_connection() as conn:
+            source = {}
+            for table in REFERENCE_TABLES:
+                cursor = conn.execute(f"SELECT * FROM {table}")
+                source[table] = ([d[0] for d in cursor.description], cursor.fetchall())
+
+        changed = {table: 0 for table in REFERENCE_TABLES}
+        for shard in list(routes.shards.values())[1:]:
+            with self.database(shard).write_transaction() as conn:
+                for table, (columns, rows) in source.items():
+                    column_list = ", ".join(columns)
+                    existing = set(conn.execute(f"SELECT {column_list} FROM {table}").fetchall())
+                    ids = {row[0] for row in rows}
+                    stale = [(row[0],) for row in existing if row[0] not in ids]
+                    updated = [row for row in rows if row not in existing]
+                    conn.executemany(f"DELETE FROM {table} WHERE id = ?", stale)
+                    conn.executemany(
+                        f"INSERT OR REPLACE INTO {table} ({column_list}) VALUES ({', '.join('?' * len(columns))})",
+                        updated
+                    )
+                    changed[table] += len(stale) + len(updated)
+        return changed
+
+    def move_tenant(self, tenant_id: str, target: str, grace: Optional[float] = None) -> Dict[str, int]:
+        """テナントのデータを別のシャードへ移動（再配置）
+
+        1. テナントを移動中にし、全プロセスのルーティング表が更新されるまで待つ
+           （移動中のテナントへの書き込みは TenantMovingError になる）
+        2. 移動元の書き込みロックを取り、実行中の書き込みが終わってから行を移動先へコピー
+        3. ディレクトリのシャードを切り替え、古いルーティング表での読み取りが
+           無くなるまで待ってから移動元の行を削除する
+        grace を省略した場合は refresh_interval の2倍待つ。
+        """
+        grace = self.refresh_interval * 2 if grace is None else grace
+        routes = self.directory.load()
+        tenant = routes.tenants.get(tenant_id)
+        if tenant is None:
+            raise KeyError(f"テナントが見つかりません: {tenant_id}")
+        target_shard = self.directory.shard(target)
+        if tenant.shard_id == target_shard.id:
+            return {}
+        source = self.database(routes.shards[tenant.shard_id])
+        destination = self.database(target_shard)
+
+        self.directory.set_tenant(tenant_id, state=MOVING)
+        switched = False
+        try:
+            time.sleep(grace)
+            with source.write_transaction() as src:
+                user_ids = [
+                    user_id for (user_id,) in src.execute("SELECT id FROM users")
+                    if routes.tenant_for(user_id) is tenant
+                ]
+                chunks = [user_ids[i:i + MOVE_CHUNK_SIZE] for i in range(0, len(user_ids), MOVE_CHUNK_SIZE)]
+                with destination.write_transaction() as dst:
+                    moved = self._copy_rows(src, dst, chunks)
+                self.directory.set_tenant(tenant_id, shard_id=target_shard.id, state=ACTIVE)
+                switched = True
+        finally:
+            if not switched:
+                self.directory.set_tenant(tenant_id, state=ACTIVE)
+            self.invalidate()
+
+        time.sleep(grace)
+        with source.write_transaction() as src:
+            for chunk in chunks:
+                self._delete_rows(src, chunk)
+        return moved
+
+    def _copy_rows(self, src, dst, chunks: List[List[int]]) -> Dict[str, int]:
+        moved = {table: 0 for table, _ in TENANT_TABLES}
+
+        # コピーで移動先に記録される変更履歴を移動元より後の番号にし、
+        # 端末は移動元で受け取った同期カーソルから続けて取得できる（全件を受け取り直す）
+        last_change = src.execute("SELECT COALESCE(MAX(version), 0) FROM change_log").fetchone()[0]
+        dst.execute("""
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT 'change_log', 0 WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'change_log')
+        """)
+        dst.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'change_log'", (last_change,))
+
+        for chunk in chunks:
+            # 中断した過去の移動で残った行を先に消す
+            self._delete_rows(dst, chunk)
+            ids = ", ".join("?" * len(chunk))
+            for table, condition in TENANT_TABLES:
+                cursor = src.execute(f"SELECT * FROM {table} WHERE {condition.format(ids=ids)}", chunk)
+                columns = [d[0] for d in cursor.description]
+                rows = cursor.fetchall()
+                dst.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    rows
+                )
+                moved[table] += len(rows)
+
+            # 移動先のバージョンを移動元より進め、各プロセスのキャッシュを読み込み直させる
+            scopes = [scope for user_id in chunk for scope in (user_scope(user_id), study_sessions_scope(user_id))]
+            versions = dict(src.execute(
+                f"SELECT scope, version FROM data_versions WHERE scope IN ({', '.join('?' * len(scopes))})", scopes
+            ).fetchall())
+            dst.executemany("""
+                INSERT INTO data_versions (scope, version, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (scope) DO UPDATE SET
+                    version = MAX(version, excluded.version),
+                    updated_at = CURRENT_TIMESTAMP
+            """, [(scope, versions.get(scope, 0) + 1) for scope in scopes])
+        return moved
+
+    def _delete_rows(self, conn, chunk: List[int]):
+        ids = ", ".join("?" * len(chunk))
+        for table, condition in reversed(TENANT_TABLES):
+            conn.execute(f"DELETE FROM {table} WHERE {condition.format(ids=ids)}", chunk)
+        # 削除で記録された分を含め、移動したユーザーの変更履歴は残さない
+        conn.execute(f"DELETE FROM change_log WHERE user_id IN ({ids})", chunk)
+        # 正答数はコピーしたクイズ結果から移動先のトリガーが数え直す
+        conn.execute(f"DELETE FROM quiz_accuracy WHERE user_id IN ({ids})", chunk)
+
+    def close(self):
+        """全シャードの書き込み接続とスレッドプールを閉じる"""
+        if self._pool is not None:
+            self._pool.shutdown()
+        for db in self._databases.values():
+            db.writer.close()
+        self.directory.close()
+
+
+def create_router(directory_path: str, default_db_path: str) -> ShardRouter:
+    """ディレクトリからルーターを作成（シャードが未登録なら default_db_path を既定のシャードにする）"""
+    directory = ShardDirectory(directory_path)
+    if not directory.load().shards:
+        directory.add_shard("primary", default_db_path)
+    return ShardRouter(directory)
@@ -0,0 +1,270 @@
+"""
+監視用サイドカーHTTPサーバー
+
+Streamlitには独自のHTTPエンドポイントを追加できないため、各ワーカープロセス内で
+デーモンスレッドとして小さなHTTPサーバーを起動し、/metrics（Prometheus形式）と
+死活監視用の /healthz（プロセスの生存）・/readyz（DBの読み取り可否と負荷の状況）を返す。
+ポートは環境変数 METRICS_PORT（監視スクリプトがワーカーごとに設定）で指定し、
+"off" で無効にできる。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.controllers import database
+from src.controllers.cache import get_cache
+from src.controllers.metrics import get_query_metrics, render_gauges
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_METRICS_PORT = 9501
+
+# パス -> (ステータス, Content-Type, 本文) を返す関数
+Route = Callable[[], Tuple[int, str, bytes]]
+
+_routes: Dict[str, Route] = {}
+_collectors: List[Callable[[], List[str]]] = []
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+_start_attempted = False
+_started_at = time.time()
+
+
+def register_route(path: str, handler: Route):
+    """サイドカーにエンドポイントを追加"""
+    _routes[path] = handler
+
+
+def register_collector(collector: Callable[[], List[str]]):
+    """/metrics に出力する行を返す関数を追加"""
+    _collectors.append(collector)
+
+
+def process_rss_bytes() -> int:
+    """プロセスの常駐メモリサイズ（バイト）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def render_metrics() -> str:
+    """プロセスのメトリクスを Prometheus テキスト形式で生成"""
+    lines: List[str] = get_query_metrics().render_prometheus()
+
+    db = database.db_controller
+    if db is not None:
+        writer = db.writer.stats()
+        lines += render_gauges([
+            ("rts_db_write_transactions_total", "counter", "Committed or attempted write transactions.", writer["transactions"]),
+            ("rts_db_write_retries_total", "counter", "BEGIN IMMEDIATE retries caused by lock contention.", writer["retries"]),
+            ("rts_db_write_failures_total", "counter", "Write transactions that could not acquire the lock.", writer["failures"]),
+            ("rts_db_write_queue_depth", "gauge", "Threads waiting for the in-process write lock.", writer["queue_depth"]),
+            ("rts_db_write_wait_seconds_max", "gauge", "Longest wait for the write lock.", writer["max_wait_ms"] / 1000),
+        ])
+        analytics = db.analytics.stats()
+        lines += render_gauges([
+            ("rts_db_analytics_connections_in_use", "gauge", "Read-only analytics connections currently lent out.", analytics["in_use"]),
+            ("rts_db_analytics_connections_max", "gauge", "Size limit of the analytics connection pool.", analytics["max_size"]),
+            ("rts_db_analytics_snapshots_total", "counter", "Analytics snapshots opened.", analytics["snapshots"]),
+            ("rts_db_analytics_timeouts_total", "counter", "Analytics requests that gave up waiting for a connection.", analytics["timeouts"]),
+            ("rts_db_analytics_wait_seconds_max", "gauge", "Longest wait for an analytics connection.", analytics["max_wait_ms"] / 1000),
+        ])
+
+    cache = get_cache().stats()
+    lines += render_gauges([
+        ("rts_cache_hits_total", "counter", "Versioned cache hits.", cache["hits"]),
+        ("rts_cache_misses_total", "counter", "Versioned cache misses.", cache["misses"]),
+        ("rts_cache_entries", "gauge", "Entries in the versioned cache.", cache["entries"]),
+        ("process_resident_memory_bytes", "gauge", "Resident memory size in bytes.", process_rss_bytes()),
+        ("process_start_time_seconds", "gauge", "Start time of the process since unix epoch.", int(_started_at)),
+    ])
+    for collector in _collectors:
+        lines += collector()
+    return "\n".join(lines) + "\n"
+
+
+def _metrics_route() -> Tuple[int, str, bytes]:
+    return 200, PROMETHEUS_CONTENT_TYPE, render_metrics().encode("utf-8")
+
+
+register_route("/metrics", _metrics_route)
+
+
+def health_status() -> Dict[str, Any]:
+    """プロセスの生存状態（DBには触れない）"""
+    return {"status": "ok", "pid": os.getpid(), "uptime_seconds": round(time.time() - _started_at, 1)}
+
+
+class DatabaseProbe:
+    """readyz 用のDB読み取り確認
+
+    接続は使い回し、進捗ハンドラーで timeout を超えた読み取りを中断する。
+    """
+
+    def __init__(self, timeout: float = 1.0):
+        self.timeout = timeout
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_path: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def check(self, db_path: str) -> Dict[str, Any]:
+        """軽い読み取りを実行して結果と所要時間を返す"""
+        started = time.perf_counter()
+        deadline = started + self.timeout
+        with self._lock:
+            try:
+                if self._conn is None or self._db_path != db_path:
+                    if self._conn is not None:
+                        self._conn.close()
+                    self._conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True,
+                                                 timeout=self.timeout, check_same_thread=False)
+                    self._db_path = db_path
+                # 期限は呼び出しごとに異なるため、進捗ハンドラーを毎回設定し直す
+                self._conn.set_progress_handler(lambda: time.perf_counter() > deadline, 1000)
+                self._conn.execute("SELECT version FROM data_versions LIMIT 1").fetchall()
+                ok, error = True, None
+            except sqlite3.Error as e:
+                ok, error = False, str(e)
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+        result: Dict[str, Any] = {"ok": ok, "latency_ms": round((time.perf_counter() - started) * 1000, 3)}
+        if error:
+            result["error"] = error
+        return result
+
+
+_database_probe = DatabaseProbe()
+
+
+def _active_sessions() -> Optional[Dict[str, int]]:
+    """Streamlitの接続中セッション数（Streamlit外のプロセスでは None）"""
+    try:
+        from streamlit.runtime import Runtime
+        if not Runtime.exists():
+            return None
+        session_mgr = Runtime.instance()._session_mgr
+        return {"active": session_mgr.num_active_sessions(), "total": session_mgr.num_sessions()}
+    except Exception:
+        return None
+
+
+def readiness_status(db=None) -> Tuple[bool, Dict[str, Any]]:
+    """DBの読み取り可否と、書き込み待ち・キャッシュ・セッションの状況"""
+    status = health_status()
+    db = db or database.db_controller
+    if db is None:
+        status.update(status="starting", database={"ok": False, "error": "database not initialized"})
+        return False, status
+
+    check = _database_probe.check(db.db_path)
+    writer = db.writer.stats()
+    analytics = db.analytics.stats()
+    cache = get_cache().stats()
+    status.update(
+        status="ready" if check["ok"] else "unavailable",
+        database=check,
+        writer={key: writer[key] for key in ("queue_depth", "max_queue_depth", "failures", "max_wait_ms")},
+        analytics={key: analytics[key] for key in ("in_use", "max_size", "timeouts")},
+        cache={"entries": cache["entries"], "hit_rate": round(cache["hit_rate"], 4)},
+        sessions=_active_sessions(),
+    )
+    return check["ok"], status
+
+
+def _json_response(status: int, body: Dict[str, Any]) -> Tuple[int, str, bytes]:
+    return status, "application/json", json.dumps(body).encode("utf-8")
+
+
+def _healthz_route() -> Tuple[int, str, bytes]:
+    return _json_response(200, health_status())
+
+
+def _readyz_route() -> Tuple[int, str, bytes]:
+    ready, status = readiness_status()
+    return _json_response(200 if ready else 503, status)
+
+
+register_route("/healthz", _healthz_route)
+register_route("/readyz", _readyz_route)
+
+
+class SidecarHandler(BaseHTTPRequestHandler):
+    """登録されたエンドポイントに応答するハンドラー"""
+
+    def do_GET(self):
+        handler = _routes.get(self.path.split("?", 1)[0])
+        if handler is None:
+            status, content_type, body = 404, "text/plain; charset=utf-8", b"not found\n"
+        else:
+            try:
+                status, content_type, body = handler()
+            except Exception:
+                logger.exception("sidecar handler failed: %s", self.path)
+                status, content_type, body = 500, "text/plain; charset=utf-8", b"internal error\n"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # スクレイプのたびにアクセスログを出さない
+        pass
+
+
+def metrics_port() -> Optional[int]:
+    """環境変数からサイドカーのポートを決定（無効な場合は None）"""
+    value = os.environ.get("METRICS_PORT")
+    if value is None:
+        index = int(os.environ.get("READY_TO_STUDY_WORKER_INDEX", "0"))
+        return DEFAULT_METRICS_PORT + index
+    if value.lower() in ("", "off", "none"):
+        return None
+    return int(value)
+
+
+def start_sidecar(port: Optional[int] = None, address: Optional[str] = None) -> Optional[ThreadingHTTPServer]:
+    """サイドカーをデーモンスレッドで起動（プロセス内で1度だけ）
+
+    Streamlitは再実行のたびに呼び出すため、2回目以降は最初の結果を返す。
+    ポートが使用中の場合は警告を出してアプリの動作を続ける。
+    """
+    global _server, _start_attempted
+    with _server_lock:
+        if _start_attempted:
+            return _server
+        _start_attempted = True
+        port = metrics_port() if port is None else port
+        if port is None:
+            return None
+        address = address or os.environ.get("METRICS_ADDRESS", "127.0.0.1")
+        try:
+            server = ThreadingHTTPServer((address, port), SidecarHandler)
+        except OSError as e:
+            logger.warning("sidecar could not listen on %s:%s: %s", address, port, e)
+            return None
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-sidecar", daemon=True).start()
+        _server = server
+        return server
+
+
+def stop_sidecar():
+    """サイドカーを停止"""
+    global _server, _start_attempted
+    with _server_lock:
+        if _server is not None:
+            _server.shutdown()
+            _server.server_close()
+            _server = None
+        _start_attempted = False
@@ -0,0 +1,353 @@
+"""
+ダッシュボードの事前集計
+
+ダッシュボードの集計（今週の学習時間・今月の学習日数・クイズ数・14日間の推移・
+30日間の教科別時間・最近の学習活動）をユーザーごとに1つのスナップショットにまとめ、
+zlib で圧縮したJSONとして dashboard_snapshots テーブルに保存する。
+スナップショットは集計前に読んだユーザーのデータバージョンを持ち、バージョンが
+変わらず、同じ日のうちで max_age を過ぎていなければ集計し直さない。
+
+SnapshotScheduler は別スレッドで data_versions を監視し、書き込みが落ち着いた
+ユーザー（quiet_period 秒書き込みが無い）と、定期的に最近更新のあったユーザーを
+同時実行数を制限して事前集計する。ダッシュボードは保存済みのスナップショットを読み、
+古い場合だけその場で集計する。
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.controllers.database import all_databases, get_database, user_scope
+from src.controllers.metrics import render_gauges
+from src.controllers.queries import (get_daily_minutes, get_overview_metrics,
+                                     get_recent_activities, get_subject_minutes)
+from src.controllers.sharding import TenantMovingError
+from src.controllers.sidecar import register_collector, register_route
+
+logger = logging.getLogger("ready_to_study.snapshots")
+
+# 保存済みのスナップショットを使う最大の経過秒数（データが変わらなくても相対日付の集計がずれるため）
+DEFAULT_MAX_AGE = float(os.environ.get("DASHBOARD_SNAPSHOT_MAX_AGE", "3600"))
+
+
+@dataclass
+class DashboardSnapshot:
+    """1ユーザー分のダッシュボードの集計結果"""
+    user_id: int
+    version: int
+    computed_at: datetime
+    metrics: Dict[str, int]
+    daily_minutes: List[Dict[str, Any]] = field(default_factory=list)
+    subject_minutes: List[Dict[str, Any]] = field(default_factory=list)
+    recent_activities: List[Dict[str, Any]] = field(default_factory=list)
+
+    def encode(self) -> bytes:
+        """保存用の圧縮したJSON"""
+        body = {
+            "metrics": self.metrics,
+            "daily_minutes": self.daily_minutes,
+            "subject_minutes": self.subject_minutes,
+            "recent_activities": self.recent_activities,
+        }
+        return zlib.compress(json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    @classmethod
+    def decode(cls, user_id: int, version: int, computed_at: str, payload: bytes) -> "DashboardSnapshot":
+        """保存された行から復元"""
+        body = json.loads(zlib.decompress(payload).decode("utf-8"))
+        return cls(user_id, version, datetime.fromisoformat(computed_at), **body)
+
+    def is_fresh(self, version: int, max_age: float = DEFAULT_MAX_AGE, now: Optional[datetime] = None) -> bool:
+        """データバージョンが同じで、同じ日のうちに max_age 秒以内に集計されたか"""
+        now = now or datetime.now()
+        return (
+            self.version == version
+            and self.computed_at.date() == now.date()
+            and (now - self.computed_at).total_seconds() < max_age
+        )
+
+
+def compute_dashboard(conn, user_id: int) -> DashboardSnapshot:
+    """ダッシュボードの集計を実行
+
+    バージョンを先に読むため、集計中に書き込みがあっても古いバージョンが記録され、
+    次回は集計し直される（新しいデータを古いバージョンで保存することはない）。
+    """
+    row = conn.execute("SELECT version FROM data_versions WHERE scope = ?", (user_scope(user_id),)).fetchone()
+    return DashboardSnapshot(
+        user_id=user_id,
+        version=row[0] if row else 0,
+        computed_at=datetime.now().replace(microsecond=0),
+        metrics=get_overview_metrics(conn, user_id),
+        daily_minutes=get_daily_minutes(conn, user_id),
+        subject_minutes=get_subject_minutes(conn, user_id),
+        recent_activities=get_recent_activities(conn, user_id),
+    )
+
+
+def load_snapshot(db, user_id: int) -> Optional[DashboardSnapshot]:
+    """保存済みのスナップショットを取得"""
+    with db.get_connection() as conn:
+        row = conn.execute(
+            "SELECT version, computed_at, payload FROM dashboard_snapshots WHERE user_id = ?", (user_id,)
+        ).fetchone()
+    return DashboardSnapshot.decode(user_id, *row) if row else None
+
+
+def save_snapshot(db, snapshot: DashboardSnapshot) -> bool:
+    """スナップショットを保存（保存済みの方が新しい場合は上書きしない）
+
+    移動中のテナントには書き込めないため保存せず False を返す。
+    """
+    try:
+        with db.write_transaction() as conn:
+            conn.execute("""
+                INSERT INTO dashboard_snapshots (user_id, version, computed_at, payload)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    version = excluded.version,
+                    computed_at = excluded.computed_at,
+                    payload = excluded.payload
+                WHERE (excluded.version, excluded.computed_at) >= (version, computed_at)
+            """, (snapshot.user_id, snapshot.version, snapshot.computed_at.isoformat(), snapshot.encode()))
+    except TenantMovingError:
+        return False
+    return True
+
+
+def refresh_snapshot(user_id: int, max_age: float = DEFAULT_MAX_AGE,
+                     use_analytics_pool: bool = False) -> Tuple[DashboardSnapshot, bool]:
+    """保存済みのスナップショットが新しければそのまま、古ければ集計し直して保存する
+
+    (スナップショット, 集計し直したか) を返す。バックグラウンドの集計は
+    use_analytics_pool=True で分析用の接続プールを使い、同時に開く接続数を制限する。
+    """
+    db = get_database(user_id)
+    stored = load_snapshot(db, user_id)
+    if stored is not None and stored.is_fresh(db.get_data_version(user_scope(user_id)), max_age):
+        return stored, False
+
+    if use_analytics_pool:
+        with db.analytics_snapshot() as conn:
+            snapshot = compute_dashboard(conn, user_id)
+    else:
+        with db.get_connection() as conn:
+            snapshot = compute_dashboard(conn, user_id)
+    save_snapshot(db, snapshot)
+    return snapshot, True
+
+
+def get_dashboard_snapshot(user_id: int) -> DashboardSnapshot:
+    """ダッシュボードに表示するスナップショットを取得"""
+    return refresh_snapshot(user_id)[0]
+
+
+class SnapshotScheduler:
+    """ダッシュボードのスナップショットを事前集計するスケジューラー"""
+
+    def __init__(self, interval: float = 300.0, poll_interval: float = 5.0, quiet_period: float = 10.0,
+                 active_hours: float = 24.0, max_workers: int = 2, max_queued: int = 1000,
+                 max_age: float = DEFAULT_MAX_AGE):
+        self.interval = interval
+        self.poll_interval = poll_interval
+        self.quiet_period = quiet_period
+        self.active_hours = active_hours
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_age = max_age
+        self.counters = {"refreshed": 0, "skipped": 0, "failed": 0, "dropped": 0, "sweeps": 0}
+        self.last_sweep: Optional[str] = None
+        # user_id -> 最後に書き込みを検出した時刻（monotonic）
+        self._pending: Dict[int, float] = {}
+        self._in_flight: set = set()
+        # db_path -> (前回の updated_at の最大値, その時点のスコープごとのバージョン)
+        self._watermarks: Dict[str, Tuple[str, Dict[str, int]]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="snapshot")
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """監視スレッドを開始"""
+        self._thread = threading.Thread(target=self._run, name="snapshot-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """監視スレッドを停止し、実行中の集計の終了を待つ"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _run(self):
+        next_sweep = 0.0
+        while not self._stop.is_set():
+            try:
+                self.poll_changes()
+                if time.monotonic() >= next_sweep:
+                    self.sweep()
+                    next_sweep = time.monotonic() + self.interval
+                self.submit_quiet()
+            except Exception:
+                logger.exception("snapshot scheduling failed")
+            self._stop.wait(self.poll_interval)
+
+    def poll_changes(self) -> List[int]:
+        """前回以降にデータバージョンが上がったユーザーを書き込み待ちに追加"""
+        changed = []
+        now = time.monotonic()
+        for db in all_databases():
+            watermark, seen = self._watermarks.get(db.db_path, (None, {}))
+            with db.get_connection() as conn:
+                if watermark is None:
+                    # 初回は現在の状態を基準にする（それ以前の変更は sweep で拾う）
+                    watermark = conn.execute(
+                        "SELECT COALESCE(MAX(updated_at), '') FROM data_versions WHERE scope LIKE 'user:%'"
+                    ).fetchone()[0]
+                    first = True
+                else:
+                    first = False
+                # 秒単位の時刻のため、基準と同じ時刻の行はバージョンで変更を判定する
+                rows = conn.execute(
+                    "SELECT scope, version, updated_at FROM data_versions "
+                    "WHERE updated_at >= ? AND scope LIKE 'user:%'", (watermark,)
+                ).fetchall()
+            if rows:
+                watermark = max(row[2] for row in rows)
+            for scope, version, _ in rows:
+                if not first and seen.get(scope) != version:
+                    changed.append(int(scope.split(":", 1)[1]))
+            self._watermarks[db.db_path] = (watermark, {row[0]: row[1] for row in rows if row[2] == watermark})
+
+        with self._lock:
+            for user_id in changed:
+                self._pending[user_id] = now
+        return changed
+
+    def submit_quiet(self) -> int:
+        """quiet_period 秒以上書き込みの無いユーザーの集計を開始"""
+        now = time.monotonic()
+        with self._lock:
+            ready = [user_id for user_id, at in self._pending.items() if now - at >= self.quiet_period]
+            for user_id in ready:
+                del self._pending[user_id]
+        return sum(self.submit(user_id) for user_id in ready)
+
+    def sweep(self) -> int:
+        """active_hours 時間以内に更新のあったユーザーの集計を開始（変わっていなければ集計時にスキップ）"""
+        user_ids = set()
+        for db in all_databases():
+            with db.get_connection() as conn:
+                rows = conn.execute(
+                    "SELECT scope FROM data_versions WHERE updated_at >= datetime('now', ?) AND scope LIKE 'user:%'",
+                    (f"-{self.active_hours} hours",)
+                ).fetchall()
+            user_ids.update(int(row[0].split(":", 1)[1]) for row in rows)
+        with self._lock:
+            self.counters["sweeps"] += 1
+            self.last_sweep = datetime.now().isoformat(timespec="seconds")
+        return sum(self.submit(user_id) for user_id in sorted(user_ids))
+
+    def submit(self, user_id: int) -> bool:
+        """ユーザーの集計を開始（実行中・待ちが上限を超える場合は行わない）"""
+        with self._lock:
+            if user_id in self._in_flight:
+                return False
+            if len(self._in_flight) >= self.max_queued:
+                self.counters["dropped"] += 1
+                return False
+            self._in_flight.add(user_id)
+        self._executor.submit(self._refresh, user_id)
+        return True
+
+    def _refresh(self, user_id: int):
+        try:
+            _, refreshed = refresh_snapshot(user_id, self.max_age, use_analytics_pool=True)
+            outcome = "refreshed" if refreshed else "skipped"
+        except Exception:
+            logger.exception("dashboard snapshot failed for user %s", user_id)
+            outcome = "failed"
+        with self._lock:
+            self.counters[outcome] += 1
+            self._in_flight.discard(user_id)
+
+    def wait_idle(self, timeout: float = 10.0) -> bool:
+        """実行中・待ちの集計が無くなるまで待つ（テスト・スクリプト用）"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._in_flight:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        """集計の件数と待ちの状況"""
+        with self._lock:
+            return {
+                **self.counters,
+                "in_flight": len(self._in_flight),
+                "pending": len(self._pending),
+                "max_workers": self.max_workers,
+                "last_sweep": self.last_sweep,
+            }
+
+    def render_prometheus(self) -> List[str]:
+        """統計を Prometheus 形式で出力"""
+        stats = self.stats()
+        return render_gauges([
+            ("rts_snapshot_refreshed_total", "counter", "Dashboard snapshots recomputed in the background.", stats["refreshed"]),
+            ("rts_snapshot_skipped_total", "counter", "Background refreshes skipped because data was unchanged.", stats["skipped"]),
+            ("rts_snapshot_failed_total", "counter", "Background refreshes that raised an error.", stats["failed"]),
+            ("rts_snapshot_dropped_total", "counter", "Refreshes not queued because the queue was full.", stats["dropped"]),
+            ("rts_snapshot_in_flight", "gauge", "Snapshot refreshes queued or running.", stats["in_flight"]),
+            ("rts_snapshot_pending", "gauge", "Users waiting for their write burst to settle.", stats["pending"]),
+        ])
+
+
+# グローバルインスタンス（start_snapshot_scheduler で作成）
+snapshot_scheduler: Optional[SnapshotScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def start_snapshot_scheduler() -> Optional[SnapshotScheduler]:
+    """環境変数で有効な場合に事前集計を開始（プロセス内で1度だけ）
+
+    DASHBOARD_PRECOMPUTE を指定しない場合は、複数ワーカーで重複しないよう
+    ワーカー番号 0 のプロセス（単独起動を含む）だけで実行する。
+    """
+    global snapshot_scheduler
+    setting = os.environ.get("DASHBOARD_PRECOMPUTE", "").lower()
+    if setting in ("0", "false", "no", "off"):
+        return None
+    if not setting and os.environ.get("READY_TO_STUDY_WORKER_INDEX", "0") != "0":
+        return None
+    with _scheduler_lock:
+        if snapshot_scheduler is None:
+            snapshot_scheduler = SnapshotScheduler(
+                interval=float(os.environ.get("DASHBOARD_PRECOMPUTE_INTERVAL", "300")),
+                quiet_period=float(os.environ.get("DASHBOARD_PRECOMPUTE_QUIET", "10")),
+                max_workers=int(os.environ.get("DASHBOARD_PRECOMPUTE_WORKERS", "2")),
+            )
+            snapshot_scheduler.start()
+    return snapshot_scheduler
+
+
+def _snapshots_route():
+    if snapshot_scheduler is None:
+        return 404, "application/json", b'{"error": "dashboard precompute is not running"}'
+    return 200, "application/json", json.dumps(snapshot_scheduler.stats()).encode("utf-8")
+
+
+def _snapshots_collector() -> List[str]:
+    return snapshot_scheduler.render_prometheus() if snapshot_scheduler is not None else []
+
+
+register_route("/debug/snapshots", _snapshots_route)
+register_collector(_snapshots_collector)
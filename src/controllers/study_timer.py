@@ -0,0 +1,111 @@
+"""
+学習タイマー
+
+開始時に利用者ごとの進行中の行（study_timers）を作り、経過時間は画面の部品が
+ブラウザ側で数える。サーバーとのやり取りは開始・CHECKPOINT_SECONDS ごとの確認・停止だけで、
+確認では進行中の行の最終確認時刻（checkpoint_at）を更新する。停止すると経過時間を
+study_sessions の記録に変換し、進行中の行を削除する（1つのトランザクション）。
+
+経過時間はサーバーの時刻で数えるため、ブラウザの時計には依存しない。ブラウザが閉じられたり
+プロセスが落ちたりしても進行中の行は残り、最終確認時刻までを記録するか破棄するかを選べる。
+進行中の行は data_versions を上げないため、確認のたびにキャッシュが無効になることはない。
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from src.controllers.queries import insert_study_session
+
+# ブラウザから最終確認時刻を更新する間隔（秒）
+CHECKPOINT_SECONDS = 60
+
+# 最終確認時刻からこの秒数を過ぎたタイマーは中断されたものとして扱う
+STALE_SECONDS = CHECKPOINT_SECONDS * 3
+
+# 1回のタイマーで記録できる学習時間の上限（分、手入力の上限と同じ）
+MAX_TIMER_MINUTES = 480
+
+
+@dataclass(frozen=True)
+class StudyTimer:
+    """進行中の学習タイマー"""
+    user_id: int
+    subject_id: int
+    started_at: datetime
+    checkpoint_at: datetime
+
+    def elapsed_seconds(self, now: Optional[datetime] = None) -> int:
+        """開始からの経過秒数"""
+        return max(int(((now or datetime.now()) - self.started_at).total_seconds()), 0)
+
+    def minutes(self, until: datetime) -> int:
+        """until までの学習時間（分、1分以上 MAX_TIMER_MINUTES 以下）"""
+        return min(max(round(self.elapsed_seconds(until) / 60), 1), MAX_TIMER_MINUTES)
+
+    def is_stale(self, now: Optional[datetime] = None) -> bool:
+        """ブラウザからの確認が途絶えているか"""
+        return (now or datetime.now()) - self.checkpoint_at > timedelta(seconds=STALE_SECONDS)
+
+
+def _timer(row) -> Optional[StudyTimer]:
+    if row is None:
+        return None
+    user_id, subject_id, started_at, checkpoint_at = row
+    return StudyTimer(user_id, subject_id, datetime.fromisoformat(started_at), datetime.fromisoformat(checkpoint_at))
+
+
+def _select(conn, user_id: int) -> Optional[StudyTimer]:
+    return _timer(conn.execute(
+        "SELECT user_id, subject_id, started_at, checkpoint_at FROM study_timers WHERE user_id = ?", (user_id,)
+    ).fetchone())
+
+
+def get_timer(db, user_id: int) -> Optional[StudyTimer]:
+    """利用者の進行中のタイマー"""
+    with db.get_connection() as conn:
+        return _select(conn, user_id)
+
+
+def start_timer(db, user_id: int, subject_id: int, now: Optional[datetime] = None) -> StudyTimer:
+    """タイマーを開始（進行中のタイマーがあればそれを返す）"""
+    now = (now or datetime.now()).replace(microsecond=0)
+    with db.write_transaction() as conn:
+        conn.execute("""
+            INSERT INTO study_timers (user_id, subject_id, started_at, checkpoint_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id) DO NOTHING
+        """, (user_id, subject_id, now, now))
+        return _select(conn, user_id)
+
+
+def checkpoint_timer(db, user_id: int, now: Optional[datetime] = None) -> bool:
+    """最終確認時刻を更新（進行中のタイマーがなければ False）"""
+    now = (now or datetime.now()).replace(microsecond=0)
+    with db.write_transaction() as conn:
+        cursor = conn.execute("UPDATE study_timers SET checkpoint_at = ? WHERE user_id = ?", (now, user_id))
+        return cursor.rowcount > 0
+
+
+def stop_timer(db, user_id: int, content: Optional[str], satisfaction_score: Optional[int],
+               now: Optional[datetime] = None, until_checkpoint: bool = False) -> Optional[int]:
+    """タイマーを停止して学習記録に変換し、記録のIDを返す（進行中のタイマーがなければ None）
+
+    until_checkpoint では中断されたタイマーを最終確認時刻までの学習として記録する。
+    """
+    with db.write_transaction() as conn:
+        timer = _select(conn, user_id)
+        if timer is None:
+            return None
+        until = timer.checkpoint_at if until_checkpoint else (now or datetime.now())
+        session_id = insert_study_session(
+            conn, user_id, timer.subject_id, timer.minutes(until), content, satisfaction_score, timer.started_at
+        )
+        conn.execute("DELETE FROM study_timers WHERE user_id = ?", (user_id,))
+        return session_id
+
+
+def discard_timer(db, user_id: int) -> bool:
+    """タイマーを記録せずに破棄"""
+    with db.write_transaction() as conn:
+        return conn.execute("DELETE FROM study_timers WHERE user_id = ?", (user_id,)).rowcount > 0
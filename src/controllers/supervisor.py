@@ -0,0 +1,210 @@
+"""
+Streamlitワーカープロセスの監視
+
+連続したポートで N 個の Streamlit ワーカー（scripts/run_worker.py）を起動し、/_stcore/health による
+ヘルスチェックと異常終了時の再起動を行う。各ワーカーの監視用サイドカー（/metrics）は
+metrics_base_port からの連番で待ち受ける。nginx の upstream 設定も生成する。
+Streamlitのセッションは WebSocket 接続に紐づくため、nginx 側ではクッキーで
+同じワーカーに振り分ける（スティッキーセッション）。
+"""
+
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@dataclass
+class Worker:
+    """ワーカープロセスの状態"""
+    index: int
+    port: int
+    process: Optional[subprocess.Popen] = None
+    started_at: float = 0.0
+    failures: int = 0
+    restarts: int = 0
+
+    @property
+    def is_running(self) -> bool:
+        """プロセスが動作中かどうか"""
+        return self.process is not None and self.process.poll() is None
+
+
+@dataclass
+class SupervisorConfig:
+    """ワーカー監視の設定"""
+    workers: int = 2
+    base_port: int = 8501
+    metrics_base_port: int = 9501
+    address: str = "127.0.0.1"
+    launcher_path: str = os.path.join(PROJECT_ROOT, "scripts", "run_worker.py")
+    check_interval: float = 10.0
+    check_timeout: float = 3.0
+    startup_grace: float = 30.0
+    max_failures: int = 3
+    extra_env: Dict[str, str] = field(default_factory=dict)
+
+
+class WorkerSupervisor:
+    """Streamlitワーカーの起動・ヘルスチェック・再起動"""
+
+    def __init__(self, config: SupervisorConfig):
+        self.config = config
+        self.workers = [
+            Worker(index=i, port=config.base_port + i) for i in range(config.workers)
+        ]
+        self._stopping = False
+        self._reload_requested = False
+
+    def command(self, worker: Worker) -> List[str]:
+        """ワーカーの起動コマンドを取得"""
+        return [
+            sys.executable, self.config.launcher_path,
+            "--server.address", self.config.address,
+            "--server.port", str(worker.port),
+            "--server.headless", "true",
+            "--browser.gatherUsageStats", "false",
+        ]
+
+    def worker_env(self, worker: Worker) -> Dict[str, str]:
+        """ワーカーに渡す環境変数を取得"""
+        env = dict(os.environ)
+        env.update(self.config.extra_env)
+        env["READY_TO_STUDY_WORKER_INDEX"] = str(worker.index)
+        env["METRICS_PORT"] = str(self.config.metrics_base_port + worker.index)
+        return env
+
+    def start_worker(self, worker: Worker):
+        """ワーカーを起動"""
+        worker.process = subprocess.Popen(
+            self.command(worker), cwd=PROJECT_ROOT, env=self.worker_env(worker)
+        )
+        worker.started_at = time.monotonic()
+        worker.failures = 0
+        logger.info("worker %d started on port %d (pid %d)", worker.index, worker.port, worker.process.pid)
+
+    def stop_worker(self, worker: Worker, timeout: float = 10.0):
+        """ワーカーを停止（応答しない場合は強制終了）"""
+        if not worker.is_running:
+            return
+        worker.process.terminate()
+        try:
+            worker.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            worker.process.kill()
+            worker.process.wait()
+        logger.info("worker %d stopped", worker.index)
+
+    def restart_worker(self, worker: Worker):
+        """ワーカーを再起動"""
+        self.stop_worker(worker)
+        worker.restarts += 1
+        self.start_worker(worker)
+
+    def is_healthy(self, worker: Worker) -> bool:
+        """Streamlitのヘルスエンドポイントで状態を確認"""
+        url = f"http://{self.config.address}:{worker.port}/_stcore/health"
+        try:
+            with urllib.request.urlopen(url, timeout=self.config.check_timeout) as response:
+                return response.status == 200
+        except OSError:
+            return False
+
+    def check_workers(self):
+        """全ワーカーを確認し、停止・異常なものを再起動"""
+        for worker in self.workers:
+            if not worker.is_running:
+                code = worker.process.returncode if worker.process else None
+                logger.warning("worker %d exited (code %s), restarting", worker.index, code)
+                self.restart_worker(worker)
+                continue
+
+            if time.monotonic() - worker.started_at < self.config.startup_grace:
+                continue
+
+            if self.is_healthy(worker):
+                worker.failures = 0
+                continue
+
+            worker.failures += 1
+            logger.warning("worker %d health check failed (%d/%d)",
+                           worker.index, worker.failures, self.config.max_failures)
+            if worker.failures >= self.config.max_failures:
+                self.restart_worker(worker)
+
+    def rolling_restart(self):
+        """1つずつ再起動して、起動完了を待ってから次へ進む"""
+        for worker in self.workers:
+            self.restart_worker(worker)
+            deadline = time.monotonic() + self.config.startup_grace
+            while time.monotonic() < deadline and not self.is_healthy(worker):
+                time.sleep(1)
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _handle_reload(self, signum, frame):
+        self._reload_requested = True
+
+    def run(self):
+        """ワーカーを起動し、停止シグナルを受けるまで監視する
+
+        SIGTERM/SIGINT で全ワーカーを停止し、SIGHUP でローリング再起動する。
+        """
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+
+        for worker in self.workers:
+            self.start_worker(worker)
+
+        next_check = time.monotonic() + self.config.check_interval
+        try:
+            while not self._stopping:
+                time.sleep(0.5)
+                if self._reload_requested:
+                    self._reload_requested = False
+                    logger.info("rolling restart requested")
+                    self.rolling_restart()
+                if time.monotonic() >= next_check:
+                    self.check_workers()
+                    next_check = time.monotonic() + self.config.check_interval
+        finally:
+            for worker in self.workers:
+                self.stop_worker(worker)
+
+
+def render_nginx_upstream(config: SupervisorConfig, upstream_name: str = "ready_to_study") -> str:
+    """ワーカー構成に対応する nginx の upstream 設定を生成
+
+    nginx のオープンソース版にはスティッキークッキーが無いため、初回リクエストの
+    $request_id をクッキー (rts_route) に保存し、その値のハッシュでワーカーを選ぶ。
+    学校のNATの背後にいる生徒が ip_hash で1つのワーカーに偏ることを避けられる。
+    サーバー側の location では rts_route クッキーを Set-Cookie で返す必要がある。
+    """
+    lines = [
+        "# このファイルは scripts/supervisor.py nginx-upstream で生成されています",
+        "",
+        "map $cookie_rts_route $rts_route {",
+        "    \"\"      $request_id;",
+        "    default $cookie_rts_route;",
+        "}",
+        "",
+        f"upstream {upstream_name} {{",
+        "    hash $rts_route consistent;",
+    ]
+    for i in range(config.workers):
+        lines.append(
+            f"    server {config.address}:{config.base_port + i} max_fails=3 fail_timeout=10s;"
+        )
+    lines += ["}", ""]
+    return "\n".join(lines)
@@ -0,0 +1,143 @@
+"""
+オフライン端末との差分同期
+
+書き込みはトリガーで change_log に (ユーザー, テーブル, 行ID, 操作, version) として
+追記される（database.CHANGE_LOG_TABLES）。端末は前回受け取った version を
+カーソルとして送り、それ以降に変更された行の現在の内容（削除された行は削除の通知）
+だけを小さなバッチで受け取る。同じ行の変更はバッチ内で1件にまとめる。
+
+端末からのアップロードは操作ごとの冪等キーとともに sync_uploads に結果を保存し、
+通信が切れて再送された操作は適用せずに保存済みの結果を返す。
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+from src.controllers.database import CHANGE_LOG_TABLES
+
+# 1回の同期で返す変更履歴の最大件数
+MAX_SYNC_BATCH = 500
+
+# 同期の対象テーブル（変更履歴に記録されるテーブル名）
+SYNC_TABLES = tuple(dict.fromkeys(logged for logged, _, _ in CHANGE_LOG_TABLES.values()))
+
+
+def _current_rows(conn, user_id: int, table: str, row_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """行IDごとの現在の内容（ユーザーの行のみ、user_id 列は除く）"""
+    owner = "id" if table == "users" else "user_id"
+    placeholders = ", ".join("?" * len(row_ids))
+    cursor = conn.execute(
+        f"SELECT * FROM {table} WHERE id IN ({placeholders}) AND {owner} = ?", [*row_ids, user_id]
+    )
+    columns = [d[0] for d in cursor.description]
+    rows = {}
+    for values in cursor.fetchall():
+        row = dict(zip(columns, values))
+        row.pop("user_id", None)
+        rows[row["id"]] = row
+
+    if table == "schedule_rules" and rows:
+        # 例外（完了・取り消し）は繰り返し予定に含めて返す
+        for rule in rows.values():
+            rule["exceptions"] = []
+        cursor = conn.execute(
+            f"SELECT rule_id, occurrence_date, is_completed, is_cancelled FROM schedule_exceptions "
+            f"WHERE rule_id IN ({', '.join('?' * len(rows))}) ORDER BY rule_id, occurrence_date",
+            list(rows)
+        )
+        for rule_id, occurrence_date, is_completed, is_cancelled in cursor.fetchall():
+            rows[rule_id]["exceptions"].append({
+                "occurrence_date": occurrence_date,
+                "is_completed": bool(is_completed),
+                "is_cancelled": bool(is_cancelled),
+            })
+    return rows
+
+
+def pull_changes(conn, user_id: int, cursor: int = 0, limit: int = MAX_SYNC_BATCH) -> Dict[str, Any]:
+    """カーソル以降の変更を取得
+
+    変更履歴を version 順に limit 件読み、行ごとに最後の変更だけを現在の内容で返す。
+    has_more が真の間は、返した cursor で続けて取得する。
+    """
+    entries = conn.execute("""
+        SELECT version, table_name, row_id
+        FROM change_log
+        WHERE user_id = ? AND version > ?
+        ORDER BY version
+        LIMIT ?
+    """, (user_id, cursor, limit)).fetchall()
+
+    latest: Dict[tuple, int] = {}
+    for version, table, row_id in entries:
+        latest[(table, row_id)] = version
+
+    current: Dict[str, Dict[int, Dict[str, Any]]] = {}
+    for table in SYNC_TABLES:
+        row_ids = [row_id for (name, row_id) in latest if name == table]
+        if row_ids:
+            current[table] = _current_rows(conn, user_id, table, row_ids)
+
+    changes = []
+    for (table, row_id), version in sorted(latest.items(), key=lambda item: item[1]):
+        row = current[table].get(row_id)
+        if row is None:
+            changes.append({"version": version, "table": table, "id": row_id, "op": "delete"})
+        else:
+            changes.append({"version": version, "table": table, "id": row_id, "op": "upsert", "data": row})
+
+    return {
+        "cursor": entries[-1][0] if entries else cursor,
+        "has_more": len(entries) == limit,
+        "changes": changes,
+    }
+
+
+def find_upload(conn, user_id: int, key: str) -> Optional[Dict[str, Any]]:
+    """冪等キーの保存済みの結果を取得"""
+    row = conn.execute(
+        "SELECT response FROM sync_uploads WHERE user_id = ? AND idempotency_key = ?", (user_id, key)
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def record_upload(conn, user_id: int, key: str, result: Dict[str, Any]):
+    """適用した操作の結果を冪等キーとともに保存"""
+    conn.execute(
+        "INSERT INTO sync_uploads (user_id, idempotency_key, response) VALUES (?, ?, ?)",
+        (user_id, key, json.dumps(result, ensure_ascii=False))
+    )
+
+
+def compact_change_log(db, upload_days: int = 30, batch_size: int = 500) -> Dict[str, int]:
+    """より新しい変更がある行の古い変更履歴と、古い冪等キーを削除
+
+    行ごとに最後の変更は残すため、どのカーソルから同期しても結果は変わらない。
+    書き込みロックを長く保持しないよう batch_size 件ずつ削除する。
+    """
+    removed = {"change_log": 0, "sync_uploads": 0}
+    last_version = 0
+    while True:
+        with db.get_connection() as conn:
+            versions = [row[0] for row in conn.execute("""
+                SELECT version FROM change_log AS c
+                WHERE version > ? AND EXISTS (
+                    SELECT 1 FROM change_log AS n
+                    WHERE n.table_name = c.table_name AND n.row_id = c.row_id AND n.version > c.version
+                )
+                ORDER BY version
+                LIMIT ?
+            """, (last_version, batch_size)).fetchall()]
+        if not versions:
+            break
+        last_version = versions[-1]
+        with db.write_transaction() as conn:
+            conn.execute(f"DELETE FROM change_log WHERE version IN ({', '.join('?' * len(versions))})", versions)
+        removed["change_log"] += len(versions)
+
+    with db.write_transaction() as conn:
+        cursor = conn.execute(
+            "DELETE FROM sync_uploads WHERE created_at < datetime('now', ?)", (f"-{upload_days} days",)
+        )
+        removed["sync_uploads"] = cursor.rowcount
+    return removed
@@ -23,6 +23,7 @@ class User(Base):
     study_sessions = relationship("StudySession", back_populates="user")
     quiz_results = relationship("QuizResult", back_populates="user")
     schedules = relationship("Schedule", back_populates="user")
+    schedule_rules = relationship("ScheduleRule", back_populates="user")
 
 class Subject(Base):
     """教科モデル"""
@@ -103,6 +104,36 @@ class Schedule(Base):
     # リレーション
     user = relationship("User", back_populates="schedules")
 
+class ScheduleRule(Base):
+    """繰り返し予定ルールモデル"""
+    __tablename__ = 'schedule_rules'
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    title = Column(String(200), nullable=False)
+    description = Column(Text)
+    event_type = Column(String(50), nullable=False)
+    rrule = Column(String(200), nullable=False)  # RRULE形式 (FREQ=WEEKLY;BYDAY=MO など)
+    dtstart = Column(DateTime, nullable=False)
+    range_end = Column(DateTime, nullable=False)  # 最終回の日時（終了しない場合は 9999-12-31）
+    created_at = Column(DateTime, default=datetime.now)
+    
+    # リレーション
+    user = relationship("User", back_populates="schedule_rules")
+    exceptions = relationship("ScheduleException", back_populates="rule")
+
+class ScheduleException(Base):
+    """繰り返し予定の各回の状態モデル"""
+    __tablename__ = 'schedule_exceptions'
+    
+    rule_id = Column(Integer, ForeignKey('schedule_rules.id'), primary_key=True)
+    occurrence_date = Column(DateTime, primary_key=True)
+    is_completed = Column(Boolean, default=False)
+    is_cancelled = Column(Boolean, default=False)
+    
+    # リレーション
+    rule = relationship("ScheduleRule", back_populates="exceptions")
+
 # データベース設定
 DATABASE_URL = "sqlite:///data/study_app.db"
 engine = create_engine(DATABASE_URL)
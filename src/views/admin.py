@@ -0,0 +1,96 @@
+"""
+管理者ビュー
+"""
+
+import hmac
+import json
+import os
+
+import pandas as pd
+import streamlit as st
+
+from src.controllers import database
+from src.controllers.profiler import PHASES, get_rerun_profiler
+from src.views.common import rerun
+
+def is_admin() -> bool:
+    """管理者として開いているかどうか
+
+    環境変数 ADMIN_TOKEN を設定し、URLに ?admin=<トークン> を付けて開いたセッションのみ管理者とする。
+    """
+    if st.session_state.get("is_admin"):
+        return True
+    token = os.environ.get("ADMIN_TOKEN")
+    if not token:
+        return False
+    supplied = st.experimental_get_query_params().get("admin", [""])[0]
+    if hmac.compare_digest(supplied.encode("utf-8"), token.encode("utf-8")):
+        st.session_state.is_admin = True
+        return True
+    return False
+
+def show_admin():
+    """管理パネルを表示"""
+    if not is_admin():
+        st.error("このページを表示する権限がありません。")
+        return
+
+    st.markdown('<h1 class="main-header">🛠️ 管理</h1>', unsafe_allow_html=True)
+    show_rerun_profile()
+    if database.shard_router is not None:
+        show_shards()
+
+def show_rerun_profile():
+    """再実行の処理時間の内訳を表示"""
+    st.subheader("⏱️ 再実行の処理時間")
+    profiler = get_rerun_profiler()
+    records = profiler.records()
+
+    if not records:
+        st.info("計測結果がありません。")
+        return
+
+    summary = pd.DataFrame(profiler.summary()).set_index("page")
+    st.caption(f"直近 {len(records)} 回の再実行（最大 {profiler.capacity} 回、このワーカープロセスのみ）")
+    st.dataframe(summary, use_container_width=True)
+
+    # ページごとの区間別平均（ミリ秒）
+    st.bar_chart(summary[[f"{name}_ms" for name in PHASES]])
+
+    st.subheader("📋 直近の再実行")
+    recent = pd.DataFrame([
+        {
+            "時刻": record["time"],
+            "ページ": record["page"],
+            "セッション": (record["session"] or "")[:8],
+            "合計(ms)": record["total_ms"],
+            **{f"{name}(ms)": record["phases_ms"][name] for name in PHASES},
+            "クエリ数": record["queries"],
+            "中断": record["interrupted"],
+        }
+        for record in reversed(records[-100:])
+    ])
+    st.dataframe(recent, use_container_width=True, hide_index=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            "📥 JSONをダウンロード",
+            json.dumps({"summary": profiler.summary(), "reruns": records}, ensure_ascii=False, indent=2),
+            file_name="reruns.json",
+            mime="application/json",
+        )
+    with col2:
+        if st.button("🗑️ 計測結果をクリア"):
+            profiler.clear()
+            rerun()
+
+def show_shards():
+    """シャードごとのデータ件数と書き込み状況を表示（全シャードに並行して問い合わせる）"""
+    st.subheader("🗄️ シャード")
+    overview = pd.DataFrame(database.shard_router.overview())
+    overview["tenants"] = overview["tenants"].map(", ".join)
+    st.dataframe(overview, use_container_width=True, hide_index=True)
+
+    totals = overview[["users", "study_sessions", "quiz_results", "schedules"]].sum()
+    st.caption("全シャード合計: " + " / ".join(f"{name} {count:,}" for name, count in totals.items()))
@@ -0,0 +1,17 @@
+"""
+ビュー共通の処理
+"""
+
+import streamlit as st
+from streamlit.proto.WidgetStates_pb2 import WidgetStates
+from streamlit.runtime.state import get_session_state
+
+def rerun():
+    """書き込み後に画面を再実行する
+
+    Streamlit 1.28 の st.rerun() はボタン・フォーム送信のトリガー値を残したまま
+    再実行するため、同じ書き込みが接続が切れるまで繰り返される。
+    トリガーを解除してから再実行する。
+    """
+    get_session_state().on_script_will_rerun(WidgetStates())
+    st.rerun()
@@ -6,9 +6,15 @@ import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import sqlite3
-from src.controllers.database import get_database
+from src.controllers.database import get_database, study_sessions_scope, user_scope
+from src.controllers.cache import get_cache
+from src.controllers.catalog import get_subject_catalog
+from src.controllers.heatmap import HEATMAP_COLORS, HEATMAP_LEVELS, load_study_heatmap, render_heatmap_svg
+from src.controllers.snapshots import DashboardSnapshot, get_dashboard_snapshot
+from src.controllers.profiler import profile_phase
+from src.views.common import rerun
 
 plt.rcParams['font.family'] = 'DejaVu Sans'
 sns.set_palette("husl")
@@ -22,8 +28,15 @@ def show_dashboard():
         st.session_state.current_user_id = 1
         create_demo_user()
     
+    # 集計は事前計算したスナップショットから表示（古い場合だけその場で集計）
+    user_id = st.session_state.current_user_id
+    snapshot = get_cache().get_or_load(
+        user_scope(user_id), "dashboard_snapshot", lambda: get_dashboard_snapshot(user_id)
+    )
+    st.caption(f"🕒 {snapshot.computed_at.strftime('%m/%d %H:%M')} 時点の集計")
+    
     # 概要メトリクス
-    show_overview_metrics()
+    show_overview_metrics(snapshot)
     
     st.markdown("---")
     
@@ -31,23 +44,28 @@ def show_dashboard():
     col1, col2 = st.columns(2)
     
     with col1:
-        show_study_time_chart()
+        show_study_time_chart(snapshot)
     
     with col2:
-        show_subject_progress()
+        show_subject_progress(snapshot)
+    
+    st.markdown("---")
+    
+    # 1年間の学習カレンダー
+    show_study_heatmap(user_id)
     
     st.markdown("---")
     
     # 最近の学習活動
-    show_recent_activities()
+    show_recent_activities(snapshot)
     
     # 今日のタスク
     show_todays_tasks()
 
 def create_demo_user():
     """デモユーザーとデータを作成"""
-    db = get_database()
-    with db.get_connection() as conn:
+    db = get_database(1)
+    with db.write_transaction() as conn:
         cursor = conn.cursor()
         
         # ユーザーが存在しない場合は作成
@@ -72,42 +90,14 @@ def create_demo_user():
                     (user_id, subject_id, duration_minutes, content, satisfaction_score, study_date)
                     VALUES (?, ?, ?, ?, ?, ?)
                 """, session)
-            
-            conn.commit()
 
-def show_overview_metrics():
+def show_overview_metrics(snapshot: DashboardSnapshot):
     """概要メトリクスを表示"""
-    db = get_database()
-    
-    with db.get_connection() as conn:
-        # 今週の学習時間
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT COALESCE(SUM(duration_minutes), 0) as total_minutes
-            FROM study_sessions 
-            WHERE user_id = ? AND study_date >= date('now', '-7 days')
-        """, (st.session_state.current_user_id,))
-        
-        weekly_minutes = cursor.fetchone()[0]
-        weekly_hours = weekly_minutes / 60
-        
-        # 今月の学習日数
-        cursor.execute("""
-            SELECT COUNT(DISTINCT date(study_date)) as study_days
-            FROM study_sessions 
-            WHERE user_id = ? AND study_date >= date('now', 'start of month')
-        """, (st.session_state.current_user_id,))
-        
-        monthly_days = cursor.fetchone()[0]
-        
-        # 完了したクイズ数
-        cursor.execute("""
-            SELECT COUNT(*) as quiz_count
-            FROM quiz_results 
-            WHERE user_id = ? AND attempted_at >= date('now', '-30 days')
-        """, (st.session_state.current_user_id,))
-        
-        quiz_count = cursor.fetchone()[0] if cursor.fetchone() else 0
+    metrics = snapshot.metrics
+    weekly_minutes = metrics["weekly_minutes"]
+    monthly_days = metrics["monthly_days"]
+    quiz_count = metrics["quiz_count"]
+    weekly_hours = weekly_minutes / 60
     
     # メトリクス表示
     col1, col2, col3, col4 = st.columns(4)
@@ -142,101 +132,106 @@ def show_overview_metrics():
             delta=f"目標: {target_hours}時間"
         )
 
-def show_study_time_chart():
+def show_study_time_chart(snapshot: DashboardSnapshot):
     """学習時間チャートを表示"""
     st.subheader("📈 最近の学習時間推移")
     
-    db = get_database()
-    with db.get_connection() as conn:
-        query = """
-            SELECT date(study_date) as study_date, 
-                   SUM(duration_minutes) as total_minutes
-            FROM study_sessions 
-            WHERE user_id = ? AND study_date >= date('now', '-14 days')
-            GROUP BY date(study_date)
-            ORDER BY study_date
-        """
-        
-        df = pd.read_sql_query(query, conn, params=(st.session_state.current_user_id,))
+    with profile_phase("pandas"):
+        df = pd.DataFrame(snapshot.daily_minutes, columns=["study_date", "total_minutes"])
     
     if not df.empty:
-        df['study_date'] = pd.to_datetime(df['study_date'])
-        df['hours'] = df['total_minutes'] / 60
-        
-        fig, ax = plt.subplots(figsize=(10, 4))
-        ax.plot(df['study_date'], df['hours'], marker='o', linewidth=2, markersize=6)
-        ax.set_xlabel('日付')
-        ax.set_ylabel('学習時間 (時間)')
-        ax.set_title('過去14日間の学習時間')
-        ax.grid(True, alpha=0.3)
-        plt.xticks(rotation=45)
-        plt.tight_layout()
+        with profile_phase("pandas"):
+            dates = pd.to_datetime(df['study_date'])
+            hours = df['total_minutes'] / 60
         
-        st.pyplot(fig)
+        with profile_phase("chart"):
+            fig, ax = plt.subplots(figsize=(10, 4))
+            ax.plot(dates, hours, marker='o', linewidth=2, markersize=6)
+            ax.set_xlabel('日付')
+            ax.set_ylabel('学習時間 (時間)')
+            ax.set_title('過去14日間の学習時間')
+            ax.grid(True, alpha=0.3)
+            plt.xticks(rotation=45)
+            plt.tight_layout()
+            
+            st.pyplot(fig)
+            plt.close(fig)
     else:
         st.info("学習データがありません。学習を記録してみましょう！")
 
-def show_subject_progress():
+def show_study_heatmap(user_id: int):
+    """1年間の学習カレンダーを表示（集計は新しい学習記録が入るまでキャッシュ）"""
+    st.subheader("🗓️ 1年間の学習カレンダー")
+    
+    today = date.today()
+    heatmap = get_cache().get_or_load(
+        study_sessions_scope(user_id), ("study_heatmap", today),
+        lambda: load_heatmap(user_id, today)
+    )
+    
+    catalog = get_subject_catalog()
+    options = {"すべての教科": None}
+    options.update({catalog.name(subject_id): subject_id for subject_id in heatmap.subjects()})
+    selected = st.selectbox("教科", list(options), key="heatmap_subject", label_visibility="collapsed")
+    subject_id = options.get(selected)
+    
+    with profile_phase("chart"):
+        svg = render_heatmap_svg(heatmap, subject_id)
+    st.markdown(f'<div style="overflow-x: auto">{svg}</div>', unsafe_allow_html=True)
+    
+    minutes = heatmap.minutes(subject_id)
+    legend = " ".join(f'<span style="color: {color}">■</span>' for color in HEATMAP_COLORS)
+    st.caption(f"合計 {minutes.sum() / 60:.1f}時間・学習した日 {int((minutes > 0).sum())}日　"
+               f"少 {legend} 多（{' / '.join(f'{level}分' for level in HEATMAP_LEVELS)}）",
+               unsafe_allow_html=True)
+
+def load_heatmap(user_id: int, today: date):
+    """学習カレンダーの集計を読み込む"""
+    with get_database(user_id).analytics_snapshot() as conn:
+        return load_study_heatmap(conn, user_id, today)
+
+def show_subject_progress(snapshot: DashboardSnapshot):
     """教科別進捗を表示"""
     st.subheader("📊 教科別学習時間")
     
-    db = get_database()
-    with db.get_connection() as conn:
-        query = """
-            SELECT s.name, SUM(ss.duration_minutes) as total_minutes
-            FROM study_sessions ss
-            JOIN subjects s ON ss.subject_id = s.id
-            WHERE ss.user_id = ? AND ss.study_date >= date('now', '-30 days')
-            GROUP BY s.id, s.name
-            ORDER BY total_minutes DESC
-            LIMIT 8
-        """
-        
-        df = pd.read_sql_query(query, conn, params=(st.session_state.current_user_id,))
+    with profile_phase("pandas"):
+        df = pd.DataFrame(snapshot.subject_minutes, columns=["subject_id", "total_minutes"])
+        df = get_subject_catalog().attach(df)
     
     if not df.empty:
-        df['hours'] = df['total_minutes'] / 60
-        
-        fig, ax = plt.subplots(figsize=(10, 4))
-        bars = ax.barh(df['name'], df['hours'])
-        ax.set_xlabel('学習時間 (時間)')
-        ax.set_title('教科別学習時間 (過去30日)')
+        hours = df['total_minutes'] / 60
         
-        # カラフルなバー
-        colors = plt.cm.Set3(range(len(df)))
-        for bar, color in zip(bars, colors):
-            bar.set_color(color)
-        
-        plt.tight_layout()
-        st.pyplot(fig)
+        with profile_phase("chart"):
+            fig, ax = plt.subplots(figsize=(10, 4))
+            bars = ax.barh(df['name'], hours)
+            ax.set_xlabel('学習時間 (時間)')
+            ax.set_title('教科別学習時間 (過去30日)')
+            
+            # カラフルなバー
+            colors = plt.cm.Set3(range(len(df)))
+            for bar, color in zip(bars, colors):
+                bar.set_color(color)
+            
+            plt.tight_layout()
+            st.pyplot(fig)
+            plt.close(fig)
     else:
         st.info("教科別データがありません。")
 
-def show_recent_activities():
+def show_recent_activities(snapshot: DashboardSnapshot):
     """最近の学習活動を表示"""
     st.subheader("🕐 最近の学習活動")
     
-    db = get_database()
-    with db.get_connection() as conn:
-        query = """
-            SELECT s.name as subject, ss.content, ss.duration_minutes, 
-                   ss.satisfaction_score, ss.study_date
-            FROM study_sessions ss
-            JOIN subjects s ON ss.subject_id = s.id
-            WHERE ss.user_id = ?
-            ORDER BY ss.study_date DESC
-            LIMIT 5
-        """
-        
-        df = pd.read_sql_query(query, conn, params=(st.session_state.current_user_id,))
+    catalog = get_subject_catalog()
+    activities = snapshot.recent_activities
     
-    if not df.empty:
-        for _, row in df.iterrows():
+    if activities:
+        for row in activities:
             with st.container():
                 col1, col2, col3 = st.columns([2, 1, 1])
                 
                 with col1:
-                    st.write(f"**{row['subject']}** - {row['content']}")
+                    st.write(f"**{catalog.name(row['subject_id'])}** - {row['content']}")
                 
                 with col2:
                     st.write(f"⏱️ {row['duration_minutes']}分")
@@ -280,4 +275,4 @@ def show_todays_tasks():
         new_task = st.text_input("タスク内容")
         if st.button("追加") and new_task:
             st.success(f"タスク「{new_task}」を追加しました！")
-            st.rerun()
+            rerun()
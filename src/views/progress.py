@@ -6,7 +6,12 @@ import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
-from src.controllers.database import get_database
+from src.controllers.database import AnalyticsPoolTimeout, get_database
+from src.controllers.profiler import profile_phase
+from src.controllers.catalog import get_subject_catalog
+from src.controllers.columnar import load_study_sessions
+from src.controllers.reports import study_advice
+from src.views.common import rerun
 
 def show_progress():
     """進捗管理ページ"""
@@ -14,21 +19,27 @@ def show_progress():
     
     tab1, tab2, tab3 = st.tabs(["📈 学習分析", "🎯 目標設定", "📋 レポート"])
     
-    with tab1:
-        show_learning_analysis()
-    
-    with tab2:
-        show_goal_setting()
-    
-    with tab3:
-        show_reports()
+    # 集計はページ全体で1つの読み取り専用スナップショットを使う
+    user_id = st.session_state.get('current_user_id', 1)
+    try:
+        with get_database(user_id).analytics_snapshot():
+            with tab1:
+                show_learning_analysis()
+            
+            with tab2:
+                show_goal_setting()
+            
+            with tab3:
+                show_reports()
+    except AnalyticsPoolTimeout:
+        st.warning("集計が混み合っています。しばらくしてから再読み込みしてください。")
 
 def show_learning_analysis():
     """学習分析"""
     st.subheader("学習パターン分析")
     
     user_id = st.session_state.get('current_user_id', 1)
-    db = get_database()
+    db = get_database(user_id)
     
     # 期間選択
     col1, col2 = st.columns(2)
@@ -46,38 +57,25 @@ def show_learning_analysis():
     else:
         start_date = datetime(2000, 1, 1)
     
-    # 学習時間分析
-    with db.get_connection() as conn:
-        # 日別学習時間
-        daily_query = """
-            SELECT date(study_date) as date, SUM(duration_minutes) as total_minutes
-            FROM study_sessions 
-            WHERE user_id = ? AND study_date >= ?
-            GROUP BY date(study_date)
-            ORDER BY date
-        """
-        daily_df = pd.read_sql_query(daily_query, conn, params=(user_id, start_date))
-        
-        # 教科別学習時間
-        subject_query = """
-            SELECT s.name, s.category, SUM(ss.duration_minutes) as total_minutes
-            FROM study_sessions ss
-            JOIN subjects s ON ss.subject_id = s.id
-            WHERE ss.user_id = ? AND ss.study_date >= ?
-            GROUP BY s.id, s.name, s.category
-            ORDER BY total_minutes DESC
-        """
-        subject_df = pd.read_sql_query(subject_query, conn, params=(user_id, start_date))
-        
-        # 時間帯別分析
-        hourly_query = """
-            SELECT strftime('%H', study_date) as hour, SUM(duration_minutes) as total_minutes
-            FROM study_sessions 
-            WHERE user_id = ? AND study_date >= ?
-            GROUP BY strftime('%H', study_date)
-            ORDER BY hour
-        """
-        hourly_df = pd.read_sql_query(hourly_query, conn, params=(user_id, start_date))
+    # 学習時間分析（書き出し済みの月は列指向エクスポートから読む）
+    with db.analytics_snapshot():
+        with profile_phase("pandas"):
+            sessions = load_study_sessions(db, user_id, start_date)
+            minutes = sessions['duration_minutes']
+            
+            # 日別学習時間
+            daily_df = (minutes.groupby(sessions['study_date'].dt.strftime('%Y-%m-%d')).sum()
+                        .rename_axis('date').reset_index(name='total_minutes'))
+            
+            # 教科別学習時間
+            subject_df = (minutes.groupby(sessions['subject_id']).sum()
+                          .reset_index(name='total_minutes')
+                          .sort_values('total_minutes', ascending=False, ignore_index=True))
+            subject_df = get_subject_catalog().attach(subject_df, columns=("name", "category"))
+            
+            # 時間帯別分析
+            hourly_df = (minutes.groupby(sessions['study_date'].dt.strftime('%H')).sum()
+                         .rename_axis('hour').reset_index(name='total_minutes'))
     
     # 学習時間推移グラフ
     if not daily_df.empty:
@@ -85,15 +83,17 @@ def show_learning_analysis():
         daily_df['date'] = pd.to_datetime(daily_df['date'])
         daily_df['hours'] = daily_df['total_minutes'] / 60
         
-        fig, ax = plt.subplots(figsize=(12, 4))
-        ax.plot(daily_df['date'], daily_df['hours'], marker='o')
-        ax.set_title('日別学習時間')
-        ax.set_xlabel('日付')
-        ax.set_ylabel('時間')
-        ax.grid(True, alpha=0.3)
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        st.pyplot(fig)
+        with profile_phase("chart"):
+            fig, ax = plt.subplots(figsize=(12, 4))
+            ax.plot(daily_df['date'], daily_df['hours'], marker='o')
+            ax.set_title('日別学習時間')
+            ax.set_xlabel('日付')
+            ax.set_ylabel('時間')
+            ax.grid(True, alpha=0.3)
+            plt.xticks(rotation=45)
+            plt.tight_layout()
+            st.pyplot(fig)
+            plt.close(fig)
         
         # 統計情報
         col1, col2, col3, col4 = st.columns(4)
@@ -114,31 +114,35 @@ def show_learning_analysis():
         
         with col1:
             # 教科別棒グラフ
-            fig, ax = plt.subplots(figsize=(8, 6))
-            subject_df['hours'] = subject_df['total_minutes'] / 60
-            bars = ax.barh(subject_df['name'], subject_df['hours'])
-            ax.set_title('教科別学習時間')
-            ax.set_xlabel('時間')
+            with profile_phase("chart"):
+                fig, ax = plt.subplots(figsize=(8, 6))
+                subject_df['hours'] = subject_df['total_minutes'] / 60
+                bars = ax.barh(subject_df['name'], subject_df['hours'])
+                ax.set_title('教科別学習時間')
+                ax.set_xlabel('時間')
             
-            # カテゴリ別色分け
-            colors = {'数学': 'blue', '国語': 'red', '英語': 'green', '理科': 'orange', '社会': 'purple', '情報': 'brown', 'その他': 'gray'}
-            for i, bar in enumerate(bars):
-                category = subject_df.iloc[i]['category']
-                bar.set_color(colors.get(category, 'gray'))
+                # カテゴリ別色分け
+                colors = {'数学': 'blue', '国語': 'red', '英語': 'green', '理科': 'orange', '社会': 'purple', '情報': 'brown', 'その他': 'gray'}
+                for i, bar in enumerate(bars):
+                    category = subject_df.iloc[i]['category']
+                    bar.set_color(colors.get(category, 'gray'))
             
-            plt.tight_layout()
-            st.pyplot(fig)
+                plt.tight_layout()
+                st.pyplot(fig)
+                plt.close(fig)
         
         with col2:
             # カテゴリ別円グラフ
             category_df = subject_df.groupby('category')['total_minutes'].sum().reset_index()
             
             if len(category_df) > 1:
-                fig, ax = plt.subplots(figsize=(6, 6))
-                ax.pie(category_df['total_minutes'], labels=category_df['category'], autopct='%1.1f%%')
-                ax.set_title('教科カテゴリ別割合')
-                plt.tight_layout()
-                st.pyplot(fig)
+                with profile_phase("chart"):
+                    fig, ax = plt.subplots(figsize=(6, 6))
+                    ax.pie(category_df['total_minutes'], labels=category_df['category'], autopct='%1.1f%%')
+                    ax.set_title('教科カテゴリ別割合')
+                    plt.tight_layout()
+                    st.pyplot(fig)
+                    plt.close(fig)
     
     # 時間帯分析
     if not hourly_df.empty:
@@ -147,14 +151,16 @@ def show_learning_analysis():
         hourly_df['hour'] = hourly_df['hour'].astype(int)
         hourly_df['hours'] = hourly_df['total_minutes'] / 60
         
-        fig, ax = plt.subplots(figsize=(12, 4))
-        ax.bar(hourly_df['hour'], hourly_df['hours'])
-        ax.set_title('時間帯別学習時間')
-        ax.set_xlabel('時間')
-        ax.set_ylabel('学習時間(時間)')
-        ax.set_xticks(range(24))
-        plt.tight_layout()
-        st.pyplot(fig)
+        with profile_phase("chart"):
+            fig, ax = plt.subplots(figsize=(12, 4))
+            ax.bar(hourly_df['hour'], hourly_df['hours'])
+            ax.set_title('時間帯別学習時間')
+            ax.set_xlabel('時間')
+            ax.set_ylabel('学習時間(時間)')
+            ax.set_xticks(range(24))
+            plt.tight_layout()
+            st.pyplot(fig)
+            plt.close(fig)
         
         # 最も活発な時間帯
         peak_hour = hourly_df.loc[hourly_df['hours'].idxmax(), 'hour']
@@ -187,7 +193,7 @@ def show_goal_setting():
         
         with st.form("goal_setting_form"):
             new_weekly = st.number_input("週間学習時間（時間）", min_value=1, max_value=100, value=goals['weekly_hours'])
-            new_daily = st.number_input("1日の学習時間（時間）", min_value=0.5, max_value=12.0, value=goals['daily_hours'], step=0.5)
+            new_daily = st.number_input("1日の学習時間（時間）", min_value=0.5, max_value=12.0, value=float(goals['daily_hours']), step=0.5)
             new_subjects = st.number_input("週間学習科目数", min_value=1, max_value=15, value=goals['subjects_per_week'])
             
             if st.form_submit_button("目標を更新"):
@@ -197,19 +203,19 @@ def show_goal_setting():
                     'subjects_per_week': new_subjects
                 }
                 st.success("目標を更新しました！")
-                st.rerun()
+                rerun()
     
     # 目標達成状況
     st.subheader("🎖️ 目標達成状況")
     
     user_id = st.session_state.get('current_user_id', 1)
-    db = get_database()
+    db = get_database(user_id)
     
     # 今週の実績
     now = datetime.now()
     week_start = now - timedelta(days=now.weekday())
     
-    with db.get_connection() as conn:
+    with db.analytics_snapshot() as conn:
         cursor = conn.cursor()
         
         # 今週の学習時間
@@ -274,7 +280,7 @@ def show_reports():
     report_period = st.selectbox("レポート期間", ["週次", "月次", "学期"])
     
     user_id = st.session_state.get('current_user_id', 1)
-    db = get_database()
+    db = get_database(user_id)
     
     if report_period == "週次":
         show_weekly_report(db, user_id)
@@ -290,7 +296,7 @@ def show_weekly_report(db, user_id):
     now = datetime.now()
     week_start = now - timedelta(days=now.weekday())
     
-    with db.get_connection() as conn:
+    with db.analytics_snapshot() as conn:
         # 今週の総学習時間
         cursor = conn.cursor()
         cursor.execute("""
@@ -307,15 +313,15 @@ def show_weekly_report(db, user_id):
         
         # 教科別時間
         cursor.execute("""
-            SELECT s.name, SUM(ss.duration_minutes) / 60.0 as hours
-            FROM study_sessions ss
-            JOIN subjects s ON ss.subject_id = s.id
-            WHERE ss.user_id = ? AND ss.study_date >= ?
-            GROUP BY s.name
+            SELECT subject_id, SUM(duration_minutes) / 60.0 as hours
+            FROM study_sessions
+            WHERE user_id = ? AND study_date >= ?
+            GROUP BY subject_id
             ORDER BY hours DESC
         """, (user_id, week_start))
         
-        subjects = cursor.fetchall()
+        catalog = get_subject_catalog()
+        subjects = [(catalog.name(subject_id), hours) for subject_id, hours in cursor.fetchall()]
     
     # サマリー
     col1, col2, col3 = st.columns(3)
@@ -335,12 +341,8 @@ def show_weekly_report(db, user_id):
     
     # アドバイス
     st.write("### 💡 学習アドバイス")
-    if total_hours >= 15:
-        st.success("素晴らしい学習量です！この調子で継続しましょう。")
-    elif total_hours >= 10:
-        st.info("良い学習ペースです。もう少し時間を増やせるとより良いですね。")
-    else:
-        st.warning("学習時間が少し不足しています。毎日少しずつでも学習を継続しましょう。")
+    level, advice = study_advice(total_hours)
+    getattr(st, level)(advice)
 
 def show_monthly_report(db, user_id):
     """月次レポート"""
@@ -4,7 +4,35 @@
 
 import streamlit as st
 from datetime import datetime, timedelta
+from itertools import islice
 from src.controllers.database import get_database
+from src.controllers.queries import insert_schedule
+from src.controllers.recurrence import (
+    iter_schedule_items, create_rule, delete_rule, set_occurrence_state
+)
+from src.views.common import rerun
+
+# 予定タイプの表示名とDB値の対応
+EVENT_TYPE_MAP = {
+    "定期テスト": "test",
+    "課題": "homework", 
+    "復習": "review",
+    "模試": "mock_exam",
+    "その他": "other"
+}
+
+# 繰り返し設定の表示名とRRULEの対応（毎週・毎月は開始日の曜日・日付を使用）
+REPEAT_OPTIONS = {
+    "繰り返さない": None,
+    "毎日": "FREQ=DAILY",
+    "平日": "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR",
+    "毎週": "FREQ=WEEKLY",
+    "隔週": "FREQ=WEEKLY;INTERVAL=2",
+    "毎月": "FREQ=MONTHLY",
+}
+
+# 予定一覧の最大表示件数
+MAX_LIST_ITEMS = 100
 
 def show_schedule():
     """スケジュール管理ページ"""
@@ -53,40 +81,23 @@ def show_schedule_list():
         end_date = datetime(2030, 12, 31)
     
     # データ取得
-    db = get_database()
     user_id = st.session_state.get('current_user_id', 1)
+    db = get_database(user_id)
+    event_type = EVENT_TYPE_MAP.get(filter_type) if filter_type != "すべて" else None
     
     with db.get_connection() as conn:
-        cursor = conn.cursor()
-        
-        query = """
-            SELECT id, title, description, scheduled_date, event_type, is_completed
-            FROM schedules 
-            WHERE user_id = ? AND scheduled_date BETWEEN ? AND ?
-        """
-        params = [user_id, start_date, end_date]
-        
-        if filter_type != "すべて":
-            event_type_map = {
-                "定期テスト": "test",
-                "課題": "homework", 
-                "復習": "review",
-                "模試": "mock_exam",
-                "その他": "other"
-            }
-            query += " AND event_type = ?"
-            params.append(event_type_map.get(filter_type, "other"))
-        
-        query += " ORDER BY scheduled_date"
-        
-        cursor.execute(query, params)
-        schedules = cursor.fetchall()
+        # 繰り返し予定は期間内の分だけを遅延展開し、表示件数で打ち切る
+        items = list(islice(
+            iter_schedule_items(conn, user_id, start_date, end_date, event_type),
+            MAX_LIST_ITEMS + 1
+        ))
+    
+    truncated = len(items) > MAX_LIST_ITEMS
+    items = items[:MAX_LIST_ITEMS]
     
     # 予定表示
-    if schedules:
-        for schedule in schedules:
-            schedule_id, title, description, scheduled_date, event_type, is_completed = schedule
-            
+    if items:
+        for item in items:
             # 予定タイプのアイコン
             type_icons = {
                 "test": "📝",
@@ -95,46 +106,62 @@ def show_schedule_list():
                 "mock_exam": "🎯",
                 "other": "📌"
             }
-            icon = type_icons.get(event_type, "📌")
-            
-            # 完了状態
-            status = "✅" if is_completed else "⏳"
+            icon = type_icons.get(item.event_type, "📌")
+            repeat_mark = " 🔁" if item.is_recurring else ""
             
             with st.container():
                 col1, col2, col3 = st.columns([0.1, 0.7, 0.2])
                 
                 with col1:
                     # 完了チェックボックス
-                    completed = st.checkbox("", value=is_completed, key=f"schedule_{schedule_id}")
-                    if completed != is_completed:
+                    completed = st.checkbox("", value=item.is_completed, key=item.key)
+                    if completed != item.is_completed:
                         # 完了状態を更新
-                        with db.get_connection() as conn:
-                            cursor = conn.cursor()
-                            cursor.execute(
-                                "UPDATE schedules SET is_completed = ? WHERE id = ?",
-                                (completed, schedule_id)
-                            )
-                            conn.commit()
-                        st.rerun()
+                        with db.write_transaction() as conn:
+                            if item.is_recurring:
+                                set_occurrence_state(
+                                    conn, item.rule_id, item.scheduled_date, is_completed=completed
+                                )
+                            else:
+                                cursor = conn.cursor()
+                                cursor.execute(
+                                    "UPDATE schedules SET is_completed = ? WHERE id = ?",
+                                    (completed, item.schedule_id)
+                                )
+                        rerun()
                 
                 with col2:
                     # 予定詳細
-                    date_str = datetime.fromisoformat(scheduled_date).strftime('%m/%d %H:%M')
-                    st.write(f"{icon} **{title}** - {date_str}")
-                    if description:
-                        st.caption(description)
+                    date_str = item.scheduled_date.strftime('%m/%d %H:%M')
+                    st.write(f"{icon} **{item.title}**{repeat_mark} - {date_str}")
+                    if item.description:
+                        st.caption(item.description)
                 
                 with col3:
-                    # 削除ボタン
-                    if st.button("🗑️", key=f"delete_{schedule_id}"):
-                        with db.get_connection() as conn:
-                            cursor = conn.cursor()
-                            cursor.execute("DELETE FROM schedules WHERE id = ?", (schedule_id,))
-                            conn.commit()
+                    # 削除ボタン（繰り返し予定はこの回のみキャンセル）
+                    if st.button("🗑️", key=f"delete_{item.key}"):
+                        with db.write_transaction() as conn:
+                            if item.is_recurring:
+                                set_occurrence_state(
+                                    conn, item.rule_id, item.scheduled_date, is_cancelled=True
+                                )
+                            else:
+                                cursor = conn.cursor()
+                                cursor.execute("DELETE FROM schedules WHERE id = ?", (item.schedule_id,))
                         st.success("予定を削除しました")
-                        st.rerun()
+                        rerun()
+                    
+                    if item.is_recurring and st.button("🔁🗑️", key=f"delete_rule_{item.key}",
+                                                       help="繰り返し予定をすべて削除"):
+                        with db.write_transaction() as conn:
+                            delete_rule(conn, item.rule_id)
+                        st.success("繰り返し予定を削除しました")
+                        rerun()
                 
                 st.divider()
+        
+        if truncated:
+            st.caption(f"先頭の{MAX_LIST_ITEMS}件を表示しています。期間を絞り込んでください。")
     else:
         st.info("予定がありません。新しい予定を追加してみましょう！")
 
@@ -156,40 +183,45 @@ def show_add_schedule():
         
         with col2:
             scheduled_time = st.time_input("時刻", value=datetime.now().time())
+            repeat = st.selectbox("繰り返し", list(REPEAT_OPTIONS.keys()))
+            use_until = st.checkbox("繰り返しの終了日を設定")
+            until_date = st.date_input("終了日", value=datetime.now().date() + timedelta(days=90))
         
         submitted = st.form_submit_button("予定を追加", type="primary")
         
         if submitted and title:
             # データベースに追加
             user_id = st.session_state.get('current_user_id', 1)
-            scheduled_datetime = datetime.combine(scheduled_date, scheduled_time)
-            
-            event_type_map = {
-                "定期テスト": "test",
-                "課題": "homework", 
-                "復習": "review",
-                "模試": "mock_exam",
-                "その他": "other"
-            }
+            scheduled_datetime = datetime.combine(scheduled_date, scheduled_time).replace(microsecond=0)
+            rule_text = REPEAT_OPTIONS[repeat]
             
-            db = get_database()
-            with db.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO schedules 
-                    (user_id, title, description, scheduled_date, event_type)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (
-                    user_id,
-                    title,
-                    description,
-                    scheduled_datetime,
-                    event_type_map.get(event_type, "other")
-                ))
-                conn.commit()
+            db = get_database(user_id)
+            with db.write_transaction() as conn:
+                if rule_text:
+                    if use_until:
+                        until = datetime.combine(until_date, datetime.max.time()).replace(microsecond=0)
+                        rule_text += f";UNTIL={until:%Y%m%dT%H%M%S}"
+                    create_rule(
+                        conn,
+                        user_id,
+                        title,
+                        description,
+                        EVENT_TYPE_MAP.get(event_type, "other"),
+                        rule_text,
+                        scheduled_datetime
+                    )
+                else:
+                    insert_schedule(
+                        conn,
+                        user_id,
+                        title,
+                        description,
+                        scheduled_datetime,
+                        EVENT_TYPE_MAP.get(event_type, "other")
+                    )
             
             st.success("予定を追加しました！")
-            st.rerun()
+            rerun()
     
     # クイック追加ボタン
     st.subheader("クイック追加")
@@ -213,15 +245,14 @@ def add_quick_schedule(title: str, event_type: str, days_ahead: int):
     user_id = st.session_state.get('current_user_id', 1)
     scheduled_date = datetime.now() + timedelta(days=days_ahead)
     
-    db = get_database()
-    with db.get_connection() as conn:
+    db = get_database(user_id)
+    with db.write_transaction() as conn:
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO schedules 
             (user_id, title, scheduled_date, event_type)
             VALUES (?, ?, ?, ?)
         """, (user_id, title, scheduled_date, event_type))
-        conn.commit()
     
     st.success(f"「{title}」を追加しました！")
-    st.rerun()
+    rerun()
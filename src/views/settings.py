@@ -3,7 +3,14 @@
 """
 
 import streamlit as st
-from src.controllers.database import get_database
+from src.controllers.database import AnalyticsPoolTimeout, get_database
+from src.controllers.catalog import get_subject_catalog
+from src.controllers.quiz_session import DIFFICULTY_PREFERENCES
+from src.controllers.retention import (
+    RetentionEngine, ArchiveReader, retention_cutoff, retention_months_from_env, default_archive_directory,
+    DEFAULT_RETENTION_MONTHS, MAX_RETENTION_MONTHS
+)
+from src.views.common import rerun
 
 def show_settings():
     """設定ページ"""
@@ -29,7 +36,7 @@ def show_profile_settings():
     
     # 現在のユーザー情報を取得
     user_id = st.session_state.get('current_user_id', 1)
-    db = get_database()
+    db = get_database(user_id)
     
     with db.get_connection() as conn:
         cursor = conn.cursor()
@@ -49,51 +56,56 @@ def show_profile_settings():
         submitted = st.form_submit_button("プロフィールを更新", type="primary")
         
         if submitted:
-            with db.get_connection() as conn:
+            with db.write_transaction() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     UPDATE users 
                     SET name = ?, email = ?, grade = ?
                     WHERE id = ?
                 """, (name, email, grade, user_id))
-                conn.commit()
             
             st.success("プロフィールを更新しました！")
-            st.rerun()
+            rerun()
     
     # 学習統計
     st.subheader("📊 学習統計")
     
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
+    try:
+        with db.analytics_snapshot() as conn:
+            cursor = conn.cursor()
         
-        # 総学習時間
-        cursor.execute("""
-            SELECT COALESCE(SUM(duration_minutes), 0) / 60.0 as total_hours
-            FROM study_sessions WHERE user_id = ?
-        """, (user_id,))
-        total_hours = cursor.fetchone()[0]
+            # 総学習時間
+            cursor.execute("""
+                SELECT COALESCE(SUM(duration_minutes), 0) / 60.0 as total_hours
+                FROM study_sessions WHERE user_id = ?
+            """, (user_id,))
+            total_hours = cursor.fetchone()[0]
         
-        # 学習日数
-        cursor.execute("""
-            SELECT COUNT(DISTINCT date(study_date)) as study_days
-            FROM study_sessions WHERE user_id = ?
-        """, (user_id,))
-        study_days = cursor.fetchone()[0]
+            # 学習日数
+            cursor.execute("""
+                SELECT COUNT(DISTINCT date(study_date)) as study_days
+                FROM study_sessions WHERE user_id = ?
+            """, (user_id,))
+            study_days = cursor.fetchone()[0]
         
-        # 最も学習した科目
-        cursor.execute("""
-            SELECT s.name, SUM(ss.duration_minutes) / 60.0 as hours
-            FROM study_sessions ss
-            JOIN subjects s ON ss.subject_id = s.id
-            WHERE ss.user_id = ?
-            GROUP BY s.name
-            ORDER BY hours DESC
-            LIMIT 1
-        """, (user_id,))
+            # 最も学習した科目
+            cursor.execute("""
+                SELECT subject_id, SUM(duration_minutes) / 60.0 as hours
+                FROM study_sessions
+                WHERE user_id = ?
+                GROUP BY subject_id
+                ORDER BY hours DESC
+                LIMIT 1
+            """, (user_id,))
         
-        top_subject_data = cursor.fetchone()
-        top_subject = f"{top_subject_data[0]} ({top_subject_data[1]:.1f}時間)" if top_subject_data else "データなし"
+            top_subject_data = cursor.fetchone()
+            top_subject = (
+                f"{get_subject_catalog().name(top_subject_data[0])} ({top_subject_data[1]:.1f}時間)"
+                if top_subject_data else "データなし"
+            )
+    except AnalyticsPoolTimeout:
+        st.warning("集計が混み合っています。しばらくしてから再読み込みしてください。")
+        return
     
     col1, col2, col3 = st.columns(3)
     
@@ -135,7 +147,12 @@ def show_learning_settings():
         auto_break_reminder = st.checkbox("休憩リマインダー", value=True)
     
     with col2:
-        difficulty_preference = st.selectbox("問題難易度設定", ["易しい", "標準", "難しい", "混合"])
+        difficulty_options = list(DIFFICULTY_PREFERENCES)
+        difficulty_preference = st.selectbox(
+            "問題難易度設定", difficulty_options,
+            index=difficulty_options.index(st.session_state.get('difficulty_preference', "自動")),
+            help="「自動」は科目ごとの正答率が7割前後になる難易度を出題します"
+        )
         show_explanations = st.checkbox("解説を常に表示", value=True)
     
     # 設定保存
@@ -169,29 +186,33 @@ def show_data_management():
         if st.button("学習記録をエクスポート", use_container_width=True):
             # CSV形式でエクスポート（実装例）
             user_id = st.session_state.get('current_user_id', 1)
-            db = get_database()
+            db = get_database(user_id)
             
-            with db.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT 
-                        s.name as subject,
-                        ss.content,
-                        ss.duration_minutes,
-                        ss.satisfaction_score,
-                        ss.study_date
-                    FROM study_sessions ss
-                    JOIN subjects s ON ss.subject_id = s.id
-                    WHERE ss.user_id = ?
-                    ORDER BY ss.study_date DESC
-                """, (user_id,))
+            try:
+                with db.analytics_snapshot() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("""
+                        SELECT 
+                            subject_id,
+                            content,
+                            duration_minutes,
+                            satisfaction_score,
+                            study_date
+                        FROM study_sessions
+                        WHERE user_id = ?
+                        ORDER BY study_date DESC
+                    """, (user_id,))
                 
-                data = cursor.fetchall()
+                    catalog = get_subject_catalog()
+                    data = [(catalog.name(row[0]), *row[1:]) for row in cursor.fetchall()]
+            except AnalyticsPoolTimeout:
+                st.warning("集計が混み合っています。しばらくしてから再読み込みしてください。")
+                data = None
             
             if data:
                 st.success(f"学習記録 {len(data)} 件をエクスポートしました！")
                 # 実際のアプリではファイルダウンロード機能を実装
-            else:
+            elif data is not None:
                 st.info("エクスポートするデータがありません。")
     
     with col2:
@@ -203,24 +224,50 @@ def show_data_management():
     
     st.warning("⚠️ 以下の操作は元に戻せません。実行前に必ずデータをエクスポートしてください。")
     
+    user_id = st.session_state.get('current_user_id', 1)
+    try:
+        default_months = retention_months_from_env()
+    except ValueError as e:
+        st.error(f"{e}（既定の {DEFAULT_RETENTION_MONTHS} ヶ月を表示しています）")
+        default_months = DEFAULT_RETENTION_MONTHS
+    retention_months = st.number_input(
+        "保存期間（月）", min_value=1, max_value=max(MAX_RETENTION_MONTHS, default_months),
+        value=default_months,
+        help="これより古いデータはアーカイブファイルへ移動され、アーカイブから参照できます"
+    )
+    confirmed = st.checkbox("確認：データベースから削除してアーカイブへ移動する")
+    
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        if st.button("古い学習記録を削除", use_container_width=True):
-            # 3ヶ月以上前のデータを削除
-            if st.button("確認：本当に削除しますか？"):
-                st.info("古い学習記録を削除しました。")
+        if st.button("古い学習記録を削除", use_container_width=True, disabled=not confirmed):
+            engine = RetentionEngine(get_database(user_id))
+            moved = engine.archive("study_sessions", retention_cutoff(retention_months), user_id)
+            engine.incremental_vacuum()
+            st.info(f"古い学習記録 {moved} 件をアーカイブへ移動しました。")
     
     with col2:
-        if st.button("クイズ結果を削除", use_container_width=True):
-            if st.button("確認：クイズ結果を削除？"):
-                st.info("クイズ結果を削除しました。")
+        if st.button("クイズ結果を削除", use_container_width=True, disabled=not confirmed):
+            engine = RetentionEngine(get_database(user_id))
+            moved = engine.archive("quiz_results", retention_cutoff(retention_months), user_id)
+            engine.incremental_vacuum()
+            st.info(f"クイズ結果 {moved} 件をアーカイブへ移動しました。")
     
     with col3:
         if st.button("全データを削除", use_container_width=True):
             if st.button("⚠️ 確認：全データ削除"):
                 st.error("この操作は実装されていません。")
     
+    # アーカイブ済みデータ
+    reader = ArchiveReader(default_archive_directory(get_database(user_id).db_path))
+    archived_months = reader.list_months("study_sessions", user_id)
+    if archived_months:
+        with st.expander(f"🗄️ アーカイブ済みの学習記録（{len(archived_months)}ヶ月分）"):
+            month = st.selectbox("月", archived_months[::-1])
+            rows = list(reader.iter_rows("study_sessions", user_id, month, month))
+            st.write(f"{len(rows)} 件")
+            st.dataframe(rows, use_container_width=True)
+    
     # データインポート
     st.write("### 📥 データインポート")
     
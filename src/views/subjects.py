@@ -3,9 +3,25 @@
 """
 
 import streamlit as st
+import pandas as pd
 import json
+import math
+import os
+import streamlit.components.v1 as components
 from datetime import datetime
-from src.controllers.database import get_database
+from src.controllers.database import AnalyticsPoolTimeout, all_databases, get_database, sync_reference_data
+from src.controllers.catalog import get_subject_catalog
+from src.controllers.queries import insert_study_session
+from src.controllers.item_analysis import DEFAULT_PAGE_SIZE, ITEM_SORTS, item_analysis, item_flag
+from src.controllers.quiz_session import QuizSession, load_accuracy
+from src.controllers.study_timer import (CHECKPOINT_SECONDS, checkpoint_timer, discard_timer, get_timer,
+                                         start_timer, stop_timer)
+from src.views.common import rerun
+
+# ブラウザ側で経過時間を数える学習タイマーの部品
+study_timer_component = components.declare_component(
+    "study_timer", path=os.path.join(os.path.dirname(__file__), "components", "study_timer")
+)
 
 def show_subjects():
     """教科学習ページを表示"""
@@ -15,25 +31,14 @@ def show_subjects():
     with st.sidebar:
         st.subheader("教科選択")
         
-        db = get_database()
-        with db.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT category FROM subjects ORDER BY category")
-            categories = [row[0] for row in cursor.fetchall()]
-        
-        selected_category = st.selectbox("教科カテゴリ", categories)
+        catalog = get_subject_catalog()
+        selected_category = st.selectbox("教科カテゴリ", catalog.categories)
         
-        # 選択されたカテゴリの科目を取得
-        with db.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT id, name, description FROM subjects WHERE category = ? ORDER BY grade_level, name",
-                (selected_category,)
-            )
-            subjects = cursor.fetchall()
+        # 選択されたカテゴリの科目
+        subjects = catalog.in_category(selected_category)
         
         if subjects:
-            subject_options = {f"{subject[1]}": subject[0] for subject in subjects}
+            subject_options = {subject.name: subject.id for subject in subjects}
             selected_subject_name = st.selectbox("科目選択", list(subject_options.keys()))
             selected_subject_id = subject_options[selected_subject_name]
         else:
@@ -56,6 +61,8 @@ def show_study_recording(subject_id: int, subject_name: str):
     """学習記録セクション"""
     st.subheader(f"📝 {subject_name}の学習記録")
     
+    show_study_timer(subject_id)
+    
     with st.form("study_session_form"):
         col1, col2 = st.columns(2)
         
@@ -74,30 +81,26 @@ def show_study_recording(subject_id: int, subject_name: str):
             if 'current_user_id' not in st.session_state:
                 st.session_state.current_user_id = 1
             
-            db = get_database()
-            with db.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO study_sessions 
-                    (user_id, subject_id, duration_minutes, content, satisfaction_score, study_date)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
+            db = get_database(st.session_state.current_user_id)
+            with db.write_transaction() as conn:
+                insert_study_session(
+                    conn,
                     st.session_state.current_user_id,
                     subject_id,
                     duration,
                     content,
                     satisfaction,
                     datetime.combine(study_date, datetime.now().time())
-                ))
-                conn.commit()
+                )
             
             st.success("学習記録を保存しました！")
-            st.rerun()
+            rerun()
     
     # 最近の学習記録表示
     st.subheader("最近の学習記録")
     
-    db = get_database()
+    user_id = st.session_state.get('current_user_id', 1)
+    db = get_database(user_id)
     with db.get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("""
@@ -106,7 +109,7 @@ def show_study_recording(subject_id: int, subject_name: str):
             WHERE user_id = ? AND subject_id = ?
             ORDER BY study_date DESC
             LIMIT 10
-        """, (st.session_state.get('current_user_id', 1), subject_id))
+        """, (user_id, subject_id))
         
         records = cursor.fetchall()
     
@@ -119,81 +122,145 @@ def show_study_recording(subject_id: int, subject_name: str):
     else:
         st.info("まだ学習記録がありません。上のフォームから記録を始めましょう！")
 
+def stop_study_timer(db, user_id: int, until_checkpoint: bool = False):
+    """停止ボタンのコールバック（経過時間を学習記録に変換）"""
+    content = st.session_state.get('timer_content') or "タイマーで記録"
+    if stop_timer(db, user_id, content, st.session_state.get('timer_satisfaction', 3),
+                  until_checkpoint=until_checkpoint) is not None:
+        st.session_state.timer_message = "学習記録を保存しました！"
+    st.session_state.pop('timer_content', None)
+
+def show_study_timer(subject_id: int):
+    """学習タイマー（経過時間はブラウザで数え、サーバーとは開始・確認・停止のときだけやり取りする）"""
+    user_id = st.session_state.get('current_user_id', 1)
+    db = get_database(user_id)
+    message = st.session_state.pop('timer_message', None)
+    if message:
+        st.success(message)
+    
+    timer = get_timer(db, user_id)
+    if timer is None:
+        st.button("▶️ タイマーで計測を開始", on_click=start_timer, args=(db, user_id, subject_id))
+        return
+    
+    subject_name = get_subject_catalog().name(timer.subject_id)
+    if timer.is_stale():
+        # ブラウザが閉じられるなどして確認が途絶えたタイマー
+        st.warning(f"{subject_name}のタイマーが {timer.checkpoint_at.strftime('%m/%d %H:%M')} から中断されています"
+                   f"（開始 {timer.started_at.strftime('%m/%d %H:%M')}）。")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.button(f"{timer.minutes(timer.checkpoint_at)}分として記録", type="primary",
+                      on_click=stop_study_timer, args=(db, user_id, True))
+        with col2:
+            st.button("破棄する", on_click=discard_timer, args=(db, user_id))
+        return
+    
+    now = datetime.now()
+    checkpoint = study_timer_component(
+        started_ms=int(timer.started_at.timestamp() * 1000),
+        server_ms=int(now.timestamp() * 1000),
+        interval_ms=CHECKPOINT_SECONDS * 1000,
+        note=f"{subject_name}を計測中",
+        key=f"study_timer_{timer.started_at.isoformat()}",
+        default=None,
+    )
+    # 部品の値は次の確認まで変わらないため、新しい値のときだけ最終確認時刻を更新する
+    if checkpoint and checkpoint != st.session_state.get('timer_checkpoint'):
+        st.session_state.timer_checkpoint = checkpoint
+        checkpoint_timer(db, user_id)
+    
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.text_input("学習内容", key="timer_content", placeholder="停止するときに記録する内容")
+    with col2:
+        st.slider("満足度", min_value=1, max_value=5, value=3, key="timer_satisfaction")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.button("⏹️ 停止して記録", type="primary", on_click=stop_study_timer, args=(db, user_id))
+    with col2:
+        st.button("破棄する", on_click=discard_timer, args=(db, user_id))
+
 def show_quiz_section(subject_id: int, subject_name: str):
     """クイズセクション"""
     st.subheader(f"🧠 {subject_name}のクイズ")
     
     # クイズ管理
-    tab1, tab2 = st.tabs(["クイズ挑戦", "クイズ作成"])
+    tab1, tab2, tab3 = st.tabs(["クイズ挑戦", "クイズ作成", "問題分析"])
     
     with tab1:
         show_quiz_challenge(subject_id, subject_name)
     
     with tab2:
         show_quiz_creation(subject_id, subject_name)
+    
+    with tab3:
+        show_item_analysis(subject_id, subject_name)
+
+def get_quiz_session(user_id: int, subject_id: int) -> QuizSession:
+    """利用者・科目の出題セッションを取得（科目・難易度設定を切り替えたら前の回答を書き込んでから作り直す）"""
+    preference = st.session_state.get('difficulty_preference', "自動")
+    session = st.session_state.get('quiz_session')
+    if session is None or (session.user_id, session.subject_id, session.preference) != (user_id, subject_id, preference):
+        if session is not None:
+            session.flush(get_database(session.user_id))
+        session = QuizSession(user_id, subject_id, preference)
+        st.session_state.quiz_session = session
+    return session
+
+def answer_quiz(db, session: QuizSession, quiz, answer_key: str):
+    """回答ボタンのコールバック（flush_every 問ごとにまとめて保存）"""
+    session.answer(quiz, st.session_state.get(answer_key, ""))
+    if session.should_flush():
+        session.flush(db)
+
+def finish_quiz_session(db, session: QuizSession):
+    """終了ボタンのコールバック（未保存の回答を保存してセッションを破棄）"""
+    session.flush(db)
+    st.session_state.pop('quiz_session', None)
 
 def show_quiz_challenge(subject_id: int, subject_name: str):
-    """クイズ挑戦"""
-    db = get_database()
-    
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT id, title, question, options, correct_answer, explanation, difficulty
-            FROM quizzes 
-            WHERE subject_id = ?
-            ORDER BY RANDOM()
-            LIMIT 1
-        """, (subject_id,))
-        
-        quiz = cursor.fetchone()
+    """クイズ挑戦（問題はまとめて取得済みのものを出題し、回答はまとめて保存する）"""
+    user_id = st.session_state.get('current_user_id', 1)
+    db = get_database(user_id)
+    session = get_quiz_session(user_id, subject_id)
+    quiz = session.current(db)
     
     if quiz:
-        quiz_id, title, question, options_json, correct_answer, explanation, difficulty = quiz
-        
-        st.write(f"**{title}**")
-        st.write(f"難易度: {'⭐' * difficulty}")
-        st.write(question)
+        st.write(f"**{quiz.title}**")
+        st.write(f"難易度: {'⭐' * quiz.difficulty}")
+        st.write(quiz.question)
         
         # 選択肢がある場合
-        if options_json:
-            try:
-                options = json.loads(options_json)
-                user_answer = st.radio("答えを選択してください:", options)
-            except:
-                user_answer = st.text_input("答えを入力してください:")
+        answer_key = f"quiz_answer_{quiz.id}_{session.answered}"
+        if quiz.options:
+            st.radio("答えを選択してください:", quiz.options, key=answer_key)
         else:
-            user_answer = st.text_input("答えを入力してください:")
+            st.text_input("答えを入力してください:", key=answer_key)
         
-        if st.button("回答する", type="primary"):
-            is_correct = str(user_answer).strip().lower() == str(correct_answer).strip().lower()
-            
-            # 結果をデータベースに保存
-            with db.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO quiz_results 
-                    (user_id, quiz_id, user_answer, is_correct, attempted_at)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (
-                    st.session_state.get('current_user_id', 1),
-                    quiz_id,
-                    str(user_answer),
-                    is_correct,
-                    datetime.now()
-                ))
-                conn.commit()
-            
-            if is_correct:
-                st.success("🎉 正解です！")
+        if session.last_result is None:
+            st.button("回答する", type="primary", on_click=answer_quiz, args=(db, session, quiz, answer_key))
+        
+        result = session.last_result
+        if result is not None:
+            if result["is_correct"]:
+                st.success(f"🎉 正解です！（{result['time_taken_seconds']}秒）")
             else:
-                st.error(f"❌ 不正解です。正解は: {correct_answer}")
+                st.error(f"❌ 不正解です。正解は: {quiz.correct_answer}")
             
-            if explanation:
-                st.info(f"💡 解説: {explanation}")
+            if quiz.explanation:
+                st.info(f"💡 解説: {quiz.explanation}")
             
-            if st.button("次の問題"):
-                st.rerun()
+            # ボタンの処理はコールバックで行い、押した回の再実行で次の問題を表示する
+            col1, col2 = st.columns(2)
+            with col1:
+                st.button("次の問題", type="primary", on_click=session.advance)
+            with col2:
+                st.button("終了して保存", on_click=finish_quiz_session, args=(db, session))
+        
+        if session.answered:
+            st.caption(f"このセッション: {session.correct}/{session.answered}問正解"
+                       + (f"（未保存 {len(session.pending)}問）" if session.pending else ""))
     
     else:
         st.info("この科目のクイズがまだありません。クイズ作成タブから問題を追加してみましょう！")
@@ -231,24 +298,65 @@ def show_quiz_creation(subject_id: int, subject_name: str):
         
         if submitted and title and question and correct_answer:
             db = get_database()
-            with db.get_connection() as conn:
+            with db.write_transaction() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     INSERT INTO quizzes 
                     (subject_id, title, question, options, correct_answer, explanation, difficulty)
                     VALUES (?, ?, ?, ?, ?, ?, ?)
                 """, (subject_id, title, question, options_json, correct_answer, explanation, difficulty))
-                conn.commit()
+            sync_reference_data()
             
             st.success("クイズを作成しました！")
-            st.rerun()
+            rerun()
+
+def show_item_analysis(subject_id: int, subject_name: str):
+    """問題分析（問題ごとの集計を並べ替えて1ページずつ表示）"""
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        sort = st.selectbox("並べ替え", list(ITEM_SORTS), key="item_sort")
+    with col2:
+        descending = st.radio("順序", ["昇順", "降順"], horizontal=True, key="item_order") == "降順"
+    with col3:
+        page = st.number_input("ページ", min_value=1, value=1, step=1, key=f"item_page_{subject_id}")
+    
+    try:
+        items, total = item_analysis(all_databases(), subject_id, sort, descending, int(page), DEFAULT_PAGE_SIZE)
+    except AnalyticsPoolTimeout:
+        st.warning("集計が混み合っています。しばらくしてから再読み込みしてください。")
+        return
+    if not total:
+        st.info("この科目のクイズがまだありません。")
+        return
+    pages = math.ceil(total / DEFAULT_PAGE_SIZE)
+    if not items:
+        st.warning(f"ページは {pages} までです。")
+        return
+    
+    rows = []
+    for item, option_counts in items:
+        rows.append({
+            "問題": item.title,
+            "難易度": "⭐" * item.difficulty,
+            "回答数": item.attempts,
+            "正答率": f"{item.accuracy:.0%}" if item.accuracy is not None else "-",
+            "平均回答時間": f"{item.mean_seconds:.1f}秒" if item.mean_seconds is not None else "-",
+            "選択肢の回答数": " / ".join(
+                f"{'✓' if option == item.correct_answer else ''}{option}: {option_counts.get(option, 0)}"
+                for option in item.options
+            ) if item.options else "",
+            "判定": item_flag(item, option_counts) or "",
+        })
+    st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+    st.caption(f"{total}問中 {(int(page) - 1) * DEFAULT_PAGE_SIZE + 1}〜"
+               f"{(int(page) - 1) * DEFAULT_PAGE_SIZE + len(items)}問目（{int(page)}/{pages}ページ）")
 
 def show_subject_progress_detail(subject_id: int, subject_name: str):
     """科目別進捗詳細"""
     st.subheader(f"📊 {subject_name}の進捗")
     
-    db = get_database()
     user_id = st.session_state.get('current_user_id', 1)
+    db = get_database(user_id)
     
     # 学習統計
     with db.get_connection() as conn:
@@ -270,16 +378,9 @@ def show_subject_progress_detail(subject_id: int, subject_name: str):
         """, (user_id, subject_id))
         study_days = cursor.fetchone()[0]
         
-        # クイズ正解率
-        cursor.execute("""
-            SELECT 
-                COUNT(*) as total,
-                SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) as correct
-            FROM quiz_results qr
-            JOIN quizzes q ON qr.quiz_id = q.id
-            WHERE qr.user_id = ? AND q.subject_id = ?
-        """, (user_id, subject_id))
-        quiz_stats = cursor.fetchone()
+        # クイズ正解率（難易度ごとの回答数・正解数から）
+        accuracy_by_difficulty = load_accuracy(conn, user_id, subject_id)
+        quiz_stats = [sum(counts[i] for counts in accuracy_by_difficulty.values()) for i in (0, 1)]
         
         if quiz_stats[0] > 0:
             accuracy = (quiz_stats[1] / quiz_stats[0]) * 100
@@ -310,6 +411,12 @@ def show_subject_progress_detail(subject_id: int, subject_name: str):
             f"{quiz_stats[1]}/{quiz_stats[0]}問" if quiz_stats[0] > 0 else "未挑戦"
         )
     
+    if accuracy_by_difficulty:
+        st.caption("難易度別の正解数: " + " / ".join(
+            f"{'⭐' * difficulty} {correct}/{attempts}問"
+            for difficulty, (attempts, correct) in sorted(accuracy_by_difficulty.items()) if attempts
+        ))
+    
     # 学習履歴
     st.subheader("学習履歴")
     
@@ -0,0 +1,200 @@
+"""
+JSON APIのテスト
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+from tornado.testing import AsyncHTTPTestCase
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.api_tokens import issue_token, revoke_tokens
+from src.controllers.database import DatabaseController
+from src.controllers.sync import compact_change_log, pull_changes
+from src.api.server import make_app
+
+class TestAPI(AsyncHTTPTestCase):
+    """JSON APIのテストクラス"""
+    
+    def setUp(self):
+        """テスト前の準備"""
+        self.test_db_file = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+        self.test_db_path = self.test_db_file.name
+        self.test_db_file.close()
+        
+        self.db = DatabaseController(self.test_db_path)
+        self.tokens = {user_id: issue_token(self.db, user_id) for user_id in (1, 2)}
+        super().setUp()
+    
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        super().tearDown()
+        if os.path.exists(self.test_db_path):
+            os.unlink(self.test_db_path)
+    
+    def get_app(self):
+        return make_app(self.db, max_workers=2)
+    
+    def fetch(self, path, user_id=1, **kwargs):
+        """利用者のトークンを付けてリクエスト（user_id=None で付けない）"""
+        headers = dict(kwargs.pop("headers", {}))
+        if user_id is not None:
+            headers.setdefault("Authorization", f"Bearer {self.tokens[user_id]}")
+        return super().fetch(path, headers=headers, **kwargs)
+    
+    def post_json(self, path, data, user_id=1):
+        return self.fetch(path, user_id, method="POST", body=json.dumps(data))
+    
+    def test_authorization(self):
+        """トークンの利用者以外のデータには 403、トークンが無い・無効なら 401 を返すテスト"""
+        self.assertEqual(self.fetch("/api/v1/users/1/sessions", user_id=None).code, 401)
+        self.assertEqual(self.fetch("/api/v1/users/1/sessions", headers={"Authorization": "Bearer x"}).code, 401)
+        self.assertEqual(self.fetch("/api/v1/users/2/sessions").code, 403)
+        self.assertEqual(self.post_json("/api/v1/users/2/sessions", {"subject_id": 1, "duration_minutes": 30}).code, 403)
+        self.assertEqual(self.fetch("/api/v1/users/2/sessions", user_id=2).code, 200)
+        self.assertEqual(self.fetch("/api/v1/subjects/1/quizzes", user_id=2).code, 200)
+        with self.db.get_connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM study_sessions").fetchone()[0], 0)
+        
+        revoke_tokens(self.db, 2)
+        self.assertEqual(self.fetch("/api/v1/users/2/sessions", user_id=2).code, 401)
+    
+    def test_conditional_get(self):
+        """ETagによる条件付きGETのテスト"""
+        response = self.fetch("/api/v1/users/1/sessions")
+        self.assertEqual(response.code, 200)
+        self.assertEqual(json.loads(response.body), [])
+        etag = response.headers["Etag"]
+        
+        response = self.fetch("/api/v1/users/1/sessions", headers={"If-None-Match": etag})
+        self.assertEqual(response.code, 304)
+        
+        self.post_json("/api/v1/users/1/sessions", {"subject_id": 1, "duration_minutes": 30})
+        response = self.fetch("/api/v1/users/1/sessions", headers={"If-None-Match": etag})
+        self.assertEqual(response.code, 200)
+        self.assertEqual(len(json.loads(response.body)), 1)
+    
+    def test_batch_is_atomic(self):
+        """バッチ書き込みが1トランザクションで適用されるかのテスト"""
+        response = self.post_json("/api/v1/users/1/batch", {"operations": [
+            {"op": "create_session", "subject_id": 1, "duration_minutes": 30},
+            {"op": "create_schedule", "title": "小テスト", "scheduled_date": "2026-05-01T09:00:00"},
+        ]})
+        self.assertEqual(response.code, 200)
+        self.assertEqual(len(json.loads(response.body)["results"]), 2)
+        
+        response = self.post_json("/api/v1/users/1/batch", {"operations": [
+            {"op": "create_session", "subject_id": 1, "duration_minutes": 30},
+            {"op": "unknown"},
+        ]})
+        self.assertEqual(response.code, 400)
+        
+        with self.db.get_connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM study_sessions").fetchone()[0], 1)
+    
+    def test_metrics(self):
+        """概要メトリクスのテスト"""
+        self.post_json("/api/v1/users/1/sessions", {"subject_id": 1, "duration_minutes": 45})
+        response = self.fetch("/api/v1/users/1/metrics")
+        self.assertEqual(json.loads(response.body)["weekly_minutes"], 45)
+
+    def test_sync(self):
+        """カーソル以降の変更の取得と冪等キー付きアップロードのテスト"""
+        upload = {"operations": [
+            {"key": "k1", "op": "create_session", "subject_id": 1, "duration_minutes": 30},
+            {"key": "k2", "op": "create_schedule", "title": "小テスト", "scheduled_date": "2026-05-01T09:00:00"},
+        ]}
+        first = json.loads(self.post_json("/api/v1/users/1/sync", upload).body)["results"]
+        retried = json.loads(self.post_json("/api/v1/users/1/sync", upload).body)["results"]
+        self.assertEqual([r["id"] for r in retried], [r["id"] for r in first])
+        self.assertTrue(all(r["replayed"] for r in retried))
+        with self.db.get_connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM study_sessions").fetchone()[0], 1)
+
+        response = self.fetch("/api/v1/users/1/sync?cursor=0")
+        pulled = json.loads(response.body)
+        self.assertEqual([c["table"] for c in pulled["changes"]], ["study_sessions", "schedules"])
+        self.assertEqual(pulled["changes"][0]["data"]["duration_minutes"], 30)
+        self.assertFalse(pulled["has_more"])
+
+        # 変更が無ければ 304、更新・削除は1行1件にまとめて返す
+        path = f"/api/v1/users/1/sync?cursor={pulled['cursor']}"
+        response = self.fetch(path)
+        self.assertEqual(json.loads(response.body)["changes"], [])
+        self.assertEqual(self.fetch(path, headers={"If-None-Match": response.headers["Etag"]}).code, 304)
+        with self.db.write_transaction() as conn:
+            conn.execute("UPDATE study_sessions SET duration_minutes = 40")
+            conn.execute("UPDATE study_sessions SET duration_minutes = 45")
+            conn.execute("DELETE FROM schedules")
+        changes = json.loads(self.fetch(path).body)["changes"]
+        self.assertEqual([(c["table"], c["op"]) for c in changes], [("study_sessions", "upsert"), ("schedules", "delete")])
+        self.assertEqual(changes[0]["data"]["duration_minutes"], 45)
+        self.assertEqual(json.loads(self.fetch("/api/v1/users/2/sync", user_id=2).body)["changes"], [])
+
+        response = self.post_json("/api/v1/users/1/sync", {"operations": [{"op": "create_session"}]})
+        self.assertEqual(response.code, 400)
+
+        # 古い変更履歴を削除しても最初から同期した結果は変わらない
+        with self.db.get_connection() as conn:
+            before = pull_changes(conn, 1)["changes"]
+        self.assertEqual(compact_change_log(self.db)["change_log"], 3)
+        with self.db.get_connection() as conn:
+            self.assertEqual(pull_changes(conn, 1)["changes"], before)
+
+    def test_sync_is_per_user(self):
+        """他の利用者の変更履歴は取得・送信できず、冪等キーは利用者ごとに別になるテスト"""
+        upload = {"operations": [{"key": "k1", "op": "create_session", "subject_id": 1, "duration_minutes": 30}]}
+        self.assertEqual(self.post_json("/api/v1/users/1/sync", upload).code, 200)
+        self.assertEqual(self.fetch("/api/v1/users/1/sync?cursor=0", user_id=2).code, 403)
+        self.assertEqual(self.post_json("/api/v1/users/1/sync", upload, user_id=2).code, 403)
+
+        results = json.loads(self.post_json("/api/v1/users/2/sync", upload, user_id=2).body)["results"]
+        self.assertNotIn("replayed", results[0])
+        with self.db.get_connection() as conn:
+            self.assertEqual(conn.execute(
+                "SELECT user_id, COUNT(*) FROM study_sessions GROUP BY user_id ORDER BY user_id"
+            ).fetchall(), [(1, 1), (2, 1)])
+
+    def test_health_endpoints(self):
+        """死活監視のエンドポイントのテスト（トークン不要）"""
+        self.assertEqual(self.fetch("/healthz").code, 200)
+        response = self.fetch("/readyz")
+        self.assertEqual(response.code, 200)
+        status = json.loads(response.body)
+        self.assertTrue(status["database"]["ok"])
+        self.assertEqual(status["pending"], 0)
+
+class TestInsecureAPI(AsyncHTTPTestCase):
+    """認証なし（--insecure）で起動した場合のテストクラス"""
+
+    def setUp(self):
+        """テスト前の準備"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseController(os.path.join(self.temp_dir.name, "test.db"))
+        super().setUp()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        super().tearDown()
+        self.db.writer.close()
+        self.db.analytics.close()
+        self.temp_dir.cleanup()
+
+    def get_app(self):
+        return make_app(self.db, max_workers=2, insecure=True)
+
+    def test_sync_requires_token(self):
+        """認証なしでも同期にはトークンが必要なテスト"""
+        self.assertEqual(self.fetch("/api/v1/users/1/sessions").code, 200)
+        self.assertEqual(self.fetch("/api/v1/users/1/sync").code, 401)
+        token = issue_token(self.db, 1)
+        response = self.fetch("/api/v1/users/1/sync", headers={"Authorization": f"Bearer {token}"})
+        self.assertEqual(response.code, 200)
+
+if __name__ == '__main__':
+    import unittest
+    unittest.main()
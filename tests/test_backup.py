@@ -0,0 +1,74 @@
+"""
+バックアップ・リストアのテスト
+"""
+
+import unittest
+import tempfile
+import shutil
+import gzip
+import os
+import sys
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import DatabaseController
+from src.controllers.backup import create_backup, restore_backup, apply_retention, list_backups
+
+class TestBackup(unittest.TestCase):
+    """バックアップ・リストアのテストクラス"""
+    
+    def setUp(self):
+        """テスト前の準備"""
+        self.test_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.test_dir, "study_app.db")
+        self.backup_dir = os.path.join(self.test_dir, "backups")
+        self.db = DatabaseController(self.db_path)
+    
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        shutil.rmtree(self.test_dir)
+    
+    def count_users(self):
+        """ユーザー数を取得"""
+        with self.db.get_connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    
+    def test_backup_and_restore(self):
+        """バックアップと復元のテスト"""
+        with self.db.get_connection() as conn:
+            conn.execute("INSERT INTO users (name, email, grade) VALUES ('テスト', 'a@example.com', 1)")
+            conn.commit()
+        
+        backup_path = create_backup(self.db_path, self.backup_dir, pages_per_step=1, sleep_seconds=0)
+        self.assertTrue(os.path.exists(f"{backup_path}.sha256"))
+        
+        with self.db.get_connection() as conn:
+            conn.execute("DELETE FROM users")
+            conn.commit()
+        self.assertEqual(self.count_users(), 0)
+        
+        restore_backup(backup_path, self.db_path, sleep_seconds=0)
+        self.assertEqual(self.count_users(), 1)
+    
+    def test_restore_rejects_corrupted_backup(self):
+        """破損したバックアップを拒否するテスト"""
+        backup_path = create_backup(self.db_path, self.backup_dir, sleep_seconds=0)
+        with gzip.open(backup_path, "wb") as f:
+            f.write(b"broken")
+        
+        with self.assertRaises(RuntimeError):
+            restore_backup(backup_path, self.db_path, sleep_seconds=0)
+    
+    def test_retention_keeps_latest(self):
+        """保存期間を過ぎても最新のバックアップは残すテスト"""
+        for label in ["a", "b"]:
+            path = create_backup(self.db_path, self.backup_dir, sleep_seconds=0, label=label)
+            os.utime(path, (0, 0))
+        
+        removed = apply_retention(self.backup_dir, retention_days=30, keep_min=1)
+        self.assertEqual(len(removed), 1)
+        self.assertEqual(len(list_backups(self.backup_dir)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+"""
+データバージョンとキャッシュのテスト
+"""
+
+import unittest
+import tempfile
+import os
+import sys
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import DatabaseController, user_scope
+from src.controllers.cache import VersionedCache
+
+class TestVersionedCache(unittest.TestCase):
+    """データバージョン付きキャッシュのテストクラス"""
+    
+    def setUp(self):
+        """テスト前の準備"""
+        self.test_db_file = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+        self.test_db_path = self.test_db_file.name
+        self.test_db_file.close()
+        
+        self.db = DatabaseController(self.test_db_path)
+    
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        if os.path.exists(self.test_db_path):
+            os.unlink(self.test_db_path)
+    
+    def add_session(self, user_id):
+        """学習セッションを追加"""
+        with self.db.get_connection() as conn:
+            conn.execute(
+                "INSERT INTO study_sessions (user_id, subject_id, duration_minutes) VALUES (?, 1, 30)",
+                (user_id,)
+            )
+            conn.commit()
+    
+    def test_triggers_bump_user_version(self):
+        """書き込みでユーザーのバージョンが上がるかのテスト"""
+        self.assertEqual(self.db.get_data_version(user_scope(1)), 0)
+        self.add_session(1)
+        self.add_session(1)
+        self.assertEqual(self.db.get_data_version(user_scope(1)), 2)
+        self.assertEqual(self.db.get_data_version(user_scope(2)), 0)
+    
+    def test_invalidation_from_another_controller(self):
+        """別プロセス相当の書き込みでキャッシュが無効化されるかのテスト"""
+        cache = VersionedCache(db=self.db)
+        loads = []
+        
+        def loader():
+            loads.append(1)
+            return len(loads)
+        
+        self.assertEqual(cache.get_or_load(user_scope(1), "metrics", loader), 1)
+        self.assertEqual(cache.get_or_load(user_scope(1), "metrics", loader), 1)
+        
+        other = DatabaseController(self.test_db_path)
+        with other.get_connection() as conn:
+            conn.execute(
+                "INSERT INTO study_sessions (user_id, subject_id, duration_minutes) VALUES (1, 1, 30)"
+            )
+            conn.commit()
+        
+        self.assertEqual(cache.get_or_load(user_scope(1), "metrics", loader), 2)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
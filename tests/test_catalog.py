@@ -0,0 +1,97 @@
+"""
+教科カタログのテスト
+"""
+
+import unittest
+import tempfile
+import os
+import sys
+
+import pandas as pd
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.catalog import CatalogProvider, Subject, SubjectCatalog
+from src.controllers.database import DatabaseController
+
+class TestSubjectCatalog(unittest.TestCase):
+    """教科カタログのテストクラス"""
+
+    def setUp(self):
+        """テスト前の準備"""
+        self.catalog = SubjectCatalog([
+            Subject(1, "数学II", "数学", None, 11),
+            Subject(2, "数学I", "数学", None, 10),
+            Subject(3, "現代の国語", "国語", None, 10),
+            Subject(4, "数学A", "数学", None, 10),
+        ], version=3)
+
+    def test_ordering(self):
+        """カテゴリ・学年・名前順の並びのテスト"""
+        self.assertEqual(self.catalog.categories, ("国語", "数学"))
+        self.assertEqual([s.id for s in self.catalog.in_category("数学")], [4, 2, 1])
+        self.assertEqual(self.catalog.in_category("理科"), ())
+        self.assertEqual(len(self.catalog), 4)
+
+    def test_lookup(self):
+        """IDからの参照と学年での絞り込みのテスト"""
+        self.assertEqual(self.catalog.name(3), "現代の国語")
+        self.assertEqual(self.catalog.name(99), "不明な教科")
+        self.assertEqual({s.id for s in self.catalog.for_grade(10)}, {2, 3, 4})
+        self.assertEqual([s.id for s in self.catalog.for_grade(11, "数学")], [4, 2, 1])
+        with self.assertRaises(TypeError):
+            self.catalog.by_id[5] = Subject(5, "化学", "理科", None, 11)
+
+    def test_attach(self):
+        """subject_id から教科名を付与するテスト"""
+        df = pd.DataFrame({"subject_id": [1, 3], "total_minutes": [90, 30]})
+        result = self.catalog.attach(df, columns=("name", "category"))
+        self.assertEqual(list(result["name"]), ["数学II", "現代の国語"])
+        self.assertEqual(list(result["category"]), ["数学", "国語"])
+        self.assertNotIn("name", df.columns)
+
+class TestCatalogProvider(unittest.TestCase):
+    """カタログの読み込み直しのテストクラス"""
+
+    def setUp(self):
+        """テスト前の準備"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseController(os.path.join(self.temp_dir.name, "test.db"))
+        self.db.insert_initial_data()
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        self.db.writer.close()
+        self.temp_dir.cleanup()
+
+    def test_reload_on_version_change(self):
+        """subjects のバージョンが進んだときだけ読み込み直すテスト"""
+        provider = CatalogProvider(self.db, refresh_interval=0)
+        catalog = provider.get()
+        self.assertGreater(len(catalog), 0)
+        self.assertIs(provider.get(), catalog)
+        self.assertEqual(provider.loads, 1)
+
+        with self.db.write_transaction() as conn:
+            conn.execute(
+                "INSERT INTO subjects (name, category, description, grade_level) VALUES (?, ?, ?, ?)",
+                ("情報II", "情報", "", 11),
+            )
+        reloaded = provider.get()
+        self.assertEqual(provider.loads, 2)
+        self.assertEqual(len(reloaded), len(catalog) + 1)
+        self.assertIn("情報II", [s.name for s in reloaded.in_category("情報")])
+
+    def test_refresh_interval(self):
+        """確認間隔内はバージョンを確認しないテスト"""
+        provider = CatalogProvider(self.db, refresh_interval=3600)
+        catalog = provider.get()
+        with self.db.write_transaction() as conn:
+            conn.execute("UPDATE subjects SET name = '数学Ⅰ' WHERE name = '数学I'")
+        self.assertIs(provider.get(), catalog)
+        provider.invalidate()
+        self.assertIsNot(provider.get(), catalog)
+
+if __name__ == '__main__':
+    unittest.main()
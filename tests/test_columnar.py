@@ -0,0 +1,124 @@
+"""
+列指向エクスポートのテスト
+"""
+
+import unittest
+import tempfile
+import os
+import sys
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.columnar import ColumnarExporter, load_study_sessions, read_export
+from src.controllers.database import DatabaseController
+from src.controllers.queries import insert_quiz_result, insert_study_session
+from src.controllers.sharding import SHARD_ID_SPAN, create_router
+
+class TestColumnarExport(unittest.TestCase):
+    """月別パーティションの書き出しと読み取りのテストクラス"""
+
+    def setUp(self):
+        """テスト前の準備"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseController(os.path.join(self.temp_dir.name, "test.db"))
+        self.directory = os.path.join(self.temp_dir.name, "columnar")
+        self.now = datetime(2030, 6, 15)
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        self.db.writer.close()
+        self.db.analytics.close()
+        self.temp_dir.cleanup()
+
+    def add_session(self, user_id: int, subject_id: int, minutes: int, when: str) -> int:
+        """学習記録を追加"""
+        with self.db.write_transaction() as conn:
+            return insert_study_session(conn, user_id, subject_id, minutes, "学習", 4,
+                                        datetime.fromisoformat(when))
+
+    def test_incremental_export(self):
+        """終わった月だけを書き出し、2回目は変わった月だけを書き直すテスト"""
+        self.add_session(1, 1, 30, "2030-04-01 10:00:00")
+        self.add_session(2, 2, 45, "2030-04-20 21:00:00")
+        self.add_session(1, 3, 20, "2030-05-03 08:00:00")
+        self.add_session(1, 1, 60, "2030-06-01 09:00:00")
+        exporter = ColumnarExporter(self.db, self.directory, row_group_size=1)
+
+        result = exporter.export("study_sessions", now=self.now)
+        self.assertEqual(result, {"months": ["2030-04", "2030-05"], "rows": 3})
+        parquet = pq.ParquetFile(exporter.path("study_sessions", "2030-04"))
+        self.assertEqual(parquet.metadata.num_row_groups, 2)
+
+        self.assertEqual(exporter.export("study_sessions", now=self.now)["months"], [])
+        self.add_session(2, 1, 15, "2030-05-30 18:00:00")
+        self.assertEqual(exporter.export("study_sessions", now=self.now)["months"], ["2030-05"])
+
+        df = read_export(self.directory, "study_sessions", user_id=2)
+        self.assertEqual(sorted(df["duration_minutes"]), [15, 45])
+        self.assertEqual(df["study_date"].min(), datetime(2030, 4, 20, 21, 0))
+        self.assertEqual(str(df["subject_id"].dtype), "category")
+
+    def test_arrow_format(self):
+        """Arrow IPC 形式でも同じ内容を読めるテスト"""
+        with self.db.write_transaction() as conn:
+            insert_quiz_result(conn, 1, 7, "a", True, 12, datetime(2030, 5, 2, 9, 0))
+            insert_quiz_result(conn, 2, 7, "b", False, 30, datetime(2030, 5, 3, 9, 0))
+        exporter = ColumnarExporter(self.db, self.directory, fmt="arrow")
+        self.assertEqual(exporter.export("quiz_results", now=self.now)["rows"], 2)
+        schema = pa.ipc.open_file(exporter.path("quiz_results", "2030-05")).schema
+        self.assertEqual(str(schema.field("quiz_id").type), "dictionary<values=int32, indices=int32, ordered=0>")
+        self.assertEqual(str(schema.field("attempted_at").type), "timestamp[s]")
+
+        df = read_export(self.directory, "quiz_results", user_id=1)
+        self.assertEqual(df[["quiz_id", "is_correct", "time_taken_seconds"]].values.tolist(), [[7, True, 12]])
+
+    def test_load_study_sessions(self):
+        """進捗画面の読み取りがエクスポートとDBを組み合わせ、変更後はDBに戻るテスト"""
+        session_id = self.add_session(1, 1, 30, "2030-04-01 10:00:00")
+        self.add_session(1, 2, 45, "2030-05-02 10:00:00")
+        ColumnarExporter(self.db, self.directory).export("study_sessions", now=self.now)
+        self.add_session(1, 1, 10, "2030-06-02 10:00:00")
+        os.environ["COLUMNAR_EXPORT_DIR"] = self.directory
+        try:
+            df = load_study_sessions(self.db, 1, datetime(2030, 4, 15))
+            self.assertEqual(sorted(df["duration_minutes"]), [10, 45])
+
+            with self.db.write_transaction() as conn:
+                conn.execute("UPDATE study_sessions SET study_date = '2030-05-01 10:00:00' WHERE id = ?",
+                             (session_id,))
+            df = load_study_sessions(self.db, 1, datetime(2030, 4, 15))
+            self.assertEqual(sorted(df["duration_minutes"]), [10, 30, 45])
+        finally:
+            del os.environ["COLUMNAR_EXPORT_DIR"]
+
+    def test_secondary_shard(self):
+        """採番範囲が 32 ビットを超える2つ目以降のシャードも書き出せるテスト"""
+        router = create_router(os.path.join(self.temp_dir.name, "directory.db"),
+                               os.path.join(self.temp_dir.name, "primary.db"))
+        try:
+            shard = router.database(router.create_shard("shard2", os.path.join(self.temp_dir.name, "shard2.db")))
+            with shard.write_transaction() as conn:
+                user_id = conn.execute(
+                    "INSERT INTO users (name, email, grade) VALUES ('user', 'user@example.com', 1)"
+                ).lastrowid
+                insert_study_session(conn, user_id, 1, 30, "学習", 4, datetime(2030, 5, 2, 10, 0))
+                insert_quiz_result(conn, user_id, 7, "a", True, 12, datetime(2030, 5, 2, 10, 5))
+            self.assertGreater(user_id, SHARD_ID_SPAN)
+
+            exporter = ColumnarExporter(shard, self.directory)
+            self.assertEqual(exporter.export("study_sessions", now=self.now)["rows"], 1)
+            self.assertEqual(exporter.export("quiz_results", now=self.now)["rows"], 1)
+            df = read_export(self.directory, "study_sessions", user_id=user_id)
+            self.assertEqual(df[["user_id", "duration_minutes"]].values.tolist(), [[user_id, 30]])
+            self.assertEqual(read_export(self.directory, "quiz_results", user_id=user_id)["user_id"].tolist(),
+                             [user_id])
+        finally:
+            router.close()
+
+if __name__ == '__main__':
+    unittest.main()
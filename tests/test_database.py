@@ -5,12 +5,15 @@
 import unittest
 import tempfile
 import os
+import sqlite3
 import sys
+import threading
 
 # プロジェクトルートをパスに追加
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.controllers.database import DatabaseController
+from src.controllers.database import AnalyticsPoolTimeout, DatabaseController, ReadOnlyPool
+from src.controllers.queries import insert_study_session
 
 class TestDatabaseController(unittest.TestCase):
     """データベースコントローラーのテストクラス"""
@@ -26,8 +29,11 @@ class TestDatabaseController(unittest.TestCase):
     
     def tearDown(self):
         """テスト後のクリーンアップ"""
-        if os.path.exists(self.test_db_path):
-            os.unlink(self.test_db_path)
+        self.db.writer.close()
+        self.db.analytics.close()
+        for path in (self.test_db_path, f"{self.test_db_path}-wal", f"{self.test_db_path}-shm"):
+            if os.path.exists(path):
+                os.unlink(path)
     
     def test_table_creation(self):
         """テーブル作成のテスト"""
@@ -66,5 +72,106 @@ class TestDatabaseController(unittest.TestCase):
             for category in expected_categories:
                 self.assertIn(category, categories, f"カテゴリ '{category}' が見つかりません")
 
+    def test_concurrent_writes(self):
+        """同時書き込みが失敗せずに直列化されるかのテスト"""
+        # 別プロセスを想定した、書き込み接続を共有しないコントローラー
+        other = DatabaseController(self.test_db_path)
+        errors = []
+        
+        def write(db):
+            try:
+                for _ in range(20):
+                    with db.write_transaction() as conn:
+                        insert_study_session(conn, 1, 1, 10, None, None)
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=write, args=(db,)) for db in (self.db, self.db, other, other)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(errors, [])
+        with self.db.get_connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM study_sessions").fetchone()[0], 80)
+        self.assertGreaterEqual(self.db.writer.stats()["transactions"], 40)
+        other.writer.close()
+    
+    def test_write_rollback(self):
+        """例外時にロールバックされるかのテスト"""
+        with self.assertRaises(ValueError):
+            with self.db.write_transaction() as conn:
+                insert_study_session(conn, 1, 1, 10, None, None)
+                raise ValueError("中断")
+        
+        with self.db.get_connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM study_sessions").fetchone()[0], 0)
+
+    def test_analytics_snapshot(self):
+        """分析用接続が読み取り専用で、ページ全体で同じスナップショットを読むかのテスト"""
+        with self.db.analytics_snapshot() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM study_sessions").fetchone()[0], 0)
+            with self.assertRaises(sqlite3.OperationalError):
+                conn.execute("DELETE FROM subjects")
+            
+            # 途中でコミットされた書き込みは同じスナップショットからは見えない
+            with self.db.write_transaction() as writer:
+                insert_study_session(writer, 1, 1, 10, None, None)
+            with self.db.analytics_snapshot() as nested:
+                self.assertIs(nested, conn)
+                self.assertEqual(nested.execute("SELECT COUNT(*) FROM study_sessions").fetchone()[0], 0)
+        
+        with self.db.analytics_snapshot() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM study_sessions").fetchone()[0], 1)
+        stats = self.db.analytics.stats()
+        self.assertEqual((stats["snapshots"], stats["in_use"], stats["idle"]), (2, 0, 1))
+    
+    def test_analytics_pool_limit(self):
+        """上限に達した分析用接続の空き待ちがタイムアウトするかのテスト"""
+        pool = ReadOnlyPool(self.test_db_path, max_size=1, timeout=0.05)
+        holding = threading.Event()
+        release = threading.Event()
+        
+        def hold():
+            with pool.snapshot():
+                holding.set()
+                release.wait(5)
+        
+        thread = threading.Thread(target=hold)
+        thread.start()
+        holding.wait(5)
+        with self.assertRaises(AnalyticsPoolTimeout):
+            with pool.snapshot():
+                pass
+        release.set()
+        thread.join()
+        
+        with pool.snapshot() as conn:
+            conn.execute("SELECT 1").fetchone()
+        self.assertEqual(pool.stats()["timeouts"], 1)
+        pool.close()
+    
+    def test_outdated_triggers_replaced(self):
+        """既存のデータベースの古い定義のトリガーが開き直すと作り直されるテスト"""
+        names = ["trg_study_sessions_insert_change", "trg_study_sessions_insert_event"]
+        with self.db.get_connection() as conn:
+            current = {name: conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)
+            ).fetchone()[0] for name in names}
+            for name in names:
+                conn.execute(f"DROP TRIGGER {name}")
+                conn.execute(f"CREATE TRIGGER {name} AFTER INSERT ON study_sessions BEGIN SELECT 1; END")
+        
+        reopened = DatabaseController(self.test_db_path)
+        reopened.writer.close()
+        reopened.analytics.close()
+        with self.db.get_connection() as conn:
+            for name in names:
+                sql = conn.execute(
+                    "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)
+                ).fetchone()[0]
+                self.assertEqual(sql.split(), current[name].split(), name)
+
 if __name__ == '__main__':
     unittest.main()
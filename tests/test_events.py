@@ -0,0 +1,153 @@
+"""
+学習イベントストアのテスト
+"""
+
+import unittest
+import tempfile
+import os
+import sys
+import threading
+from datetime import date, datetime
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import DatabaseController
+from src.controllers.events import EventStore, QuizBoxes, StudyRollup
+from src.controllers.queries import insert_quiz_result, insert_study_session
+from src.controllers.retention import RetentionEngine
+
+class TestEventStore(unittest.TestCase):
+    """イベントの追記・圧縮・再生のテストクラス"""
+
+    def setUp(self):
+        """テスト前の準備"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseController(os.path.join(self.temp_dir.name, "test.db"))
+        self.store = EventStore(self.db, os.path.join(self.temp_dir.name, "events"), segment_bytes=512)
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        self.db.writer.close()
+        self.db.analytics.close()
+        self.temp_dir.cleanup()
+
+    def add_session(self, user_id: int, subject_id: int, minutes: int, day: str) -> int:
+        """学習記録を追加"""
+        with self.db.write_transaction() as conn:
+            return insert_study_session(conn, user_id, subject_id, minutes, "学習", 4,
+                                        datetime.fromisoformat(f"{day} 10:00:00"))
+
+    def test_flush_appends_segments(self):
+        """送信待ちのイベントがセグメントに順に追記されるテスト"""
+        for day in range(1, 9):
+            self.add_session(1, 1, 30, f"2030-04-0{day}")
+        self.assertEqual(self.store.flush(batch_size=3), 8)
+        self.assertGreater(len(self.store.segments()), 1)
+        with self.db.get_connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM event_outbox").fetchone()[0], 0)
+
+        events = list(self.store.read())
+        self.assertEqual([e["seq"] for e in events], sorted(e["seq"] for e in events))
+        self.assertEqual({e["type"] for e in events}, {"study_sessions.insert"})
+        self.assertEqual([e["seq"] for e in self.store.read(events[5]["seq"])], [e["seq"] for e in events[6:]])
+
+        # 開き直しても続きの seq から追記し、同じイベントを重複して書かない
+        reopened = EventStore(self.db, self.store.directory, segment_bytes=512)
+        self.assertEqual(reopened.last_seq, events[-1]["seq"])
+        self.assertEqual(reopened.flush(), 0)
+
+    def test_concurrent_flush(self):
+        """別々のストア（別プロセスの cron とワーカーに相当）が同時に追記しても重複しないテスト"""
+        with self.db.write_transaction() as conn:
+            for _ in range(200):
+                insert_study_session(conn, 1, 1, 30, "学習", 4, datetime(2030, 1, 1, 10, 0))
+        stores = [self.store, EventStore(self.db, self.store.directory, segment_bytes=512)]
+        threads = [threading.Thread(target=store.flush, kwargs={"batch_size": 7}) for store in stores * 2]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        seqs = [event["seq"] for event in self.store.read()]
+        self.assertEqual(len(seqs), 200)
+        self.assertEqual(seqs, sorted(set(seqs)))
+
+    def test_compact_and_replay(self):
+        """スナップショットと以降のイベントの再生が最初からの再生と一致するテスト"""
+        rollup = StudyRollup()
+        session_id = self.add_session(1, 1, 30, "2030-04-01")
+        self.add_session(1, 2, 45, "2030-04-02")
+        self.add_session(2, 1, 10, "2030-04-02")
+        self.assertEqual(self.store.compact(rollup)["users"], 2)
+
+        with self.db.write_transaction() as conn:
+            conn.execute("UPDATE study_sessions SET duration_minutes = 60 WHERE id = ?", (session_id,))
+        self.add_session(1, 1, 20, "2030-04-03")
+        self.store.flush()
+
+        state = self.store.replay(rollup, 1)
+        self.assertEqual(state["minutes"], 125)
+        self.assertEqual(state["subjects"], {"1": 80, "2": 45})
+        self.assertEqual(StudyRollup.streaks(state, date(2030, 4, 4)), {"current": 3, "longest": 3})
+
+        with self.db.get_connection() as conn:
+            snapshot_seq = conn.execute(
+                "SELECT seq FROM event_snapshots WHERE projection = ? AND user_id = 1", (rollup.name,)
+            ).fetchone()[0]
+        self.assertEqual(len(list(self.store.read(snapshot_seq, 1))), 2)
+        self.assertEqual(self.store.replay(rollup, 1, until=datetime(2999, 1, 1)), state)
+
+        with self.db.write_transaction() as conn:
+            conn.execute("DELETE FROM study_sessions WHERE user_id = 2")
+        self.store.compact(rollup)
+        self.assertEqual(self.store.replay(rollup, 2)["sessions"], 0)
+        self.assertEqual(self.store.replay(rollup, 3), rollup.initial())
+
+    def test_archive_keeps_rollup(self):
+        """保存期間管理のアーカイブでは学習時間の累計と連続日数が減らないテスト"""
+        rollup = StudyRollup()
+        self.add_session(1, 1, 30, "2030-04-01")
+        self.add_session(1, 1, 40, "2030-04-02")
+        self.add_session(1, 2, 50, "2031-04-01")
+        self.store.compact(rollup)
+        before = self.store.replay(rollup, 1)
+
+        engine = RetentionEngine(self.db, os.path.join(self.temp_dir.name, "archive"), pause_seconds=0)
+        self.assertEqual(engine.archive("study_sessions", datetime(2031, 1, 1)), 2)
+        self.store.flush()
+        self.assertEqual(self.store.replay(rollup, 1), before)
+        self.assertEqual([event["type"] for event in self.store.read()][-2:], ["study_sessions.archive"] * 2)
+
+        # 利用者による削除は累計から除く
+        with self.db.write_transaction() as conn:
+            conn.execute("DELETE FROM study_sessions WHERE user_id = 1")
+        self.store.compact(rollup)
+        self.assertEqual(self.store.replay(rollup, 1)["minutes"], 70)
+
+    def test_backfill_uses_row_dates(self):
+        """イベントストア導入前の行が行自身の日時のイベントとして登録されるテスト"""
+        self.add_session(1, 1, 30, "2030-04-01")
+        with self.db.write_transaction() as conn:
+            conn.execute("DROP TABLE event_outbox")
+        migrated = DatabaseController(self.db.db_path)
+        try:
+            store = EventStore(migrated, os.path.join(self.temp_dir.name, "migrated"))
+            store.flush()
+            events = list(store.read())
+        finally:
+            migrated.writer.close()
+            migrated.analytics.close()
+        self.assertEqual([event["at"] for event in events], ["2030-04-01 10:00:00"])
+
+    def test_quiz_boxes(self):
+        """クイズの正誤で復習間隔の箱が進む・戻るテスト"""
+        with self.db.write_transaction() as conn:
+            for correct, day in ((True, 1), (True, 2), (False, 3), (True, 4)):
+                insert_quiz_result(conn, 1, 7, "a", correct, 10, datetime(2030, 4, day, 9, 0))
+        self.store.flush()
+        state = self.store.replay(QuizBoxes(), 1)
+        self.assertEqual(state["7"], {"box": 2, "attempts": 4, "due": "2030-04-06"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+学習カレンダー（ヒートマップ）のテスト
+"""
+
+import unittest
+import tempfile
+import os
+import sys
+from datetime import date, datetime
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.cache import VersionedCache
+from src.controllers.database import DatabaseController, study_sessions_scope
+from src.controllers.heatmap import heatmap_period, load_study_heatmap, render_heatmap_svg
+from src.controllers.queries import insert_quiz_result, insert_study_session
+
+class TestHeatmap(unittest.TestCase):
+    """日ごと・教科ごとの集計と SVG の作成のテストクラス"""
+
+    def setUp(self):
+        """テスト前の準備"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseController(os.path.join(self.temp_dir.name, "test.db"))
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        self.db.writer.close()
+        self.db.analytics.close()
+        self.temp_dir.cleanup()
+
+    def test_period(self):
+        """期間が日曜日に始まり、今日を含む53週になるテスト"""
+        start, end = heatmap_period(date(2030, 4, 3))
+        self.assertEqual(start.weekday(), 6)
+        self.assertEqual(end, date(2030, 4, 4))
+        self.assertEqual(((end - start).days + 6) // 7, 53)
+
+    def test_load_and_render(self):
+        """範囲内の学習記録だけを日ごと・教科ごとに集計し、SVG に描画するテスト"""
+        today = date(2030, 4, 3)
+        start, end = heatmap_period(today)
+        with self.db.write_transaction() as conn:
+            insert_study_session(conn, 1, 1, 30, "朝", 3, datetime(2030, 4, 3, 7, 0))
+            insert_study_session(conn, 1, 2, 45, "夜", 3, datetime(2030, 4, 3, 21, 30))
+            insert_study_session(conn, 1, 1, 90, "初日", 3, datetime.combine(start, datetime.min.time()))
+            insert_study_session(conn, 1, 1, 60, "範囲外", 3, datetime(2029, 1, 1, 9, 0))
+            insert_study_session(conn, 1, 1, 60, "明日", 3, datetime(2030, 4, 4, 9, 0))
+            insert_study_session(conn, 2, 1, 60, "別の利用者", 3, datetime(2030, 4, 3, 9, 0))
+
+        with self.db.get_connection() as conn:
+            heatmap = load_study_heatmap(conn, 1, today)
+        days = (end - start).days
+        self.assertEqual(len(heatmap.total), days)
+        self.assertEqual(heatmap.total[-1], 75)
+        self.assertEqual(heatmap.total[0], 90)
+        self.assertEqual(heatmap.total.sum(), 165)
+        self.assertEqual(heatmap.subjects(), [1, 2])
+        self.assertEqual((heatmap.minutes(1)[-1], heatmap.minutes(2)[-1], heatmap.minutes(3).sum()), (30, 45, 0))
+
+        svg = render_heatmap_svg(heatmap)
+        self.assertTrue(svg.startswith("<svg"))
+        self.assertEqual(svg.count("<rect"), days)
+        self.assertIn("<title>2030-04-03: 75分</title>", svg)
+        self.assertIn("<title>2030-04-03: 45分</title>", render_heatmap_svg(heatmap, 2))
+
+        with self.db.get_connection() as conn:
+            empty = load_study_heatmap(conn, 3, today)
+        self.assertEqual((empty.total.sum(), empty.subjects()), (0, []))
+
+    def test_cache_scope(self):
+        """学習カレンダーのキャッシュが学習記録の変更でだけ読み込み直されるテスト"""
+        cache = VersionedCache(db=self.db)
+        today = date(2030, 4, 3)
+        loads = []
+
+        def load():
+            loads.append(today)
+            with self.db.get_connection() as conn:
+                return load_study_heatmap(conn, 1, today)
+
+        get = lambda: cache.get_or_load(study_sessions_scope(1), ("study_heatmap", today), load)
+        get()
+        with self.db.write_transaction() as conn:
+            insert_quiz_result(conn, 1, 1, "a", True)
+            conn.execute("UPDATE users SET grade = grade WHERE id = 1")
+            insert_study_session(conn, 2, 1, 30, "別の利用者", 3, datetime(2030, 4, 3, 9, 0))
+        self.assertEqual(get().total.sum(), 0)
+        self.assertEqual(len(loads), 1)
+
+        with self.db.write_transaction() as conn:
+            insert_study_session(conn, 1, 1, 30, "朝", 3, datetime(2030, 4, 3, 7, 0))
+        self.assertEqual(get().total.sum(), 30)
+        self.assertEqual(len(loads), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+"""
+クイズの問題分析のテスト
+"""
+
+import unittest
+import tempfile
+import json
+import os
+import sys
+from datetime import datetime
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import DatabaseController
+from src.controllers.item_analysis import item_analysis, item_flag
+from src.controllers.queries import insert_quiz_result
+from src.controllers.retention import RetentionEngine
+
+class TestItemAnalysis(unittest.TestCase):
+    """問題ごとの集計の更新と分析の並べ替え・ページ分けのテストクラス"""
+
+    def setUp(self):
+        """テスト前の準備"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.databases = [DatabaseController(os.path.join(self.temp_dir.name, f"{name}.db"))
+                          for name in ("primary", "shard")]
+        for db in self.databases:
+            with db.write_transaction() as conn:
+                self.subject_id = conn.execute("SELECT MIN(id) FROM subjects").fetchone()[0]
+                conn.execute("""
+                    INSERT INTO quizzes (id, subject_id, title, question, options, correct_answer, difficulty)
+                    VALUES (1001, ?, '選択式', '?', ?, 'A', 2),
+                           (1002, ?, '記述式', '?', NULL, 'x', 3),
+                           (1003, ?, '壊れた選択肢', '?', '[壊れた', 'A', 1),
+                           (1004, ?, '未回答', '?', NULL, 'y', 4)
+                """, (self.subject_id, json.dumps(["A", "B", "C"]), self.subject_id, self.subject_id,
+                      self.subject_id))
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        for db in self.databases:
+            db.writer.close()
+            db.analytics.close()
+        self.temp_dir.cleanup()
+
+    def stats(self, db):
+        """問題ごとの集計と選択肢ごとの回答数"""
+        with db.get_connection() as conn:
+            return (conn.execute("SELECT * FROM quiz_item_stats ORDER BY quiz_id").fetchall(),
+                    conn.execute("SELECT * FROM quiz_option_counts ORDER BY quiz_id, answer").fetchall())
+
+    def test_triggers_and_backfill(self):
+        """追加・更新・削除で集計が増減し、既存の結果から作り直しても一致するテスト"""
+        db = self.databases[0]
+        with db.write_transaction() as conn:
+            insert_quiz_result(conn, 1, 1001, "A", True, 10)
+            insert_quiz_result(conn, 1, 1001, "B", False, None)
+            insert_quiz_result(conn, 2, 1001, "Z", False, 20)
+            insert_quiz_result(conn, 1, 1002, "x", True, 5)
+            insert_quiz_result(conn, 1, 1003, "A", True, 7)
+        self.assertEqual(self.stats(db), (
+            [(1001, 3, 1, 2, 30), (1002, 1, 1, 1, 5), (1003, 1, 1, 1, 7)],
+            [(1001, "A", 1), (1001, "B", 1)],
+        ))
+
+        with db.write_transaction() as conn:
+            conn.execute("UPDATE quiz_results SET user_answer = 'C', time_taken_seconds = 4 WHERE user_answer = 'B'")
+            conn.execute("DELETE FROM quiz_results WHERE user_answer = 'Z'")
+        expected = ([(1001, 2, 1, 2, 14), (1002, 1, 1, 1, 5), (1003, 1, 1, 1, 7)],
+                    [(1001, "A", 1), (1001, "B", 0), (1001, "C", 1)])
+        self.assertEqual(self.stats(db), expected)
+
+        with db.write_transaction() as conn:
+            conn.execute("DELETE FROM quiz_item_stats")
+            conn.execute("DELETE FROM quiz_option_counts")
+            db.backfill_item_stats(conn.cursor())
+        self.assertEqual(self.stats(db), (expected[0], [row for row in expected[1] if row[2]]))
+
+    def test_archive_keeps_stats(self):
+        """保存期間管理のアーカイブでは集計が減らず、既存のトリガーも作り直されるテスト"""
+        db = self.databases[0]
+        with db.write_transaction() as conn:
+            # 印を参照しない以前の定義のトリガー
+            conn.execute("DROP TRIGGER trg_quiz_results_delete_item_stats")
+            conn.execute("""
+                CREATE TRIGGER trg_quiz_results_delete_item_stats AFTER DELETE ON quiz_results
+                BEGIN
+                    UPDATE quiz_item_stats SET attempts = attempts - 1 WHERE quiz_id = OLD.quiz_id;
+                END
+            """)
+        db = DatabaseController(db.db_path)
+        with db.write_transaction() as conn:
+            insert_quiz_result(conn, 1, 1001, "A", True, 10, datetime(2020, 1, 1, 9, 0))
+            insert_quiz_result(conn, 1, 1001, "B", False, 20, datetime(2030, 1, 1, 9, 0))
+        before = self.stats(db)
+
+        engine = RetentionEngine(db, os.path.join(self.temp_dir.name, "archive"), pause_seconds=0)
+        self.assertEqual(engine.archive("quiz_results", datetime(2025, 1, 1)), 1)
+        self.assertEqual(self.stats(db), before)
+        with db.write_transaction() as conn:
+            self.assertIsNone(conn.execute("SELECT 1 FROM retention_archiving").fetchone())
+            conn.execute("DELETE FROM quiz_results")
+        self.assertEqual(self.stats(db)[0], [(1001, 1, 1, 1, 10)])
+        db.writer.close()
+        db.analytics.close()
+
+    def test_sort_and_pages(self):
+        """並べ替え・ページ分けと、シャードの集計を足し合わせた結果が一致するテスト"""
+        for db, answers in zip(self.databases, (["A"] * 6 + ["B"] * 2, ["B"] * 6)):
+            with db.write_transaction() as conn:
+                for answer in answers:
+                    insert_quiz_result(conn, 1, 1001, answer, answer == "A", 3)
+                insert_quiz_result(conn, 1, 1002, "x", True, 30)
+
+        single = self.databases[:1]
+        items, total = item_analysis(single, self.subject_id, "正答率", page_size=2)
+        self.assertEqual(total, 4)
+        self.assertEqual([item.quiz_id for item, _ in items], [1001, 1002])
+        items, _ = item_analysis(single, self.subject_id, "正答率", page=2, page_size=2)
+        # 回答のない問題は最後に並ぶ
+        self.assertEqual([item.quiz_id for item, _ in items], [1003, 1004])
+        items, _ = item_analysis(single, self.subject_id, "平均回答時間", descending=True, page_size=3)
+        self.assertEqual([item.quiz_id for item, _ in items], [1002, 1001, 1004])
+        self.assertEqual(items[1][1], {"A": 6, "B": 2})
+
+        merged, total = item_analysis(self.databases, self.subject_id, "正答率", page_size=2)
+        self.assertEqual(total, 4)
+        self.assertEqual([(item.quiz_id, item.attempts, item.correct) for item, _ in merged],
+                         [(1001, 14, 6), (1002, 2, 2)])
+        self.assertEqual(merged[0][1], {"A": 6, "B": 8})
+        # 誤答の選択肢が正解より多く選ばれている
+        self.assertEqual(item_flag(*merged[0]), "誤答が最多（正解の確認）")
+        self.assertIsNone(item_flag(*merged[1]))
+
+        with self.assertRaises(ValueError):
+            item_analysis(single, self.subject_id, "不明")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+メモリ計測のテスト
+"""
+
+import unittest
+import os
+import sys
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import pandas as pd
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.memory import MemoryMonitor, estimate_size, open_figure_count
+
+class TestMemoryMonitor(unittest.TestCase):
+    """メモリ計測のテストクラス"""
+
+    def test_estimate_size(self):
+        """参照先・DataFrameを含めたサイズ推定のテスト"""
+        df = pd.DataFrame({"minutes": range(10000)})
+        shared = "x" * 10000
+        state = {"df": df, "a": shared, "b": shared}
+        size = estimate_size(state)
+        self.assertGreaterEqual(size, df.memory_usage(deep=True).sum() + len(shared))
+        self.assertLess(size, df.memory_usage(deep=True).sum() + 2 * len(shared))
+
+    def test_open_figure_count(self):
+        """閉じていない図の数のテスト"""
+        before = open_figure_count()
+        fig, _ = plt.subplots()
+        self.assertEqual(open_figure_count(), before + 1)
+        plt.close(fig)
+        self.assertEqual(open_figure_count(), before)
+
+    def test_sample_reports_growth_and_alert(self):
+        """スナップショット間の増加と、しきい値超過の警告のテスト"""
+        monitor = MemoryMonitor(interval=3600, alert_mb=1024 * 1024)
+        monitor.start()
+        try:
+            monitor.take_sample()
+            self.assertFalse(monitor.alerting)
+            retained = [bytearray(1024) for _ in range(2000)]
+            monitor.alert_bytes = 0
+            with self.assertLogs("ready_to_study.memory", level="WARNING") as logs:
+                sample = monitor.take_sample()
+            self.assertEqual(len(logs.output), 1)
+            self.assertTrue(monitor.alerting)
+            self.assertIn(__file__, sample["top_growth"][0]["location"])
+            self.assertGreaterEqual(sample["top_growth"][0]["growth_bytes"], 2000 * 1024)
+
+            # しきい値を超えたままなら警告は繰り返さない
+            with self.assertNoLogs("ready_to_study.memory", level="WARNING"):
+                monitor.take_sample()
+            self.assertIn("rts_memory_alert 1", monitor.render_prometheus())
+            del retained
+        finally:
+            monitor.stop()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+"""
+クエリ計測・スロークエリログ・サイドカー（メトリクス・死活監視）のテスト
+"""
+
+import unittest
+import tempfile
+import json
+import logging
+import os
+import sys
+import urllib.error
+import urllib.request
+from unittest import mock
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers import metrics, sidecar
+from src.controllers.database import DatabaseController
+from src.controllers.metrics import QueryMetrics, normalize_statement, statement_id
+
+class TestQueryMetrics(unittest.TestCase):
+    """クエリ計測のテストクラス"""
+
+    def setUp(self):
+        """テスト前の準備"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, "test.db")
+        self.log_path = os.path.join(self.temp_dir.name, "slow.log")
+        self.db = DatabaseController(self.db_path)
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        self.db.writer.close()
+        self.temp_dir.cleanup()
+
+    def use_metrics(self, threshold_ms):
+        """テスト用の計測インスタンスに差し替える"""
+        recorder = QueryMetrics(slow_threshold_ms=threshold_ms, slow_log_path=self.log_path)
+        patcher = mock.patch.object(metrics, "query_metrics", recorder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(recorder.close)
+        return recorder
+
+    def test_normalize_statement(self):
+        """SQLの正規化のテスト"""
+        self.assertEqual(
+            normalize_statement("SELECT *\n  FROM subjects\n WHERE id IN (?, ?,?)"),
+            "SELECT * FROM subjects WHERE id IN (?, ...)"
+        )
+
+    def test_records_rows_and_caller(self):
+        """取得行数と呼び出し元が記録されるかのテスト"""
+        recorder = self.use_metrics(threshold_ms=10000)
+        conn = self.db.get_connection()
+        rows = conn.execute("SELECT id FROM subjects WHERE grade_level = ?", (1,)).fetchall()
+        conn.close()
+
+        sql = "SELECT id FROM subjects WHERE grade_level = ?"
+        entry = next(item for item in recorder.snapshot() if item["sql"] == sql)
+        self.assertEqual(entry["count"], 1)
+        self.assertEqual(entry["rows"], len(rows))
+        self.assertEqual(entry["caller"], "tests.test_metrics:test_records_rows_and_caller")
+
+        text = "\n".join(recorder.render_prometheus())
+        self.assertIn(f'rts_db_query_duration_seconds_count{{statement="{statement_id(sql)}",'
+                      f'caller="tests.test_metrics:test_records_rows_and_caller"}} 1', text)
+        self.assertIn("rts_db_slow_queries_total 0", text)
+
+    def test_unfinished_cursor_is_recorded(self):
+        """最後まで取得しないカーソルも記録されるかのテスト"""
+        recorder = self.use_metrics(threshold_ms=10000)
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM subjects")
+        cursor.fetchone()
+        cursor.execute("SELECT COUNT(*) FROM subjects")
+        cursor.close()
+        conn.close()
+
+        counts = {item["sql"]: item for item in recorder.snapshot()}
+        self.assertEqual(counts["SELECT id FROM subjects"]["rows"], 1)
+        self.assertEqual(counts["SELECT COUNT(*) FROM subjects"]["count"], 1)
+
+    def test_slow_query_log_includes_plan(self):
+        """スロークエリログに実行計画が含まれるかのテスト"""
+        recorder = self.use_metrics(threshold_ms=0)
+        with self.db.write_transaction() as conn:
+            conn.execute(
+                "INSERT INTO study_sessions (user_id, subject_id, duration_minutes) VALUES (?, 1, 30)", (1,)
+            )
+        conn = self.db.get_connection()
+        conn.execute("SELECT * FROM study_sessions WHERE user_id = ?", (1,)).fetchall()
+        conn.close()
+        recorder.close()
+
+        with open(self.log_path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        select = next(r for r in records if r["sql"] == "SELECT * FROM study_sessions WHERE user_id = ?")
+        self.assertEqual(select["rows"], 1)
+        self.assertTrue(any("study_sessions" in step for step in select["plan"]))
+        self.assertGreater(recorder.slow_queries, 0)
+
+    def test_slow_query_log_needs_path(self):
+        """パスを指定しない場合はスロークエリログのファイルを作らないテスト"""
+        with mock.patch.dict(os.environ, {}, clear=False):
+            os.environ.pop("SLOW_QUERY_LOG", None)
+            recorder = QueryMetrics(slow_threshold_ms=0)
+        self.addCleanup(recorder.close)
+        self.assertIsNone(recorder.slow_log_path)
+        recorder.observe("SELECT 1", (), "test", 1.0, 1)
+        self.assertIsInstance(recorder._log_handler, logging.NullHandler)
+        self.assertEqual(recorder.slow_queries, 1)
+
+        with mock.patch.dict(os.environ, {"SLOW_QUERY_LOG": self.log_path}):
+            self.assertEqual(QueryMetrics().slow_log_path, self.log_path)
+
+    def test_sidecar_serves_metrics(self):
+        """サイドカーが /metrics を返すかのテスト"""
+        self.use_metrics(threshold_ms=10000)
+        server = sidecar.start_sidecar(port=0)
+        self.addCleanup(sidecar.stop_sidecar)
+        port = server.server_address[1]
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            body = response.read().decode("utf-8")
+            self.assertIn("text/plain", response.headers["Content-Type"])
+        self.assertIn("# TYPE rts_db_query_duration_seconds histogram", body)
+        self.assertIn("rts_cache_hits_total", body)
+
+    def test_sidecar_health_endpoints(self):
+        """/healthz と /readyz がDBの状態を返すかのテスト"""
+        server = sidecar.start_sidecar(port=0)
+        self.addCleanup(sidecar.stop_sidecar)
+        port = server.server_address[1]
+
+        with mock.patch("src.controllers.database.db_controller", self.db):
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=5) as response:
+                self.assertEqual(json.loads(response.read())["status"], "ok")
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/readyz", timeout=5) as response:
+                status = json.loads(response.read())
+            self.assertEqual(status["status"], "ready")
+            self.assertTrue(status["database"]["ok"])
+            self.assertEqual(status["writer"]["queue_depth"], 0)
+
+        with mock.patch("src.controllers.database.db_controller", None):
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/readyz", timeout=5)
+            self.assertEqual(context.exception.code, 503)
+
+    def test_readiness_reports_unreadable_database(self):
+        """DBを読み取れない場合に準備未完了になるかのテスト"""
+        broken = mock.Mock(db_path=os.path.join(self.temp_dir.name, "missing", "x.db"))
+        broken.writer.stats.return_value = self.db.writer.stats()
+        broken.analytics.stats.return_value = self.db.analytics.stats()
+        with mock.patch("src.controllers.database.db_controller", broken):
+            ready, status = sidecar.readiness_status()
+        self.assertFalse(ready)
+        self.assertEqual(status["status"], "unavailable")
+        self.assertIn("error", status["database"])
+
+if __name__ == '__main__':
+    unittest.main()
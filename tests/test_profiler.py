@@ -0,0 +1,72 @@
+"""
+再実行プロファイラーのテスト
+"""
+
+import unittest
+import tempfile
+import os
+import sys
+import time
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import DatabaseController
+from src.controllers.profiler import RerunProfiler, profile_phase, tag_rerun
+
+class TestRerunProfiler(unittest.TestCase):
+    """再実行プロファイラーのテストクラス"""
+
+    def test_nested_phases_are_exclusive(self):
+        """内側の区間とDB時間が外側の区間から除かれるかのテスト"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db = DatabaseController(os.path.join(temp_dir, "test.db"))
+            profiler = RerunProfiler()
+
+            with profiler.profile(session_id="session-1"):
+                tag_rerun("ダッシュボード")
+                with profile_phase("chart"):
+                    time.sleep(0.02)
+                    with profile_phase("widgets"):
+                        time.sleep(0.03)
+                with profile_phase("pandas"):
+                    conn = db.get_connection()
+                    conn.execute("SELECT COUNT(*) FROM subjects").fetchone()
+                    conn.close()
+            db.writer.close()
+
+        record = profiler.records()[0]
+        phases = record["phases_ms"]
+        self.assertEqual(record["page"], "ダッシュボード")
+        self.assertEqual(record["session"], "session-1")
+        self.assertEqual(record["queries"], 1)
+        self.assertGreaterEqual(phases["chart"], 15)
+        self.assertLess(phases["chart"], 40)
+        self.assertGreaterEqual(phases["widgets"], 25)
+        self.assertGreater(phases["db"], 0)
+        self.assertAlmostEqual(sum(phases.values()), record["total_ms"], delta=0.1)
+
+    def test_interrupted_rerun_is_recorded(self):
+        """例外で中断した再実行も記録されるかのテスト"""
+        profiler = RerunProfiler()
+        with self.assertRaises(RuntimeError):
+            with profiler.profile():
+                raise RuntimeError("rerun")
+        self.assertTrue(profiler.records()[0]["interrupted"])
+
+    def test_ring_buffer_is_bounded(self):
+        """上限を超えた古い記録が捨てられるかのテスト"""
+        profiler = RerunProfiler(capacity=3)
+        for page in ["a", "b", "c", "d"]:
+            with profiler.profile():
+                tag_rerun(page)
+        self.assertEqual([r["page"] for r in profiler.records()], ["b", "c", "d"])
+        self.assertEqual([row["page"] for row in profiler.summary()], ["b", "c", "d"])
+
+    def test_phase_outside_rerun_is_ignored(self):
+        """計測中でない区間は何もしないかのテスト"""
+        with profile_phase("chart"):
+            pass
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+"""
+クイズの連続出題セッションのテスト
+"""
+
+import unittest
+import tempfile
+import json
+import os
+import sys
+from datetime import datetime
+from unittest import mock
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import DatabaseController
+from src.controllers.queries import insert_quiz_result
+from src.controllers.quiz_session import QuizSession, choose_difficulty, load_accuracy, parse_options
+from src.controllers.retention import RetentionEngine
+
+class TestQuizSession(unittest.TestCase):
+    """まとめて取得した問題の出題と回答の書き込みのテストクラス"""
+
+    def setUp(self):
+        """テスト前の準備"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseController(os.path.join(self.temp_dir.name, "test.db"))
+        with self.db.write_transaction() as conn:
+            self.subject_id = conn.execute("SELECT MIN(id) FROM subjects").fetchone()[0]
+            for number in range(1, 5):
+                conn.execute("""
+                    INSERT INTO quizzes (subject_id, title, question, options, correct_answer, difficulty)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (self.subject_id, f"問題{number}", f"{number} + 1 は？",
+                      json.dumps([str(number + 1), "0"]) if number % 2 else None, str(number + 1), number))
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        self.db.writer.close()
+        self.db.analytics.close()
+        self.temp_dir.cleanup()
+
+    def quiz_results(self):
+        """保存されたクイズ結果"""
+        with self.db.get_connection() as conn:
+            return conn.execute(
+                "SELECT quiz_id, is_correct, time_taken_seconds FROM quiz_results ORDER BY id"
+            ).fetchall()
+
+    def test_parse_options(self):
+        """選択肢の JSON の読み込みテスト"""
+        self.assertEqual(parse_options('["a", "b"]'), ("a", "b"))
+        self.assertIsNone(parse_options(None))
+        self.assertIsNone(parse_options("壊れた値"))
+        self.assertIsNone(parse_options("[]"))
+
+    def test_session_batches_and_timing(self):
+        """1回の取得で出題し、回答時間を記録してまとめて書き込むテスト"""
+        session = QuizSession(1, self.subject_id, "混合", batch_size=3, flush_every=3)
+        clock = iter([100.0, 104.4, 200.0, 212.0])
+        with mock.patch("src.controllers.quiz_session.time.monotonic", lambda: next(clock)):
+            first = session.current(self.db)
+            self.assertIs(session.current(self.db), first)
+            result = session.answer(first, f" {first.correct_answer} ")
+            self.assertEqual((result["is_correct"], result["time_taken_seconds"]), (True, 4))
+            # 同じ問題への再度の回答は記録しない
+            self.assertIs(session.answer(first, "0"), result)
+            session.advance()
+
+            second = session.current(self.db)
+            self.assertNotEqual(second.id, first.id)
+            self.assertEqual(session.answer(second, "0")["time_taken_seconds"], 12)
+            session.advance()
+
+        self.assertFalse(session.should_flush())
+        self.assertEqual(self.quiz_results(), [])
+        self.assertTrue(session.flush(self.db))
+        self.assertEqual(self.quiz_results(), [(first.id, 1, 4), (second.id, 0, 12)])
+        self.assertEqual((session.answered, session.correct, session.pending), (2, 1, []))
+
+        # 手持ちの問題が尽きたら、直前に出題した問題を除いて次のまとまりを取得する
+        session.current(self.db)
+        session.advance()
+        refilled = session.current(self.db)
+        self.assertEqual(session.pools[None], [])
+        self.assertNotIn(refilled.id, [first.id, second.id])
+
+    def test_choose_difficulty(self):
+        """正答率の推定で難易度が上下するテスト"""
+        levels = (1, 2, 3, 4, 5)
+        self.assertEqual(choose_difficulty({}, levels), 2)
+        self.assertEqual(choose_difficulty({2: [10, 10]}, levels), 3)
+        self.assertEqual(choose_difficulty({2: [10, 10], 3: [10, 3]}, levels), 2)
+        self.assertEqual(choose_difficulty({1: [10, 2]}, levels), 1)
+        self.assertEqual(choose_difficulty({4: [5, 0]}, (4, 5)), 4)
+
+    def test_adaptive_session(self):
+        """正答数がトリガーで更新され、自動の難易度選択が回答に応じて変わるテスト"""
+        with self.db.write_transaction() as conn:
+            for number in range(20):
+                conn.execute("""
+                    INSERT INTO quizzes (subject_id, title, question, correct_answer, difficulty)
+                    VALUES (?, ?, '?', 'a', ?)
+                """, (self.subject_id, f"追加{number}", number % 3 + 2))
+            quiz_id = conn.execute(
+                "SELECT MIN(id) FROM quizzes WHERE subject_id = ? AND difficulty = 2", (self.subject_id,)
+            ).fetchone()[0]
+            for correct in (True, True, False):
+                insert_quiz_result(conn, 1, quiz_id, "a", correct)
+            self.assertEqual(load_accuracy(conn, 1, self.subject_id), {2: [3, 2]})
+            conn.execute("DELETE FROM quiz_results WHERE is_correct = 0")
+            self.assertEqual(load_accuracy(conn, 1, self.subject_id), {2: [2, 2]})
+
+        session = QuizSession(1, self.subject_id, "自動", batch_size=4, flush_every=100)
+        difficulties = []
+        for _ in range(12):
+            question = session.current(self.db)
+            difficulties.append(question.difficulty)
+            session.answer(question, question.correct_answer)
+            session.advance()
+        # 正解を重ねると難易度が上がり、難易度ごとの手持ちが尽きたときだけ取得する
+        self.assertEqual(difficulties[0], 2)
+        self.assertEqual(max(difficulties), 4)
+        self.assertEqual(difficulties, sorted(difficulties))
+
+        session.flush(self.db)
+        with self.db.get_connection() as conn:
+            accuracy = load_accuracy(conn, 1, self.subject_id)
+        self.assertEqual(accuracy, session.accuracy)
+
+    def test_accuracy_uses_difficulty_at_answer_time(self):
+        """問題の難易度を変えた後の削除は回答時点の難易度から減らし、アーカイブでは減らさないテスト"""
+        with self.db.write_transaction() as conn:
+            quiz_id = conn.execute("SELECT MIN(id) FROM quizzes WHERE difficulty = 2").fetchone()[0]
+            insert_quiz_result(conn, 1, quiz_id, "a", True, attempted_at=datetime(2020, 1, 1, 9, 0))
+            insert_quiz_result(conn, 1, quiz_id, "a", False)
+            conn.execute("UPDATE quizzes SET difficulty = 5 WHERE id = ?", (quiz_id,))
+            insert_quiz_result(conn, 1, quiz_id, "a", True)
+            self.assertEqual(load_accuracy(conn, 1, self.subject_id), {2: [2, 1], 5: [1, 1]})
+
+        engine = RetentionEngine(self.db, os.path.join(self.temp_dir.name, "archive"), pause_seconds=0)
+        self.assertEqual(engine.archive("quiz_results", datetime(2025, 1, 1)), 1)
+        with self.db.write_transaction() as conn:
+            self.assertEqual(load_accuracy(conn, 1, self.subject_id), {2: [2, 1], 5: [1, 1]})
+            conn.execute("DELETE FROM quiz_results WHERE is_correct = 0")
+            self.assertEqual(load_accuracy(conn, 1, self.subject_id), {2: [1, 1], 5: [1, 1]})
+
+if __name__ == '__main__':
+    unittest.main()
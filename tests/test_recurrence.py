@@ -0,0 +1,101 @@
+"""
+繰り返し予定のテスト
+"""
+
+import unittest
+import tempfile
+import os
+import sys
+from datetime import datetime
+
+from dateutil.rrule import rrulestr
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import DatabaseController
+from src.controllers.recurrence import (
+    parse_rrule, iter_occurrences, compute_range_end, create_rule,
+    set_occurrence_state, iter_schedule_items, OPEN_ENDED
+)
+
+class TestRecurrence(unittest.TestCase):
+    """繰り返し予定のテストクラス"""
+    
+    def setUp(self):
+        """テスト前の準備"""
+        self.test_db_file = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+        self.test_db_path = self.test_db_file.name
+        self.test_db_file.close()
+        
+        self.db = DatabaseController(self.test_db_path)
+    
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        if os.path.exists(self.test_db_path):
+            os.unlink(self.test_db_path)
+    
+    def test_unsupported_rule(self):
+        """サポート外のRRULEのテスト"""
+        with self.assertRaises(ValueError):
+            parse_rrule("FREQ=HOURLY")
+        with self.assertRaises(ValueError):
+            parse_rrule("FREQ=DAILY;BYSETPOS=1")
+    
+    def test_occurrences_in_window(self):
+        """期間内の各回のみ展開されるかのテスト"""
+        dtstart = datetime(2020, 1, 6, 9, 0)
+        occurrences = list(iter_occurrences(
+            "FREQ=WEEKLY;BYDAY=MO,WE", dtstart,
+            datetime(2026, 3, 2), datetime(2026, 3, 8, 23, 59)
+        ))
+        self.assertEqual(occurrences, [datetime(2026, 3, 2, 9, 0), datetime(2026, 3, 4, 9, 0)])
+    
+    def test_monthly_occurrences_match_full_expansion(self):
+        """毎月のルールを起点をずらして展開しても全展開と同じ各回になるかのテスト"""
+        window_start, window_end = datetime(2026, 2, 1), datetime(2026, 7, 31, 23, 59)
+        for rule_text, dtstart in [
+            ("FREQ=MONTHLY", datetime(2020, 1, 31, 9, 0)),
+            ("FREQ=MONTHLY;INTERVAL=5", datetime(2020, 3, 15, 18, 30)),
+            ("FREQ=MONTHLY;BYMONTHDAY=1,-1", datetime(2020, 1, 10, 7, 0)),
+            ("FREQ=MONTHLY;INTERVAL=2;BYDAY=1MO", datetime(2019, 11, 4, 9, 0)),
+            ("FREQ=MONTHLY;UNTIL=20260415T000000", datetime(2021, 6, 30, 9, 0)),
+        ]:
+            expected = rrulestr(rule_text, dtstart=dtstart).between(window_start, window_end, inc=True)
+            self.assertTrue(expected, rule_text)
+            self.assertEqual(list(iter_occurrences(rule_text, dtstart, window_start, window_end)), expected, rule_text)
+    
+    def test_range_end(self):
+        """最終回の計算のテスト"""
+        dtstart = datetime(2026, 1, 1, 9, 0)
+        self.assertEqual(compute_range_end("FREQ=DAILY;COUNT=3", dtstart), datetime(2026, 1, 3, 9, 0))
+        self.assertEqual(compute_range_end("FREQ=DAILY", dtstart), OPEN_ENDED)
+    
+    def test_schedule_items_with_exceptions(self):
+        """単発予定と繰り返し予定のマージと例外のテスト"""
+        with self.db.get_connection() as conn:
+            rule_id = create_rule(conn, 1, "単語テスト", None, "review", "FREQ=DAILY", datetime(2026, 1, 1, 7, 0))
+            create_rule(conn, 1, "終了済み", None, "review", "FREQ=DAILY;COUNT=2", datetime(2025, 1, 1, 7, 0))
+            conn.execute(
+                "INSERT INTO schedules (user_id, title, scheduled_date, event_type) VALUES (?, ?, ?, ?)",
+                (1, "定期テスト", datetime(2026, 2, 2, 12, 0), "test")
+            )
+            set_occurrence_state(conn, rule_id, datetime(2026, 2, 1, 7, 0), is_completed=True)
+            set_occurrence_state(conn, rule_id, datetime(2026, 2, 3, 7, 0), is_cancelled=True)
+            conn.commit()
+            
+            items = list(iter_schedule_items(conn, 1, datetime(2026, 2, 1), datetime(2026, 2, 3, 23, 59)))
+        
+        self.assertEqual(
+            [(item.title, item.scheduled_date) for item in items],
+            [
+                ("単語テスト", datetime(2026, 2, 1, 7, 0)),
+                ("単語テスト", datetime(2026, 2, 2, 7, 0)),
+                ("定期テスト", datetime(2026, 2, 2, 12, 0)),
+            ]
+        )
+        self.assertTrue(items[0].is_completed)
+        self.assertFalse(items[1].is_completed)
+
+if __name__ == '__main__':
+    unittest.main()
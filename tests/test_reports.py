@@ -0,0 +1,84 @@
+"""
+学習レポート一括作成のテスト
+"""
+
+import unittest
+import tempfile
+import json
+import os
+import sys
+from datetime import date, datetime
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import DatabaseController
+from src.controllers.queries import insert_quiz_result, insert_study_session
+from src.controllers.reports import ReportBatch, collect_report_data, report_period, study_advice
+
+class TestReports(unittest.TestCase):
+    """集計とレポートファイルの作成のテストクラス"""
+
+    def setUp(self):
+        """テスト前の準備"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseController(os.path.join(self.temp_dir.name, "test.db"))
+        with self.db.write_transaction() as conn:
+            for user_id, grade in ((1, 1), (2, 1), (3, 2)):
+                conn.execute("INSERT INTO users (id, name, email, grade) VALUES (?, ?, ?, ?)",
+                             (user_id, f"生徒{user_id}", f"user{user_id}@example.com", grade))
+            subject_id = conn.execute("SELECT MIN(id) FROM subjects").fetchone()[0]
+            insert_study_session(conn, 1, subject_id, 120, "問題集", 4, datetime(2030, 4, 2, 19, 0))
+            insert_study_session(conn, 1, subject_id, 60, "復習", 2, datetime(2030, 4, 3, 19, 0))
+            insert_study_session(conn, 2, subject_id, 30, "予習", 5, datetime(2030, 4, 4, 7, 0))
+            insert_study_session(conn, 2, subject_id, 90, "先週", 3, datetime(2030, 3, 31, 7, 0))
+            insert_quiz_result(conn, 1, 1, "a", True, 10, datetime(2030, 4, 2, 20, 0))
+            insert_quiz_result(conn, 1, 2, "b", False, 10, datetime(2030, 4, 2, 20, 5))
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        self.db.writer.close()
+        self.db.analytics.close()
+        self.temp_dir.cleanup()
+
+    def test_collect_report_data(self):
+        """期間内の集計と学年平均のテスト"""
+        start, end = report_period("weekly", date(2030, 4, 3))
+        self.assertEqual((start, end), (date(2030, 4, 1), date(2030, 4, 8)))
+        with self.db.get_connection() as conn:
+            users, shared = collect_report_data(conn, start, end)
+        by_id = {user["user_id"]: user for user in users}
+        self.assertEqual(by_id[1]["total_minutes"], 180)
+        self.assertEqual(by_id[1]["daily"], {"2030-04-02": 120, "2030-04-03": 60})
+        self.assertEqual((by_id[1]["quiz_attempts"], by_id[1]["quiz_correct"]), (2, 1))
+        self.assertEqual(by_id[2]["total_minutes"], 30)
+        self.assertEqual(by_id[2]["grade_average_minutes"], 105)
+        self.assertIsNone(by_id[3]["grade_average_minutes"])
+        self.assertEqual(len(shared["days"]), 7)
+        self.assertEqual(study_advice(11, 7)[0], "info")
+        self.assertEqual(study_advice(40, 30)[0], "warning")
+
+    def test_batch_is_resumable(self):
+        """ファイルとマニフェストを作成し、再実行では変わったユーザーだけ作り直すテスト"""
+        output_dir = os.path.join(self.temp_dir.name, "reports")
+        batch = ReportBatch(self.db, "weekly", date(2030, 4, 3), output_dir, workers=2, chunk_size=2)
+        self.assertEqual(batch.run()["generated"], 3)
+        with open(os.path.join(batch.directory, "user_1.html"), encoding="utf-8") as f:
+            content = f.read()
+        self.assertIn("生徒1", content)
+        self.assertIn("<svg", content)
+        with open(os.path.join(batch.directory, "user_1.pdf"), "rb") as f:
+            self.assertEqual(f.read(5), b"%PDF-")
+        with open(batch.manifest_path, encoding="utf-8") as f:
+            self.assertEqual(sorted(json.load(f)["users"]), ["1", "2", "3"])
+
+        self.assertEqual(batch.run()["skipped"], 3)
+        with self.db.write_transaction() as conn:
+            conn.execute("UPDATE study_sessions SET duration_minutes = 40 WHERE user_id = 2 AND content = '予習'")
+        os.remove(os.path.join(batch.directory, "user_3.pdf"))
+        result = batch.run()
+        # 学年平均が変わる生徒1・2と、ファイルがなくなった生徒3を作り直す
+        self.assertEqual((result["generated"], result["skipped"]), (3, 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+保存期間管理のテスト
+"""
+
+import unittest
+import tempfile
+import shutil
+import os
+import sys
+from datetime import datetime
+from unittest import mock
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import DatabaseController
+from src.controllers.retention import (
+    RetentionEngine, ArchiveReader, retention_cutoff, retention_months_from_env,
+    default_archive_directory
+)
+from src.controllers.sync import pull_changes
+
+class TestRetention(unittest.TestCase):
+    """保存期間管理のテストクラス"""
+    
+    def setUp(self):
+        """テスト前の準備"""
+        self.test_dir = tempfile.mkdtemp()
+        self.db = DatabaseController(os.path.join(self.test_dir, "study_app.db"))
+        self.archive_dir = os.path.join(self.test_dir, "archive")
+        
+        with self.db.get_connection() as conn:
+            conn.executemany("""
+                INSERT INTO study_sessions (user_id, subject_id, duration_minutes, content, study_date)
+                VALUES (?, ?, ?, ?, ?)
+            """, [
+                (1, 1, 30, "古い記録1", datetime(2024, 1, 10, 9, 0)),
+                (1, 2, 45, "古い記録2", datetime(2024, 1, 20, 9, 0)),
+                (1, 3, 60, "古い記録3", datetime(2024, 2, 5, 9, 0)),
+                (2, 1, 15, "他ユーザー", datetime(2024, 1, 10, 9, 0)),
+                (1, 1, 90, "新しい記録", datetime(2026, 5, 1, 9, 0)),
+            ])
+            conn.commit()
+    
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        shutil.rmtree(self.test_dir)
+    
+    def test_retention_cutoff(self):
+        """保存期間の境界日時のテスト"""
+        self.assertEqual(retention_cutoff(3, datetime(2026, 2, 15)), datetime(2025, 11, 1))
+    
+    def test_retention_months_from_env(self):
+        """環境変数の保存期間の検証のテスト"""
+        with mock.patch.dict(os.environ, {"RETENTION_MONTHS": "120"}):
+            self.assertEqual(retention_months_from_env(), 120)
+        with mock.patch.dict(os.environ, {"RETENTION_MONTHS": ""}):
+            self.assertEqual(retention_months_from_env(), 12)
+        for value in ("0", "-3", "一年"):
+            with mock.patch.dict(os.environ, {"RETENTION_MONTHS": value}):
+                with self.assertRaises(ValueError):
+                    retention_months_from_env()
+    
+    def test_default_archive_directory(self):
+        """アーカイブの既定の保存先がDBと同じ場所になるかのテスト"""
+        with mock.patch.dict(os.environ):
+            os.environ.pop("ARCHIVE_DIR", None)
+            engine = RetentionEngine(self.db, pause_seconds=0)
+        self.assertEqual(engine.archive_dir, self.archive_dir)
+        with mock.patch.dict(os.environ, {"ARCHIVE_DIR": "/srv/archive"}):
+            self.assertEqual(default_archive_directory(self.db.db_path), "/srv/archive")
+    
+    def test_archive_in_batches(self):
+        """バッチ単位のアーカイブと読み取りのテスト"""
+        engine = RetentionEngine(self.db, self.archive_dir, batch_size=1, pause_seconds=0)
+        moved = engine.archive("study_sessions", datetime(2025, 1, 1), user_id=1)
+        self.assertEqual(moved, 3)
+        
+        with self.db.get_connection() as conn:
+            remaining = [row[0] for row in conn.execute("SELECT content FROM study_sessions ORDER BY id")]
+        self.assertEqual(remaining, ["他ユーザー", "新しい記録"])
+        
+        reader = ArchiveReader(self.archive_dir)
+        self.assertEqual(reader.list_months("study_sessions", 1), ["2024-01", "2024-02"])
+        self.assertEqual(
+            [row["content"] for row in reader.iter_rows("study_sessions", 1, "2024-01", "2024-01")],
+            ["古い記録1", "古い記録2"]
+        )
+    
+    def test_archive_is_not_synced_as_delete(self):
+        """アーカイブした行がオフライン端末の同期で削除として届かないテスト"""
+        with self.db.get_connection() as conn:
+            synced = pull_changes(conn, 1)["cursor"]
+        
+        engine = RetentionEngine(self.db, self.archive_dir, batch_size=2, pause_seconds=0)
+        self.assertEqual(engine.archive("study_sessions", datetime(2025, 1, 1), user_id=1), 3)
+        with self.db.get_connection() as conn:
+            self.assertEqual(pull_changes(conn, 1, synced)["changes"], [])
+            changes = pull_changes(conn, 1)["changes"]
+        self.assertEqual([change["op"] for change in changes], ["upsert"])
+        self.assertEqual(changes[0]["data"]["content"], "新しい記録")
+        
+        # 利用者による削除は引き続き同期される
+        with self.db.write_transaction() as conn:
+            conn.execute("DELETE FROM study_sessions WHERE content = '新しい記録'")
+        with self.db.get_connection() as conn:
+            self.assertEqual([change["op"] for change in pull_changes(conn, 1, synced)["changes"]], ["delete"])
+    
+    def test_incremental_vacuum(self):
+        """インクリメンタルバキュームのテスト"""
+        engine = RetentionEngine(self.db, self.archive_dir, pause_seconds=0)
+        self.assertEqual(engine.auto_vacuum_mode(), 2)
+        
+        engine.archive("study_sessions", datetime(2027, 1, 1))
+        engine.incremental_vacuum()
+        with self.db.get_connection() as conn:
+            self.assertEqual(conn.execute("PRAGMA freelist_count").fetchone()[0], 0)
+
+if __name__ == '__main__':
+    unittest.main()
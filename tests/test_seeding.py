@@ -0,0 +1,135 @@
+"""
+テストデータ生成のテスト
+"""
+
+import unittest
+import tempfile
+import os
+import sys
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import DatabaseController
+from src.controllers.queries import insert_quiz_result, insert_study_session
+from src.controllers.seeding import SeedConfig, seed_database
+
+class TestSeeding(unittest.TestCase):
+    """テストデータ生成のテストクラス"""
+    
+    def setUp(self):
+        """テスト前の準備"""
+        self.test_dir = tempfile.mkdtemp()
+        self.db = DatabaseController(os.path.join(self.test_dir, "bench.db"))
+        self.config = SeedConfig(users=50, study_sessions=5000, quiz_results=2000,
+                                 quizzes_per_subject=3, schedules_per_user=2, chunk_size=1000)
+    
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        import shutil
+        self.db.writer.close()
+        shutil.rmtree(self.test_dir)
+    
+    def test_row_counts(self):
+        """指定した件数が投入されるかのテスト"""
+        result = seed_database(self.db, self.config)
+        
+        with self.db.get_connection() as conn:
+            counts = {
+                table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("users", "study_sessions", "quiz_results", "schedules")
+            }
+        self.assertEqual(counts, {"users": 50, "study_sessions": 5000, "quiz_results": 2000, "schedules": 100})
+        self.assertEqual(result["study_sessions"], 5000)
+    
+    def test_realistic_values(self):
+        """学年・時刻・回答が実際の利用に近い値になるかのテスト"""
+        seed_database(self.db, self.config)
+        
+        with self.db.get_connection() as conn:
+            # 学年より上の科目は学習しない
+            above_grade = conn.execute("""
+                SELECT COUNT(*) FROM study_sessions ss
+                JOIN users u ON ss.user_id = u.id
+                JOIN subjects s ON ss.subject_id = s.id
+                WHERE s.grade_level > u.grade
+            """).fetchone()[0]
+            self.assertEqual(above_grade, 0)
+            
+            # 深夜の学習は少ない
+            late_night = conn.execute(
+                "SELECT COUNT(*) FROM study_sessions WHERE strftime('%H', study_date) IN ('02', '03', '04')"
+            ).fetchone()[0]
+            self.assertLess(late_night, 5000 * 0.02)
+            
+            # 正解の回答は正解と一致する
+            mismatched = conn.execute("""
+                SELECT COUNT(*) FROM quiz_results qr JOIN quizzes q ON qr.quiz_id = q.id
+                WHERE qr.is_correct AND qr.user_answer != q.correct_answer
+            """).fetchone()[0]
+            self.assertEqual(mismatched, 0)
+            
+            # 予定の種類は画面の予定タイプと同じ値
+            event_types = {row[0] for row in conn.execute("SELECT DISTINCT event_type FROM schedules")}
+            self.assertLessEqual(event_types, {"test", "homework", "review", "mock_exam", "other"})
+    
+    def test_version_triggers_restored(self):
+        """投入後にバージョン更新トリガーが戻っているかのテスト"""
+        seed_database(self.db, self.config)
+        
+        before = self.db.get_data_version("user:1")
+        with self.db.write_transaction() as conn:
+            conn.execute("UPDATE users SET grade = 1 WHERE id = 1")
+        self.assertEqual(self.db.get_data_version("user:1"), before + 1)
+
+    def test_derived_data_backfilled(self):
+        """トリガーを外して投入した行が派生データにまとめて反映されるテスト"""
+        with self.db.write_transaction() as conn:
+            quiz_id = conn.execute(
+                "INSERT INTO quizzes (subject_id, title, question, correct_answer) VALUES (1, '既存', '?', 'a')"
+            ).lastrowid
+            insert_study_session(conn, 1, 1, 30, "既存", 3)
+            existing_result = insert_quiz_result(conn, 1, quiz_id, "a", True, 10)
+        before = self.db.get_data_version("user:1")
+        seed_database(self.db, self.config)
+        
+        with self.db.get_connection() as conn:
+            for table in ("users", "study_sessions", "quiz_results", "schedules"):
+                rows, logged = conn.execute(f"""
+                    SELECT (SELECT COUNT(*) FROM {table}),
+                           (SELECT COUNT(DISTINCT row_id) FROM change_log WHERE table_name = '{table}')
+                """).fetchone()
+                self.assertEqual(logged, rows, table)
+            events = conn.execute(
+                "SELECT COUNT(*) FROM event_outbox WHERE type = 'quiz_results.insert'"
+            ).fetchone()[0]
+            self.assertEqual(events, 2001)
+            # 投入した行のイベントの発生日時は登録した時刻ではなく回答日時
+            misdated = conn.execute("""
+                SELECT COUNT(*) FROM event_outbox e JOIN quiz_results qr
+                    ON qr.id = json_extract(e.payload, '$.id')
+                WHERE e.type = 'quiz_results.insert' AND qr.id > ?
+                  AND e.occurred_at != datetime(qr.attempted_at)
+            """, (existing_result,)).fetchone()[0]
+            self.assertEqual(misdated, 0)
+            accuracy = conn.execute(
+                "SELECT user_id, subject_id, difficulty, attempts, correct FROM quiz_accuracy ORDER BY 1, 2, 3"
+            ).fetchall()
+            expected = conn.execute("""
+                SELECT qr.user_id, q.subject_id, COALESCE(qr.difficulty, q.difficulty, 1), COUNT(*),
+                       SUM(qr.is_correct != 0)
+                FROM quiz_results AS qr JOIN quizzes AS q ON q.id = qr.quiz_id
+                GROUP BY 1, 2, 3 ORDER BY 1, 2, 3
+            """).fetchall()
+            self.assertEqual(accuracy, expected)
+            item_stats = conn.execute("SELECT quiz_id, attempts FROM quiz_item_stats ORDER BY quiz_id").fetchall()
+            expected = conn.execute(
+                "SELECT quiz_id, COUNT(*) FROM quiz_results GROUP BY quiz_id ORDER BY quiz_id"
+            ).fetchall()
+            self.assertEqual(item_stats, expected)
+            seeded_user = conn.execute("SELECT MAX(user_id) FROM study_sessions").fetchone()[0]
+        self.assertGreater(self.db.get_data_version(f"user:{seeded_user}"), 0)
+        self.assertGreaterEqual(self.db.get_data_version("user:1"), before)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+"""
+テナント単位のシャーディングのテスト
+"""
+
+import unittest
+import tempfile
+import os
+import sys
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import study_sessions_scope, user_scope
+from src.controllers.queries import insert_quiz_result, insert_schedule, insert_study_session
+from src.controllers.sharding import SHARD_ID_SPAN, TenantMovingError, create_router
+
+class TestShardRouter(unittest.TestCase):
+    """シャードへの振り分け・並行問い合わせ・テナント移動のテストクラス"""
+
+    def setUp(self):
+        """テスト前の準備"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        path = lambda name: os.path.join(self.temp_dir.name, name)
+        self.router = create_router(path("directory.db"), path("primary.db"))
+        self.router.refresh_interval = 0
+        self.router.create_shard("shard2", path("shard2.db"))
+        self.directory = self.router.directory
+        self.directory.add_tenant("school-a", "primary")
+        self.directory.add_tenant("range-1", "shard2", 1000, 1999)
+        self.directory.assign_users("school-a", [1, 2])
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        self.router.close()
+        self.temp_dir.cleanup()
+
+    def add_user(self, user_id: int, sessions: int = 3):
+        """ユーザーと学習記録を所属シャードに作成"""
+        with self.router.database_for_user(user_id).write_transaction() as conn:
+            conn.execute(
+                "INSERT INTO users (id, name, email, grade) VALUES (?, ?, ?, 1)",
+                (user_id, f"user{user_id}", f"user{user_id}@example.com")
+            )
+            for _ in range(sessions):
+                insert_study_session(conn, user_id, 1, 30, "学習", 4)
+
+    def test_routing(self):
+        """所属・範囲・既定のシャードへの振り分けのテスト"""
+        routes = self.router.routes()
+        self.assertEqual(routes.shard_for(1).name, "primary")
+        self.assertEqual(routes.shard_for(1500).name, "shard2")
+        self.assertEqual(routes.shard_for(2000).name, "primary")
+        self.assertEqual(routes.tenant_for(1).id, "school-a")
+        self.assertIsNone(routes.tenant_for(5))
+        with self.assertRaises(ValueError):
+            self.directory.add_tenant("range-2", "shard2", 1900, 2500)
+
+    def test_reference_data_and_id_ranges(self):
+        """参照用データの複製とシャードごとの採番範囲のテスト"""
+        self.add_user(1500)
+        shard2 = self.router.database_for_user(1500)
+        with shard2.get_connection() as conn:
+            session_id = conn.execute("SELECT MIN(id) FROM study_sessions").fetchone()[0]
+            subjects = conn.execute("SELECT COUNT(*) FROM subjects").fetchone()[0]
+        self.assertGreater(session_id, SHARD_ID_SPAN)
+        self.assertGreater(subjects, 0)
+
+        with self.router.primary().write_transaction() as conn:
+            conn.execute(
+                "INSERT INTO quizzes (subject_id, title, question, correct_answer) VALUES (1, 't', 'q', 'a')"
+            )
+        self.assertEqual(self.router.sync_reference_data()["quizzes"], 1)
+        self.assertEqual(self.router.sync_reference_data()["quizzes"], 0)
+        with shard2.get_connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM quizzes").fetchone()[0], 1)
+
+    def test_fan_out(self):
+        """全シャードへの並行問い合わせのテスト"""
+        self.add_user(1, sessions=2)
+        self.add_user(1500, sessions=5)
+        counts = {shard.name: count for shard, count in self.router.fan_out(
+            lambda conn: conn.execute("SELECT COUNT(*) FROM study_sessions").fetchone()[0]
+        )}
+        self.assertEqual(counts, {"primary": 2, "shard2": 5})
+
+        frame = self.router.fan_out_frame("SELECT user_id, COUNT(*) AS n FROM study_sessions GROUP BY user_id")
+        self.assertEqual(sorted(frame["shard"]), ["primary", "shard2"])
+        overview = {row["shard"]: row for row in self.router.overview()}
+        self.assertEqual(overview["shard2"]["tenants"], ["range-1"])
+
+    def test_move_tenant(self):
+        """テナントの移動でデータ・ID・バージョンが引き継がれるテスト"""
+        self.add_user(1)
+        self.add_user(2)
+        self.add_user(3)
+        primary = self.router.primary()
+        with primary.write_transaction() as conn:
+            insert_schedule(conn, 1, "テスト", None, "2030-01-01 09:00:00", "exam")
+            conn.execute("INSERT INTO quizzes (subject_id, title, question, correct_answer, difficulty) "
+                         "VALUES (1, 't', 'q', 'a', 2)")
+            insert_quiz_result(conn, 1, conn.execute("SELECT MAX(id) FROM quizzes").fetchone()[0], "a", True)
+        self.router.sync_reference_data()
+        version = primary.get_data_version(user_scope(1))
+        sessions_version = primary.get_data_version(study_sessions_scope(1))
+        with primary.get_connection() as conn:
+            last_change = conn.execute("SELECT MAX(version) FROM change_log").fetchone()[0]
+
+        moved = self.router.move_tenant("school-a", "shard2", grace=0)
+        self.assertEqual(moved["users"], 2)
+        self.assertEqual(moved["study_sessions"], 6)
+        self.assertEqual(moved["schedules"], 1)
+
+        shard2 = self.router.database_for_user(1)
+        self.assertEqual(shard2.db_path, self.router.directory.shard("shard2").path)
+        self.assertGreater(shard2.get_data_version(user_scope(1)), version)
+        self.assertGreater(shard2.get_data_version(study_sessions_scope(1)), sessions_version)
+        with shard2.get_connection() as conn:
+            # 移動先の変更履歴は移動元より後の番号で、同期カーソルから続けて取得できる
+            first_change = conn.execute("SELECT MIN(version) FROM change_log WHERE user_id = 1").fetchone()[0]
+        self.assertGreater(first_change, last_change)
+        with primary.get_connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM change_log WHERE user_id IN (1, 2)").fetchone()[0], 0)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM quiz_accuracy WHERE user_id = 1").fetchone()[0], 0)
+        with shard2.get_connection() as conn:
+            # 正答数は移動先でコピーしたクイズ結果から数え直される
+            self.assertEqual(conn.execute("SELECT difficulty, attempts, correct FROM quiz_accuracy WHERE user_id = 1").fetchall(),
+                             [(2, 1, 1)])
+        with shard2.get_connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM study_sessions WHERE user_id IN (1, 2)").fetchone()[0], 6)
+        with primary.get_connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM study_sessions WHERE user_id IN (1, 2)").fetchone()[0], 0)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM study_sessions WHERE user_id = 3").fetchone()[0], 3)
+
+        # 移動後の書き込みは移動先で採番される
+        self.add_user(4, sessions=0)
+        with shard2.write_transaction() as conn:
+            self.assertGreater(insert_study_session(conn, 1, 1, 10, "追加", 3), SHARD_ID_SPAN)
+
+    def test_moving_tenant_is_read_only(self):
+        """移動中のテナントへの書き込みが拒否されるテスト"""
+        self.directory.set_tenant("school-a", state="moving")
+        db = self.router.database_for_user(1)
+        with db.get_connection() as conn:
+            conn.execute("SELECT COUNT(*) FROM users").fetchone()
+        with self.assertRaises(TenantMovingError):
+            db.write_transaction()
+        self.router.database_for_user(3).write_transaction()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""
+ダッシュボードの事前集計のテスト
+"""
+
+import unittest
+import tempfile
+import os
+import sys
+from datetime import datetime, timedelta
+from unittest import mock
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import DatabaseController
+from src.controllers.queries import insert_study_session
+from src.controllers.snapshots import (DashboardSnapshot, SnapshotScheduler, load_snapshot,
+                                       refresh_snapshot, save_snapshot)
+
+class TestDashboardSnapshots(unittest.TestCase):
+    """スナップショットの保存・再利用・スケジューラーのテストクラス"""
+
+    def setUp(self):
+        """テスト前の準備"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseController(os.path.join(self.temp_dir.name, "test.db"))
+        patcher = mock.patch("src.controllers.database.db_controller", self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.add_sessions(1, [(1, 60), (2, 30)])
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        self.db.writer.close()
+        self.db.analytics.close()
+        self.temp_dir.cleanup()
+
+    def add_sessions(self, user_id: int, sessions):
+        """ユーザーと学習記録を作成"""
+        with self.db.write_transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO users (id, name, email, grade) VALUES (?, ?, ?, 1)",
+                (user_id, f"user{user_id}", f"user{user_id}@example.com")
+            )
+            for subject_id, minutes in sessions:
+                insert_study_session(conn, user_id, subject_id, minutes, "学習", 4)
+
+    def test_encode_roundtrip(self):
+        """圧縮したJSONからの復元と鮮度の判定のテスト"""
+        computed_at = datetime(2030, 4, 1, 9, 0)
+        snapshot = DashboardSnapshot(1, 7, computed_at, {"weekly_minutes": 90},
+                                     [{"study_date": "2030-04-01", "total_minutes": 90}])
+        restored = DashboardSnapshot.decode(1, 7, computed_at.isoformat(), snapshot.encode())
+        self.assertEqual(restored, snapshot)
+        self.assertTrue(restored.is_fresh(7, 3600, now=computed_at + timedelta(minutes=30)))
+        self.assertFalse(restored.is_fresh(8, 3600, now=computed_at + timedelta(minutes=30)))
+        self.assertFalse(restored.is_fresh(7, 3600, now=computed_at + timedelta(hours=2)))
+        self.assertFalse(restored.is_fresh(7, 86400, now=datetime(2030, 4, 2, 0, 10)))
+
+    def test_skip_unchanged(self):
+        """データが変わらない間は集計し直さないテスト"""
+        snapshot, refreshed = refresh_snapshot(1)
+        self.assertTrue(refreshed)
+        self.assertEqual(snapshot.metrics["weekly_minutes"], 90)
+        self.assertEqual([row["subject_id"] for row in snapshot.subject_minutes], [1, 2])
+        self.assertEqual(len(snapshot.recent_activities), 2)
+
+        again, refreshed = refresh_snapshot(1)
+        self.assertFalse(refreshed)
+        self.assertEqual(again, snapshot)
+
+        self.add_sessions(1, [(3, 45)])
+        updated, refreshed = refresh_snapshot(1)
+        self.assertTrue(refreshed)
+        self.assertEqual(updated.metrics["weekly_minutes"], 135)
+        self.assertEqual(load_snapshot(self.db, 1), updated)
+
+    def test_older_snapshot_is_not_saved(self):
+        """古いバージョンの集計で新しいスナップショットを上書きしないテスト"""
+        stale, _ = refresh_snapshot(1)
+        self.add_sessions(1, [(3, 45)])
+        fresh, _ = refresh_snapshot(1)
+        save_snapshot(self.db, stale)
+        self.assertEqual(load_snapshot(self.db, 1).version, fresh.version)
+
+    def test_scheduler_after_write_burst(self):
+        """書き込みが落ち着いたユーザーだけを事前集計するテスト"""
+        scheduler = SnapshotScheduler(quiet_period=0, max_workers=2)
+        try:
+            self.assertEqual(scheduler.sweep(), 1)
+            self.assertTrue(scheduler.wait_idle())
+            self.assertEqual(scheduler.stats()["refreshed"], 1)
+
+            scheduler.poll_changes()
+            self.assertEqual(scheduler.poll_changes(), [])
+            self.add_sessions(2, [(1, 20)])
+            self.assertEqual(scheduler.poll_changes(), [2])
+            self.assertEqual(scheduler.submit_quiet(), 1)
+            self.assertTrue(scheduler.wait_idle())
+            self.assertIsNotNone(load_snapshot(self.db, 2))
+
+            # 変更の無いユーザーは集計時にスキップされる
+            scheduler.sweep()
+            self.assertTrue(scheduler.wait_idle())
+            stats = scheduler.stats()
+            self.assertEqual(stats["refreshed"], 2)
+            self.assertEqual(stats["skipped"], 2)
+            self.assertEqual(stats["failed"], 0)
+        finally:
+            scheduler.stop()
+
+if __name__ == '__main__':
+    unittest.main()
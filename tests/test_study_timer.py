@@ -0,0 +1,78 @@
+"""
+学習タイマーのテスト
+"""
+
+import unittest
+import tempfile
+import os
+import sys
+from datetime import datetime, timedelta
+
+# プロジェクトルートをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.controllers.database import DatabaseController
+from src.controllers.study_timer import (MAX_TIMER_MINUTES, checkpoint_timer, discard_timer, get_timer,
+                                         start_timer, stop_timer)
+
+class TestStudyTimer(unittest.TestCase):
+    """進行中の行の作成・確認と学習記録への変換のテストクラス"""
+
+    def setUp(self):
+        """テスト前の準備"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseController(os.path.join(self.temp_dir.name, "test.db"))
+        self.started = datetime(2030, 4, 3, 19, 0, 0)
+
+    def tearDown(self):
+        """テスト後のクリーンアップ"""
+        self.db.writer.close()
+        self.db.analytics.close()
+        self.temp_dir.cleanup()
+
+    def sessions(self):
+        """保存された学習記録"""
+        with self.db.get_connection() as conn:
+            return conn.execute(
+                "SELECT subject_id, duration_minutes, content, study_date FROM study_sessions ORDER BY id"
+            ).fetchall()
+
+    def test_start_checkpoint_and_stop(self):
+        """開始は1つだけで、停止で経過時間の学習記録に変わるテスト"""
+        timer = start_timer(self.db, 1, 2, self.started)
+        # 二重に押しても最初のタイマーのまま
+        self.assertEqual(start_timer(self.db, 1, 3, self.started + timedelta(minutes=5)), timer)
+        self.assertTrue(checkpoint_timer(self.db, 1, self.started + timedelta(minutes=20)))
+        self.assertFalse(get_timer(self.db, 1).is_stale(self.started + timedelta(minutes=22)))
+        self.assertTrue(get_timer(self.db, 1).is_stale(self.started + timedelta(minutes=24)))
+        with self.db.get_connection() as conn:
+            version = conn.execute("SELECT COALESCE(MAX(version), 0) FROM data_versions WHERE scope = 'user:1'").fetchone()
+
+        self.assertIsNotNone(stop_timer(self.db, 1, "問題集", 4, self.started + timedelta(minutes=45, seconds=20)))
+        self.assertEqual(self.sessions(), [(2, 45, "問題集", "2030-04-03 19:00:00")])
+        self.assertIsNone(get_timer(self.db, 1))
+        self.assertIsNone(stop_timer(self.db, 1, "二重の停止", 4))
+        self.assertFalse(checkpoint_timer(self.db, 1))
+        with self.db.get_connection() as conn:
+            # 確認では利用者のデータバージョンが上がらず、記録の追加で上がる
+            self.assertEqual(conn.execute(
+                "SELECT version FROM data_versions WHERE scope = 'user:1'"
+            ).fetchone()[0], version[0] + 1)
+
+    def test_interrupted_timer(self):
+        """中断されたタイマーを最終確認時刻までで記録・破棄するテスト"""
+        start_timer(self.db, 1, 2, self.started)
+        checkpoint_timer(self.db, 1, self.started + timedelta(minutes=30))
+        stop_timer(self.db, 1, None, None, self.started + timedelta(days=1), until_checkpoint=True)
+        self.assertEqual([row[1] for row in self.sessions()], [30])
+
+        start_timer(self.db, 1, 2, self.started)
+        stop_timer(self.db, 1, None, None, self.started + timedelta(days=1))
+        self.assertEqual([row[1] for row in self.sessions()], [30, MAX_TIMER_MINUTES])
+
+        start_timer(self.db, 1, 2, self.started)
+        self.assertTrue(discard_timer(self.db, 1))
+        self.assertEqual(len(self.sessions()), 2)
+
+if __name__ == '__main__':
+    unittest.main()